@@ -0,0 +1,60 @@
+"""Server load and latency of a fan-out of identical GET requests
+
+`--threads` threads sharing one client all call ``get_alert(1)`` at once, repeated for
+`--rounds` rounds, against a local stand-in server answering after `--delay-ms`. Reports the
+requests the server received and the median and slowest call latency, with and without
+coalescing of identical requests in flight.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_coalesce --threads 32 --rounds 20
+"""
+import argparse
+from concurrent.futures import ThreadPoolExecutor
+import threading
+import time
+
+from irflow_client import IRFlowClient
+from tests.stub_server import StubServer
+
+
+def run(server, coalesce, threads, rounds):
+    """Return (requests received, latencies in ms) of `rounds` fan-outs"""
+    irfc = IRFlowClient(dict(server.config_args, coalesce_requests=coalesce,
+                             pool_maxsize=threads))
+    before = len(server.requests)
+    latencies = []
+    barrier = threading.Barrier(threads)
+
+    def call(_):
+        barrier.wait()
+        start = time.perf_counter()
+        irfc.get_alert(1)
+        return (time.perf_counter() - start) * 1000
+
+    with ThreadPoolExecutor(max_workers=threads) as executor:
+        for _ in range(rounds):
+            latencies.extend(executor.map(call, range(threads)))
+    return len(server.requests) - before, sorted(latencies)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--threads', type=int, default=32, help='concurrent callers')
+    parser.add_argument('--rounds', type=int, default=20, help='fan-outs to measure')
+    parser.add_argument('--delay-ms', type=float, default=20.0,
+                        help='server side latency of get_alert')
+    args = parser.parse_args(argv)
+
+    with StubServer() as server:
+        server.add('GET', '/api/v1/alerts/1', json_body={'success': True, 'data': {}},
+                   delay=args.delay_ms / 1000)
+        print('{:<12}{:>12}{:>16}{:>16}'.format('coalesce', 'requests', 'p50 (ms)', 'max (ms)'))
+        for coalesce in (False, True):
+            requests, latencies = run(server, coalesce, args.threads, args.rounds)
+            print('{:<12}{:>12}{:>16.1f}{:>16.1f}'.format(
+                str(coalesce), requests, latencies[len(latencies) // 2], latencies[-1]))
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,58 @@
+"""Per call CPU overhead of IRFlowClient methods, without any network
+
+Every call is answered by an in-memory transport, so the figures are the SDK's own cost:
+URL building, header handling, request preparation in ``requests``, json encoding and
+decoding, and debug logging or metrics collection when enabled.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_dispatch --iterations 2000
+"""
+import argparse
+import logging
+import time
+
+from benchmarks.mock_transport import mock_client
+
+CALLS = [
+    ('get_alert', lambda irfc: irfc.get_alert(1)),
+    ('create_alert', lambda irfc: irfc.create_alert({'src_ip': '10.0.0.1', 'user': 'bob'},
+                                                    description='bench',
+                                                    incoming_field_group_name='bench')),
+    ('put_fact_group', lambda irfc: irfc.put_fact_group(1, {'field_1': 'value'})),
+    ('get_fact_group', lambda irfc: irfc.get_fact_group(1)),
+    ('list_picklist_items', lambda irfc: irfc.list_picklist_items(1)),
+    ('get_picklist_item', lambda irfc: irfc.get_picklist_item(1)),
+    ('close_alert', lambda irfc: irfc.close_alert(1, 'False Positive')),
+]
+
+
+def measure(irfc, call, iterations):
+    """Return the mean microseconds of `call`"""
+    for _ in range(min(100, iterations)):
+        call(irfc)
+    start = time.perf_counter()
+    for _ in range(iterations):
+        call(irfc)
+    return (time.perf_counter() - start) / iterations * 1e6
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--iterations', type=int, default=2000)
+    args = parser.parse_args(argv)
+
+    # Debug output is formatted but discarded, as with a configured but quiet logger
+    logging.getLogger('irflow_client').setLevel(logging.CRITICAL)
+    clients = [mock_client()[0], mock_client(debug=True)[0],
+               mock_client(collect_metrics=True)[0]]
+
+    print('{:<22}{:>14}{:>16}{:>18}'.format('call', 'us/call', 'debug us/call',
+                                            'metrics us/call'))
+    for name, call in CALLS:
+        print('{:<22}{:>14.1f}{:>16.1f}{:>18.1f}'.format(
+            name, *[measure(irfc, call, args.iterations) for irfc in clients]))
+
+
+if __name__ == '__main__':
+    main()
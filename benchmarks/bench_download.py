@@ -0,0 +1,85 @@
+"""Throughput of in-memory attachment downloads across file sizes
+
+Compares, for every size, against a local stand-in server:
+
+- `tempfile`: the previous ``download_attachment_string``, 1 KiB chunks written to a temporary
+  file, read back in full
+- `bytes`: ``download_attachment_string``, returning a copy of the buffer as bytes
+- `memoryview`: ``download_attachment_buffer``, using the buffer without a copy
+
+Run from the repository root::
+
+    python -m benchmarks.bench_download --sizes-kb 16,1024,16384,131072
+"""
+import argparse
+import tempfile
+import time
+
+from irflow_client import IRFlowClient
+from tests.stub_server import StubServer
+
+
+def legacy_download(irfc, attachment_id):
+    url = irfc._url('get_attachment', (attachment_id,))
+    temp = tempfile.TemporaryFile()
+    response = irfc._send('get_attachment', 'GET', url, stream=True)
+    for block in response.iter_content(1024):
+        temp.write(block)
+    temp.seek(0)
+    return temp.read()
+
+
+def memoryview_download(irfc, attachment_id):
+    with irfc.download_attachment_buffer(attachment_id) as attachment:
+        view = attachment.memoryview()
+        size = len(view)
+        view.release()
+        return size
+
+
+MODES = [
+    ('tempfile', legacy_download),
+    ('bytes', lambda irfc, attachment_id: irfc.download_attachment_string(attachment_id)),
+    ('memoryview', memoryview_download),
+]
+
+
+def measure(irfc, func, attachment_id, size, min_seconds):
+    """Return MiB/s of repeated downloads, for at least `min_seconds`"""
+    func(irfc, attachment_id)
+    rounds = 0
+    start = time.perf_counter()
+    while True:
+        func(irfc, attachment_id)
+        rounds += 1
+        elapsed = time.perf_counter() - start
+        if elapsed >= min_seconds:
+            return rounds * size / elapsed / (1024 * 1024)
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--sizes-kb', default='16,1024,16384,131072',
+                        help='comma separated attachment sizes in KiB')
+    parser.add_argument('--min-seconds', type=float, default=1.0,
+                        help='minimum measuring time per size and mode')
+    args = parser.parse_args(argv)
+
+    sizes = [int(size) * 1024 for size in args.sizes_kb.split(',')]
+    with StubServer() as server:
+        for attachment_id, size in enumerate(sizes):
+            server.add('GET', '/api/v1/attachments/%s/download' % attachment_id,
+                       body=b'\0' * size)
+        irfc = IRFlowClient(server.config_args)
+
+        print('{:>12}'.format('size (KiB)') +
+              ''.join('{:>18}'.format(name + ' MiB/s') for name, _ in MODES))
+        for attachment_id, size in enumerate(sizes):
+            rates = [measure(irfc, func, attachment_id, size, args.min_seconds)
+                     for _, func in MODES]
+            print('{:>12}'.format(size // 1024) + ''.join('{:>18.1f}'.format(rate)
+                                                          for rate in rates))
+
+
+if __name__ == '__main__':
+    main()
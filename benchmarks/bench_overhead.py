@@ -0,0 +1,271 @@
+"""Per call CPU overhead of every IRFlowClient method, compared against a stored baseline
+
+Every call is answered by an in-memory transport, so the figures are the SDK's own cost. Each
+API method of :class:`irflow_client.IRFlowClient` is measured end to end, and the steps of the
+dispatch path are measured on their own: url building, header merging, json encoding and
+decoding, and the debug output, both filtered out by the logger and actually written.
+
+The results can be saved as a baseline, later runs are compared against it and changes beyond
+`--threshold` are flagged. The exit status is 1 if a case regressed, so the suite can gate a
+CI job. Baselines only compare well on the machine and Python version they were saved on.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_overhead --save          # store benchmarks/baseline.json
+    python -m benchmarks.bench_overhead                 # compare against it
+    python -m benchmarks.bench_overhead --filter picklist --threshold 0.1
+"""
+from contextlib import redirect_stdout
+import argparse
+import datetime
+import inspect
+import io
+import json
+import logging
+import os
+import platform
+import shutil
+import sys
+import tempfile
+import timeit
+
+import requests
+from requests.sessions import merge_setting
+from requests.structures import CaseInsensitiveDict
+
+from benchmarks.mock_transport import DEFAULT_BODY, mock_client
+from irflow_client import IRFlowClient
+from irflow_client.dispatch import _JSON_HEADERS
+
+DEFAULT_BASELINE = os.path.join(os.path.dirname(__file__), 'baseline.json')
+
+ALERT_FIELDS = {'src_ip': '10.0.0.1', 'dst_ip': '10.0.0.2', 'user': 'bob', 'host': 'ws-042',
+                'rule': 'beacon', 'severity': 'high'}
+ATTACHMENT = b'x' * 4096
+
+# Public methods that make no single API call, measured elsewhere or not at all
+NOT_BENCHMARKED = {
+    'create_alerts': 'thread pool fan-out of create_alert',
+    'download_attachments': 'thread pool fan-out of resumable downloads, see bench_download',
+    'fact_group_writer': 'no call, returns a write-behind buffer',
+    'request_options': 'no call, a context manager',
+    'get_field_by_name': 'no call, a list lookup',
+    'dump_request_debug_info': 'measured as the debug steps',
+    'dump_response_debug_info': 'measured as the debug steps',
+    'dump_settings': 'no call, logs the configuration',
+}
+
+
+def method_cases(workdir):
+    """Return (name, callable taking the client) for every API method"""
+    download_path = os.path.join(workdir, 'attachment.bin')
+    return [
+        ('get_version', lambda irfc: irfc.get_version()),
+        ('get_alert', lambda irfc: irfc.get_alert(1)),
+        ('create_alert', lambda irfc: irfc.create_alert(ALERT_FIELDS, description='bench',
+                                                        incoming_field_group_name='bench')),
+        ('close_alert', lambda irfc: irfc.close_alert(1, 'False Positive')),
+        ('assign_user_to_alert', lambda irfc: irfc.assign_user_to_alert(1, 'bob')),
+        ('attach_incident_to_alert', lambda irfc: irfc.attach_incident_to_alert(2, 1)),
+        ('attach_alert_to_incident', lambda irfc: irfc.attach_alert_to_incident(1, 2)),
+        ('create_incident', lambda irfc: irfc.create_incident('Phishing', {'user': 'bob'},
+                                                              description='bench')),
+        ('get_incident', lambda irfc: irfc.get_incident(2)),
+        ('update_incident', lambda irfc: irfc.update_incident(2, {'user': 'bob'}, 'Phishing',
+                                                              1, [1, 2])),
+        ('get_fact_group', lambda irfc: irfc.get_fact_group(1)),
+        ('get_fact_group_view', lambda irfc: irfc.get_fact_group_view(1)),
+        ('put_fact_group', lambda irfc: irfc.put_fact_group(1, {'field_1': 'value'})),
+        ('list_picklists', lambda irfc: irfc.list_picklists()),
+        ('get_picklist', lambda irfc: irfc.get_picklist(1)),
+        ('add_item_to_picklist', lambda irfc: irfc.add_item_to_picklist(1, 'v', 'Value')),
+        ('list_picklist_items', lambda irfc: irfc.list_picklist_items(1, with_trashed=True)),
+        ('create_picklist_item', lambda irfc: irfc.create_picklist_item(1, 'v', 'Value')),
+        ('get_picklist_item', lambda irfc: irfc.get_picklist_item(1)),
+        ('restore_picklist_item', lambda irfc: irfc.restore_picklist_item(1)),
+        ('delete_picklist_item', lambda irfc: irfc.delete_picklist_item(1)),
+        ('create_object_type', lambda irfc: irfc.create_object_type('bench', 'Bench',
+                                                                    parent_type_id=1)),
+        ('attach_field_to_object_type',
+         lambda irfc: irfc.attach_field_to_object_type('bench', 'field_1')),
+        ('upload_attachment_to_alert',
+         lambda irfc: irfc.upload_attachment_to_alert(1, ATTACHMENT, 'a.bin')),
+        ('upload_attachment_to_incident',
+         lambda irfc: irfc.upload_attachment_to_incident(2, ATTACHMENT, 'a.bin')),
+        ('upload_attachment_to_task',
+         lambda irfc: irfc.upload_attachment_to_task(3, ATTACHMENT, 'a.bin')),
+        ('download_attachment', lambda irfc: irfc.download_attachment(1, download_path)),
+        ('download_attachment_buffer', lambda irfc: irfc.download_attachment_buffer(1).close()),
+        ('download_attachment_string', lambda irfc: irfc.download_attachment_string(1)),
+    ]
+
+
+def step_cases():
+    """Return (name, callable taking the client) for the single steps of the dispatch path"""
+    body = json.dumps(DEFAULT_BODY).encode('utf-8')
+    response = requests.models.Response()
+    response.status_code = 200
+    response._content = body
+    response.encoding = 'utf-8'
+    alert = {'alert_fields': ALERT_FIELDS, 'description': 'bench',
+             'incoming_field_group_name': 'bench', 'suppress_missing_field_warning': False}
+    return [
+        ('step.url', lambda irfc: irfc._url('put_incident_on_alert', (1, 2))),
+        ('step.url_suffix', lambda irfc: irfc._url('get_fact_group', suffix=1)),
+        ('step.headers', lambda irfc: merge_setting(_JSON_HEADERS, irfc.session.headers,
+                                                    dict_class=CaseInsensitiveDict)),
+        ('step.prepare_request', lambda irfc: irfc.session.prepare_request(requests.Request(
+            'POST', irfc._url('create_alert'), headers=_JSON_HEADERS, json=alert))),
+        ('step.json_encode', lambda irfc: json.dumps(alert)),
+        ('step.json_decode', lambda irfc: irfc._decode('Get Fact Group', response)),
+        ('step.debug_filtered', lambda irfc: irfc.dump_request_debug_info(
+            'Create Alert', irfc._url('create_alert'), headers=_JSON_HEADERS, data=alert)),
+    ]
+
+
+def debug_cases():
+    """Return (name, callable taking the client) measured with debug output written"""
+    alert = {'alert_fields': ALERT_FIELDS, 'description': 'bench'}
+    return [
+        ('debug.request', lambda irfc: irfc.dump_request_debug_info(
+            'Create Alert', irfc._url('create_alert'), headers=_JSON_HEADERS, data=alert)),
+        ('debug.response', lambda irfc: irfc.dump_response_debug_info(
+            'Get Fact Group', 200, DEFAULT_BODY)),
+        ('debug.get_alert', lambda irfc: irfc.get_alert(1)),
+        ('debug.create_alert', lambda irfc: irfc.create_alert(ALERT_FIELDS)),
+        ('debug.get_fact_group', lambda irfc: irfc.get_fact_group(1)),
+    ]
+
+
+def uncovered(cases):
+    """Return the public IRFlowClient methods neither benchmarked nor listed as skipped"""
+    names = set(name for name, _ in cases)
+    return sorted(name for name, member in inspect.getmembers(IRFlowClient)
+                  if not name.startswith('_') and callable(member) and
+                  name not in names and name not in NOT_BENCHMARKED)
+
+
+def measure(irfc, call, repeat, min_time):
+    """Return the microseconds per call of `call`, the best of `repeat` rounds"""
+    timer = timeit.Timer(lambda: call(irfc))
+    number, elapsed = timer.autorange()
+    number = max(1, int(number * min_time / max(elapsed, 1e-9)))
+    return min(timer.repeat(repeat, number)) / number * 1e6
+
+
+def load_baseline(path):
+    """Return the stored baseline, `None` if there is none"""
+    try:
+        with open(path) as handle:
+            return json.load(handle)
+    except (IOError, OSError):
+        return None
+
+
+def save_baseline(path, results):
+    baseline = {
+        'created': datetime.datetime.now().isoformat(timespec='seconds'),
+        'python': platform.python_version(),
+        'platform': platform.platform(),
+        'unit': 'us/call',
+        'results': dict((name, round(value, 3)) for name, value in results.items()),
+    }
+    with open(path, 'w') as handle:
+        json.dump(baseline, handle, indent=2, sort_keys=True)
+        handle.write('\n')
+
+
+def compare(results, baseline, threshold):
+    """Return (rows of name, baseline, now, change, flag; regressed names)"""
+    rows = []
+    regressed = []
+    previous = baseline['results'] if baseline else {}
+    for name, now in results.items():
+        before = previous.get(name)
+        if before is None:
+            rows.append((name, None, now, None, 'new'))
+            continue
+        change = now / before - 1
+        flag = ''
+        if change > threshold:
+            flag = 'REGRESSION'
+            regressed.append(name)
+        elif change < -threshold:
+            flag = 'improved'
+        rows.append((name, before, now, change, flag))
+    return rows, regressed
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--baseline', default=DEFAULT_BASELINE,
+                        help='baseline file, default = benchmarks/baseline.json')
+    parser.add_argument('--save', action='store_true',
+                        help='store the results as the new baseline instead of comparing')
+    parser.add_argument('--threshold', type=float, default=0.2,
+                        help='relative slow down flagged as a regression, default = 0.2')
+    parser.add_argument('--filter', default='', help='only run cases containing this text')
+    parser.add_argument('--repeat', type=int, default=5)
+    parser.add_argument('--min-time', type=float, default=0.05,
+                        help='seconds per measured round, default = 0.05')
+    args = parser.parse_args(argv)
+
+    workdir = tempfile.mkdtemp()
+    cases = method_cases(workdir) + step_cases()
+    missing = uncovered(cases)
+    if missing:
+        print('Not benchmarked: {}'.format(', '.join(missing)), file=sys.stderr)
+
+    # Debug output is either filtered out by a quiet logger, or formatted and written to
+    # /dev/null by a debug client
+    logger = logging.getLogger('irflow_client')
+    devnull = open(os.devnull, 'w')
+    handler = logging.StreamHandler(devnull)
+    groups = [(cases, mock_client()[0], logging.CRITICAL),
+              (debug_cases(), mock_client(debug=True)[0], logging.DEBUG)]
+    results = {}
+    try:
+        # download_attachment prints to stdout on every call
+        with redirect_stdout(io.StringIO()):
+            for group, irfc, level in groups:
+                logger.setLevel(level)
+                if level == logging.DEBUG:
+                    logger.addHandler(handler)
+                for name, call in group:
+                    if args.filter in name:
+                        results[name] = measure(irfc, call, args.repeat, args.min_time)
+    finally:
+        logger.removeHandler(handler)
+        devnull.close()
+        shutil.rmtree(workdir, ignore_errors=True)
+
+    if args.save:
+        save_baseline(args.baseline, results)
+        for name, now in results.items():
+            print('{:<32}{:>12.2f}'.format(name, now))
+        print('Saved {} results to {}'.format(len(results), args.baseline))
+        return 0
+
+    baseline = load_baseline(args.baseline)
+    if baseline is None:
+        print('No baseline at {}, store one with --save'.format(args.baseline))
+    elif [baseline.get('python'), baseline.get('platform')] != [platform.python_version(),
+                                                                platform.platform()]:
+        print('Baseline was saved with Python {} on {}, figures may not compare'.format(
+            baseline.get('python'), baseline.get('platform')))
+    rows, regressed = compare(results, baseline, args.threshold)
+    print('{:<32}{:>12}{:>12}{:>10}  {}'.format('case', 'baseline us', 'us/call', 'change',
+                                                'flag'))
+    for name, before, now, change, flag in rows:
+        print('{:<32}{:>12}{:>12.2f}{:>10}  {}'.format(
+            name, '-' if before is None else '{:.2f}'.format(before), now,
+            '-' if change is None else '{:+.1%}'.format(change), flag))
+    if regressed:
+        print('{} case(s) regressed by more than {:.0%}: {}'.format(
+            len(regressed), args.threshold, ', '.join(regressed)))
+        return 1
+    return 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,71 @@
+"""Start up time of IRFlowClient with eager, lazy and cached server version negotiation
+
+Each round builds a new client, like a short lived IR-Flow action script does, and makes one
+API call. The local stand-in server adds `--latency` seconds to every response to model the
+round trip to a remote IR-Flow server.
+
+Run from the repository root::
+
+    python -m benchmarks.bench_startup --rounds 50 --latency 0.02
+"""
+import argparse
+import os
+import shutil
+import tempfile
+import time
+
+from irflow_client import IRFlowClient
+from tests.stub_server import StubServer
+
+
+def run_mode(server, rounds, **options):
+    """Return (seconds to construct, seconds to construct and make one call) per round"""
+    construct = []
+    first_call = []
+    for _ in range(rounds):
+        start = time.perf_counter()
+        irfc = IRFlowClient(dict(server.config_args, **options))
+        constructed = time.perf_counter()
+        irfc.get_alert(1)
+        done = time.perf_counter()
+        irfc.session.close()
+        construct.append(constructed - start)
+        first_call.append(done - start)
+    return sum(construct) / rounds, sum(first_call) / rounds
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--rounds', type=int, default=50)
+    parser.add_argument('--latency', type=float, default=0.02,
+                        help='seconds added to every response by the stand-in server')
+    args = parser.parse_args(argv)
+
+    # Eager mode is skipped on CI runners
+    os.environ.pop('CI', None)
+    cache_dir = tempfile.mkdtemp()
+    cache_file = os.path.join(cache_dir, 'irflow_version.json')
+    try:
+        with StubServer() as server:
+            server.add('GET', '/api/v1/version', json_body={'data': {'version': '5.1'}},
+                       delay=args.latency)
+            server.add('GET', '/api/v1/alerts/1', json_body={'success': True},
+                       delay=args.latency)
+            modes = [
+                ('eager', {'eager_version': True}),
+                ('lazy', {}),
+                ('eager + cache', {'eager_version': True, 'version_cache_file': cache_file}),
+            ]
+            print('{:<16}{:>18}{:>24}'.format('mode', 'construct (ms)', 'construct+call (ms)'))
+            for name, options in modes:
+                construct, first_call = run_mode(server, args.rounds, **options)
+                print('{:<16}{:>18.2f}{:>24.2f}'.format(name, construct * 1000,
+                                                       first_call * 1000))
+            print('version requests served: {}'.format(
+                len(server.requests_for('GET', '/api/v1/version'))))
+    finally:
+        shutil.rmtree(cache_dir)
+
+
+if __name__ == '__main__':
+    main()
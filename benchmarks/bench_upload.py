@@ -0,0 +1,124 @@
+"""Peak memory and throughput of a multi-GB attachment upload
+
+Uploads a sparse file of `--size-mb` MiB to a local server that reads and discards the body.
+Each mode runs in its own process, so the peak resident set size it reports is that mode's
+alone:
+
+- `streamed`: ``upload_attachment_to_alert``, streaming the multipart body from disk
+- `buffered`: the previous implementation, ``requests`` ``files=`` encoding the whole multipart
+  body in memory before sending it
+
+Run from the repository root::
+
+    python -m benchmarks.bench_upload --size-mb 2048
+"""
+import argparse
+import json
+import os
+import resource
+import subprocess
+import sys
+import tempfile
+import threading
+import time
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+except ImportError:
+    pass
+
+from irflow_client import IRFlowClient
+
+READ_SIZE = 1024 * 1024
+
+
+class DiscardHandler(BaseHTTPRequestHandler):
+    """Read any request body in small pieces, answer with a json success"""
+    protocol_version = 'HTTP/1.1'
+
+    def log_message(self, *args):
+        pass
+
+    def do_POST(self):
+        if self.headers.get('Transfer-Encoding') == 'chunked':
+            while True:
+                size = int(self.rfile.readline().strip(), 16)
+                self._discard(size)
+                self.rfile.readline()
+                if not size:
+                    break
+        else:
+            self._discard(int(self.headers.get('Content-Length') or 0))
+        body = b'{"success": true}'
+        self.send_response(200)
+        self.send_header('Content-Type', 'application/json')
+        self.send_header('Content-Length', str(len(body)))
+        self.end_headers()
+        self.wfile.write(body)
+
+    def _discard(self, length):
+        while length:
+            length -= len(self.rfile.read(min(length, READ_SIZE)))
+
+
+def peak_rss_mb():
+    # ru_maxrss is in KiB on Linux, bytes on macOS
+    scale = 1024 * 1024 if sys.platform == 'darwin' else 1024
+    return resource.getrusage(resource.RUSAGE_SELF).ru_maxrss / float(scale)
+
+
+def run_mode(mode, path):
+    """Upload `path` once with the given mode, return the measurements of this process"""
+    server = ThreadingHTTPServer(('127.0.0.1', 0), DiscardHandler)
+    server.daemon_threads = True
+    threading.Thread(target=server.serve_forever, daemon=True).start()
+    address = '127.0.0.1:%s' % server.server_address[1]
+    irfc = IRFlowClient({'address': address, 'api_user': 'bench', 'api_key': 'bench',
+                         'protocol': 'http', 'debug': False, 'verbose': 0})
+    baseline = peak_rss_mb()
+
+    start = time.perf_counter()
+    if mode == 'streamed':
+        irfc.upload_attachment_to_alert(1, path)
+    else:
+        with open(path, 'rb') as handle:
+            irfc.session.post('http://%s/api/v1/alerts/1/attachments' % address, data={},
+                              files={'file': handle}).json()
+    elapsed = time.perf_counter() - start
+    server.shutdown()
+    return {'mode': mode, 'seconds': elapsed, 'baseline_mb': baseline,
+            'peak_mb': peak_rss_mb()}
+
+
+def main(argv=None):
+    parser = argparse.ArgumentParser(description=__doc__.split('\n')[0])
+    parser.add_argument('--size-mb', type=int, default=2048, help='size of the uploaded file')
+    parser.add_argument('--modes', default='streamed,buffered',
+                        help='comma separated modes to run, buffered needs twice --size-mb of RAM')
+    parser.add_argument('--run-mode', help=argparse.SUPPRESS)
+    parser.add_argument('--path', help=argparse.SUPPRESS)
+    args = parser.parse_args(argv)
+
+    if args.run_mode:
+        print(json.dumps(run_mode(args.run_mode, args.path)))
+        return
+
+    handle, path = tempfile.mkstemp(prefix='irflow_upload_', suffix='.bin')
+    try:
+        os.ftruncate(handle, args.size_mb * 1024 * 1024)
+        os.close(handle)
+        print('{:<10}{:>12}{:>12}{:>18}{:>16}'.format(
+            'mode', 'seconds', 'MiB/s', 'peak RSS (MiB)', 'growth (MiB)'))
+        for mode in args.modes.split(','):
+            output = subprocess.check_output([sys.executable, '-m', 'benchmarks.bench_upload',
+                                              '--run-mode', mode, '--path', path])
+            result = json.loads(output.decode('utf-8').strip().splitlines()[-1])
+            print('{:<10}{:>12.2f}{:>12.1f}{:>18.1f}{:>16.1f}'.format(
+                mode, result['seconds'], args.size_mb / result['seconds'], result['peak_mb'],
+                result['peak_mb'] - result['baseline_mb']))
+    finally:
+        os.remove(path)
+
+
+if __name__ == '__main__':
+    main()
@@ -0,0 +1,83 @@
+"""In-memory transport adapter answering every request with a canned response
+
+Mounting it on the session of an IRFlowClient removes the network from a benchmark, so only
+the client's own CPU cost is measured.
+"""
+import io
+import json
+
+from requests.adapters import BaseAdapter
+from requests.models import Response
+from requests.structures import CaseInsensitiveDict
+
+DEFAULT_BODY = {
+    'success': True,
+    'message': 'OK',
+    'errorCode': None,
+    'exception': None,
+    'data': {
+        'version': '5.1',
+        'alert': {'alert_num': 1, 'id': 1, 'fact_group_id': 1},
+        'fact_group': {'id': 1,
+                       'facts': [{'field': {'field_name': 'field_%s' % n, 'id': n},
+                                  'value': 'value_%s' % n} for n in range(20)]},
+    }
+}
+
+
+class MockAdapter(BaseAdapter):
+    """Answer every request with `body` serialized as json
+
+    Args:
+        body (dict): The json response body, defaults to a typical IR-Flow response
+        status (int): The HTTP status code, default = 200
+    """
+
+    def __init__(self, body=None, status=200):
+        super(MockAdapter, self).__init__()
+        self.content = json.dumps(DEFAULT_BODY if body is None else body).encode('utf-8')
+        self.status = status
+        self.requests = 0
+
+    def send(self, request, stream=False, timeout=None, verify=True, cert=None, proxies=None):
+        self.requests += 1
+        response = Response()
+        response.status_code = self.status
+        response.headers = CaseInsensitiveDict({'Content-Type': 'application/json',
+                                                'Content-Length': str(len(self.content))})
+        response.raw = io.BytesIO(self.content)
+        if not stream:
+            response._content = self.content
+        response.encoding = 'utf-8'
+        response.url = request.url
+        response.request = request
+        response.connection = self
+        return response
+
+    def close(self):
+        pass
+
+
+def mock_client(client_class=None, debug=False, body=None, status=200, **options):
+    """Build an IRFlowClient whose calls are answered by a MockAdapter
+
+    Returns:
+        tuple: The (client, adapter)
+    """
+    if client_class is None:
+        from irflow_client import IRFlowClient
+        client_class = IRFlowClient
+    config_args = {
+        'address': 'irflow.bench',
+        'api_user': 'bench_user',
+        'api_key': 'bench_key',
+        'protocol': 'http',
+        'debug': debug,
+        'verbose': 0,
+    }
+    config_args.update(options)
+    irfc = client_class(config_args)
+    adapter = MockAdapter(body, status)
+    irfc.session.mount('http://', adapter)
+    irfc.session.mount('https://', adapter)
+    return irfc, adapter
@@ -22,13 +22,19 @@ if irflowAPI.debug:
 alert_type = 'ds_test'
 description = 'New CSV Alert on ' + strftime("%Y-%m-%d %H:%M:%S", gmtime())
 
-with open('sample_csv_of_alerts.csv', 'rb') as csv_file:
+with open('sample_csv_of_alerts.csv', 'r') as csv_file:
     csv_reader = csv.DictReader(csv_file)
-    for row in csv_reader:
-        result = irflowAPI.create_alert(row, description=description, incoming_field_group_name=alert_type)
-        if result['success']:
-            logger.info('Created Alert_Num: ' + str(result['data']['alert']['alert_num']))
+    # Keep up to 8 alerts in flight, results are still reported in csv order
+    bulk = irflowAPI.create_alerts(csv_reader, description=description,
+                                   incoming_field_group_name=alert_type, max_workers=8)
+    for result in bulk:
+        if result.success:
+            logger.info('Created Alert_Num: ' + str(result.alert_num))
         else:
-            logger.error('Failed to create alert')
-            logger.error('Success == ' + str(result['success']))
-            pp.pprint(result)
+            logger.error('Failed to create alert for row ' + str(result.index))
+            logger.error('Error == ' + str(result.error))
+            pp.pprint(result.response)
+
+logger.info('Created {} alerts, {} failed, {:.1f} alerts/s'.format(bulk.summary.succeeded,
+                                                                 bulk.summary.failed,
+                                                                 bulk.summary.throughput))
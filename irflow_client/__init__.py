@@ -3,5 +3,8 @@
 
 try:
     from irflow_client.irflow_client import IRFlowClient
+    from irflow_client.async_client import AsyncIRFlowClient
 except ImportError:
     from irflow_client import IRFlowClient
+
+__all__ = ['IRFlowClient', 'AsyncIRFlowClient']
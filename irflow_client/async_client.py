@@ -0,0 +1,892 @@
+"""Asyncio flavour of the IR-Flow REST API client
+
+The :class:`AsyncIRFlowClient` exposes the same methods as
+:class:`irflow_client.irflow_client.IRFlowClient`, but every API call is a coroutine built on
+``aiohttp``, so a single event loop can keep many IR-Flow calls in flight at once.
+
+``aiohttp`` is an optional dependency, install it with ``pip install irflow_client[async]``.
+"""
+import asyncio
+import functools
+import json as json_module
+import os
+import time
+
+from .bulk import AsyncBulkOperation
+from .coalesce import AsyncSingleFlight
+from .deadline import Deadline
+from .dedup import content_digest
+from .downloads import AsyncDownloadOperation, AttachmentBuffer, content_length, content_range
+from .facts import FactGroup
+from .dispatch import _CONTENT_TYPE_HEADERS, _JSON_HEADERS
+from .exceptions import IRFlowClientConfigError, IRFlowDownloadError, IRFlowMaintenanceError
+from .irflow_client import IRFlowClient
+from .metrics import body_size
+from .multipart import MultipartUpload
+from .outbox import REFUSED_STATUSES, TRANSIENT_STATUSES
+from .retry import CONNECT_ERRORS, TRANSPORT_ERRORS
+from .writebehind import AsyncFactGroupWriter
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+
+class _Response(object):
+    """Status, headers and body of an ``aiohttp`` response, read like a ``requests.Response``
+    by the retry loop shared with :class:`IRFlowClient`
+
+    Args:
+        response (aiohttp.ClientResponse): The response
+        content (bytes): The body, `None` while it is still to be read from `raw`
+    """
+
+    def __init__(self, response, content=None):
+        self.raw = response
+        self.status_code = response.status
+        self.reason = response.reason
+        self.headers = response.headers
+        self.request_info = response.request_info
+        self.content = content
+
+    def close(self):
+        """Release the connection, also when the body was not read to the end"""
+        self.raw.release()
+
+
+def _coroutine(name):
+    """Helper function to run an endpoint method of :class:`IRFlowClient` as a coroutine
+
+    The method builds its request and returns the result of ``self._dispatch(...)``, which is a
+    coroutine on :class:`AsyncIRFlowClient`, so the payload of every endpoint is written once.
+
+    Args:
+        name (str): The name of the :class:`IRFlowClient` method
+
+    Returns:
+        function: The coroutine function
+    """
+    method = getattr(IRFlowClient, name)
+
+    @functools.wraps(method)
+    async def dispatch(self, *args, **kwargs):
+        return await method(self, *args, **kwargs)
+
+    return dispatch
+
+
+class AsyncIRFlowClient(IRFlowClient):
+    """Asyncio SDK for the IR-Flow REST API.
+
+    All API methods of :class:`IRFlowClient` are available as coroutines with the same
+    arguments and return values. The client owns a single, bounded ``aiohttp`` connection pool
+    that is shared by every call; close it with :func:`close` or use the client as an async
+    context manager::
+
+        async with AsyncIRFlowClient(config_file='api.conf') as irfc:
+            alerts = await asyncio.gather(*[irfc.get_alert(num) for num in alert_nums])
+    """
+    # Set by awaiting get_version, the lazy property of IRFlowClient cannot await
+    version = None
+
+    def __init__(self, config_args=None, config_file=None, max_connections=100,
+                 max_connections_per_host=0, connector=None, tracer=None):
+        """Create an asyncio API Client instance
+
+        Calls are retried, timed out and limited exactly like those of :class:`IRFlowClient`,
+        `request_options` included. Unlike :class:`IRFlowClient` the server version is not
+        requested on creation, await :func:`get_version` if it is needed, and the pool options
+        of ``requests`` are replaced by `max_connections` and `max_connections_per_host`.
+
+        Args:
+             config_args (dict): Key, Value pairs of IR-Flow API configuration options
+             config_file (str): Path to a valid Ir-Flow configuration file
+             max_connections (int): Upper bound of open connections in the pool, default = 100
+             max_connections_per_host (int): Upper bound of open connections to a single host,
+                0 means no per host limit, default = 0
+             connector (aiohttp.BaseConnector): An existing connector to share between several
+                clients. The client will not close a connector it did not create.
+             tracer (irflow_client.tracing.Tracer): Creates a span for every call and sends its
+                trace context to IR-Flow, default = no tracing
+
+        Raises:
+            IRFlowClientConfigError: `cache_responses` is configured, the response cache is not
+                supported by the asyncio client
+        """
+        if aiohttp is None:
+            raise ImportError('AsyncIRFlowClient requires aiohttp, install it with '
+                              '"pip install irflow_client[async]"')
+
+        self._setup(config_args, config_file, tracer)
+        if self.cache_responses:
+            raise IRFlowClientConfigError('cache_responses is not supported by '
+                                          'AsyncIRFlowClient')
+        self.response_cache = None
+
+        self.max_connections = max_connections
+        self.max_connections_per_host = max_connections_per_host
+        self._connector = connector
+        self._connector_owner = connector is None
+        self.session = None
+        self.request_coalescer = AsyncSingleFlight() if self.coalesce_requests else None
+
+        self.headers = {
+            'User-Agent': IRFlowClient._build_user_agent(),
+            'X-Authorization': '{} {}'.format(self.api_user, self.api_key)
+        }
+
+    def __enter__(self):
+        raise TypeError('AsyncIRFlowClient must be used with "async with"')
+
+    async def __aenter__(self):
+        await self._get_session()
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    async def close(self):
+        """Close the underlying ``aiohttp`` session and, if owned by this client, its pool,
+        then the recording file and the outbox"""
+        if self.session is not None:
+            await self.session.close()
+            self.session = None
+        self._close_files()
+
+    async def _get_session(self):
+        """Helper function to lazily create the ``aiohttp`` session inside the running loop
+
+        Returns:
+            aiohttp.ClientSession: The session shared by every call of this client
+        """
+        if self.session is None or self.session.closed:
+            if self._connector is None or (self._connector_owner and self._connector.closed):
+                self._connector = aiohttp.TCPConnector(
+                    limit=self.max_connections,
+                    limit_per_host=self.max_connections_per_host,
+                    ssl=False
+                )
+            # Every request passes its own timeout, see _fetch
+            self.session = aiohttp.ClientSession(connector=self._connector,
+                                                 connector_owner=self._connector_owner,
+                                                 headers=self.headers)
+        return self.session
+
+    @staticmethod
+    def _encode_params(params):
+        """Helper function to encode query parameters the same way ``requests`` does
+
+        Args:
+            params (dict): Key, Value pairs of query parameters
+
+        Returns:
+            dict: The parameters with every value converted to a string
+        """
+        if params is None:
+            return None
+        return {key: str(value) for key, value in params.items() if value is not None}
+
+    @staticmethod
+    def _client_timeout(timeout):
+        """Helper function to convert a ``requests`` timeout to an ``aiohttp`` one
+
+        Args:
+            timeout (tuple or float): A (connect, read) tuple or a single timeout in seconds
+
+        Returns:
+            aiohttp.ClientTimeout: The timeout of the connection and of every read
+        """
+        connect, read = timeout if isinstance(timeout, tuple) else (timeout, timeout)
+        return aiohttp.ClientTimeout(sock_connect=connect, sock_read=read)
+
+    @staticmethod
+    def _never_delivered(exc):
+        """Helper function to tell whether a failed request certainly did not reach IR-Flow
+
+        Args:
+            exc (Exception): The error the request failed with
+
+        Returns:
+            bool: `True` if the server refused it or the connection was never established
+        """
+        return isinstance(exc, (IRFlowMaintenanceError, aiohttp.ClientConnectorError) +
+                          CONNECT_ERRORS)
+
+    async def _dispatch(self, endpoint, method, heading, path_args=None, suffix=None,
+                        headers=_JSON_HEADERS, json=None, params=None):
+        """Helper function to call a json endpoint of the IR-Flow API
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            heading (str): A string heading for debug messages
+            path_args (tuple): Values for the placeholders of the endpoint path, if any
+            suffix (str): A path segment to append to the endpoint path, if any
+            headers (dict): The headers of this request, json content type by default
+            json (dict): Data to send as a json body, if any
+            params (dict): Key, Value pairs of query parameters, if any
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        return await self._request(endpoint, heading, method,
+                                   self._url(endpoint, path_args, suffix), headers=headers,
+                                   json=json, params=params)
+
+    async def _request(self, endpoint, heading, method, url, headers=None, json=None,
+                       params=None, data=None):
+        """Helper function to send a request and decode the json response
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            heading (str): A string heading for debug messages
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            headers (dict): The headers of this request
+            json (dict): Data to send as a json body
+            params (dict): Key, Value pairs of query parameters
+            data (irflow_client.multipart.MultipartUpload): A streamed request body
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        if self.debug:
+            self.dump_request_debug_info(heading, url, headers, data=json, params=params)
+
+        if method == 'GET' and self.request_coalescer is not None:
+            # Concurrent identical GETs share the response, each caller decodes its own copy
+            key = self._coalesce_key(url, self._encode_params(params), headers)
+            response = await self.request_coalescer.do(
+                key, lambda: self._send(endpoint, 'GET', url, headers=headers, params=params))
+        else:
+            try:
+                response = await self._send(endpoint, method, url, headers=headers, json=json,
+                                            params=params, data=data)
+            except (IRFlowMaintenanceError,) + TRANSPORT_ERRORS as exc:
+                if self.outbox is None or endpoint not in self.outbox_endpoints:
+                    raise
+                # A single local SQLite insert, cheap enough not to need an executor
+                return self._defer(endpoint, method, url, headers, json,
+                                   '{}: {}'.format(exc.__class__.__name__, exc),
+                                   not self._never_delivered(exc))
+            if self.outbox is not None and response.status_code in TRANSIENT_STATUSES and \
+                    endpoint in self.outbox_endpoints:
+                return self._defer(endpoint, method, url, headers, json,
+                                   'HTTP {}'.format(response.status_code),
+                                   response.status_code not in REFUSED_STATUSES)
+        body = self._loads(response.content)
+
+        if self.debug:
+            self.dump_response_debug_info(heading, response.status_code, body)
+
+        return body
+
+    @staticmethod
+    def _loads(content):
+        """Helper function to decode a json body like ``aiohttp``, `None` if it is empty"""
+        return json_module.loads(content) if content.strip() else None
+
+    async def _send(self, endpoint, method, url, **kwargs):
+        """Helper function to send a request to the IR-Flow API, retrying failures
+
+        The attempts are made by the loop shared with :class:`IRFlowClient`, see
+        :func:`IRFlowClient._attempts`. The call is recorded in `metrics` if metrics are
+        collected, wrapped in a span if the client has a tracer and appended to the recording
+        if a `record_file` is configured.
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            **kwargs: The `headers`, `json`, `params` and streamed `data` of the request, and
+                `stream` to return before reading the body
+
+        Returns:
+            _Response: The response of the last attempt, its body read unless `stream` is set
+
+        Raises:
+            IRFlowMaintenanceError: The server still answers HTTP 503 after all retries
+            IRFlowCircuitOpenError: The circuit breaker is open, IR-Flow was not called
+        """
+        session = await self._get_session()
+        span = None
+        if self.tracer is not None:
+            span = self.tracer.start_span(
+                endpoint,
+                attributes=self._trace_attributes(endpoint, method, url, kwargs.get('json')))
+            kwargs['headers'] = dict(kwargs.get('headers') or {}, traceparent=span.traceparent)
+        started = time.perf_counter()
+        try:
+            response, retries = await self._send_retrying(session, endpoint, method, url,
+                                                          kwargs)
+        except Exception as exc:
+            if self.metrics is not None:
+                self.metrics.record(endpoint, time.perf_counter() - started,
+                                    exc.__class__.__name__)
+            if span is not None:
+                span.record_error(exc)
+                span.end()
+            raise
+        elapsed = time.perf_counter() - started
+        stream = kwargs.get('stream')
+        sent = received = 0
+        if self.metrics is not None or span is not None or self.recorder is not None:
+            sent = self._request_size(kwargs)
+            # A streamed body is still to be read, count what the server announced
+            received = self._response_size(response, stream)
+        if self.metrics is not None:
+            self.metrics.record(endpoint, elapsed, response.status_code, sent, received, retries)
+        if self.recorder is not None:
+            request_info = response.request_info
+            self.recorder.record(endpoint, method, request_info.url.raw_path_qs,
+                                 request_info.headers, kwargs.get('json'), sent,
+                                 response.status_code, response.headers,
+                                 None if stream else response.content, elapsed, received)
+        if span is not None:
+            span.set_attribute('http.status_code', response.status_code)
+            span.set_attribute('http.request_content_length', sent)
+            span.set_attribute('http.response_content_length', received)
+            span.set_attribute('irflow.retries', retries)
+            if response.status_code >= 400:
+                span.record_error('HTTP {}'.format(response.status_code))
+            span.end()
+        if response.status_code == 503:
+            response.close()
+            raise IRFlowMaintenanceError('IR-Flow Server is down for maintenance')
+        return response
+
+    @staticmethod
+    def _request_size(kwargs):
+        """Helper function to return the body size of a request, as sent by ``aiohttp``"""
+        if kwargs.get('json') is not None:
+            return len(json_module.dumps(kwargs['json']).encode('utf-8'))
+        return body_size(kwargs.get('data'))
+
+    async def _send_retrying(self, session, endpoint, method, url, kwargs):
+        """Helper function to send a request, retrying failures according to the retry policy
+
+        Args:
+            session (aiohttp.ClientSession): The session of the client
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            kwargs (dict): The keyword arguments of :func:`_send`
+
+        Returns:
+            tuple: (the response of the last attempt, number of retries)
+        """
+        attempts = self._attempts(endpoint, method, url, kwargs)
+        try:
+            wait = next(attempts)
+            while True:
+                if wait is not None:
+                    await asyncio.sleep(wait)
+                    wait = next(attempts)
+                    continue
+                try:
+                    response = await self._fetch(session, method, url, kwargs)
+                except BaseException as exc:
+                    wait = attempts.throw(exc)
+                else:
+                    wait = attempts.send(response)
+        except StopIteration as done:
+            return done.value
+        finally:
+            # Settles the attempt of a wait that was cancelled
+            attempts.close()
+
+    async def _fetch(self, session, method, url, kwargs):
+        """Helper function to make one attempt of a request
+
+        Args:
+            session (aiohttp.ClientSession): The session of the client
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            kwargs (dict): The keyword arguments of :func:`_send`, with the `timeout` of the
+                attempt
+
+        Returns:
+            _Response: The response, its body read unless `stream` is set
+        """
+        data = kwargs.get('data')
+        response = await session.request(
+            method, url, headers=kwargs.get('headers'), json=kwargs.get('json'),
+            data=self._stream_body(data) if data is not None else None,
+            params=self._encode_params(kwargs.get('params')), ssl=False,
+            timeout=self._client_timeout(kwargs['timeout']))
+        if kwargs.get('stream'):
+            return _Response(response)
+        try:
+            return _Response(response, await response.read())
+        finally:
+            response.release()
+
+    def dump_request_debug_info(self, heading, url, headers=None, data=None, params=None):
+        """Helper function to dump request info to the debug stream on the logging bus
+
+        Args:
+            heading (str): A string heading for the debug message - typically the name of the
+                endpoint being queried
+            url (str): The full url of the API endpoint
+            headers (dict): The headers of this request, if desired
+            data (dict): Key, Value pairs of data in the body of a request, if desired
+            params (dict): Key, Value pairs of parameters passed in a request, if desired
+        """
+        debug_string = '========== {} ==========\n' \
+                       'URL: "{}"\n' \
+                       'Session Headers: "{}"'.format(heading, url, self.headers)
+        if headers:
+            debug_string += '\nHeaders: "{}"'.format(headers)
+        if data:
+            debug_string += '\nBody: "{}"'.format(data)
+        if params:
+            debug_string += '\nParams: "{}"'.format(params)
+
+        self.logger.debug(debug_string)
+
+    async def get_version(self):
+        """Function to get Current IR-Flow Version
+
+        Returns:
+            str: IR-Flow Version Number
+                Example: 4.6.0"""
+        response = await self._dispatch('version', 'GET', 'Get Version',
+                                        headers=_CONTENT_TYPE_HEADERS)
+
+        self.version = str(response['data']['version'])
+        if self.version_cache is not None:
+            self.version_cache.set(self._version_cache_key(), self.version)
+
+        return self.version
+
+    # The remaining endpoint methods only build a request for _dispatch, they are shared with
+    # IRFlowClient and awaited here
+    close_alert = _coroutine('close_alert')
+    assign_user_to_alert = _coroutine('assign_user_to_alert')
+    attach_incident_to_alert = _coroutine('attach_incident_to_alert')
+    get_alert = _coroutine('get_alert')
+    put_fact_group = _coroutine('put_fact_group')
+    get_fact_group = _coroutine('get_fact_group')
+    create_incident = _coroutine('create_incident')
+    get_incident = _coroutine('get_incident')
+    update_incident = _coroutine('update_incident')
+    attach_alert_to_incident = _coroutine('attach_alert_to_incident')
+    list_picklists = _coroutine('list_picklists')
+    get_picklist = _coroutine('get_picklist')
+    add_item_to_picklist = _coroutine('add_item_to_picklist')
+    list_picklist_items = _coroutine('list_picklist_items')
+    create_picklist_item = _coroutine('create_picklist_item')
+    get_picklist_item = _coroutine('get_picklist_item')
+    restore_picklist_item = _coroutine('restore_picklist_item')
+    delete_picklist_item = _coroutine('delete_picklist_item')
+    create_object_type = _coroutine('create_object_type')
+    attach_field_to_object_type = _coroutine('attach_field_to_object_type')
+
+    async def _upload_attachment(self, heading, object_type, object_id, source,
+                                 attachment_name, progress):
+        """Helper function to stream a file to IR-Flow as a multipart attachment
+
+        Args:
+            heading (str): A string heading for debug messages
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object to which the file should be uploaded
+            source (str or file or bytes): The path to the file, an open binary file object or
+                the content to be uploaded
+            attachment_name (str): The file name shown in IR-Flow
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        url = self._url('put_attachment', (object_type, object_id))
+
+        content = None
+        if self.upload_index is not None:
+            content = await asyncio.get_event_loop().run_in_executor(None, content_digest, source)
+            skipped = self._skip_uploaded(heading, object_type, object_id, content)
+            if skipped is not None:
+                return skipped
+
+        with MultipartUpload(source, attachment_name, progress=progress) as body:
+            headers = {'Content-Type': body.content_type}
+            if body.len is not None:
+                headers['Content-Length'] = str(body.len)
+            result = await self._request('put_attachment', heading, 'POST', url, headers=headers,
+                                         data=body)
+            self._record_upload(object_type, object_id, content, body.name, result)
+        return result
+
+    @staticmethod
+    async def _stream_body(body):
+        """Helper function to read a streamed body in the default executor, off the event loop
+
+        A new stream is made for every attempt, the body is rewound before a retry.
+
+        Args:
+            body (irflow_client.multipart.MultipartUpload): The body to send
+        """
+        loop = asyncio.get_event_loop()
+        while True:
+            chunk = await loop.run_in_executor(None, body.read)
+            if not chunk:
+                return
+            yield bytes(chunk)
+
+    async def upload_attachment_to_alert(self, alert_num, filename, attachment_name=None,
+                                         progress=None):
+        """Upload an attachment to the specified alert
+
+        Args:
+            alert_num (int): The IR-Flow Assigned Alert number of the
+                Alert to which the desired filed should be uploaded
+            filename (str or file or bytes): The path to the file to be uploaded, or an open
+                binary file object or bytes to upload instead
+            attachment_name (str): The file name shown in IR-Flow, defaults to the base name of
+                the file, or `attachment` for bytes
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        return await self._upload_attachment('Upload Attachment to Alert', 'alerts',
+                                             alert_num, filename, attachment_name, progress)
+
+    async def upload_attachment_to_incident(self, incident_id, filename, attachment_name=None,
+                                            progress=None):
+        """Upload an attachment to the specified incident
+
+        Args:
+            incident_id (int): The ID of the Incident to which the desired file should be uploaded
+            filename (str or file or bytes): The path to the file to be uploaded, or an open
+                binary file object or bytes to upload instead
+            attachment_name (str): The file name shown in IR-Flow, defaults to the base name of
+                the file, or `attachment` for bytes
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        return await self._upload_attachment('Upload Attachment to Incident', 'incidents',
+                                             incident_id, filename, attachment_name,
+                                             progress)
+
+    async def upload_attachment_to_task(self, task_id, filename, attachment_name=None,
+                                        progress=None):
+        """Upload an attachment to the specified task
+
+        Args:
+            task_id (int): The ID of the task to which the desired file should be uploaded
+            filename (str or file or bytes): The path to the file to be uploaded, or an open
+                binary file object or bytes to upload instead
+            attachment_name (str): The file name shown in IR-Flow, defaults to the base name of
+                the file, or `attachment` for bytes
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        return await self._upload_attachment('Upload Attachment to Task', 'tasks',
+                                             task_id, filename, attachment_name, progress)
+
+    async def download_attachment(self, attachment_id, attachment_output_file):
+        """Download the attachment with the specified ID
+
+        Args:
+            attachment_id (int): The ID of the attachment to be downloaded
+            attachment_output_file (str): The full path to the file on disk
+                to which the desired attachment should be saved
+        """
+        url = self._url('get_attachment', (attachment_id,))
+
+        if self.debug:
+            self.dump_request_debug_info('Download Attachment', url)
+
+        response = await self._send('get_attachment', 'GET', url, stream=True)
+        try:
+            with open(attachment_output_file, 'wb') as handle:
+                async for block in response.raw.content.iter_chunked(self.download_chunk_size):
+                    handle.write(block)
+        finally:
+            response.close()
+
+        if self.debug:
+            self.dump_response_debug_info('Download Attachment', response.status_code,
+                                          {"response": response.status_code})
+
+    def download_attachments(self, attachment_ids, directory, max_workers=4, max_resumes=3,
+                             ordered=False, adaptive=False):
+        """Download many attachments concurrently, each to `<directory>/<attachment_id>`
+
+        See :func:`irflow_client.irflow_client.IRFlowClient.download_attachments`, iterate
+        the result with ``async for``.
+
+        Args:
+            attachment_ids (iterable of int): The IDs of the attachments, consumed lazily
+            directory (str): The directory to save the attachments in, created if missing
+            max_workers (int): The number of downloads kept in flight, default = 4
+            max_resumes (int): Connection drops survived per attachment, default = 3
+            ordered (bool): Yield results in input order if `True`, or as soon as they
+                complete if `False` (default)
+            adaptive (bool): Adapt the number of downloads in flight to the latency and
+                failures observed, with `max_workers` as the upper bound, see
+                :class:`irflow_client.concurrency.AdaptiveConcurrencyLimiter`
+
+        Returns:
+            irflow_client.downloads.AsyncDownloadOperation: An async iterable of
+                :class:`irflow_client.bulk.BulkResult`
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        async def download(attachment_id):
+            return await self._download_resumable(attachment_id,
+                                                  os.path.join(directory, str(attachment_id)),
+                                                  max_resumes)
+
+        return AsyncDownloadOperation(download, attachment_ids, max_workers=max_workers,
+                                      ordered=ordered,
+                                      limiter=self._concurrency_limiter(
+                                          adaptive, max_workers, 'download_attachments'))
+
+    async def _download_resumable(self, attachment_id, path, max_resumes):
+        """Helper function to download an attachment to `path`, resuming after connection drops
+
+        Args:
+            attachment_id (int): The ID of the attachment to be downloaded
+            path (str): The file to save the attachment in
+            max_resumes (int): Connection drops to recover from before giving up
+
+        Returns:
+            dict: `attachment_id`, `path`, `size`, `transferred`, `resumed_from` and `resumes`
+        """
+        url = self._url('get_attachment', (attachment_id,))
+        part_path = path + '.part'
+        if os.path.exists(path) and not os.path.exists(part_path):
+            os.replace(path, part_path)
+        offset = resumed_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        transferred = 0
+        resumes = 0
+
+        while True:
+            headers = {'Accept-Encoding': 'identity'}
+            if offset:
+                headers['Range'] = 'bytes=%d-' % offset
+            if self.debug:
+                self.dump_request_debug_info('Download Attachment', url, headers=headers)
+            try:
+                response = await self._send('get_attachment', 'GET', url, stream=True,
+                                            headers=headers)
+                try:
+                    if response.status_code == 416 and offset:
+                        size = (content_range(response) or (None, None, None))[2]
+                        if size == offset:
+                            break
+                        offset = 0
+                        continue
+                    response.raw.raise_for_status()
+
+                    if response.status_code == 206:
+                        first, _, size = content_range(response) or (None, None, None)
+                        if first != offset:
+                            raise IRFlowDownloadError(
+                                'Asked for byte {} of attachment {}, received byte {}'.format(
+                                    offset, attachment_id, first))
+                        mode = 'ab'
+                    else:
+                        size = content_length(response)
+                        offset = 0
+                        mode = 'wb'
+
+                    with open(part_path, mode) as handle:
+                        async for block in response.raw.content.iter_chunked(
+                                self.download_chunk_size):
+                            handle.write(block)
+                            offset += len(block)
+                            transferred += len(block)
+                finally:
+                    response.close()
+
+                if size is None or offset == size:
+                    break
+                if offset > size:
+                    raise IRFlowDownloadError('Attachment {} is {} bytes, expected {}'.format(
+                        attachment_id, offset, size))
+                raise aiohttp.ClientPayloadError(
+                    'Attachment {} ended after {} of {} bytes'.format(attachment_id, offset,
+                                                                      size))
+            except (aiohttp.ClientConnectionError, aiohttp.ClientPayloadError,
+                    asyncio.TimeoutError) as exc:
+                if resumes >= max_resumes:
+                    raise
+                resumes += 1
+                self.logger.info('Resuming attachment {} at byte {} ({}), attempt {}'.format(
+                    attachment_id, offset, exc.__class__.__name__, resumes))
+
+        os.replace(part_path, path)
+        return {'success': True, 'attachment_id': attachment_id, 'path': path, 'size': offset,
+                'transferred': transferred, 'resumed_from': resumed_from, 'resumes': resumes}
+
+    async def download_attachment_buffer(self, attachment_id, chunk_size=None,
+                                         spill_threshold=None):
+        """Download an attachment to memory, or to a temporary file if it is large
+
+        Args:
+            attachment_id (int): The ID of the attachment to be downloaded
+            chunk_size (int): Largest read in bytes, defaults to `download_chunk_size`
+            spill_threshold (int): Largest attachment kept in memory in bytes, defaults to
+                `download_spill_threshold`
+
+        Returns:
+            irflow_client.downloads.AttachmentBuffer: The attachment content
+        """
+        url = self._url('get_attachment', (attachment_id,))
+
+        if self.debug:
+            self.dump_request_debug_info('Download Attachment Buffer', url)
+
+        response = await self._send('get_attachment', 'GET', url, stream=True)
+        try:
+            attachment = AttachmentBuffer(content_length(response),
+                                          spill_threshold or self.download_spill_threshold,
+                                          response.raw.charset)
+            try:
+                async for chunk in response.raw.content.iter_chunked(
+                        chunk_size or self.download_chunk_size):
+                    attachment.write(chunk)
+            except BaseException:
+                attachment.close()
+                raise
+        finally:
+            response.close()
+
+        if self.debug:
+            self.dump_response_debug_info('Download Attachment Buffer', response.status_code,
+                                          {"response": response.status_code,
+                                           "size": attachment.size})
+
+        return attachment
+
+    async def download_attachment_string(self, attachment_id, encoding=None):
+        """Download an attachment and return its contents
+
+        Args:
+            attachment_id (int): The ID of the attachment to be downloaded
+            encoding (str): Decode the contents with this encoding, default = return bytes
+
+        Returns:
+            bytes: The contents of the downloaded file, decoded to str if `encoding` is given
+        """
+        with await self.download_attachment_buffer(attachment_id) as attachment:
+            if encoding is not None:
+                return attachment.text(encoding)
+            return attachment.getvalue()
+
+    def fact_group_writer(self, max_updates=20, max_delay=0.5):
+        """Create a write-behind buffer merging updates of the same fact group into one call
+
+        See :func:`irflow_client.irflow_client.IRFlowClient.fact_group_writer`, use the result
+        as an async context manager.
+
+        Args:
+            max_updates (int): Pending updates of a fact group that trigger a write,
+                default = 20
+            max_delay (float): Seconds the oldest pending update may wait, default = 0.5
+
+        Returns:
+            irflow_client.writebehind.AsyncFactGroupWriter: The writer, close it when done
+        """
+        return AsyncFactGroupWriter(self.put_fact_group, max_updates=max_updates,
+                                    max_delay=max_delay)
+
+    async def get_fact_group_view(self, fact_group_id):
+        """Retrieve the specified fact group as a view indexed by field name and id
+
+        Args:
+            fact_group_id (int): The IR-Flow assigned ID of the fact_group to retrieve
+
+        Returns:
+            irflow_client.facts.FactGroup: The fact group, its `response` attribute holds the
+                full json response object from the IR-Flow API
+        """
+        return FactGroup.from_response(await self.get_fact_group(fact_group_id))
+
+    async def create_alert(self, alert_fields, description=None, incoming_field_group_name=None,
+                           suppress_missing_field_warning=False):
+        """Create an alert of the desired field group name with the specified fields and description
+
+        Args:
+            alert_fields (dict): Key, Value pairs of fields configured in IR-Flow and their values
+            description (str): An optional string description for the alert
+            incoming_field_group_name (str): The string name of the incoming
+                field group name for this alert as specified in IR-Flow
+            suppress_missing_field_warning (bool): Suppress the API warnings indicating
+                missing fields if `True` - defaults to `False`
+
+        Returns:
+            dict: The full json response object from the IR-Flow API
+        """
+        params = {
+            'fields': alert_fields,
+            'suppress_missing_field_warning': suppress_missing_field_warning
+        }
+        if description is not None:
+            params['description'] = description
+        if incoming_field_group_name is not None:
+            params['data_field_group_name'] = incoming_field_group_name
+
+        if self.alert_dedup is None:
+            return await self._dispatch('create_alert', 'POST', 'Create Alert', json=params)
+
+        fingerprint, suppressed = self._check_duplicate_alert(alert_fields,
+                                                              incoming_field_group_name)
+        if suppressed is not None:
+            return suppressed
+        result = None
+        try:
+            result = await self._dispatch('create_alert', 'POST', 'Create Alert', json=params)
+        finally:
+            self._settle_alert(fingerprint, result)
+        return result
+
+    def create_alerts(self, alerts_fields, description=None, incoming_field_group_name=None,
+                      suppress_missing_field_warning=False, max_workers=8, ordered=True,
+                      deadline=None, adaptive=False):
+        """Create many alerts concurrently, one per dict of alert fields
+
+        Iterate the returned object with ``async for``; afterwards its `summary` attribute
+        holds the aggregate throughput and latency.
+
+        Args:
+            alerts_fields (iterable of dict): Key, Value pairs of fields for each alert
+            description (str): An optional string description for every alert
+            incoming_field_group_name (str): The string name of the incoming
+                field group name for these alerts as specified in IR-Flow
+            suppress_missing_field_warning (bool): Suppress the API warnings indicating
+                missing fields if `True` - defaults to `False`
+            max_workers (int): The number of alerts kept in flight, default = 8
+            ordered (bool): Yield results in input order if `True` (default), or as soon as
+                they complete if `False`
+            deadline (float): Time budget in seconds for the whole operation. Once spent, no
+                further input is read, calls in flight fail with a timeout and the summary is
+                flagged with `deadline_exceeded`.
+            adaptive (bool): Adapt the number of alerts in flight to the latency and
+                failures observed, with `max_workers` as the upper bound, see
+                :class:`irflow_client.concurrency.AdaptiveConcurrencyLimiter`
+
+        Returns:
+            irflow_client.bulk.AsyncBulkOperation: An async iterable of
+                :class:`irflow_client.bulk.BulkResult`
+        """
+        deadline = Deadline.coerce(deadline)
+
+        async def create(alert_fields):
+            with self.request_options(deadline=deadline):
+                return await self.create_alert(
+                    alert_fields, description=description,
+                    incoming_field_group_name=incoming_field_group_name,
+                    suppress_missing_field_warning=suppress_missing_field_warning)
+
+        return AsyncBulkOperation(create, alerts_fields, max_workers=max_workers, ordered=ordered,
+                                  deadline=deadline, limiter=self._concurrency_limiter(adaptive, max_workers,
+                                                                    'create_alerts'))
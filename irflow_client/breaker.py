@@ -0,0 +1,193 @@
+"""Circuit breaker for IR-Flow outages and maintenance
+
+With ``circuit_breaking`` configured, every request of a client passes the client's
+:class:`CircuitBreaker` first. The breaker counts consecutive failed requests, connection
+errors, timeouts and HTTP 502, 503 and 504 answers, retries included. Once
+`failure_threshold` of them happened in a row, the circuit opens: for `reset_timeout` seconds,
+or as long as a ``Retry-After`` of IR-Flow asks for, every call of every method of the client
+fails at once with :class:`irflow_client.irflow_client.IRFlowCircuitOpenError` instead of
+waiting for its timeout.
+
+After that the circuit is half-open: up to `half_open_probes` calls are let through as
+trial probes while the others keep failing fast. A successful probe closes the circuit, a
+failed one opens it again::
+
+    irfc = IRFlowClient(dict(config, circuit_breaking=True))
+    try:
+        irfc.get_alert(alert_num)
+    except IRFlowCircuitOpenError as exc:
+        print('IR-Flow is unavailable, try again in {:.0f}s'.format(exc.retry_after))
+"""
+import logging
+import threading
+from time import monotonic
+
+CLOSED = 'closed'
+OPEN = 'open'
+HALF_OPEN = 'half_open'
+
+# Values of the `circuit_state` gauge, by state
+STATE_VALUES = {CLOSED: 0, HALF_OPEN: 1, OPEN: 2}
+
+# Responses telling that IR-Flow or the proxy in front of it is unavailable
+FAILURE_STATUSES = frozenset([502, 503, 504])
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class CircuitBreaker(object):
+    """Closed, open and half-open circuit over the requests of one client, thread safe
+
+    Args:
+        failure_threshold (int): Consecutive failed requests opening the circuit, default = 5
+        reset_timeout (float): Seconds the circuit stays open before probing, default = 30
+        half_open_probes (int): Trial requests let through at once while half-open,
+            default = 1
+        failure_statuses (frozenset): HTTP statuses counted as failures,
+            default = `FAILURE_STATUSES`
+        metrics (irflow_client.metrics.ClientMetrics): Publishes the state as the
+            `circuit_state` gauge if given, 0 closed, 1 half-open and 2 open
+
+    Attributes:
+        opened (int): Times the circuit opened
+        rejected (int): Calls failed fast while the circuit was open
+    """
+
+    def __init__(self, failure_threshold=5, reset_timeout=30.0, half_open_probes=1,
+                 failure_statuses=FAILURE_STATUSES, metrics=None):
+        if failure_threshold < 1:
+            raise ValueError('failure_threshold must be at least 1')
+        self.failure_threshold = failure_threshold
+        self.reset_timeout = reset_timeout
+        self.half_open_probes = max(1, half_open_probes)
+        self.failure_statuses = frozenset(failure_statuses)
+        self.metrics = metrics
+        self.opened = 0
+        self.rejected = 0
+        self._state = CLOSED
+        self._failures = 0
+        self._open_until = 0.0
+        self._probes = 0
+        self._lock = threading.Lock()
+        self._publish(CLOSED)
+
+    def _publish(self, state):
+        if self.metrics is not None:
+            self.metrics.set_gauge('circuit_state', STATE_VALUES[state], None,
+                                   'State of the circuit breaker, 0 closed, 1 half-open, '
+                                   '2 open.')
+
+    def _current_state(self, now):
+        """Helper function to return the state, moving an expired open circuit to half-open"""
+        if self._state == OPEN and now >= self._open_until:
+            self._state = HALF_OPEN
+            self._probes = 0
+            logger.info('Circuit half-open, probing IR-Flow')
+            self._publish(HALF_OPEN)
+        return self._state
+
+    @property
+    def state(self):
+        """str: `closed`, `open` or `half_open`"""
+        with self._lock:
+            return self._current_state(monotonic())
+
+    @property
+    def retry_after(self):
+        """float: Seconds until the circuit lets a probe through, 0 if it is not open"""
+        with self._lock:
+            if self._current_state(monotonic()) != OPEN:
+                return 0.0
+            return max(0.0, self._open_until - monotonic())
+
+    def allow(self):
+        """Return whether a request may be sent now, counting it as a probe if half-open
+
+        Returns:
+            bool: `False` if the call has to fail fast
+        """
+        with self._lock:
+            state = self._current_state(monotonic())
+            if state == CLOSED:
+                return True
+            if state == HALF_OPEN and self._probes < self.half_open_probes:
+                self._probes += 1
+                return True
+            self.rejected += 1
+            return False
+
+    def record_success(self):
+        """Count a request IR-Flow answered, closing a half-open circuit"""
+        with self._lock:
+            self._failures = 0
+            if self._state == CLOSED:
+                return
+            self._state = CLOSED
+            logger.info('Circuit closed, IR-Flow answered a probe')
+        self._publish(CLOSED)
+
+    def record_failure(self, retry_after=None):
+        """Count a failed request, opening the circuit after too many in a row
+
+        A failed probe opens a half-open circuit again at once.
+
+        Args:
+            retry_after (float): Seconds IR-Flow asked clients to wait, keeps the circuit open
+                at least that long once it opens
+        """
+        with self._lock:
+            now = monotonic()
+            state = self._current_state(now)
+            self._failures += 1
+            if state == OPEN or (state == CLOSED and self._failures < self.failure_threshold):
+                return
+            self._state = OPEN
+            self._open_until = now + max(self.reset_timeout, retry_after or 0.0)
+            self.opened += 1
+            failures = self._failures
+        logger.warning('Circuit open after {} consecutive failures, failing calls fast for '
+                       '{:.1f}s'.format(failures, self._open_until - now))
+        self._publish(OPEN)
+
+    def record(self, status, retry_after=None):
+        """Count a request by the HTTP status of its response
+
+        Args:
+            status (int): The HTTP status
+            retry_after (float): The ``Retry-After`` of the response in seconds, if any
+        """
+        if status in self.failure_statuses:
+            self.record_failure(retry_after)
+        else:
+            self.record_success()
+
+    def release(self):
+        """Give back the probe slot of a request that got no answer
+
+        A request cancelled while it was sent, or failed by an error that says nothing about
+        IR-Flow being available, neither closes nor opens a half-open circuit; another call
+        may probe instead.
+        """
+        with self._lock:
+            if self._state == HALF_OPEN and self._probes > 0:
+                self._probes -= 1
+
+    def reset(self):
+        """Close the circuit and forget the failures counted so far"""
+        with self._lock:
+            self._state = CLOSED
+            self._failures = 0
+            self._probes = 0
+        self._publish(CLOSED)
+
+    def as_dict(self):
+        state = self.state
+        with self._lock:
+            return {'state': state, 'failures': self._failures, 'opened': self.opened,
+                    'rejected': self.rejected}
+
+    def __repr__(self):
+        return 'CircuitBreaker(state={}, opened={}, rejected={})'.format(self.state,
+                                                                        self.opened,
+                                                                        self.rejected)
@@ -0,0 +1,315 @@
+"""Helpers for running many IR-Flow API calls concurrently
+
+The :class:`BulkOperation` iterable is returned by bulk methods such as
+:func:`irflow_client.irflow_client.IRFlowClient.create_alerts`. It streams its input, keeps a
+bounded number of calls in flight on a thread pool and yields one :class:`BulkResult` per
+input item. Once the iteration is exhausted, :attr:`BulkOperation.summary` holds the aggregate
+throughput and latency figures. :class:`AsyncBulkOperation` is the asyncio counterpart used by
+:class:`irflow_client.async_client.AsyncIRFlowClient`. Given a
+:class:`irflow_client.concurrency.AdaptiveConcurrencyLimiter`, the number of calls in flight
+follows the limiter instead, up to `max_workers`.
+"""
+import asyncio
+from collections import deque
+from concurrent.futures import ThreadPoolExecutor, wait, FIRST_COMPLETED
+import time
+
+
+def percentile(sorted_values, pct):
+    """Helper function to return the nearest-rank percentile of an already sorted list
+
+    Args:
+        sorted_values (list): Values sorted in ascending order
+        pct (float): The desired percentile between 0 and 100
+
+    Returns:
+        float: The percentile value, `None` for an empty list
+    """
+    if not sorted_values:
+        return None
+    rank = int(round(pct / 100.0 * (len(sorted_values) - 1)))
+    return sorted_values[rank]
+
+
+class BulkResult(object):
+    """The outcome of a single call in a bulk operation
+
+    Attributes:
+        index (int): Position of the item in the input iterable
+        item: The input item
+        response (dict): The full json response object from the IR-Flow API, if any
+        error (Exception or str): The exception raised, or the API message of a failed call
+        latency (float): Seconds spent on this call
+    """
+    __slots__ = ('index', 'item', 'response', 'error', 'latency')
+
+    def __init__(self, index, item, response=None, error=None, latency=0.0):
+        self.index = index
+        self.item = item
+        self.response = response
+        self.error = error
+        self.latency = latency
+
+    @property
+    def success(self):
+        return self.error is None
+
+    @property
+    def queued(self):
+        """bool: The call was kept in the outbox of the client to be sent later"""
+        return isinstance(self.response, dict) and bool(self.response.get('queued'))
+
+    @property
+    def alert_num(self):
+        """int: The alert number of a created alert, `None` if unavailable"""
+        try:
+            return self.response['data']['alert']['alert_num']
+        except (KeyError, TypeError):
+            return None
+
+    def __repr__(self):
+        return 'BulkResult(index={}, success={}, latency={:.4f})'.format(self.index,
+                                                                         self.success,
+                                                                         self.latency)
+
+
+class BulkSummary(object):
+    """Aggregate figures of a finished bulk operation
+
+    Attributes:
+        total (int): Number of items processed
+        succeeded (int): Number of successful calls
+        failed (int): Number of failed calls
+        queued (int): Number of calls kept in the outbox of the client to be sent later
+        elapsed (float): Wall clock seconds of the whole operation
+        throughput (float): Items processed per second
+        latency_mean (float): Mean latency of a single call in seconds
+        latency_p50 (float): Median latency of a single call in seconds
+        latency_p99 (float): 99th percentile latency of a single call in seconds
+        latency_max (float): Slowest single call in seconds
+        deadline_exceeded (bool): The operation stopped reading input because its deadline
+            passed
+        bytes_transferred (int): Payload bytes moved by the operation, for transfers such as
+            attachment downloads
+        bytes_per_second (float): Aggregate transfer rate of the whole operation
+    """
+
+    def __init__(self, latencies, failed, elapsed, deadline_exceeded=False, bytes_transferred=0,
+                 queued=0):
+        latencies = sorted(latencies)
+        self.total = len(latencies)
+        self.failed = failed
+        self.queued = queued
+        self.succeeded = self.total - failed - queued
+        self.elapsed = elapsed
+        self.throughput = self.total / elapsed if elapsed > 0 else 0.0
+        self.latency_mean = sum(latencies) / self.total if self.total else None
+        self.latency_p50 = percentile(latencies, 50)
+        self.latency_p99 = percentile(latencies, 99)
+        self.latency_max = latencies[-1] if latencies else None
+        self.deadline_exceeded = deadline_exceeded
+        self.bytes_transferred = bytes_transferred
+        self.bytes_per_second = bytes_transferred / elapsed if elapsed > 0 else 0.0
+
+    def as_dict(self):
+        return dict(self.__dict__)
+
+    def __repr__(self):
+        return ('BulkSummary(total={total}, succeeded={succeeded}, failed={failed}, '
+                'elapsed={elapsed:.3f}s, throughput={throughput:.1f}/s)'.format(**self.__dict__))
+
+
+class BulkOperation(object):
+    """Iterable running `func` for each item of `items` with bounded concurrency
+
+    Args:
+        func (callable): Called as ``func(item)`` for each input item, returns the IR-Flow json
+            response
+        items (iterable): The input items, consumed lazily
+        max_workers (int): Number of calls kept in flight, default = 8
+        ordered (bool): Yield results in input order if `True`, else as they complete
+        deadline (irflow_client.deadline.Deadline): Stop reading input once it has passed
+        limiter (irflow_client.concurrency.AdaptiveConcurrencyLimiter): Decides how many of
+            the `max_workers` calls are kept in flight, default = all of them
+    """
+
+    def __init__(self, func, items, max_workers=8, ordered=True, deadline=None, limiter=None):
+        if max_workers < 1:
+            raise ValueError('max_workers must be at least 1')
+        self.func = func
+        self.items = items
+        self.max_workers = max_workers
+        self.ordered = ordered
+        self.deadline = deadline
+        self.limiter = limiter
+        self.deadline_exceeded = False
+        self.summary = None
+
+    def _bytes_transferred(self, result):
+        """Payload bytes moved by one call, added up in the summary. Bulk API calls move none."""
+        return 0
+
+    def _deadline_passed(self):
+        if self.deadline is not None and self.deadline.expired:
+            self.deadline_exceeded = True
+        return self.deadline_exceeded
+
+    def _in_flight_limit(self):
+        if self.limiter is None:
+            return self.max_workers
+        return min(self.max_workers, self.limiter.limit)
+
+    def _started(self):
+        return self.limiter.start() if self.limiter is not None else None
+
+    def _finished(self, result, window):
+        """Helper function to report a call to the limiter, only exceptions count as failures
+
+        An API message, e.g. a rejected field, says nothing about the load of IR-Flow.
+        """
+        if self.limiter is not None:
+            self.limiter.finish(result.latency, isinstance(result.error, Exception), window)
+        return result
+
+    def _call(self, index, item):
+        window = self._started()
+        start = time.time()
+        try:
+            response = self.func(item)
+        except Exception as exc:
+            return self._finished(BulkResult(index, item, error=exc,
+                                             latency=time.time() - start), window)
+        error = None
+        if isinstance(response, dict) and response.get('success') is False and \
+                not response.get('queued'):
+            error = response.get('message') or 'IR-Flow API call failed'
+        return self._finished(BulkResult(index, item, response, error, time.time() - start),
+                              window)
+
+    def __iter__(self):
+        latencies = []
+        failed = 0
+        queued = 0
+        transferred = 0
+        start = time.time()
+        items = enumerate(self.items)
+        pending = deque()
+
+        with ThreadPoolExecutor(max_workers=self.max_workers) as executor:
+            def submit_next():
+                if self._deadline_passed():
+                    return False
+                for index, item in items:
+                    pending.append(executor.submit(self._call, index, item))
+                    return True
+                return False
+
+            def fill():
+                while len(pending) < self._in_flight_limit() and submit_next():
+                    pass
+
+            fill()
+
+            while pending:
+                if self.ordered:
+                    done = [pending.popleft()]
+                else:
+                    done, _ = wait(pending, return_when=FIRST_COMPLETED)
+                    for future in done:
+                        pending.remove(future)
+                for future in done:
+                    result = future.result()
+                    latencies.append(result.latency)
+                    transferred += self._bytes_transferred(result)
+                    if not result.success:
+                        failed += 1
+                    elif result.queued:
+                        queued += 1
+                    fill()
+                    yield result
+
+        self.summary = BulkSummary(latencies, failed, time.time() - start,
+                                   self.deadline_exceeded, transferred, queued)
+
+
+class AsyncBulkOperation(BulkOperation):
+    """Async iterable running the coroutine function `func` for each item of `items`
+
+    Args:
+        func (callable): Coroutine function called as ``func(item)`` for each input item
+        items (iterable): The input items, consumed lazily
+        max_workers (int): Number of calls kept in flight, default = 8
+        ordered (bool): Yield results in input order if `True`, else as they complete
+        limiter (irflow_client.concurrency.AdaptiveConcurrencyLimiter): Decides how many of
+            the `max_workers` calls are kept in flight, default = all of them
+    """
+
+    async def _call(self, index, item):
+        window = self._started()
+        start = time.time()
+        try:
+            response = await self.func(item)
+        except Exception as exc:
+            return self._finished(BulkResult(index, item, error=exc,
+                                             latency=time.time() - start), window)
+        error = None
+        if isinstance(response, dict) and response.get('success') is False and \
+                not response.get('queued'):
+            error = response.get('message') or 'IR-Flow API call failed'
+        return self._finished(BulkResult(index, item, response, error, time.time() - start),
+                              window)
+
+    def __iter__(self):
+        raise TypeError('AsyncBulkOperation must be iterated with "async for"')
+
+    def __aiter__(self):
+        return self._run()
+
+    async def _run(self):
+        latencies = []
+        failed = 0
+        queued = 0
+        transferred = 0
+        start = time.time()
+        items = enumerate(self.items)
+        pending = deque()
+
+        def submit_next():
+            if self._deadline_passed():
+                return False
+            for index, item in items:
+                pending.append(asyncio.ensure_future(self._call(index, item)))
+                return True
+            return False
+
+        def fill():
+            while len(pending) < self._in_flight_limit() and submit_next():
+                pass
+
+        fill()
+
+        try:
+            while pending:
+                if self.ordered:
+                    done = [pending.popleft()]
+                    await done[0]
+                else:
+                    done, _ = await asyncio.wait(pending, return_when=asyncio.FIRST_COMPLETED)
+                    for task in done:
+                        pending.remove(task)
+                for task in done:
+                    result = task.result()
+                    latencies.append(result.latency)
+                    transferred += self._bytes_transferred(result)
+                    if not result.success:
+                        failed += 1
+                    elif result.queued:
+                        queued += 1
+                    fill()
+                    yield result
+        finally:
+            for task in pending:
+                task.cancel()
+
+        self.summary = BulkSummary(latencies, failed, time.time() - start,
+                                   self.deadline_exceeded, transferred, queued)
@@ -0,0 +1,259 @@
+"""Caches used by the IR-Flow REST API client
+
+:class:`VersionCache` persists the server version of each IR-Flow address on disk, so short
+lived scripts can skip the version request on start up.
+
+:class:`ResponseCache` keeps responses of read-mostly endpoints in memory, so repeated
+lookups of picklists, fact groups and the version are answered without a round trip.
+"""
+from collections import OrderedDict
+import json
+import os
+import tempfile
+import threading
+import time
+from time import monotonic
+
+
+class VersionCache(object):
+    """On-disk cache of IR-Flow server versions keyed by server url
+
+    The file is a small json document shared by every process using it. Writes replace it
+    atomically, so concurrent processes never read a partial file.
+
+    Args:
+        path (str): Path of the cache file
+        ttl (float): Seconds a cached version stays valid, default = 3600
+    """
+
+    def __init__(self, path, ttl=3600.0):
+        self.path = os.path.expanduser(path)
+        self.ttl = ttl
+
+    def _read(self):
+        try:
+            with open(self.path, 'r') as handle:
+                entries = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return {}
+        return entries if isinstance(entries, dict) else {}
+
+    def get(self, key):
+        """Return the cached version for `key`, `None` if missing or expired
+
+        Args:
+            key (str): The server url, e.g. `https://irflow.example.com`
+
+        Returns:
+            str: The cached version
+        """
+        entry = self._read().get(key)
+        if not entry or time.time() - entry.get('fetched', 0) > self.ttl:
+            return None
+        return entry.get('version')
+
+    def set(self, key, version):
+        """Store `version` for `key`, dropping expired entries of other servers
+
+        Args:
+            key (str): The server url, e.g. `https://irflow.example.com`
+            version (str): The IR-Flow version of that server
+        """
+        now = time.time()
+        entries = {name: entry for name, entry in self._read().items()
+                   if now - entry.get('fetched', 0) <= self.ttl}
+        entries[key] = {'version': version, 'fetched': now}
+
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.irflow_version')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(entries, temp_file)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+
+class CacheEntry(object):
+    """A cached response body with its validators
+
+    Attributes:
+        endpoint (str): The key of the endpoint in `end_points` the response belongs to
+        url (str): The full url of the request
+        content (bytes): The raw response body
+        etag (str): The ``ETag`` response header, if any
+        last_modified (str): The ``Last-Modified`` response header, if any
+        expires_at (float): Monotonic time after which the entry must be revalidated
+    """
+    __slots__ = ('endpoint', 'url', 'content', 'etag', 'last_modified', 'expires_at')
+
+    def __init__(self, endpoint, url, content, etag, last_modified, expires_at):
+        self.endpoint = endpoint
+        self.url = url
+        self.content = content
+        self.etag = etag
+        self.last_modified = last_modified
+        self.expires_at = expires_at
+
+    @property
+    def fresh(self):
+        return monotonic() < self.expires_at
+
+    @property
+    def size(self):
+        return len(self.content) + len(self.url)
+
+    def validators(self):
+        """dict: Conditional request headers to revalidate this entry with"""
+        headers = {}
+        if self.etag:
+            headers['If-None-Match'] = self.etag
+        if self.last_modified:
+            headers['If-Modified-Since'] = self.last_modified
+        return headers
+
+    def json(self):
+        """Decode the cached body, every call returns a new object"""
+        return json.loads(self.content)
+
+
+class ResponseCache(object):
+    """Thread safe in-memory LRU cache of GET responses, bounded by the size of the bodies
+
+    Only endpoints with a TTL in `ttls` are cached. Entries past their TTL are kept until
+    evicted, so they can be revalidated with ``If-None-Match`` / ``If-Modified-Since`` when
+    the server sent an ``ETag`` or ``Last-Modified`` header.
+
+    Args:
+        ttls (dict): Seconds a response stays fresh, keyed by endpoint name, default =
+            `DEFAULT_TTLS`
+        max_bytes (int): Upper bound of the cached response bodies in bytes, default = 8 MiB
+
+    Attributes:
+        hits (int): Lookups answered from a fresh entry
+        misses (int): Lookups that needed a request, revalidations included
+        revalidations (int): Stale entries the server confirmed with HTTP 304
+        evictions (int): Entries dropped to stay under `max_bytes`
+        invalidations (int): Entries dropped because the client wrote to their resource
+    """
+    DEFAULT_TTLS = {
+        'version': 3600.0,
+        'get_picklist_list': 300.0,
+        'get_picklist': 300.0,
+        'get_picklist_item_list': 300.0,
+        'get_fact_group': 30.0,
+    }
+
+    def __init__(self, ttls=None, max_bytes=8 * 1024 * 1024):
+        self.ttls = dict(self.DEFAULT_TTLS if ttls is None else ttls)
+        self.max_bytes = max_bytes
+        self._lock = threading.Lock()
+        self._entries = OrderedDict()
+        self._bytes = 0
+        self.hits = 0
+        self.misses = 0
+        self.revalidations = 0
+        self.evictions = 0
+        self.invalidations = 0
+
+    @staticmethod
+    def key(endpoint, url, params=None):
+        """Return the cache key of a request
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            url (str): The full url of the request
+            params (dict): The query parameters of the request, if any
+
+        Returns:
+            tuple: The cache key
+        """
+        return endpoint, url, tuple(sorted(params.items())) if params else ()
+
+    def get(self, key):
+        """Return the entry for `key`, fresh or stale, `None` if there is none
+
+        Fresh entries count as a hit, anything else as a miss.
+
+        Returns:
+            CacheEntry: The cached entry
+        """
+        with self._lock:
+            entry = self._entries.get(key)
+            if entry is None or not entry.fresh:
+                self.misses += 1
+            else:
+                self.hits += 1
+                self._entries.move_to_end(key)
+            return entry
+
+    def store(self, key, content, headers):
+        """Cache a response body, unless the response forbids it or it exceeds `max_bytes`
+
+        Args:
+            key (tuple): The cache key, see :func:`key`
+            content (bytes): The raw response body
+            headers (dict): The response headers
+        """
+        endpoint, url, _ = key
+        if 'no-store' in headers.get('Cache-Control', ''):
+            return
+        entry = CacheEntry(endpoint, url, content, headers.get('ETag'),
+                           headers.get('Last-Modified'), monotonic() + self.ttls[endpoint])
+        if entry.size > self.max_bytes:
+            return
+        with self._lock:
+            self._remove(key)
+            self._entries[key] = entry
+            self._bytes += entry.size
+            while self._bytes > self.max_bytes:
+                self._remove(next(iter(self._entries)))
+                self.evictions += 1
+
+    def revalidated(self, key, entry):
+        """Mark a stale entry as fresh again after the server answered HTTP 304"""
+        with self._lock:
+            entry.expires_at = monotonic() + self.ttls[entry.endpoint]
+            self.revalidations += 1
+            if key in self._entries:
+                self._entries.move_to_end(key)
+
+    def invalidate(self, endpoint, url=None):
+        """Drop the cached responses of an endpoint
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            url (str): Only drop the response of this url, default = all urls
+        """
+        with self._lock:
+            for key in [key for key in self._entries
+                        if key[0] == endpoint and (url is None or key[1] == url)]:
+                self._remove(key)
+                self.invalidations += 1
+
+    def clear(self):
+        with self._lock:
+            self._entries.clear()
+            self._bytes = 0
+
+    def _remove(self, key):
+        entry = self._entries.pop(key, None)
+        if entry is not None:
+            self._bytes -= entry.size
+
+    def __len__(self):
+        return len(self._entries)
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'entries': len(self._entries),
+                'bytes': self._bytes,
+                'hits': self.hits,
+                'misses': self.misses,
+                'revalidations': self.revalidations,
+                'evictions': self.evictions,
+                'invalidations': self.invalidations
+            }
@@ -0,0 +1,153 @@
+"""Coalescing of concurrent identical requests
+
+When many threads of a fan-out call ``get_alert(n)`` for the same alert at once, a
+:class:`SingleFlight` lets the first one send the request while the others wait for it and
+share its response, so the server sees one request instead of one per thread.
+:class:`AsyncSingleFlight` does the same for the tasks of an asyncio event loop.
+
+Only the response is shared. Every caller decodes the json body itself, so no caller sees
+changes another caller makes to its result. A caller joining a request already in flight
+may get an answer IR-Flow gave before the caller's own last write, which is why clients only
+coalesce with ``coalesce_requests`` turned on.
+"""
+import asyncio
+import threading
+
+
+class _Flight(object):
+    """A call in progress, with its outcome once done"""
+    __slots__ = ('done', 'result', 'error')
+
+    def __init__(self):
+        self.done = threading.Event()
+        self.result = None
+        self.error = None
+
+
+class SingleFlight(object):
+    """Run a function once for all concurrent callers asking with the same key
+
+    Attributes:
+        calls (int): Calls that ran their function
+        coalesced (int): Calls that waited for another call instead
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._lock = threading.Lock()
+        self._flights = {}
+
+    def do(self, key, func, timeout=None):
+        """Return ``func()``, or the outcome of a call with the same key already in flight
+
+        An exception raised by the call in flight is raised to every caller waiting for it.
+
+        Args:
+            key (hashable): Identifies identical calls, e.g. the method, url and parameters
+            func (callable): Makes the call, without arguments
+            timeout (float): Seconds to wait for a call in flight. Once passed, the caller stops
+                waiting and runs `func` itself. Default = wait until it is done.
+
+        Returns:
+            object: The return value of `func`
+        """
+        with self._lock:
+            flight = self._flights.get(key)
+            leader = flight is None
+            if leader:
+                flight = self._flights[key] = _Flight()
+                self.calls += 1
+            else:
+                self.coalesced += 1
+
+        if not leader:
+            if not flight.done.wait(timeout):
+                return func()
+            if flight.error is not None:
+                raise flight.error
+            return flight.result
+
+        try:
+            flight.result = func()
+            return flight.result
+        except BaseException as exc:
+            flight.error = exc
+            raise
+        finally:
+            with self._lock:
+                del self._flights[key]
+            flight.done.set()
+
+    def __len__(self):
+        with self._lock:
+            return len(self._flights)
+
+    def as_dict(self):
+        """dict: The calls and coalesced counters"""
+        with self._lock:
+            return {'calls': self.calls, 'coalesced': self.coalesced}
+
+    def __repr__(self):
+        return 'SingleFlight(calls={}, coalesced={})'.format(self.calls, self.coalesced)
+
+
+class AsyncSingleFlight(object):
+    """Await a coroutine once for all concurrent tasks asking with the same key
+
+    Use an instance from a single event loop only.
+
+    Attributes:
+        calls (int): Calls that awaited their coroutine
+        coalesced (int): Calls that waited for another call instead
+    """
+
+    def __init__(self):
+        self.calls = 0
+        self.coalesced = 0
+        self._flights = {}
+
+    async def do(self, key, func):
+        """Return ``await func()``, or the outcome of a call with the same key already in flight
+
+        A waiting task that is cancelled does not cancel the call it waits for.
+
+        Args:
+            key (hashable): Identifies identical calls, e.g. the method, url and parameters
+            func (callable): Returns the coroutine making the call, without arguments
+
+        Returns:
+            object: The result of the coroutine
+        """
+        future = self._flights.get(key)
+        if future is not None:
+            self.coalesced += 1
+            return await asyncio.shield(future)
+
+        future = self._flights[key] = asyncio.get_event_loop().create_future()
+        self.calls += 1
+        try:
+            result = await func()
+        except asyncio.CancelledError:
+            future.cancel()
+            raise
+        except BaseException as exc:
+            future.set_exception(exc)
+            # Mark it retrieved, nobody may be waiting for it
+            future.exception()
+            raise
+        else:
+            future.set_result(result)
+            return result
+        finally:
+            del self._flights[key]
+
+    def __len__(self):
+        return len(self._flights)
+
+    def as_dict(self):
+        """dict: The calls and coalesced counters"""
+        return {'calls': self.calls, 'coalesced': self.coalesced}
+
+    def __repr__(self):
+        return 'AsyncSingleFlight(calls={}, coalesced={})'.format(self.calls, self.coalesced)
@@ -0,0 +1,162 @@
+"""Adaptive concurrency of bulk operations
+
+A fixed number of workers is either too low when IR-Flow is idle or too high when it is busy.
+With ``adaptive=True``, bulk methods such as
+:func:`irflow_client.irflow_client.IRFlowClient.create_alerts` keep as many calls in flight as
+an :class:`AdaptiveConcurrencyLimiter` allows, and `max_workers` is only the upper bound.
+
+The limiter judges the calls in windows of `limit` completions. It compares the median
+latency of a window with the lowest median seen so far, the latency of an idle server. While
+the two stay within `tolerance` of each other and few calls fail, the limit grows: doubling
+at first, then by one call per window. Once latency rises or calls fail, the limit is cut by
+`backoff`::
+
+    bulk = irfc.create_alerts(rows, max_workers=64, adaptive=True)
+    for result in bulk:
+        ...
+    print(bulk.limiter.limit, bulk.limiter.as_dict())
+"""
+import threading
+
+
+class AdaptiveConcurrencyLimiter(object):
+    """Additive increase, multiplicative decrease limit of the calls kept in flight
+
+    Args:
+        initial_limit (int): Calls allowed in flight at the start, default = 2
+        min_limit (int): The limit never drops below this, default = 1
+        max_limit (int): The limit never grows above this, default = 64
+        tolerance (float): Ratio of window to idle latency still considered flat,
+            default = 1.5
+        backoff (float): Factor the limit is multiplied by on congestion, default = 0.75
+        max_error_rate (float): Fraction of failed calls in a window still considered
+            healthy, default = 0.1
+        baseline_drift (float): Fraction of the gap to a slower window the idle latency moves
+            up by, so the limiter follows a server that became slower for good,
+            default = 0.05
+        metrics (irflow_client.metrics.ClientMetrics): Publishes the limit as the
+            `concurrency_limit` gauge if given
+        name (str): The `operation` label of the gauge, default = `bulk`
+
+    Attributes:
+        limit (int): Calls currently allowed in flight
+        in_flight (int): Calls currently in flight
+        increases (int): Windows that raised the limit
+        decreases (int): Windows that cut the limit
+    """
+
+    def __init__(self, initial_limit=2, min_limit=1, max_limit=64, tolerance=1.5,
+                 backoff=0.75, max_error_rate=0.1, baseline_drift=0.05, metrics=None,
+                 name='bulk'):
+        if not 1 <= min_limit <= max_limit:
+            raise ValueError('Expected 1 <= min_limit <= max_limit')
+        if not 0 < backoff < 1:
+            raise ValueError('backoff must be between 0 and 1')
+        self.min_limit = min_limit
+        self.max_limit = max_limit
+        self.tolerance = tolerance
+        self.backoff = backoff
+        self.max_error_rate = max_error_rate
+        self.baseline_drift = baseline_drift
+        self.metrics = metrics
+        self.name = name
+        self.limit = max(min_limit, min(max_limit, initial_limit))
+        self.in_flight = 0
+        self.increases = 0
+        self.decreases = 0
+        self.baseline = None
+        self._slow_start = True
+        self._latencies = []
+        self._errors = 0
+        self._saturated = False
+        self._window = 0
+        self._lock = threading.Lock()
+        self._publish()
+
+    def _publish(self):
+        if self.metrics is not None:
+            self.metrics.set_gauge('concurrency_limit', self.limit, {'operation': self.name},
+                                   'Calls a bulk operation currently keeps in flight.')
+
+    def available(self):
+        """int: Calls that may be started now"""
+        with self._lock:
+            return max(0, self.limit - self.in_flight)
+
+    def start(self):
+        """Count a call as started
+
+        Returns:
+            int: The window the call belongs to, pass it to :func:`finish`
+        """
+        with self._lock:
+            self.in_flight += 1
+            if self.in_flight >= self.limit:
+                self._saturated = True
+            return self._window
+
+    def finish(self, latency, failed=False, window=None):
+        """Count a call as finished, adjusting the limit at the end of a window
+
+        Calls started before the limit last changed are not judged, their latency reflects
+        the old limit.
+
+        Args:
+            latency (float): Seconds the call took
+            failed (bool): The call failed in a way that hints at an overloaded server, e.g.
+                a timeout or a 5xx response
+            window (int): The value :func:`start` returned for the call
+        """
+        with self._lock:
+            self.in_flight = max(0, self.in_flight - 1)
+            if window is not None and window != self._window:
+                return
+            self._latencies.append(latency)
+            self._errors += bool(failed)
+            if len(self._latencies) < self.limit:
+                return
+            latencies = sorted(self._latencies)
+            median = latencies[len(latencies) // 2]
+            error_rate = float(self._errors) / len(latencies)
+            saturated = self._saturated
+            self._latencies = []
+            self._errors = 0
+            self._saturated = self.in_flight >= self.limit
+            changed = self._adjust(median, error_rate, saturated)
+        if changed:
+            self._publish()
+
+    def _adjust(self, median, error_rate, saturated):
+        """Helper function to move the limit after a window, returns whether it changed"""
+        if self.baseline is None or median < self.baseline:
+            self.baseline = median
+        congested = error_rate > self.max_error_rate or \
+            median > self.baseline * self.tolerance
+        if not congested:
+            self.baseline += (median - self.baseline) * self.baseline_drift
+        limit = self.limit
+        if congested:
+            self._slow_start = False
+            limit = max(self.min_limit, int(limit * self.backoff))
+            if limit < self.limit:
+                self.decreases += 1
+        elif saturated:
+            # A limit that was never reached says nothing about the server
+            limit = min(self.max_limit, limit * 2 if self._slow_start else limit + 1)
+            if limit > self.limit:
+                self.increases += 1
+        if limit == self.limit:
+            return False
+        self.limit = limit
+        self._window += 1
+        return True
+
+    def as_dict(self):
+        with self._lock:
+            return {'limit': self.limit, 'in_flight': self.in_flight,
+                    'baseline': self.baseline, 'increases': self.increases,
+                    'decreases': self.decreases}
+
+    def __repr__(self):
+        return 'AdaptiveConcurrencyLimiter(limit={}, min_limit={}, max_limit={})'.format(
+            self.limit, self.min_limit, self.max_limit)
@@ -0,0 +1,64 @@
+"""Time budgets for logical IR-Flow operations
+
+A :class:`Deadline` covers everything done on behalf of one logical operation: every call made
+while it is active, their retries and the backoff between them. The client clamps each request
+timeout to the remaining budget, and refuses to start a request once the budget is spent.
+"""
+from time import monotonic
+
+
+class Deadline(object):
+    """A point in time after which no further request should be started
+
+    Args:
+        seconds (float): The budget, measured from now
+    """
+
+    def __init__(self, seconds):
+        self.seconds = seconds
+        self.expires_at = monotonic() + seconds
+
+    @classmethod
+    def coerce(cls, deadline):
+        """Return `deadline` as a Deadline instance
+
+        Args:
+            deadline (Deadline or float): A deadline, a budget in seconds or `None`
+
+        Returns:
+            Deadline: The deadline, `None` if `deadline` is `None`
+        """
+        if deadline is None or isinstance(deadline, Deadline):
+            return deadline
+        return cls(deadline)
+
+    def remaining(self):
+        """float: Seconds left in the budget, negative once expired"""
+        return self.expires_at - monotonic()
+
+    @property
+    def expired(self):
+        return self.remaining() <= 0
+
+    def clamp(self, timeout):
+        """Shorten a ``requests`` timeout so it does not outlast the deadline
+
+        Args:
+            timeout (tuple or float): A (connect, read) tuple or a single timeout in seconds
+
+        Returns:
+            tuple: The (connect, read) timeout, each at most the remaining budget
+        """
+        remaining = max(self.remaining(), 0.001)
+        if not isinstance(timeout, tuple):
+            timeout = (timeout, timeout)
+        return tuple(remaining if value is None else min(value, remaining) for value in timeout)
+
+    def earliest(self, other):
+        """Return whichever of this deadline and `other` expires first"""
+        if other is None or self.expires_at <= other.expires_at:
+            return self
+        return other
+
+    def __repr__(self):
+        return 'Deadline(remaining={:.3f})'.format(self.remaining())
@@ -0,0 +1,339 @@
+"""Deduplication of attachment uploads and alerts
+
+:class:`UploadIndex` remembers the content hashes of the attachments uploaded to every IR-Flow
+object, so re-attaching the same evidence file to the same alert or incident is skipped
+instead of sent again. Content is hashed in chunks with :func:`content_digest`, files of any
+size are hashed in constant memory.
+
+:class:`AlertDeduplicator` suppresses alerts repeating an alert created within a time window,
+so a detector firing the same alert many times a minute creates it once per window.
+"""
+from collections import OrderedDict
+import hashlib
+import io
+import json
+import os
+import tempfile
+import threading
+import time
+from time import monotonic
+
+CHUNK_SIZE = 1024 * 1024
+
+
+def content_digest(source, chunk_size=CHUNK_SIZE):
+    """Hash the content an upload of `source` would send
+
+    File objects are hashed from their current position and put back there, so the upload
+    that follows sends the same content.
+
+    Args:
+        source (str or file or bytes): Path of the file, a binary file object or the content
+        chunk_size (int): Largest read in bytes, default = 1 MiB
+
+    Returns:
+        tuple: (sha256 hex digest, size in bytes), `None` for a file object that cannot seek
+            and would be consumed by hashing
+    """
+    digest = hashlib.sha256()
+    if isinstance(source, (bytes, bytearray, memoryview)):
+        view = memoryview(source).cast('B')
+        digest.update(view)
+        return digest.hexdigest(), len(view)
+
+    if hasattr(source, 'read'):
+        try:
+            if not source.seekable():
+                return None
+            start = source.tell()
+        except (AttributeError, OSError, ValueError):
+            return None
+        try:
+            size = _hash_file(source, digest, chunk_size)
+        finally:
+            source.seek(start)
+        return digest.hexdigest(), size
+
+    with open(os.fspath(source), 'rb') as handle:
+        size = _hash_file(handle, digest, chunk_size)
+    return digest.hexdigest(), size
+
+
+def _hash_file(handle, digest, chunk_size):
+    """Helper function to feed the rest of a binary file into `digest`, returns the bytes read"""
+    size = 0
+    scratch = bytearray(chunk_size)
+    view = memoryview(scratch)
+    readinto = getattr(handle, 'readinto', None)
+    while True:
+        if readinto is not None:
+            count = readinto(scratch)
+            block = view[:count] if count else b''
+        else:
+            block = handle.read(chunk_size)
+        if not block:
+            return size
+        digest.update(block)
+        size += len(block)
+
+
+class UploadIndex(object):
+    """Content hashes of the attachments uploaded to each IR-Flow object
+
+    Entries are keyed by object type and ID, e.g. `alerts` and `1234`, and by the sha256 of the
+    content, whatever the attachment was called. With a `path`, the index is kept in a json
+    file shared by every process using it; writes merge with the file on disk and replace it
+    atomically. Without one it lasts as long as the client.
+
+    Args:
+        path (str): Path of the index file, `None` for an in-memory index
+
+    Attributes:
+        uploaded (int): Uploads recorded by this instance
+        skipped (int): Uploads skipped as duplicates
+        bytes_skipped (int): Content not sent because of skipped uploads
+    """
+
+    def __init__(self, path=None):
+        self.path = os.path.expanduser(path) if path else None
+        self.uploaded = 0
+        self.skipped = 0
+        self.bytes_skipped = 0
+        self._lock = threading.Lock()
+        self._objects = self._read()
+
+    @staticmethod
+    def _key(object_type, object_id):
+        return '%s/%s' % (object_type, object_id)
+
+    def _read(self):
+        if self.path is None:
+            return {}
+        try:
+            with io.open(self.path, 'r', encoding='utf-8') as handle:
+                objects = json.load(handle)
+        except (IOError, OSError, ValueError):
+            return {}
+        return objects if isinstance(objects, dict) else {}
+
+    def _write(self):
+        directory = os.path.dirname(os.path.abspath(self.path))
+        handle, temp_path = tempfile.mkstemp(dir=directory, prefix='.irflow_uploads')
+        try:
+            with os.fdopen(handle, 'w') as temp_file:
+                json.dump(self._objects, temp_file)
+            os.replace(temp_path, self.path)
+        except Exception:
+            if os.path.exists(temp_path):
+                os.remove(temp_path)
+            raise
+
+    def get(self, object_type, object_id, digest):
+        """Return the record of a known upload
+
+        Args:
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object
+            digest (str): The sha256 hex digest of the content
+
+        Returns:
+            dict: `attachment_name`, `size` and `uploaded` (epoch seconds), `None` if unknown
+        """
+        with self._lock:
+            return self._objects.get(self._key(object_type, object_id), {}).get(digest)
+
+    def add(self, object_type, object_id, digest, size, attachment_name=None):
+        """Record an upload
+
+        Args:
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object
+            digest (str): The sha256 hex digest of the content
+            size (int): The size of the content in bytes
+            attachment_name (str): The file name shown in IR-Flow
+        """
+        entry = {'attachment_name': attachment_name, 'size': size, 'uploaded': time.time()}
+        key = self._key(object_type, object_id)
+        with self._lock:
+            if self.path is not None:
+                # Keep what other processes recorded since this index was read
+                for other_key, digests in self._read().items():
+                    self._objects.setdefault(other_key, {}).update(
+                        (other, record) for other, record in digests.items()
+                        if other not in self._objects[other_key])
+            self._objects.setdefault(key, {})[digest] = entry
+            self.uploaded += 1
+            if self.path is not None:
+                self._write()
+
+    def record_skip(self, size):
+        """Count an upload skipped as a duplicate of `size` bytes"""
+        with self._lock:
+            self.skipped += 1
+            self.bytes_skipped += size
+
+    def forget(self, object_type, object_id, digest=None):
+        """Drop the records of an object, e.g. after its attachments were deleted in IR-Flow
+
+        Args:
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object
+            digest (str): Drop only this content hash, default = all of the object
+        """
+        key = self._key(object_type, object_id)
+        with self._lock:
+            if self.path is not None:
+                self._objects = self._read()
+            if digest is None:
+                self._objects.pop(key, None)
+            else:
+                self._objects.get(key, {}).pop(digest, None)
+            if self.path is not None:
+                self._write()
+
+    def __len__(self):
+        with self._lock:
+            return sum(len(digests) for digests in self._objects.values())
+
+    def as_dict(self):
+        """dict: The upload counters"""
+        with self._lock:
+            return {'uploaded': self.uploaded, 'skipped': self.skipped,
+                    'bytes_skipped': self.bytes_skipped}
+
+    def __repr__(self):
+        return 'UploadIndex(path={!r}, entries={}, skipped={})'.format(
+            self.path, len(self), self.skipped)
+
+
+def parse_fields(value):
+    """Parse a list of field names given as a list or as a comma separated string
+
+    Args:
+        value (str or iterable of str): The field names, e.g. `'src_ip, rule_name'`
+
+    Returns:
+        tuple: The stripped, non-empty field names
+    """
+    if isinstance(value, str):
+        value = value.split(',')
+    return tuple(name.strip() for name in value if name and name.strip())
+
+
+class AlertDeduplicator(object):
+    """Memory bounded, expiring store of the fingerprints of recently created alerts
+
+    An alert is fingerprinted by its incoming field group and its fields, or only the `fields`
+    listed, ignoring the description. The first alert of a fingerprint is forwarded; repeats
+    are suppressed until `window` seconds after it. The window is not extended by repeats, so
+    an alert firing continuously is created once per window. A fingerprint is reserved when
+    its alert is forwarded, so concurrent repeats are suppressed too, and released with
+    :func:`release` if creating the alert fails.
+
+    Args:
+        window (float): Seconds repeats of a forwarded alert are suppressed, default = 60
+        fields (iterable of str): Names of the fields making up the fingerprint, default =
+            all fields
+        max_entries (int): Upper bound of fingerprints kept, the oldest are dropped first,
+            default = 10000
+
+    Attributes:
+        forwarded (int): Alerts passed on to IR-Flow
+        suppressed (int): Alerts suppressed as repeats
+        evicted (int): Fingerprints dropped before their window ended to respect
+            `max_entries`
+    """
+
+    def __init__(self, window=60.0, fields=None, max_entries=10000):
+        self.window = window
+        self.fields = parse_fields(fields) if fields else None
+        self.max_entries = max_entries
+        self.forwarded = 0
+        self.suppressed = 0
+        self.evicted = 0
+        self._lock = threading.Lock()
+        # fingerprint -> [expires_at, alert_num, repeats], in order of expiry
+        self._entries = OrderedDict()
+
+    def fingerprint(self, alert_fields, incoming_field_group_name=None):
+        """Return the fingerprint of an alert
+
+        Args:
+            alert_fields (dict): Key, Value pairs of the fields of the alert
+            incoming_field_group_name (str): The incoming field group name of the alert
+
+        Returns:
+            str: A sha256 hex digest
+        """
+        if self.fields is not None:
+            alert_fields = dict((name, alert_fields.get(name)) for name in self.fields)
+        document = json.dumps([incoming_field_group_name, alert_fields], sort_keys=True,
+                              separators=(',', ':'), default=str)
+        return hashlib.sha256(document.encode('utf-8')).hexdigest()
+
+    def _expire(self, now):
+        while self._entries:
+            fingerprint, entry = next(iter(self._entries.items()))
+            if entry[0] > now:
+                return
+            del self._entries[fingerprint]
+
+    def check(self, fingerprint):
+        """Decide whether an alert is forwarded or suppressed
+
+        A forwarded alert reserves its fingerprint for `window` seconds.
+
+        Args:
+            fingerprint (str): The fingerprint of the alert
+
+        Returns:
+            dict: `alert_num` of the alert created first (`None` until known or if unknown),
+                `repeats` suppressed so far and `expires_in` seconds for a suppressed alert,
+                `None` if the alert is to be forwarded
+        """
+        now = monotonic()
+        with self._lock:
+            self._expire(now)
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                entry[2] += 1
+                self.suppressed += 1
+                return {'alert_num': entry[1], 'repeats': entry[2], 'expires_in': entry[0] - now}
+            self._entries[fingerprint] = [now + self.window, None, 0]
+            self.forwarded += 1
+            while len(self._entries) > self.max_entries:
+                self._entries.popitem(last=False)
+                self.evicted += 1
+            return None
+
+    def resolve(self, fingerprint, alert_num):
+        """Record the alert number IR-Flow assigned to a forwarded alert"""
+        with self._lock:
+            entry = self._entries.get(fingerprint)
+            if entry is not None:
+                entry[1] = alert_num
+
+    def release(self, fingerprint):
+        """Forget a forwarded alert that was not created, so its next repeat is forwarded"""
+        with self._lock:
+            self._entries.pop(fingerprint, None)
+
+    def clear(self):
+        """Forget every fingerprint, the counters are kept"""
+        with self._lock:
+            self._entries.clear()
+
+    def __len__(self):
+        with self._lock:
+            self._expire(monotonic())
+            return len(self._entries)
+
+    def as_dict(self):
+        """dict: The forwarded, suppressed and evicted counters"""
+        with self._lock:
+            return {'forwarded': self.forwarded, 'suppressed': self.suppressed,
+                    'evicted': self.evicted}
+
+    def __repr__(self):
+        return 'AlertDeduplicator(window={}, forwarded={}, suppressed={})'.format(
+            self.window, self.forwarded, self.suppressed)
@@ -0,0 +1,705 @@
+"""Request path shared by the IR-Flow clients
+
+:class:`RequestDispatcher` holds everything between an endpoint method of
+:class:`irflow_client.irflow_client.IRFlowClient` and the HTTP library: endpoint urls,
+response caching and coalescing, per call `request_options`, the retry loop with timeouts,
+deadlines, rate limiting and the circuit breaker, metrics, tracing, recording and the outbox.
+The endpoint methods only build their request and hand it to :func:`RequestDispatcher._dispatch`.
+"""
+from contextlib import contextmanager
+import contextvars
+import re
+import time
+from types import MappingProxyType
+
+import requests
+import urllib3
+
+from .breaker import CircuitBreaker
+from .deadline import Deadline
+from .exceptions import IRFlowCircuitOpenError, IRFlowDeadlineExceededError, IRFlowMaintenanceError
+from .metrics import body_size
+from .outbox import PENDING, REFUSED_STATUSES, TRANSIENT_STATUSES, failed_state
+from .ratelimit import FileBucketStore, RateLimiter, THROTTLE_STATUSES
+from .recording import Recorder
+from .retry import TRANSPORT_ERRORS
+
+# Per call overrides set by IRFlowClient.request_options, keyed by client instance
+_request_options = contextvars.ContextVar('irflow_request_options', default={})
+
+# Request headers shared by all calls, read-only so no call can change them for the others
+_JSON_HEADERS = MappingProxyType({
+    'Content-type': 'application/json',
+    'Accept': 'application/json'
+})
+_CONTENT_TYPE_HEADERS = MappingProxyType({'Content-type': 'application/json'})
+
+# Span attribute names of the ID of the object an attachment is uploaded to, by object type
+_ATTACHMENT_OWNERS = {'alerts': 'alert_num', 'incidents': 'incident_num', 'tasks': 'task_id'}
+
+
+class RequestDispatcher(object):
+    """Sends the requests of a client, the base class of
+    :class:`irflow_client.irflow_client.IRFlowClient`
+
+    Uses the configuration, `session`, `end_points` and the optional features set up by the
+    client.
+    """
+
+    def _create_recorder(self):
+        """Helper function to create the traffic recorder if configured
+
+        Returns:
+            irflow_client.recording.Recorder: The recorder, `None` if calls are not recorded
+        """
+        if self.record_file:
+            return Recorder(self.record_file, self.record_redact_fields)
+        return None
+
+    def _create_rate_limiter(self):
+        """Helper function to create the rate limiter if configured
+
+        Returns:
+            irflow_client.ratelimit.RateLimiter: The limiter, `None` if requests are not limited
+        """
+        if not (self.rate_limit or self.rate_limit_endpoints):
+            return None
+        store = FileBucketStore(self.rate_limit_file) if self.rate_limit_file else None
+        return RateLimiter(self.rate_limit, self.rate_limit_burst, self.rate_limit_endpoints,
+                           store)
+
+    def _create_circuit_breaker(self):
+        """Helper function to create the circuit breaker shared by every call, if configured
+
+        Returns:
+            irflow_client.breaker.CircuitBreaker: The breaker, `None` if calls are not guarded
+        """
+        if not self.circuit_breaking:
+            return None
+        return CircuitBreaker(self.circuit_failure_threshold, self.circuit_reset_timeout,
+                              self.circuit_half_open_probes, metrics=self.metrics)
+
+    def _circuit_open_error(self, endpoint):
+        """Helper function to create the error of a call failed fast by the circuit breaker
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+
+        Returns:
+            IRFlowCircuitOpenError: The error to raise
+        """
+        retry_after = self.circuit_breaker.retry_after
+        return IRFlowCircuitOpenError(
+            'IR-Flow is unavailable after {} consecutive failures, not calling {} for another '
+            '{:.1f}s'.format(self.circuit_breaker.failure_threshold, endpoint, retry_after),
+            retry_after)
+
+    @staticmethod
+    def _never_delivered(exc):
+        """Helper function to tell whether a failed request certainly did not reach IR-Flow
+
+        Args:
+            exc (Exception): The error the request failed with
+
+        Returns:
+            bool: `True` if the server refused it or the connection was never established
+        """
+        if isinstance(exc, (IRFlowMaintenanceError, requests.exceptions.ConnectTimeout)):
+            return True
+        reason = getattr(exc.args[0], 'reason', None) if exc.args else None
+        return isinstance(reason, urllib3.exceptions.NewConnectionError)
+
+    def _defer(self, endpoint, method, url, headers, json, reason, maybe_received):
+        """Helper function to keep a failed call in the outbox
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the call
+            url (str): The full url of the call
+            headers (dict): The headers of the call
+            json (dict): The json body of the call
+            reason (str): Why the call failed
+            maybe_received (bool): IR-Flow may have received the call
+
+        Returns:
+            dict: An unsuccessful response with `queued` set and the `outbox_id` in its data
+        """
+        state = failed_state(method, maybe_received)
+        base = '%s://%s' % (self.protocol, self.address)
+        entry_id = self.outbox.add(endpoint, method, url[len(base):], json,
+                                   dict(headers or {}), reason, state)
+        self.logger.warning('{} {} failed ({}), kept in the outbox as entry {} ({})'.format(
+            method, url, reason, entry_id, state))
+        if state == PENDING:
+            message = 'IR-Flow is unavailable, the call is queued in the outbox'
+        else:
+            message = 'IR-Flow may have received the call, it is kept in the outbox for review'
+        return {'success': False, 'queued': True, 'message': message,
+                'data': {'outbox_id': entry_id, 'state': state, 'reason': reason}}
+
+    def _build_urls(self):
+        """Helper function to precompute the full url template of every endpoint"""
+        base_url = '%s://%s/' % (self.protocol, self.address)
+        self._urls = {name: base_url + path.replace('{0}', '%s')
+                      for name, path in self.end_points.items()}
+        self._urls_key = (self.protocol, self.address)
+
+    def _url(self, endpoint, path_args=None, suffix=None):
+        """Helper function to return the full url of an endpoint
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            path_args (tuple): Values for the placeholders of the endpoint path, if any
+            suffix (str): A path segment to append, e.g. an object ID
+
+        Returns:
+            str: The url
+        """
+        if self._urls_key != (self.protocol, self.address):
+            self._build_urls()
+        url = self._urls[endpoint]
+        if path_args:
+            url = url % path_args
+        if suffix is not None:
+            url = '%s/%s' % (url, suffix)
+        return url
+
+    def _dispatch(self, endpoint, method, heading, path_args=None, suffix=None,
+                  headers=_JSON_HEADERS, json=None, params=None):
+        """Helper function to call a json endpoint of the IR-Flow API
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            heading (str): A string heading for debug messages
+            path_args (tuple): Values for the placeholders of the endpoint path, if any
+            suffix (str): A path segment to append to the endpoint path, if any
+            headers (dict): The headers of this request, json content type by default
+            json (dict): Data to send as a json body, if any
+            params (dict): Key, Value pairs of query parameters, if any
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        url = self._url(endpoint, path_args, suffix)
+        cache = self.response_cache
+        if cache is not None and method == 'GET' and endpoint in cache.ttls:
+            return self._dispatch_cached(cache, endpoint, heading, url, headers, params)
+
+        if self.debug:
+            self.dump_request_debug_info(heading, url, headers=headers, data=json, params=params)
+
+        if method == 'GET':
+            return self._decode(heading, self._send_get(endpoint, url, headers, params))
+        try:
+            response = self._send(endpoint, method, url, headers=headers, json=json,
+                                  params=params)
+        except (IRFlowMaintenanceError, requests.exceptions.ConnectionError,
+                requests.exceptions.Timeout) as exc:
+            if self.outbox is None or endpoint not in self.outbox_endpoints:
+                raise
+            return self._defer(endpoint, method, url, headers, json,
+                               '{}: {}'.format(exc.__class__.__name__, exc),
+                               not self._never_delivered(exc))
+        finally:
+            if cache is not None and endpoint in self.cache_invalidations:
+                self._invalidate_cached(cache, endpoint, url)
+
+        if self.outbox is not None and response.status_code in TRANSIENT_STATUSES and \
+                endpoint in self.outbox_endpoints:
+            return self._defer(endpoint, method, url, headers, json,
+                               'HTTP {}'.format(response.status_code),
+                               response.status_code not in REFUSED_STATUSES)
+        return self._decode(heading, response)
+
+    def _dispatch_cached(self, cache, endpoint, heading, url, headers, params):
+        """Helper function to answer a GET from the response cache, revalidating stale entries
+
+        Args:
+            cache (irflow_client.cache.ResponseCache): The response cache
+            endpoint (str): The key of the endpoint in `end_points`
+            heading (str): A string heading for debug messages
+            url (str): The full url of the request
+            headers (dict): The headers of this request
+            params (dict): Key, Value pairs of query parameters, if any
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        key = cache.key(endpoint, url, params)
+        entry = cache.get(key)
+        if entry is not None and entry.fresh:
+            body = entry.json()
+            if self.debug:
+                self.dump_response_debug_info(heading + ' (cached)', 200, body)
+            return body
+
+        if entry is not None:
+            headers = dict(headers, **entry.validators())
+        if self.debug:
+            self.dump_request_debug_info(heading, url, headers=headers, params=params)
+
+        response = self._send_get(endpoint, url, headers, params)
+
+        if entry is not None and response.status_code == 304:
+            cache.revalidated(key, entry)
+            body = entry.json()
+            if self.debug:
+                self.dump_response_debug_info(heading + ' (revalidated)', 304, body)
+            return body
+
+        body = self._decode(heading, response)
+        if response.status_code == 200:
+            cache.store(key, response.content, response.headers)
+        return body
+
+    def _send_get(self, endpoint, url, headers, params):
+        """Helper function to send a GET, sharing the response of an identical GET in flight
+
+        A caller waiting for another thread's request waits at most until its own deadline.
+        The request may have been sent before a write of the caller, turn `coalesce_requests`
+        on only where that is acceptable.
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            url (str): The full url of the request
+            headers (dict): The headers of this request
+            params (dict): Key, Value pairs of query parameters, if any
+
+        Returns:
+            requests.Response: The response, read completely
+        """
+        def send():
+            return self._send(endpoint, 'GET', url, headers=headers, params=params)
+
+        if self.request_coalescer is None:
+            return send()
+        deadline = _request_options.get().get(self, {}).get('deadline')
+        return self.request_coalescer.do(self._coalesce_key(url, params, headers), send,
+                                         deadline.remaining() if deadline is not None else None)
+
+    def _coalesce_key(self, url, params, headers):
+        """Helper function to return the key of a GET request in `request_coalescer`
+
+        Only requests sent alike share a response, the retry policy and timeout of
+        :func:`request_options` included.
+
+        Args:
+            url (str): The full url of the request
+            params (dict): Key, Value pairs of query parameters, if any
+            headers (dict): The headers of this request
+
+        Returns:
+            tuple: The key
+        """
+        options = _request_options.get().get(self, {})
+        return (url, tuple(sorted(params.items())) if params else (),
+                tuple(sorted(headers.items())) if headers else (), options.get('timeout'),
+                options.get('retry'))
+
+    def _invalidate_cached(self, cache, endpoint, url):
+        """Helper function to drop cached responses made stale by a write to `endpoint`
+
+        Args:
+            cache (irflow_client.cache.ResponseCache): The response cache
+            endpoint (str): The key of the written endpoint in `end_points`
+            url (str): The full url of the write request
+        """
+        for cached_endpoint in self.cache_invalidations[endpoint]:
+            same_path = self.end_points[cached_endpoint] == self.end_points[endpoint]
+            cache.invalidate(cached_endpoint, url if same_path else None)
+
+    def _decode(self, heading, response):
+        """Helper function to decode a json response body exactly once
+
+        Args:
+            heading (str): A string heading for debug messages
+            response (requests.Response): The response to decode
+
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        body = response.json()
+        if self.debug:
+            self.dump_response_debug_info(heading, response.status_code, body)
+        return body
+
+    @contextmanager
+    def request_options(self, retry=None, timeout=None, deadline=None):
+        """Context manager overriding request options for the calls made inside it
+
+        The overrides apply to calls of this client made from the current thread or asyncio
+        task only. A deadline covers every call made inside the block, retries and backoff
+        included; once it has passed, further calls raise
+        :class:`IRFlowDeadlineExceededError`::
+
+            with irfc.request_options(deadline=10):
+                alert = irfc.get_alert(alert_num)
+                irfc.put_fact_group(alert['data']['alert']['fact_group_id'], facts)
+
+        Args:
+            retry (irflow_client.retry.RetryPolicy): The retry policy to use instead of
+                `retry_policy`
+            timeout (tuple or float): (connect, read) timeout in seconds to use instead of
+                `timeout` and `end_point_timeouts`
+            deadline (float or irflow_client.deadline.Deadline): Time budget in seconds for
+                all calls made inside the block. A deadline nested in another one cannot
+                extend it.
+        """
+        options = dict(_request_options.get())
+        overrides = dict(options.get(self, {}))
+        if retry is not None:
+            overrides['retry'] = retry
+        if timeout is not None:
+            overrides['timeout'] = timeout
+        if deadline is not None:
+            overrides['deadline'] = Deadline.coerce(deadline).earliest(overrides.get('deadline'))
+        options[self] = overrides
+        token = _request_options.set(options)
+        try:
+            yield self
+        finally:
+            _request_options.reset(token)
+
+    def _send(self, endpoint, method, url, **kwargs):
+        """Helper function to send a request to the IR-Flow API, retrying failures
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            **kwargs: Passed through to ``requests.Session.request``
+
+        Returns:
+            requests.Response: The response of the last attempt
+
+        Raises:
+            IRFlowMaintenanceError: The server still answers HTTP 503 after all retries
+            IRFlowCircuitOpenError: The circuit breaker is open, IR-Flow was not called
+        """
+        if self.tracer is not None:
+            return self._send_traced(endpoint, method, url, kwargs)
+        response, _ = self._send_checked(endpoint, method, url, kwargs)
+        return response
+
+    def _send_checked(self, endpoint, method, url, kwargs):
+        """Helper function to send a request, measured if metrics are collected
+
+        Returns:
+            tuple: (the response of the last attempt, number of retries)
+
+        Raises:
+            IRFlowMaintenanceError: The server still answers HTTP 503 after all retries
+        """
+        if self.metrics is None:
+            response, retries = self._send_retrying(endpoint, method, url, kwargs)
+        else:
+            response, retries = self._send_measured(endpoint, method, url, kwargs)
+        if self.recorder is not None:
+            self._record(endpoint, method, response, kwargs)
+        if response.status_code == 503:
+            raise IRFlowMaintenanceError('IR-Flow Server is down for maintenance')
+
+        return response, retries
+
+    def _record(self, endpoint, method, response, kwargs):
+        """Helper function to append a call to the recording
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            response (requests.Response): The response of the last attempt
+            kwargs (dict): The keyword arguments of the request
+        """
+        request = response.request
+        stream = kwargs.get('stream')
+        self.recorder.record(endpoint, method, request.path_url, request.headers,
+                             kwargs.get('json'), body_size(request.body), response.status_code,
+                             response.headers, None if stream else response.content,
+                             response.elapsed.total_seconds(),
+                             self._response_size(response, stream))
+
+    def _send_traced(self, endpoint, method, url, kwargs):
+        """Helper function to send a request inside a span, passing its trace context along
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            kwargs (dict): Passed through to ``requests.Session.request``
+
+        Returns:
+            requests.Response: The response of the last attempt
+        """
+        span = self.tracer.start_span(
+            endpoint, attributes=self._trace_attributes(endpoint, method, url, kwargs.get('json')))
+        kwargs['headers'] = dict(kwargs.get('headers') or {}, traceparent=span.traceparent)
+        try:
+            response, retries = self._send_checked(endpoint, method, url, kwargs)
+        except Exception as exc:
+            span.record_error(exc)
+            span.end()
+            raise
+        span.set_attribute('http.status_code', response.status_code)
+        span.set_attribute('http.request_content_length', body_size(response.request.body))
+        span.set_attribute('http.response_content_length',
+                           self._response_size(response, kwargs.get('stream')))
+        span.set_attribute('irflow.retries', retries)
+        if response.status_code >= 400:
+            span.record_error('HTTP {}'.format(response.status_code))
+        span.end()
+        return response
+
+    def _trace_attributes(self, endpoint, method, url, json=None):
+        """Helper function to describe a call as span attributes
+
+        The IDs of the objects a call concerns, e.g. `irflow.alert_num`, are read from its url
+        as named in `trace_arguments`, or from the `alert_num` and `incident_num` of its json
+        body.
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            json (dict): The json body of the request, if any
+
+        Returns:
+            dict: The span attributes
+        """
+        attributes = {'irflow.endpoint': endpoint, 'http.method': method, 'http.url': url}
+        names = self.trace_arguments.get(endpoint)
+        if names:
+            pattern = self._trace_patterns.get(endpoint)
+            if pattern is None:
+                path = self.end_points[endpoint].strip('/').replace('{0}', '%s')
+                path = re.escape(path).replace(re.escape('%s'), '([^/]+)')
+                pattern = re.compile('/{}(?:/([^/?#]+))?(?:[?#]|$)'.format(path))
+                self._trace_patterns[endpoint] = pattern
+            match = pattern.search(url)
+            if match is not None:
+                values = dict(zip(names, match.groups()))
+                if 'object_type' in values:
+                    owner = _ATTACHMENT_OWNERS.get(values.pop('object_type'), 'object_id')
+                    values[owner] = values.pop('object_id')
+                for name, value in values.items():
+                    if value is not None:
+                        attributes['irflow.' + name] = value
+        if isinstance(json, dict):
+            for name in ('alert_num', 'incident_num'):
+                if json.get(name) is not None:
+                    attributes.setdefault('irflow.' + name, str(json[name]))
+        return attributes
+
+    @staticmethod
+    def _response_size(response, stream=False):
+        """Helper function to return the body size of a response, announced if still streamed"""
+        if stream:
+            return int(response.headers.get('Content-Length') or 0)
+        return len(response.content)
+
+    def _send_measured(self, endpoint, method, url, kwargs):
+        """Helper function to send a request, recording it in `metrics`
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            kwargs (dict): Passed through to ``requests.Session.request``
+
+        Returns:
+            tuple: (the response of the last attempt, number of retries)
+        """
+        started = time.perf_counter()
+        try:
+            response, retries = self._send_retrying(endpoint, method, url, kwargs)
+        except Exception as exc:
+            self.metrics.record(endpoint, time.perf_counter() - started,
+                                exc.__class__.__name__)
+            raise
+        # A streamed body is still to be read, count what the server announced
+        received = self._response_size(response, kwargs.get('stream'))
+        self.metrics.record(endpoint, time.perf_counter() - started, response.status_code,
+                            body_size(response.request.body), received, retries)
+        return response, retries
+
+    def _send_retrying(self, endpoint, method, url, kwargs):
+        """Helper function to send a request, retrying failures according to the retry policy
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            kwargs (dict): Passed through to ``requests.Session.request``
+
+        Returns:
+            tuple: (the response of the last attempt, number of retries)
+        """
+        attempts = self._attempts(endpoint, method, url, kwargs)
+        try:
+            wait = next(attempts)
+            while True:
+                if wait is not None:
+                    time.sleep(wait)
+                    wait = next(attempts)
+                    continue
+                try:
+                    response = self.session.request(method, url, verify=False, **kwargs)
+                except BaseException as exc:
+                    wait = attempts.throw(exc)
+                else:
+                    wait = attempts.send(response)
+        except StopIteration as done:
+            return done.value
+        finally:
+            # Settles the attempt of a wait that was interrupted
+            attempts.close()
+
+    def _attempts(self, endpoint, method, url, kwargs):
+        """Helper generator running the attempts of a request: retry policy, timeouts,
+        deadline, rate limiter and circuit breaker
+
+        The loop is shared by :class:`IRFlowClient` and
+        :class:`irflow_client.async_client.AsyncIRFlowClient`, which only wait and send. It
+        yields the seconds to wait before going on, or `None` once ``kwargs['timeout']`` is
+        set and the request is to be sent. The response is passed back with ``send()``, an
+        exception raised while sending with ``throw()``. Responses need the `status_code`,
+        `headers` and `close()` of a ``requests.Response``.
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            url (str): The full url of the API endpoint
+            kwargs (dict): The keyword arguments of the request, `timeout` is set for each
+                attempt
+
+        Returns:
+            tuple: (the response of the last attempt, number of retries), as the value of the
+                final ``StopIteration``
+
+        Raises:
+            IRFlowDeadlineExceededError: The deadline passed before an attempt could be made
+            IRFlowCircuitOpenError: The circuit breaker is open, IR-Flow was not called
+        """
+        options = _request_options.get().get(self, {})
+        policy = options.get('retry', self.retry_policy)
+        if not getattr(kwargs.get('data'), 'rewindable', True):
+            # A streamed body read from a pipe or socket cannot be sent twice
+            policy = policy.copy(max_retries=0)
+        timeout = options.get('timeout') or self.end_point_timeouts.get(endpoint, self.timeout)
+        deadline = options.get('deadline')
+        attempt = 0
+        circuit = self.circuit_breaker
+        while True:
+            if deadline is not None and deadline.expired:
+                raise IRFlowDeadlineExceededError(
+                    'Deadline of {}s exceeded before calling {}'.format(deadline.seconds,
+                                                                        endpoint))
+            # An open circuit fails the call before it takes a rate limit token. A probe slot
+            # of a half-open circuit is given back if the request is not sent, every outcome
+            # of the send below settles it
+            if circuit is not None and not circuit.allow():
+                raise self._circuit_open_error(endpoint)
+            if self.rate_limiter is not None:
+                try:
+                    delay = self._rate_limit_delay(endpoint, deadline)
+                    if delay > 0:
+                        yield delay
+                except BaseException:
+                    if circuit is not None:
+                        circuit.release()
+                    raise
+            kwargs['timeout'] = deadline.clamp(timeout) if deadline is not None else timeout
+            try:
+                response = yield None
+            except Exception as exc:
+                if circuit is not None:
+                    if isinstance(exc, TRANSPORT_ERRORS):
+                        circuit.record_failure()
+                    else:
+                        circuit.release()
+                if not policy.should_retry_exception(method, exc, attempt) or \
+                        not self._has_time_to_retry(deadline, policy.get_delay(attempt)):
+                    if attempt:
+                        self.retry_stats.record_exhausted()
+                    raise
+                delay = policy.get_delay(attempt)
+                reason = exc.__class__.__name__
+            except BaseException:
+                # Cancelled or interrupted while sending
+                if circuit is not None:
+                    circuit.release()
+                raise
+            else:
+                if circuit is not None:
+                    circuit.record(response.status_code, policy.get_retry_after(response))
+                if self.rate_limiter is not None and \
+                        response.status_code in THROTTLE_STATUSES:
+                    self.rate_limiter.throttle(policy.get_retry_after(response))
+                if not policy.should_retry_response(method, response, attempt):
+                    break
+                delay = policy.get_delay(attempt, response)
+                if not self._has_time_to_retry(deadline, delay):
+                    break
+                reason = 'HTTP {}'.format(response.status_code)
+                response.close()
+
+            attempt += 1
+            self.retry_stats.record_retry(endpoint)
+            self.logger.info('Retrying {} {} ({}), attempt {} in {:.2f}s'.format(
+                method, url, reason, attempt, delay))
+            self._rewind_body(kwargs)
+            yield delay
+
+        if attempt and response.status_code in policy.retry_statuses:
+            self.retry_stats.record_exhausted()
+        return response, attempt
+
+    def _rate_limit_delay(self, endpoint, deadline):
+        """Helper function to reserve a token of the rate limiter for a request to `endpoint`
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            deadline (irflow_client.deadline.Deadline): The active deadline, if any
+
+        Returns:
+            float: Seconds to wait before sending the request
+
+        Raises:
+            IRFlowDeadlineExceededError: The wait would outlast the deadline
+        """
+        # No token is taken for a wait the deadline does not leave time for
+        remaining = deadline.remaining() if deadline is not None else None
+        delay = self.rate_limiter.reserve(endpoint, remaining)
+        if delay > 0 and remaining is not None and delay >= remaining:
+            raise IRFlowDeadlineExceededError(
+                'Deadline of {}s exceeded waiting {:.2f}s for the rate limit of {}'.format(
+                    deadline.seconds, delay, endpoint))
+        return delay
+
+    @staticmethod
+    def _has_time_to_retry(deadline, delay):
+        """Helper function to check a retry after `delay` seconds still fits in `deadline`
+
+        Args:
+            deadline (irflow_client.deadline.Deadline): The active deadline, if any
+            delay (float): The backoff before the retry
+
+        Returns:
+            bool: `True` if there is budget left for another attempt
+        """
+        return deadline is None or deadline.remaining() > delay
+
+    @staticmethod
+    def _rewind_body(kwargs):
+        """Helper function to seek a streamed body and multipart file handles back to the start
+        before a retry
+
+        Args:
+            kwargs (dict): The keyword arguments of a request
+        """
+        handles = [value[1] if isinstance(value, tuple) else value
+                   for value in (kwargs.get('files') or {}).values()]
+        handles.append(kwargs.get('data'))
+        for handle in handles:
+            if hasattr(handle, 'seek'):
+                handle.seek(0)
@@ -0,0 +1,296 @@
+"""Helpers for attachment downloads
+
+An :class:`AttachmentBuffer` receives an attachment body in large chunks. When the size is
+announced by ``Content-Length`` and below the spill threshold, the buffer is allocated once and
+filled in place; otherwise it grows as data arrives and moves to a temporary file once the
+threshold is crossed. The content is available as a memoryview without further copies, as
+bytes, or decoded to text on request.
+
+:class:`DownloadOperation` is returned by
+:func:`irflow_client.irflow_client.IRFlowClient.download_attachments`, which downloads many
+attachments to files concurrently and resumes interrupted files with HTTP Range requests.
+"""
+import mmap
+import re
+import tempfile
+
+import requests
+import urllib3
+
+from .bulk import AsyncBulkOperation, BulkOperation
+
+CHUNK_SIZE = 1024 * 1024
+SPILL_THRESHOLD = 64 * 1024 * 1024
+
+
+def content_length(response):
+    """Return the announced size of the decoded body of a response
+
+    Args:
+        response (requests.Response): A streamed response
+
+    Returns:
+        int: The size in bytes, `None` if unknown or if the body is content encoded
+    """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        return None
+    try:
+        length = int(response.headers['Content-Length'])
+    except (KeyError, ValueError):
+        return None
+    return length if length >= 0 else None
+
+
+def content_range(response):
+    """Parse the Content-Range header of a response
+
+    Args:
+        response (requests.Response): A 206 or 416 response
+
+    Returns:
+        tuple: (first byte, last byte, complete size), the byte positions are `None` for an
+            unsatisfied range and the size is `None` if unknown. `None` without a valid header.
+    """
+    match = re.match(r'bytes\s+(?:(\d+)-(\d+)|\*)/(\d+|\*)$',
+                     response.headers.get('Content-Range', '').strip())
+    if match is None:
+        return None
+    first, last, size = match.groups()
+    return (None if first is None else int(first), None if last is None else int(last),
+            None if size == '*' else int(size))
+
+
+def iter_received(response, chunk_size=CHUNK_SIZE):
+    """Yield the body of a streamed ``requests`` response as it is received
+
+    Unlike ``iter_content``, a block is yielded as soon as any data arrives, so the bytes
+    received before a connection drops are not lost with the exception. Content encoded
+    bodies are decoded by ``iter_content``.
+
+    Args:
+        response (requests.Response): A response requested with `stream=True`
+        chunk_size (int): Largest block in bytes, default = 1 MiB
+
+    Yields:
+        bytes: The next block of the body
+    """
+    if response.headers.get('Content-Encoding', 'identity') != 'identity':
+        for block in response.iter_content(chunk_size):
+            yield block
+        return
+    # urllib3 >= 2 fills `read` up to the requested amount, `read1` returns what has arrived
+    read = getattr(response.raw, 'read1', response.raw.read)
+    while True:
+        try:
+            block = read(chunk_size)
+        except urllib3.exceptions.ProtocolError as exc:
+            raise requests.exceptions.ChunkedEncodingError(exc)
+        except urllib3.exceptions.ReadTimeoutError as exc:
+            raise requests.exceptions.ConnectionError(exc)
+        if not block:
+            return
+        yield block
+
+
+class AttachmentBuffer(object):
+    """Attachment content held in memory, or in a temporary file above `spill_threshold`
+
+    Use it as a context manager, or call :func:`close`, to release a spilled file early.
+
+    Args:
+        length (int): The expected size, preallocated if it does not exceed `spill_threshold`
+        spill_threshold (int): Largest content kept in memory in bytes, default = 64 MiB
+        encoding (str): Encoding used by :func:`text`, default = utf-8
+
+    Attributes:
+        size (int): Bytes received so far
+        file (file): The temporary file holding spilled content, `None` while in memory
+    """
+
+    def __init__(self, length=None, spill_threshold=SPILL_THRESHOLD, encoding=None):
+        self.spill_threshold = spill_threshold
+        self.encoding = encoding
+        self.size = 0
+        self.file = None
+        self._mmap = None
+        self._buffer = None
+        self._preallocated = length is not None and length <= spill_threshold
+        if length is not None and not self._preallocated:
+            self.file = tempfile.TemporaryFile()
+        else:
+            self._buffer = bytearray(length or 0)
+
+    @property
+    def spilled(self):
+        return self.file is not None
+
+    def write(self, data):
+        """Append a chunk of content
+
+        Args:
+            data (bytes-like): The chunk
+        """
+        length = len(data)
+        if self.file is None and self.size + length > self.spill_threshold:
+            self.file = tempfile.TemporaryFile()
+            self.file.write(memoryview(self._buffer)[:self.size])
+            self._buffer = None
+        if self.file is not None:
+            self.file.write(data)
+        elif self._preallocated and self.size + length <= len(self._buffer):
+            self._buffer[self.size:self.size + length] = data
+        else:
+            # More content than announced, or no announced size: grow the buffer
+            del self._buffer[self.size:]
+            self._buffer += data
+            self._preallocated = False
+        self.size += length
+
+    def fill(self, readinto, chunk_size=CHUNK_SIZE):
+        """Receive content until `readinto` returns 0
+
+        While the buffer is preallocated, the content is read straight into it. Otherwise a
+        single scratch buffer of `chunk_size` bytes is reused for every read.
+
+        Args:
+            readinto (callable): Reads into a writable buffer and returns the number of bytes
+                read, e.g. the `readinto` method of a file object
+            chunk_size (int): Largest read in bytes, default = 1 MiB
+        """
+        if self._preallocated:
+            view = memoryview(self._buffer)
+            try:
+                while self.size < len(self._buffer):
+                    count = readinto(view[self.size:self.size + chunk_size])
+                    if not count:
+                        return
+                    self.size += count
+            finally:
+                view.release()
+
+        scratch = memoryview(bytearray(chunk_size))
+        while True:
+            count = readinto(scratch)
+            if not count:
+                return
+            self.write(scratch[:count])
+
+    def memoryview(self):
+        """Return the content without copying it
+
+        Returns:
+            memoryview: The content, backed by the buffer or by a memory map of the spilled
+                file. It is only valid until the buffer is closed.
+        """
+        if self.file is None:
+            return memoryview(self._buffer)[:self.size]
+        if self.size == 0:
+            return memoryview(b'')
+        if self._mmap is None:
+            self.file.flush()
+            self._mmap = mmap.mmap(self.file.fileno(), 0, access=mmap.ACCESS_READ)
+        return memoryview(self._mmap)
+
+    def getvalue(self):
+        """bytes: A copy of the content"""
+        if self.file is None:
+            if self.size == len(self._buffer):
+                return bytes(self._buffer)
+            return bytes(memoryview(self._buffer)[:self.size])
+        self.file.seek(0)
+        return self.file.read()
+
+    def text(self, encoding=None, errors='strict'):
+        """Decode the content
+
+        Args:
+            encoding (str): The encoding, defaults to `encoding` given on creation, else utf-8
+            errors (str): The error handling scheme of ``bytes.decode``, default = `strict`
+
+        Returns:
+            str: The decoded content
+        """
+        view = self.memoryview()
+        try:
+            return str(view, encoding or self.encoding or 'utf-8', errors)
+        finally:
+            view.release()
+
+    def close(self):
+        """Release the memory map and the temporary file of spilled content"""
+        if self._mmap is not None:
+            try:
+                self._mmap.close()
+            except BufferError:
+                # A memoryview is still in use, the map is closed once it is released
+                pass
+            self._mmap = None
+        if self.file is not None:
+            self.file.close()
+
+    def __len__(self):
+        return self.size
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return 'AttachmentBuffer(size={}, spilled={})'.format(self.size, self.spilled)
+
+
+def read_response(response, chunk_size=CHUNK_SIZE, spill_threshold=SPILL_THRESHOLD):
+    """Receive the body of a streamed ``requests`` response into an :class:`AttachmentBuffer`
+
+    Bodies without content encoding are read into the buffer in place, encoded bodies are
+    decoded by ``requests`` in chunks of `chunk_size` bytes.
+
+    Args:
+        response (requests.Response): A response requested with `stream=True`, closed when done
+        chunk_size (int): Largest read in bytes, default = 1 MiB
+        spill_threshold (int): Largest body kept in memory in bytes, default = 64 MiB
+
+    Returns:
+        AttachmentBuffer: The body
+    """
+    buffer = AttachmentBuffer(content_length(response), spill_threshold, response.encoding)
+    try:
+        if response.headers.get('Content-Encoding', 'identity') == 'identity':
+            try:
+                buffer.fill(response.raw.readinto, chunk_size)
+            except urllib3.exceptions.ProtocolError as exc:
+                raise requests.exceptions.ChunkedEncodingError(exc)
+            except urllib3.exceptions.ReadTimeoutError as exc:
+                raise requests.exceptions.ConnectionError(exc)
+        else:
+            for chunk in response.iter_content(chunk_size):
+                buffer.write(chunk)
+    except Exception:
+        buffer.close()
+        raise
+    finally:
+        response.close()
+    return buffer
+
+
+class DownloadOperation(BulkOperation):
+    """Iterable downloading attachments to files with bounded concurrency
+
+    Yields one :class:`irflow_client.bulk.BulkResult` per attachment ID. The `response` of a
+    successful result is a dict with the keys `attachment_id`, `path`, `size`, `transferred`
+    (bytes received by this run), `resumed_from` (bytes already on disk) and `resumes`
+    (connection drops recovered from). Once the iteration is exhausted, `summary` holds the
+    aggregate `bytes_transferred` and `bytes_per_second`.
+    """
+
+    def _bytes_transferred(self, result):
+        return result.response['transferred'] if result.success else 0
+
+
+class AsyncDownloadOperation(AsyncBulkOperation):
+    """Async iterable counterpart of :class:`DownloadOperation`, iterate it with ``async for``"""
+
+    def _bytes_transferred(self, result):
+        return result.response['transferred'] if result.success else 0
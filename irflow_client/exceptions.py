@@ -0,0 +1,36 @@
+"""Exceptions raised by the IR-Flow clients
+
+They are also available from :mod:`irflow_client.irflow_client`.
+"""
+
+
+class IRFlowClientConfigError(Exception):
+    """Raised on Config Errors"""
+    pass
+
+
+class IRFlowMaintenanceError(Exception):
+    """Raised on HTTP 503 from IR-Flow App, likely being upgraded."""
+    pass
+
+
+class IRFlowCircuitOpenError(IRFlowMaintenanceError):
+    """Raised without calling IR-Flow while the circuit breaker is open after repeated failures
+
+    Attributes:
+        retry_after (float): Seconds until the circuit lets a trial call through
+    """
+
+    def __init__(self, message, retry_after=0.0):
+        super(IRFlowCircuitOpenError, self).__init__(message)
+        self.retry_after = retry_after
+
+
+class IRFlowDeadlineExceededError(Exception):
+    """Raised when the time budget of an operation is spent before a call could be made"""
+    pass
+
+
+class IRFlowDownloadError(Exception):
+    """Raised when a downloaded attachment does not match the size announced by IR-Flow"""
+    pass
@@ -0,0 +1,144 @@
+"""Indexed view of an IR-Flow fact group
+
+:func:`irflow_client.irflow_client.IRFlowClient.get_field_by_name` scans the whole fact list on
+every lookup. A :class:`FactGroup` indexes the facts of a ``get_fact_group`` response by field
+name and field id once, so every further lookup is a dict access::
+
+    fact_group = irfc.get_fact_group_view(fact_group_id)
+    src_dns = fact_group.value('src_dns')
+    fact_group.set('src_dns', 'phishing.com')
+    irfc.put_fact_group(fact_group.id, fact_group.changes())
+"""
+
+
+class FactGroup(object):
+    """Facts of one fact group, indexed by field name and field id
+
+    Args:
+        facts (list): The fact objects, as found in
+            ``response['data']['fact_group']['facts']``
+        fact_group_id (int): The IR-Flow assigned ID of the fact group, if known
+        response (dict): The full json response the facts were taken from, if any
+
+    Attributes:
+        id (int): The IR-Flow assigned ID of the fact group
+        facts (list): The fact objects, in the order IR-Flow returned them
+        response (dict): The full json response object from the IR-Flow API
+    """
+
+    def __init__(self, facts, fact_group_id=None, response=None):
+        self.id = fact_group_id
+        self.facts = facts
+        self.response = response
+        self._by_name = {}
+        self._by_id = {}
+        for fact in facts:
+            field = fact['field']
+            # Like get_field_by_name, the first fact of a name wins
+            self._by_name.setdefault(field['field_name'], fact)
+            if field.get('id') is not None:
+                self._by_id.setdefault(field['id'], fact)
+        self._changes = {}
+
+    @classmethod
+    def from_response(cls, response):
+        """Build the view of a ``get_fact_group`` response
+
+        Args:
+            response (dict): The full json response object returned by
+                :func:`irflow_client.irflow_client.IRFlowClient.get_fact_group`
+
+        Returns:
+            FactGroup: The indexed fact group
+        """
+        fact_group = response['data']['fact_group']
+        return cls(fact_group.get('facts') or [], fact_group.get('id'), response)
+
+    def get(self, field_name, default=None):
+        """Return the fact of a field name
+
+        Args:
+            field_name (str): The string name of the desired field
+            default: Returned if the fact group has no such field, default = `None`
+
+        Returns:
+            dict: The fact object
+        """
+        return self._by_name.get(field_name, default)
+
+    def get_by_id(self, field_id, default=None):
+        """Return the fact of a field id
+
+        Args:
+            field_id (int): The IR-Flow assigned ID of the desired field
+            default: Returned if the fact group has no such field, default = `None`
+
+        Returns:
+            dict: The fact object
+        """
+        return self._by_id.get(field_id, default)
+
+    def value(self, field_name, default=None):
+        """Return the value of a field, including changes made with :func:`set`
+
+        Args:
+            field_name (str): The string name of the desired field
+            default: Returned if the fact group has no such field, default = `None`
+        """
+        if field_name in self._changes:
+            return self._changes[field_name]
+        fact = self._by_name.get(field_name)
+        return default if fact is None else fact.get('value')
+
+    def set(self, field_name, value):
+        """Record a new value for a field, to be sent with :func:`changes`
+
+        Args:
+            field_name (str): The string name of the field to update
+            value: The new value
+
+        Raises:
+            KeyError: The fact group has no such field
+        """
+        if field_name not in self._by_name:
+            raise KeyError('Fact group {} has no field "{}"'.format(self.id, field_name))
+        self._changes[field_name] = value
+
+    def changes(self):
+        """Return the fact data of the fields changed with :func:`set`
+
+        Returns:
+            dict: Key, Value pairs of fact fields, the `fact_data` of
+                :func:`irflow_client.irflow_client.IRFlowClient.put_fact_group`
+        """
+        return dict(self._changes)
+
+    def as_fact_data(self):
+        """Return the value of every field, changes included
+
+        Returns:
+            dict: Key, Value pairs of fact fields, the `fact_data` of
+                :func:`irflow_client.irflow_client.IRFlowClient.put_fact_group`
+        """
+        fact_data = {name: fact.get('value') for name, fact in self._by_name.items()}
+        fact_data.update(self._changes)
+        return fact_data
+
+    def field_names(self):
+        return list(self._by_name)
+
+    def __contains__(self, field_name):
+        return field_name in self._by_name
+
+    def __getitem__(self, field_name):
+        return self._by_name[field_name]
+
+    def __iter__(self):
+        return iter(self.facts)
+
+    def __len__(self):
+        return len(self.facts)
+
+    def __repr__(self):
+        return 'FactGroup(id={}, facts={}, changes={})'.format(self.id, len(self.facts),
+                                                              len(self._changes))
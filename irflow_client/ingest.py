@@ -0,0 +1,214 @@
+"""Stream a CSV file of alert facts into IR-Flow
+
+Each CSV row (after the header row) becomes one alert. Rows are read lazily, so files of any
+size are ingested in constant memory, and posted concurrently with
+:func:`irflow_client.irflow_client.IRFlowClient.create_alerts`. After every batch of
+acknowledged rows a checkpoint file records the last row IR-Flow answered for, so a run that
+died part way can simply be started again and continues after that row. Rows in flight when
+a run died are sent again on resume.
+
+Run it as a command::
+
+    irflow-csv-ingest --config api.conf --field-group ds_test alerts.csv
+
+or from python with :func:`ingest_csv`.
+"""
+import argparse
+import csv
+import itertools
+import json
+import logging
+import os
+import sys
+import time
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+class IngestReport(object):
+    """Outcome of a CSV ingestion run
+
+    Attributes:
+        resumed_from (int): Number of data rows skipped because a checkpoint covered them
+        last_row (int): Number of the last acknowledged data row, 1 based
+        summary (irflow_client.bulk.BulkSummary): Throughput and latency of this run
+    """
+
+    def __init__(self, resumed_from, last_row, summary):
+        self.resumed_from = resumed_from
+        self.last_row = last_row
+        self.summary = summary
+
+    def __repr__(self):
+        return 'IngestReport(resumed_from={}, last_row={}, summary={})'.format(
+            self.resumed_from, self.last_row, self.summary)
+
+
+class Checkpoint(object):
+    """Atomically persisted position of an ingestion run
+
+    Args:
+        path (str): Path of the checkpoint file
+        csv_file (str): The CSV file the checkpoint belongs to
+    """
+
+    def __init__(self, path, csv_file):
+        self.path = path
+        self.csv_file = os.path.abspath(csv_file)
+
+    def load(self):
+        """Return the last acknowledged row of a previous run, 0 if there is none
+
+        Raises:
+            ValueError: The checkpoint was written for another CSV file
+        """
+        if not os.path.exists(self.path):
+            return 0
+        with open(self.path, 'r') as handle:
+            state = json.load(handle)
+        if state.get('csv_file') != self.csv_file:
+            raise ValueError('Checkpoint "{}" belongs to "{}", not "{}"'.format(
+                self.path, state.get('csv_file'), self.csv_file))
+        return int(state['last_row'])
+
+    def save(self, last_row):
+        """Persist `last_row`, replacing the previous checkpoint in one atomic step"""
+        temp_path = self.path + '.tmp'
+        with open(temp_path, 'w') as handle:
+            json.dump({'csv_file': self.csv_file, 'last_row': last_row,
+                       'updated': time.time()}, handle)
+            handle.flush()
+            os.fsync(handle.fileno())
+        os.replace(temp_path, self.path)
+
+    def clear(self):
+        if os.path.exists(self.path):
+            os.remove(self.path)
+
+
+def ingest_csv(irfc, csv_file, incoming_field_group_name=None, description=None,
+               checkpoint_file=None, max_workers=8, checkpoint_every=100,
+               failed_rows_file=None, max_rows=None, encoding='utf-8', adaptive=False):
+    """Create one alert per row of a CSV file, resuming from a checkpoint if there is one
+
+    Args:
+        irfc (irflow_client.irflow_client.IRFlowClient): The client to post alerts with
+        csv_file (str): Path to a CSV file with a header row of IR-Flow field names
+        incoming_field_group_name (str): The incoming field group name of the alerts
+        description (str): An optional description for every alert
+        checkpoint_file (str): Path of the checkpoint file, defaults to
+            `<csv_file>.checkpoint`
+        max_workers (int): Number of alerts kept in flight, default = 8
+        checkpoint_every (int): Rows between two checkpoint writes, default = 100
+        failed_rows_file (str): Append rows IR-Flow rejected to this CSV file, if given;
+            rows kept in the outbox of the client are not rejected
+        max_rows (int): Stop after this many rows, default = all rows
+        encoding (str): Encoding of the CSV file, default = utf-8
+        adaptive (bool): Adapt the number of alerts in flight to the latency of IR-Flow, with
+            `max_workers` as the upper bound
+
+    Returns:
+        IngestReport: The outcome of the run
+    """
+    checkpoint = Checkpoint(checkpoint_file or csv_file + '.checkpoint', csv_file)
+    resumed_from = checkpoint.load()
+    last_row = resumed_from
+    if resumed_from:
+        logger.info('Resuming "{}" after row {}'.format(csv_file, resumed_from))
+
+    failed_handle = None
+    failed_writer = None
+    bulk = None
+    try:
+        with open(csv_file, 'r', newline='', encoding=encoding) as csv_handle:
+            reader = csv.DictReader(csv_handle)
+            rows = itertools.islice(reader, resumed_from,
+                                    None if max_rows is None else resumed_from + max_rows)
+            bulk = irfc.create_alerts(rows, description=description,
+                                      incoming_field_group_name=incoming_field_group_name,
+                                      max_workers=max_workers, ordered=True,
+                                      adaptive=adaptive)
+            for result in bulk:
+                last_row = resumed_from + result.index + 1
+                if result.queued:
+                    logger.warning('Row {} queued: {}'.format(last_row,
+                                                             result.response['data']['reason']))
+                elif not result.success:
+                    logger.error('Row {} failed: {}'.format(last_row, result.error))
+                    if failed_rows_file:
+                        if failed_writer is None:
+                            write_header = not os.path.exists(failed_rows_file)
+                            failed_handle = open(failed_rows_file, 'a', newline='',
+                                                 encoding=encoding)
+                            failed_writer = csv.DictWriter(failed_handle, reader.fieldnames)
+                            if write_header:
+                                failed_writer.writeheader()
+                        failed_writer.writerow(result.item)
+                if (last_row - resumed_from) % checkpoint_every == 0:
+                    if failed_handle is not None:
+                        failed_handle.flush()
+                    checkpoint.save(last_row)
+                    logger.info('Row {} acknowledged'.format(last_row))
+    finally:
+        if failed_handle is not None:
+            failed_handle.close()
+        if last_row != resumed_from:
+            checkpoint.save(last_row)
+
+    return IngestReport(resumed_from, last_row, bulk.summary)
+
+
+def main(argv=None):
+    """Command line entry point of the CSV ingestion"""
+    parser = argparse.ArgumentParser(description='Create one IR-Flow alert per row of a CSV '
+                                                 'file, resuming interrupted runs.')
+    parser.add_argument('csv_file', help='CSV file with a header row of IR-Flow field names')
+    parser.add_argument('--config', default='api.conf', help='IR-Flow api.conf file')
+    parser.add_argument('--field-group', dest='incoming_field_group_name',
+                        help='incoming field group name of the alerts')
+    parser.add_argument('--description', help='description of every alert')
+    parser.add_argument('--workers', type=int, default=8, help='alerts kept in flight')
+    parser.add_argument('--adaptive', action='store_true',
+                        help='adapt the alerts kept in flight to the latency of IR-Flow, up '
+                             'to --workers')
+    parser.add_argument('--checkpoint', help='checkpoint file, default <csv_file>.checkpoint')
+    parser.add_argument('--checkpoint-every', type=int, default=100,
+                        help='rows between checkpoint writes')
+    parser.add_argument('--failed-rows', help='append rejected rows to this CSV file')
+    parser.add_argument('--max-rows', type=int, help='stop after this many rows')
+    parser.add_argument('--restart', action='store_true',
+                        help='ignore an existing checkpoint and start from the first row')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+
+    # Imported here so `--help` works without a configured client
+    from .irflow_client import IRFlowClient
+    irfc = IRFlowClient(config_file=args.config)
+
+    checkpoint_file = args.checkpoint or args.csv_file + '.checkpoint'
+    if args.restart:
+        Checkpoint(checkpoint_file, args.csv_file).clear()
+
+    report = ingest_csv(irfc, args.csv_file,
+                        incoming_field_group_name=args.incoming_field_group_name,
+                        description=args.description, checkpoint_file=checkpoint_file,
+                        max_workers=args.workers, checkpoint_every=args.checkpoint_every,
+                        failed_rows_file=args.failed_rows, max_rows=args.max_rows,
+                        adaptive=args.adaptive)
+
+    summary = report.summary
+    print('Ingested rows {}-{}: {} succeeded, {} failed'.format(
+        report.resumed_from + 1, report.last_row, summary.succeeded, summary.failed))
+    if summary.queued:
+        print('{} rows queued in the outbox, send them with irflow-outbox'.format(
+            summary.queued))
+    if summary.total:
+        print('{:.1f} rows/s, latency p50 {:.1f} ms, p99 {:.1f} ms'.format(
+            summary.throughput, summary.latency_p50 * 1000, summary.latency_p99 * 1000))
+    return 1 if summary.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -5,11 +5,30 @@ from json import dumps
 import logging
 import os
 import sys
-import tempfile
 
 import requests
 import urllib3
 from .__version__ import __version__
+from .bulk import BulkOperation
+from .concurrency import AdaptiveConcurrencyLimiter
+from .cache import ResponseCache, VersionCache
+from .coalesce import SingleFlight
+from .deadline import Deadline
+from .dispatch import _CONTENT_TYPE_HEADERS, RequestDispatcher
+from .dedup import AlertDeduplicator, UploadIndex, content_digest, parse_fields
+from .downloads import (DownloadOperation, content_length, content_range, iter_received,
+                        read_response)
+from .facts import FactGroup
+from .exceptions import (IRFlowCircuitOpenError, IRFlowClientConfigError,  # noqa: F401
+                         IRFlowDeadlineExceededError, IRFlowDownloadError,
+                         IRFlowMaintenanceError)
+from .metrics import ClientMetrics
+from .multipart import MultipartUpload
+from .outbox import Outbox
+from .ratelimit import parse_rates
+from .writebehind import FactGroupWriter
+from .retry import RetryPolicy, RetryStats
+from .transport import ConnectionStats, IRFlowHTTPAdapter
 
 try:
     import configparser
@@ -23,17 +42,7 @@ from urllib3.exceptions import InsecureRequestWarning
 urllib3.disable_warnings(InsecureRequestWarning)
 
 
-class IRFlowClientConfigError(Exception):
-    """Raised on Config Errors"""
-    pass
-
-
-class IRFlowMaintenanceError(Exception):
-    """Raised on HTTP 503 from IR-Flow App, likely being upgraded."""
-    pass
-
-
-class IRFlowClient(object):
+class IRFlowClient(RequestDispatcher):
     """Python SDK for the IR-Flow REST API.
 
     """
@@ -63,19 +72,269 @@ class IRFlowClient(object):
         'version': 'api/v1/version'
     }
 
-    def __init__(self, config_args=None, config_file=None):
+    # Cached GET endpoints made stale by a write to an endpoint. They are dropped after the
+    # write even if it failed, since it may have been applied. Only the written url is dropped
+    # when both endpoints share a path, e.g. a single fact group.
+    cache_invalidations = {
+        'put_fact_group': ('get_fact_group',),
+        'add_item_to_picklist': ('get_picklist', 'get_picklist_list', 'get_picklist_item_list'),
+        'create_picklist_item': ('get_picklist', 'get_picklist_list', 'get_picklist_item_list'),
+        'restore_picklist_item': ('get_picklist', 'get_picklist_item', 'get_picklist_item_list'),
+        'delete_picklist_item': ('get_picklist', 'get_picklist_item', 'get_picklist_item_list'),
+    }
+
+    # Span attribute names of the IDs in the path of an endpoint, its placeholders followed by
+    # its suffix, see _trace_attributes
+    trace_arguments = {
+        'assign_user_to_alert': ('alert_num',),
+        'get_alert': ('alert_num',),
+        'put_incident_on_alert': ('alert_num', 'incident_num'),
+        'get_attachment': ('attachment_id',),
+        'put_attachment': ('object_type', 'object_id'),
+        'get_fact_group': ('fact_group_id',),
+        'put_fact_group': ('fact_group_id',),
+        'get_incident': ('incident_num',),
+        'put_incident': ('incident_num',),
+        'put_alert_on_incident': ('incident_num', 'alert_num'),
+        'get_picklist': ('picklist_id',),
+        'add_item_to_picklist': ('picklist_id',),
+        'get_picklist_item': ('picklist_item_id',),
+        'restore_picklist_item': ('picklist_item_id',),
+        'delete_picklist_item': ('picklist_item_id',),
+    }
+
+    # Compiled url patterns of trace_arguments, built on first use
+    _trace_patterns = {}
+
+    # Endpoints whose calls are kept in the outbox, if configured, when IR-Flow is unavailable
+    outbox_endpoints = frozenset(['create_alert', 'put_fact_group'])
+
+    # Optional tuning options as name: (type, default). They can be set in config_args or in
+    # the [IRFlowAPI] section of the configuration file.
+    config_options = {
+        'pool_connections': (int, 10),
+        'pool_maxsize': (int, 10),
+        'pool_block': (bool, False),
+        'tcp_keepalive': (bool, True),
+        'max_retries': (int, 3),
+        'backoff_factor': (float, 0.5),
+        'backoff_max': (float, 30.0),
+        'retry_non_idempotent': (bool, False),
+        'connect_timeout': (float, 5.0),
+        'read_timeout': (float, 30.0),
+        'attachment_read_timeout': (float, 300.0),
+        'eager_version': (bool, False),
+        'version_cache_file': (str, None),
+        'version_cache_ttl': (float, 3600.0),
+        'download_chunk_size': (int, 1024 * 1024),
+        'download_spill_threshold': (int, 64 * 1024 * 1024),
+        'cache_responses': (bool, False),
+        'response_cache_max_bytes': (int, 8 * 1024 * 1024),
+        'dedup_uploads': (bool, False),
+        'upload_index_file': (str, None),
+        'dedup_alerts': (bool, False),
+        'alert_dedup_window': (float, 60.0),
+        'alert_dedup_fields': (parse_fields, None),
+        'alert_dedup_max_entries': (int, 10000),
+        'coalesce_requests': (bool, False),
+        'collect_metrics': (bool, False),
+        'record_file': (str, None),
+        'record_redact_fields': (parse_fields, None),
+        'rate_limit': (float, None),
+        'rate_limit_burst': (float, None),
+        'rate_limit_endpoints': (parse_rates, None),
+        'rate_limit_file': (str, None),
+        'circuit_breaking': (bool, False),
+        'circuit_failure_threshold': (int, 5),
+        'circuit_reset_timeout': (float, 30.0),
+        'circuit_half_open_probes': (int, 1),
+        'outbox_file': (str, None),
+    }
+
+    def __init__(self, config_args=None, config_file=None, tracer=None):
         """Create an API Client instance
 
         Creates API Client to IR-Flow API. Default timeout is 5 seconds on connect and
-        30 seconds on response.
+        30 seconds on response. The options are listed in :func:`_get_config_args_params`.
 
         Args:
              config_args (dict): Key, Value pairs of IR-Flow API configuration options
              config_file (str): Path to a valid Ir-Flow configuration file
+             tracer (irflow_client.tracing.Tracer): Creates a span for every call and sends its
+                trace context to IR-Flow, default = no tracing
+        """
+        self._setup(config_args, config_file, tracer)
+
+        # Get a reusable session object, with a tuned connection pool for all calls
+        self.session = requests.Session()
+        self.connection_stats = ConnectionStats()
+        adapter = IRFlowHTTPAdapter(pool_connections=self.pool_connections,
+                                    pool_maxsize=self.pool_maxsize,
+                                    pool_block=self.pool_block,
+                                    tcp_keepalive=self.tcp_keepalive,
+                                    stats=self.connection_stats)
+        self.session.mount('https://', adapter)
+        self.session.mount('http://', adapter)
+
+        # Set the User-Agent
+        self.session.headers.update({'User-Agent': IRFlowClient._build_user_agent()})
+
+        # Set the X-Authorization header for all calls through the API
+        # The rest of the headers are specified by the individual calls.
+        self.session.headers.update({'X-Authorization': "{} {}"
+                                    .format(self.api_user, self.api_key)})
+
+        # Proxy settings are read from the environment once here, instead of requests
+        # scanning os.environ again on every call.
+        self.session.trust_env = False
+        self.session.proxies.update(requests.utils.get_environ_proxies(self._urls['version']))
+
+        # Opt-in cache of read-mostly GET responses, dropped on writes made by this client
+        self.response_cache = None
+        if self.cache_responses:
+            self.response_cache = ResponseCache(max_bytes=self.response_cache_max_bytes)
+
+        # Concurrent identical GETs wait for the first one and share its response
+        self.request_coalescer = SingleFlight() if self.coalesce_requests else None
+
+        # The server version is requested on first use of `version`, unless eager_version is
+        # set (and we are not running in CI)
+        if self.eager_version and not self.circle_ci:
+            self._version = self._resolve_version()
+
+    def _setup(self, config_args, config_file, tracer):
+        """Helper function to load the configuration and create the state of a client that
+        does not depend on its HTTP library, shared with
+        :class:`irflow_client.async_client.AsyncIRFlowClient`
+
+        Args:
+             config_args (dict): Key, Value pairs of IR-Flow API configuration options
+             config_file (str): Path to a valid Ir-Flow configuration file
+             tracer (irflow_client.tracing.Tracer): Creates a span for every call, if given
         """
         self.circle_ci = os.environ.get('CI', False)
         self.logger = logging.getLogger(__name__)
         self.logger.addHandler(logging.NullHandler())
+        self._load_config(config_args, config_file)
+
+        # Retry policy applied to every call, see request_options for per call overrides
+        self.retry_policy = RetryPolicy(max_retries=self.max_retries,
+                                        backoff_factor=self.backoff_factor,
+                                        backoff_max=self.backoff_max,
+                                        retry_non_idempotent=self.retry_non_idempotent)
+        self.retry_stats = RetryStats()
+
+        # Set timeout on (connect, read) timeouts, neither HTTP library has a default timeout
+        # here so it is passed on every call. Attachment transfers get a longer read timeout.
+        self.timeout = (self.connect_timeout, self.read_timeout)
+        self.end_point_timeouts = {
+            'get_attachment': (self.connect_timeout, self.attachment_read_timeout),
+            'put_attachment': (self.connect_timeout, self.attachment_read_timeout),
+        }
+
+        # Endpoint urls are built once, see _url
+        self._build_urls()
+
+        # Opt-in per endpoint metrics, nothing is measured without them
+        self.metrics = ClientMetrics() if self.collect_metrics else None
+        self.tracer = tracer
+        self.recorder = self._create_recorder()
+
+        # Opt-in token buckets every request waits for, tightened on HTTP 429 and 503
+        self.rate_limiter = self._create_rate_limiter()
+        self.circuit_breaker = self._create_circuit_breaker()
+        self.outbox = Outbox(self.outbox_file) if self.outbox_file else None
+
+        # Opt-in index of uploaded content hashes, repeated uploads to an object are skipped
+        self.upload_index = self._create_upload_index()
+        self.alert_dedup = self._create_alert_dedup()
+
+        # The server version can be cached on disk between processes
+        self._version = None
+        self.version_cache = None
+        if self.version_cache_file:
+            self.version_cache = VersionCache(self.version_cache_file, self.version_cache_ttl)
+
+    def _create_upload_index(self):
+        """Helper function to create the upload index if configured
+
+        Returns:
+            irflow_client.dedup.UploadIndex: The index, `None` if uploads are not deduplicated
+        """
+        if self.dedup_uploads or self.upload_index_file:
+            return UploadIndex(self.upload_index_file)
+        return None
+
+    def _create_alert_dedup(self):
+        """Helper function to create the alert deduplicator if configured
+
+        Returns:
+            irflow_client.dedup.AlertDeduplicator: The deduplicator, `None` if alerts are not
+                deduplicated
+        """
+        if self.dedup_alerts:
+            return AlertDeduplicator(self.alert_dedup_window, self.alert_dedup_fields,
+                                     self.alert_dedup_max_entries)
+        return None
+
+    def close(self):
+        """Close the connection pool, the recording file and the outbox of this client
+
+        A ``.gz`` recording is only complete once closed. They are opened again if the client
+        is used afterwards.
+        """
+        self.session.close()
+        self._close_files()
+
+    def _close_files(self):
+        """Helper function to close the recording file and the outbox, if configured"""
+        for resource in (self.recorder, self.outbox):
+            if resource is not None:
+                resource.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    @property
+    def version(self):
+        """str: The IR-Flow server version, resolved on first use
+
+        The version is read from the version cache file if one is configured and holds a
+        fresh entry for this server, otherwise it is requested with :func:`get_version`.
+        """
+        if self._version is None:
+            self._version = self._resolve_version()
+        return self._version
+
+    @version.setter
+    def version(self, value):
+        self._version = value
+
+    def _resolve_version(self):
+        """Helper function to get the server version from the version cache or the server
+
+        Returns:
+            str: IR-Flow Version Number
+        """
+        if self.version_cache is not None:
+            cached = self.version_cache.get(self._version_cache_key())
+            if cached is not None:
+                return cached
+        return self.get_version()
+
+    def _version_cache_key(self):
+        return '{}://{}'.format(self.protocol, self.address)
+
+    def _load_config(self, config_args, config_file):
+        """Helper function to load configuration from either a dict or a configuration file
+
+        Args:
+             config_args (dict): Key, Value pairs of IR-Flow API configuration options
+             config_file (str): Path to a valid Ir-Flow configuration file
+        """
         # Make sure we have config info we need
         if not (config_args or config_file):
             print('Missing config input parameters. Need either api.conf, or to pass in '
@@ -93,22 +352,6 @@ class IRFlowClient(object):
         elif config_file:
             self._get_config_file_params(config_file)
 
-        # Get a reusable session object.
-        self.session = requests.Session()
-
-        # Set timeout on (connect, read) timeouts
-        self.session.timeout = (5, 30)
-        # Set the User-Agent
-        self.session.headers.update({'User-Agent': IRFlowClient._build_user_agent()})
-
-        # Set the X-Authorization header for all calls through the API
-        # The rest of the headers are specified by the individual calls.
-        self.session.headers.update({'X-Authorization': "{} {}"
-                                    .format(self.api_user, self.api_key)})
-
-        if not self.circle_ci:
-            self.version = self.get_version()
-
     def dump_settings(self):
         """Helper function to print configuration information
         """
@@ -137,6 +380,8 @@ class IRFlowClient(object):
             data (dict): Key, Value pairs of data in the body of a request, if desired
             params (dict): Key, Value pairs of parameters passed in a request, if desired
         """
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
         debug_string = '========== {} ==========\n' \
                        'URL: "{}"\n' \
                        'Session Headers: "{}"'.format(heading, url, self.session.headers)
@@ -159,6 +404,8 @@ class IRFlowClient(object):
             status (int): The HTTP response code of the previously made request
             json (dict): The full json response body as returned by the IR-Flow API
         """
+        if not self.logger.isEnabledFor(logging.DEBUG):
+            return
         self.logger.debug('========== {} Response ==========\n'
                           'HTTP Status: "{}"\n'
                           'Response JSON:\n{}'.format(heading, status, dumps(json, indent=2)))
@@ -170,15 +417,13 @@ class IRFlowClient(object):
             str: IR-Flow Version Number
                 Example: 4.6.0"""
 
-        url = "%s://%s/%s" % (self.protocol, self.address, self.end_points['version'])
-        headers = {'Content-type': 'application/json'}
-
-        response = self.session.get(url, verify=False, headers=headers)
+        response = self._dispatch('version', 'GET', 'Get Version', headers=_CONTENT_TYPE_HEADERS)
 
-        if response.status_code == 503:
-            raise IRFlowMaintenanceError('IR-Flow Server is down for maintenance')
+        self._version = str(response['data']['version'])
+        if self.version_cache is not None:
+            self.version_cache.set(self._version_cache_key(), self._version)
 
-        return str(response.json()['data']['version'])
+        return self._version
 
     def close_alert(self, alert_num, close_reason):
         """Close the alert with the provided number, for the provided reason
@@ -190,19 +435,10 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object returned by the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_alert_close'])
         data = {"alert_num": "%s" % alert_num, "close_reason_name": "%s" % close_reason}
-        headers = {'Content-type': 'application/json'}
-
-        if self.debug:
-            self.dump_request_debug_info('Close Alert', url, headers, data=data)
 
-        response = self.session.put(url, json=data, headers=headers, verify=False)
-
-        if self.debug:
-            self.dump_response_debug_info('Close Alert', response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('put_alert_close', 'PUT', 'Close Alert',
+                              headers=_CONTENT_TYPE_HEADERS, json=data)
 
     def assign_user_to_alert(self, alert_num, username):
         """ Assign a user to an Alert
@@ -216,22 +452,11 @@ class IRFlowClient(object):
             dict: The full json response object returned by the IR-Flow API.
 
         """
-
-        url = '{0}://{1}/{2}'.format(self.protocol, self.address,
-                                     self.end_points['assign_user_to_alert'])
-        url = url.format(alert_num)
-        headers = {'Content-type': 'application/json'}
         payload = {'username': username}
-        if self.debug:
-            self.dump_request_debug_info('Assign User to Alert', url, headers=headers)
 
-        response = self.session.put(url, json=payload, headers=headers, verify=False)
-
-        if self.debug:
-            self.dump_response_debug_info('Assign User to Alert',
-                                          response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('assign_user_to_alert', 'PUT', 'Assign User to Alert',
+                              path_args=(alert_num,), headers=_CONTENT_TYPE_HEADERS,
+                              json=payload)
 
     def attach_incident_to_alert(self, incident_num, alert_num):
         """Attach the specified alert to the specified incident
@@ -250,99 +475,150 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object returned by the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_incident_on_alert'])
-        url = url % (alert_num, incident_num)
-        headers = {'Content-type': 'application/json'}
+        return self._dispatch('put_incident_on_alert', 'PUT', 'Attach Incident to Alert',
+                              path_args=(alert_num, incident_num),
+                              headers=_CONTENT_TYPE_HEADERS)
 
-        if self.debug:
-            self.dump_request_debug_info('Attach Incident to Alert', url, headers=headers)
+    def _upload_attachment(self, heading, object_type, object_id, source, attachment_name,
+                           progress):
+        """Helper function to stream a file to IR-Flow as a multipart attachment
 
-        response = self.session.put(url, headers=headers, verify=False)
+        Args:
+            heading (str): A string heading for debug messages
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object to which the file should be uploaded
+            source (str or file or bytes): The path to the file, an open binary file object or
+                the content to be uploaded
+            attachment_name (str): The file name shown in IR-Flow
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
 
-        if self.debug:
-            self.dump_response_debug_info('Attach Incident to Alert',
-                                          response.status_code, response.json())
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        url = self._url('put_attachment', (object_type, object_id))
+        content = None
+        if self.upload_index is not None:
+            content = content_digest(source)
+            skipped = self._skip_uploaded(heading, object_type, object_id, content)
+            if skipped is not None:
+                return skipped
 
-        return response.json()
+        with MultipartUpload(source, attachment_name, progress=progress) as body:
+            headers = {'Content-Type': body.content_type}
+            if self.debug:
+                self.dump_request_debug_info(heading, url, headers=headers)
 
-    def upload_attachment_to_alert(self, alert_num, filename):
-        """Upload an attachment to the specified alert
+            response = self._send('put_attachment', 'POST', url, data=body, headers=headers)
+            result = self._decode(heading, response)
+            self._record_upload(object_type, object_id, content, body.name, result)
+
+        return result
+
+    def _skip_uploaded(self, heading, object_type, object_id, content):
+        """Helper function to answer an upload of content already uploaded to the object
 
         Args:
-            alert_num (int): The IR-Flow Assigned Alert number of the
-                Alert to which the desired filed should be uploaded
-            filename (str): The path to the file to be uploaded
+            heading (str): A string heading for debug messages
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object to which the file should be uploaded
+            content (tuple): (sha256 hex digest, size) of the content, `None` if unknown
 
         Returns:
-            dict: The full json response object returned by the IR-Flow API
+            dict: A successful response with `skipped` set and the record of the earlier
+                upload as `data`, `None` if the content has to be uploaded
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_attachment'])
-        url = url % ('alerts', alert_num)
-        data = {'file': open(filename, 'rb')}
-        headers = {}
-
+        if content is None:
+            return None
+        digest, size = content
+        known = self.upload_index.get(object_type, object_id, digest)
+        if known is None:
+            return None
+        self.upload_index.record_skip(size)
+        self.logger.info('Skipped upload of {} bytes to {} {}, already uploaded as {}'.format(
+            size, object_type, object_id, known['attachment_name']))
+        result = {'success': True, 'skipped': True,
+                  'message': 'Attachment already uploaded, upload skipped',
+                  'data': dict(known, sha256=digest)}
         if self.debug:
-            self.dump_request_debug_info('Upload Attachment to Alert', url, headers=headers)
+            self.dump_response_debug_info(heading + ' (skipped)', None, result)
+        return result
 
-        response = self.session.post(url, data={}, files=data, headers=headers, verify=False)
+    def _record_upload(self, object_type, object_id, content, attachment_name, result):
+        """Helper function to add a successful upload to the upload index
 
-        if self.debug:
-            self.dump_response_debug_info('Upload Attachment to Alert',
-                                          response.status_code, response.json())
+        Args:
+            object_type (str): The plural IR-Flow object type, e.g. `alerts`
+            object_id (int): The ID of the object the file was uploaded to
+            content (tuple): (sha256 hex digest, size) of the content, `None` if unknown
+            attachment_name (str): The file name shown in IR-Flow
+            result (dict): The json response of the upload
+        """
+        if content is None or not isinstance(result, dict) or not result.get('success'):
+            return
+        self.upload_index.add(object_type, object_id, content[0], content[1], attachment_name)
 
-        return response.json()
+    def upload_attachment_to_alert(self, alert_num, filename, attachment_name=None,
+                                   progress=None):
+        """Upload an attachment to the specified alert
 
-    def upload_attachment_to_incident(self, incident_id, filename):
-        """Upload an attachment to the specified incident
+        The file is streamed from disk in chunks, files of any size are uploaded in constant
+        memory.
 
         Args:
-            incident_id (int): The ID of the Incident to which the desired file should be uploaded
-            filename (str): The path to the file to be uploaded
+            alert_num (int): The IR-Flow Assigned Alert number of the
+                Alert to which the desired filed should be uploaded
+            filename (str or file or bytes): The path to the file to be uploaded, or an open
+                binary file object or bytes to upload instead
+            attachment_name (str): The file name shown in IR-Flow, defaults to the base name of
+                the file, or `attachment` for bytes
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
 
         Returns:
             dict: The full json response object returned by the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_attachment'])
-        url = url % ('incidents', incident_id)
-        data = {'file': open(filename, 'rb')}
-        headers = {}
+        return self._upload_attachment('Upload Attachment to Alert', 'alerts', alert_num,
+                                       filename, attachment_name, progress)
 
-        if self.debug:
-            self.dump_request_debug_info('Upload Attachment to Incident', url, headers=headers)
+    def upload_attachment_to_incident(self, incident_id, filename, attachment_name=None,
+                                      progress=None):
+        """Upload an attachment to the specified incident
 
-        response = self.session.post(url, data={}, files=data, headers=headers, verify=False)
+        The file is streamed from disk in chunks, files of any size are uploaded in constant
+        memory.
 
-        if self.debug:
-            self.dump_response_debug_info('Upload Attachment to Incident',
-                                          response.status_code, response.json())
+        Args:
+            incident_id (int): The ID of the Incident to which the desired file should be uploaded
+            filename (str or file or bytes): The path to the file to be uploaded, or an open
+                binary file object or bytes to upload instead
+            attachment_name (str): The file name shown in IR-Flow, defaults to the base name of
+                the file, or `attachment` for bytes
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
 
-        return response.json()
+        Returns:
+            dict: The full json response object returned by the IR-Flow API
+        """
+        return self._upload_attachment('Upload Attachment to Incident', 'incidents',
+                                       incident_id, filename, attachment_name, progress)
 
-    def upload_attachment_to_task(self, task_id, filename):
+    def upload_attachment_to_task(self, task_id, filename, attachment_name=None, progress=None):
         """Upload an attachment to the specified task
 
+        The file is streamed from disk in chunks, files of any size are uploaded in constant
+        memory.
+
         Args:
             task_id (int): The ID of the task to which the desired file should be uploaded
-            filename (str): The path to the file to be uploaded
+            filename (str or file or bytes): The path to the file to be uploaded, or an open
+                binary file object or bytes to upload instead
+            attachment_name (str): The file name shown in IR-Flow, defaults to the base name of
+                the file, or `attachment` for bytes
+            progress (callable): Called as ``progress(bytes_sent, total_bytes)`` while sending
 
         Returns:
             dict: The full json response object returned by the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_attachment'])
-        url = url % ('tasks', task_id)
-        data = {'file': open(filename, 'rb')}
-        headers = {}
-
-        if self.debug:
-            self.dump_request_debug_info('Upload Attachment to Alert', url, headers=headers)
-
-        response = self.session.post(url, data={}, files=data, headers=headers, verify=False)
-
-        if self.debug:
-            self.dump_response_debug_info('Upload Attachment to Alert Response',
-                                          response.status_code, response.json())
-
-        return response.json()
+        return self._upload_attachment('Upload Attachment to Task', 'tasks', task_id,
+                                       filename, attachment_name, progress)
 
     def download_attachment(self, attachment_id, attachment_output_file):
         """Download the attachment with the specified ID
@@ -352,15 +628,14 @@ class IRFlowClient(object):
             attachment_output_file (str): The full path to the file on disk
                 to which the desired attachment should be saved
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['get_attachment'])
-        url = url % attachment_id
+        url = self._url('get_attachment', (attachment_id,))
 
         if self.debug:
             self.dump_request_debug_info('Download Attachment', url)
 
         with open(attachment_output_file, 'wb') as handle:
-            response = self.session.get(url, stream=True, verify=False)
-            for block in response.iter_content(1024):
+            response = self._send('get_attachment', 'GET', url, stream=True)
+            for block in response.iter_content(self.download_chunk_size):
                 handle.write(block)
 
         if self.debug:
@@ -369,36 +644,181 @@ class IRFlowClient(object):
 
         print('done')
 
-    def download_attachment_string(self, attachment_id):
-        """Download an attachment and return it as text
+    def download_attachments(self, attachment_ids, directory, max_workers=4, max_resumes=3,
+                             ordered=False, adaptive=False):
+        """Download many attachments concurrently, each to `<directory>/<attachment_id>`
+
+        Every file is first written to `<attachment_id>.part`. When the connection drops, the
+        download continues from the end of that file with an HTTP Range request, and runs
+        started again later pick up leftover `.part` files the same way. Files that already
+        exist are verified with a Range request for the bytes past their end, which
+        transfers nothing if they are complete. Sizes are checked against Content-Length and
+        Content-Range before a file is moved into place::
+
+            downloads = irfc.download_attachments(attachment_ids, '/cases/1234')
+            for result in downloads:
+                print(result.item, result.error or result.response['path'])
+            print(downloads.summary.bytes_per_second)
+
+        Args:
+            attachment_ids (iterable of int): The IDs of the attachments, consumed lazily
+            directory (str): The directory to save the attachments in, created if missing
+            max_workers (int): The number of downloads kept in flight, default = 4
+            max_resumes (int): Connection drops survived per attachment, default = 3
+            ordered (bool): Yield results in input order if `True`, or as soon as they
+                complete if `False` (default)
+            adaptive (bool): Adapt the number of downloads in flight to the latency and
+                failures observed, with `max_workers` as the upper bound, see
+                :class:`irflow_client.concurrency.AdaptiveConcurrencyLimiter`
+
+        Returns:
+            irflow_client.downloads.DownloadOperation: An iterable of
+                :class:`irflow_client.bulk.BulkResult`
+        """
+        if not os.path.isdir(directory):
+            os.makedirs(directory)
+
+        def download(attachment_id):
+            return self._download_resumable(attachment_id,
+                                            os.path.join(directory, str(attachment_id)),
+                                            max_resumes)
+
+        return DownloadOperation(download, attachment_ids, max_workers=max_workers,
+                                 ordered=ordered,
+                                 limiter=self._concurrency_limiter(adaptive, max_workers,
+                                                                   'download_attachments'))
+
+    def _download_resumable(self, attachment_id, path, max_resumes):
+        """Helper function to download an attachment to `path`, resuming after connection drops
 
         Args:
             attachment_id (int): The ID of the attachment to be downloaded
+            path (str): The file to save the attachment in
+            max_resumes (int): Connection drops to recover from before giving up
 
         Returns:
-            str: The textual contents of the downloaded file
+            dict: `attachment_id`, `path`, `size`, `transferred`, `resumed_from` and `resumes`
+
+        Raises:
+            IRFlowDownloadError: The file does not match the size announced by IR-Flow
+            requests.exceptions.HTTPError: IR-Flow answered with an error status
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['get_attachment'])
-        url = url % attachment_id
+        url = self._url('get_attachment', (attachment_id,))
+        part_path = path + '.part'
+        if os.path.exists(path) and not os.path.exists(part_path):
+            os.replace(path, part_path)
+        offset = resumed_from = os.path.getsize(part_path) if os.path.exists(part_path) else 0
+        transferred = 0
+        resumes = 0
+
+        while True:
+            # Ranges count encoded bytes, so ask for the attachment as stored
+            headers = {'Accept-Encoding': 'identity'}
+            if offset:
+                headers['Range'] = 'bytes=%d-' % offset
+            if self.debug:
+                self.dump_request_debug_info('Download Attachment', url, headers=headers)
+            try:
+                with self._send('get_attachment', 'GET', url, stream=True,
+                                headers=headers) as response:
+                    if response.status_code == 416 and offset:
+                        size = (content_range(response) or (None, None, None))[2]
+                        if size == offset:
+                            # Nothing past the end of the partial file, it is complete
+                            break
+                        offset = 0
+                        continue
+                    response.raise_for_status()
+
+                    if response.status_code == 206:
+                        first, _, size = content_range(response) or (None, None, None)
+                        if first != offset:
+                            raise IRFlowDownloadError(
+                                'Asked for byte {} of attachment {}, received byte {}'.format(
+                                    offset, attachment_id, first))
+                        mode = 'ab'
+                    else:
+                        # Range not supported or not requested, start over
+                        size = content_length(response)
+                        offset = 0
+                        mode = 'wb'
+
+                    with open(part_path, mode) as handle:
+                        for block in iter_received(response, self.download_chunk_size):
+                            handle.write(block)
+                            offset += len(block)
+                            transferred += len(block)
+
+                if size is None or offset == size:
+                    break
+                if offset > size:
+                    raise IRFlowDownloadError('Attachment {} is {} bytes, expected {}'.format(
+                        attachment_id, offset, size))
+                # The body ended early without an error, resume like after a dropped connection
+                raise requests.exceptions.ChunkedEncodingError(
+                    'Attachment {} ended after {} of {} bytes'.format(attachment_id, offset,
+                                                                      size))
+            except (requests.exceptions.ConnectionError, requests.exceptions.Timeout,
+                    requests.exceptions.ChunkedEncodingError) as exc:
+                if resumes >= max_resumes:
+                    raise
+                resumes += 1
+                self.logger.info('Resuming attachment {} at byte {} ({}), attempt {}'.format(
+                    attachment_id, offset, exc.__class__.__name__, resumes))
+
+        os.replace(part_path, path)
+        return {'success': True, 'attachment_id': attachment_id, 'path': path, 'size': offset,
+                'transferred': transferred, 'resumed_from': resumed_from, 'resumes': resumes}
+
+    def download_attachment_buffer(self, attachment_id, chunk_size=None, spill_threshold=None):
+        """Download an attachment to memory, or to a temporary file if it is large
+
+        The body is read in chunks of `download_chunk_size` bytes into a single buffer,
+        preallocated from the Content-Length header when the server sends one. Attachments
+        larger than `download_spill_threshold` bytes are written to a temporary file instead::
+
+            with irfc.download_attachment_buffer(attachment_id) as attachment:
+                header = attachment.memoryview()[:24]
 
-        if self.debug:
-            self.dump_request_debug_info('Download Attachment String', url)
+        Args:
+            attachment_id (int): The ID of the attachment to be downloaded
+            chunk_size (int): Largest read in bytes, defaults to `download_chunk_size`
+            spill_threshold (int): Largest attachment kept in memory in bytes, defaults to
+                `download_spill_threshold`
 
-        # Get a temporary file to download the results into
-        temp = tempfile.TemporaryFile()
+        Returns:
+            irflow_client.downloads.AttachmentBuffer: The attachment content
+        """
+        url = self._url('get_attachment', (attachment_id,))
+
+        if self.debug:
+            self.dump_request_debug_info('Download Attachment Buffer', url)
 
-        response = self.session.get(url, stream=True, verify=False)
-        # Iterate, downloading data 1,024 bytes at a time
-        for block in response.iter_content(1024):
-            temp.write(block)
+        response = self._send('get_attachment', 'GET', url, stream=True)
+        attachment = read_response(response, chunk_size or self.download_chunk_size,
+                                   spill_threshold or self.download_spill_threshold)
 
-        # Rewind the file to the beginning so we can read it into a string
-        temp.seek(0)
         if self.debug:
-            self.dump_response_debug_info('Download Attachment String',
-                                          response.status_code, response.json())
+            self.dump_response_debug_info('Download Attachment Buffer', response.status_code,
+                                          {"response": response.status_code,
+                                           "size": attachment.size})
+
+        return attachment
 
-        return temp.read()
+    def download_attachment_string(self, attachment_id, encoding=None):
+        """Download an attachment and return its contents
+
+        Args:
+            attachment_id (int): The ID of the attachment to be downloaded
+            encoding (str): Decode the contents with this encoding, default = return bytes
+
+        Returns:
+            bytes: The contents of the downloaded file, decoded to str if `encoding` is given
+        """
+        with self.download_attachment_buffer(attachment_id) as attachment:
+            if encoding is not None:
+                return attachment.text(encoding)
+            return attachment.getvalue()
 
     def put_fact_group(self, fact_group_id, fact_data):
         """Put new or updated fact data in the specified fact group
@@ -411,22 +831,33 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s/%s' % (self.protocol, self.address,
-                                 self.end_points['get_fact_group'], fact_group_id)
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
         fact_payload = {'fields': fact_data}
-        if self.debug:
-            self.dump_request_debug_info('Put Fact Group', url, headers=headers)
 
-        response = self.session.put(url, json=fact_payload, verify=False, headers=headers)
+        return self._dispatch('put_fact_group', 'PUT', 'Put Fact Group', suffix=fact_group_id,
+                              json=fact_payload)
 
-        if self.debug:
-            self.dump_response_debug_info('Put Fact Group', response.status_code, response.json())
+    def fact_group_writer(self, max_updates=20, max_delay=0.5, max_workers=4):
+        """Create a write-behind buffer merging updates of the same fact group into one call
+
+        Updates are sent with :func:`put_fact_group` once `max_updates` of a fact group are
+        pending, once the oldest has waited `max_delay` seconds, or when the writer is flushed
+        or closed. Each update returns a future of the response it was sent with::
 
-        return response.json()
+            with irfc.fact_group_writer() as writer:
+                futures = [writer.put(fact_group_id, facts) for facts in enrichments]
+            errors = [future.exception() for future in futures]
+
+        Args:
+            max_updates (int): Pending updates of a fact group that trigger a write,
+                default = 20
+            max_delay (float): Seconds the oldest pending update may wait, default = 0.5
+            max_workers (int): Calls kept in flight for different fact groups, default = 4
+
+        Returns:
+            irflow_client.writebehind.FactGroupWriter: The writer, close it when done
+        """
+        return FactGroupWriter(self.put_fact_group, max_updates=max_updates,
+                               max_delay=max_delay, max_workers=max_workers)
 
     def get_fact_group(self, fact_group_id):
         """Retrieve the current data in the specified fact group
@@ -437,21 +868,19 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s/%s' % (self.protocol, self.address,
-                                 self.end_points['get_fact_group'], fact_group_id)
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get Fact Group', url, headers=headers)
+        return self._dispatch('get_fact_group', 'GET', 'Get Fact Group', suffix=fact_group_id)
 
-        response = self.session.get(url, verify=False, headers=headers)
+    def get_fact_group_view(self, fact_group_id):
+        """Retrieve the specified fact group as a view indexed by field name and id
 
-        if self.debug:
-            self.dump_response_debug_info('Get Fact Group', response.status_code, response.json())
+        Args:
+            fact_group_id (int): The IR-Flow assigned ID of the fact_group to retrieve
 
-        return response.json()
+        Returns:
+            irflow_client.facts.FactGroup: The fact group, its `response` attribute holds the
+                full json response object from the IR-Flow API
+        """
+        return FactGroup.from_response(self.get_fact_group(fact_group_id))
 
     def get_alert(self, alert_num):
         """Retrieve the alert with the specified alert number
@@ -462,21 +891,7 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s/%s' % (self.protocol, self.address,
-                                 self.end_points['get_alert'], alert_num)
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get Alert', url, headers=headers)
-
-        response = self.session.get(url, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Get Alert', response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('get_alert', 'GET', 'Get Alert', suffix=alert_num)
 
     def create_alert(self, alert_fields, description=None, incoming_field_group_name=None,
                      suppress_missing_field_warning=False):
@@ -493,29 +908,135 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['create_alert'])
         params = {
             'fields': alert_fields,
             'suppress_missing_field_warning': suppress_missing_field_warning
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
 
         if description is not None:
             params['description'] = description
         if incoming_field_group_name is not None:
             params['data_field_group_name'] = incoming_field_group_name
 
-        if self.debug:
-            self.dump_request_debug_info('Create Alert', url, headers=headers, params=params)
+        if self.alert_dedup is None:
+            return self._dispatch('create_alert', 'POST', 'Create Alert', json=params)
 
-        response = self.session.post(url, json=params, verify=False, headers=headers)
-        if self.debug:
-            self.dump_response_debug_info('Create Alert', response.status_code, response.json())
+        fingerprint, suppressed = self._check_duplicate_alert(alert_fields,
+                                                              incoming_field_group_name)
+        if suppressed is not None:
+            return suppressed
+        result = None
+        try:
+            result = self._dispatch('create_alert', 'POST', 'Create Alert', json=params)
+        finally:
+            self._settle_alert(fingerprint, result)
+        return result
 
-        return response.json()
+    def _check_duplicate_alert(self, alert_fields, incoming_field_group_name):
+        """Helper function to suppress an alert repeating one created within the dedup window
+
+        Args:
+            alert_fields (dict): Key, Value pairs of the fields of the alert
+            incoming_field_group_name (str): The incoming field group name of the alert
+
+        Returns:
+            tuple: (fingerprint, response), the response is a successful one with `suppressed`
+                set if the alert is a repeat, `None` if it has to be created
+        """
+        fingerprint = self.alert_dedup.fingerprint(alert_fields, incoming_field_group_name)
+        repeat = self.alert_dedup.check(fingerprint)
+        if repeat is None:
+            return fingerprint, None
+        self.logger.debug('Suppressed repeat {} of alert {} for another {:.1f}s'.format(
+            repeat['repeats'], repeat['alert_num'], repeat['expires_in']))
+        data = {'fingerprint': fingerprint, 'repeats': repeat['repeats']}
+        if repeat['alert_num'] is not None:
+            data['alert'] = {'alert_num': repeat['alert_num']}
+        return fingerprint, {'success': True, 'suppressed': True,
+                             'message': 'Repeated alert suppressed', 'data': data}
+
+    def _settle_alert(self, fingerprint, result):
+        """Helper function to record the outcome of a forwarded alert with the deduplicator
+
+        An alert kept in the outbox keeps its fingerprint reserved, so repeats are not queued
+        again while IR-Flow is unavailable.
+
+        Args:
+            fingerprint (str): The fingerprint of the alert
+            result (dict): The json response of create_alert, `None` if the call failed
+        """
+        if not isinstance(result, dict) or not (result.get('success') or result.get('queued')):
+            self.alert_dedup.release(fingerprint)
+            return
+        alert = (result.get('data') or {}).get('alert') or {}
+        self.alert_dedup.resolve(fingerprint, alert.get('alert_num'))
+
+    def create_alerts(self, alerts_fields, description=None, incoming_field_group_name=None,
+                      suppress_missing_field_warning=False, max_workers=8, ordered=True,
+                      deadline=None, adaptive=False):
+        """Create many alerts concurrently, one per dict of alert fields
+
+        The input is consumed lazily and at most `max_workers` alerts are in flight at once,
+        so arbitrarily large iterables (e.g. a csv.DictReader) can be streamed. Iterate the
+        returned object to receive one result per alert; afterwards its `summary` attribute
+        holds the aggregate throughput and latency::
+
+            bulk = irfc.create_alerts(rows, incoming_field_group_name='ds_test')
+            for result in bulk:
+                print(result.index, result.alert_num, result.error)
+            print(bulk.summary)
+
+        Args:
+            alerts_fields (iterable of dict): Key, Value pairs of fields for each alert
+            description (str): An optional string description for every alert
+            incoming_field_group_name (str): The string name of the incoming
+                field group name for these alerts as specified in IR-Flow
+            suppress_missing_field_warning (bool): Suppress the API warnings indicating
+                missing fields if `True` - defaults to `False`
+            max_workers (int): The number of alerts kept in flight, default = 8
+            ordered (bool): Yield results in input order if `True` (default), or as soon as
+                they complete if `False`
+            deadline (float): Time budget in seconds for the whole operation. Once spent, no
+                further input is read, calls in flight fail with a timeout and the summary is
+                flagged with `deadline_exceeded`.
+            adaptive (bool): Adapt the number of alerts in flight to the latency and
+                failures observed, with `max_workers` as the upper bound, see
+                :class:`irflow_client.concurrency.AdaptiveConcurrencyLimiter`
+
+        Returns:
+            irflow_client.bulk.BulkOperation: An iterable of
+                :class:`irflow_client.bulk.BulkResult`
+        """
+        deadline = Deadline.coerce(deadline)
+
+        def create(alert_fields):
+            with self.request_options(deadline=deadline):
+                return self.create_alert(
+                    alert_fields, description=description,
+                    incoming_field_group_name=incoming_field_group_name,
+                    suppress_missing_field_warning=suppress_missing_field_warning)
+
+        return BulkOperation(create, alerts_fields, max_workers=max_workers, ordered=ordered,
+                             deadline=deadline,
+                             limiter=self._concurrency_limiter(adaptive, max_workers,
+                                                               'create_alerts'))
+
+    def _concurrency_limiter(self, adaptive, max_workers, name):
+        """Helper function to create the limiter of an adaptive bulk operation
+
+        Args:
+            adaptive (bool): The operation adapts its concurrency, else no limiter is needed
+            max_workers (int): The upper bound of the limit
+            name (str): The operation, the label of its `concurrency_limit` gauge
+
+        Returns:
+            irflow_client.concurrency.AdaptiveConcurrencyLimiter: The limiter, or `None`
+        """
+        if not adaptive:
+            return None
+        return AdaptiveConcurrencyLimiter(initial_limit=min(2, max_workers),
+                                          max_limit=max_workers, metrics=self.metrics,
+                                          name=name)
 
     def create_incident(self, incident_type_name, incident_fields=None,
                         incident_subtype_name=None, description=None,
@@ -534,15 +1055,10 @@ class IRFlowClient(object):
             priority_id (str): ID of the priority to set
             owner_id (str): ID of the user to set incident owner to
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['create_incident'])
         params = {
             'fields': incident_fields,
             'incident_type_name': incident_type_name,
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
 
         if incident_subtype_name is not None:
             params['incident_subtype_name'] = incident_subtype_name
@@ -553,15 +1069,7 @@ class IRFlowClient(object):
         if owner_id is not None:
             params['owner_id'] = owner_id
 
-        if self.debug:
-            self.dump_request_debug_info('Create Incident', url, headers=headers, params=params)
-
-        response = self.session.post(url, json=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Create Incident', response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('create_incident', 'POST', 'Create Incident', json=params)
 
     def get_incident(self, incident_num):
         """Retrieve the incident with the specified ID
@@ -572,21 +1080,7 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['get_incident'])
-        url = url % incident_num
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get Incident', url, headers=headers)
-
-        response = self.session.get(url, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Get Incident', response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('get_incident', 'GET', 'Get Incident', path_args=(incident_num,))
 
     def update_incident(self, incident_num, incident_fields, incident_type_name,
                         owner_id, group_ids, incident_subtype_name=None, description=None, priority_id=None):
@@ -607,18 +1101,12 @@ class IRFlowClient(object):
         Returns:
              dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_incident'])
-        url = url % incident_num
         params = {
             'fields': incident_fields,
             'incident_type_name': incident_type_name,
             'owner_id': owner_id,
             'group_ids': group_ids
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
 
         if incident_subtype_name is not None:
             params['incident_subtype_name'] = incident_subtype_name
@@ -627,15 +1115,8 @@ class IRFlowClient(object):
         if priority_id is not None:
             params['priority_id'] = priority_id
 
-        if self.debug:
-            self.dump_request_debug_info('Update Incident', url, headers=headers, params=params)
-
-        response = self.session.put(url, json=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Update Incident', response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('put_incident', 'PUT', 'Update Incident',
+                              path_args=(incident_num,), json=params)
 
     def attach_alert_to_incident(self, alert_num, incident_num):
         """Attach the specified alert to the specified incident
@@ -649,20 +1130,9 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object returned by the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['put_alert_on_incident'])
-        url = url % (incident_num, alert_num)
-        headers = {'Content-type': 'application/json'}
-
-        if self.debug:
-            self.dump_request_debug_info('Attach Alert to Incident', url, headers=headers)
-
-        response = self.session.put(url, headers=headers, verify=False)
-
-        if self.debug:
-            self.dump_response_debug_info('Attach Alert to Incident',
-                                          response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('put_alert_on_incident', 'PUT', 'Attach Alert to Incident',
+                              path_args=(incident_num, alert_num),
+                              headers=_CONTENT_TYPE_HEADERS)
 
     def list_picklists(self, with_trashed=False, only_trashed=False):
         """List all picklists
@@ -674,26 +1144,12 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['get_picklist_list'])
         params = {
             'with_trashed': with_trashed,
             'only_trashed': only_trashed,
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get List of Picklists', url, headers=headers,
-                                         params=params)
-
-        response = self.session.get(url, params=params, verify=False, headers=headers)
 
-        if self.debug:
-            self.dump_response_debug_info('Get List of Picklists',
-                                          response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('get_picklist_list', 'GET', 'Get List of Picklists', params=params)
 
     def get_picklist(self, picklist_id):
         """Retrieve the picklist with the desired ID
@@ -704,21 +1160,7 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['get_picklist'])
-        url = url % picklist_id
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get Picklist', url, headers=headers)
-
-        response = self.session.get(url, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Get Picklist', response.status_code, response.json())
-
-        return response.json()
+        return self._dispatch('get_picklist', 'GET', 'Get Picklist', path_args=(picklist_id,))
 
     def add_item_to_picklist(self, picklist_id, value, label, description=None):
         """Add an item with the provided value, label, and description to the picklist
@@ -735,31 +1177,16 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['add_item_to_picklist'])
-        url = url % picklist_id
         params = {
             'value': value,
             'label': label,
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
 
         if description is not None:
             params['description'] = description
 
-        if self.debug:
-            self.dump_request_debug_info('Add Item to Picklist', url, headers=headers,
-                                         params=params)
-
-        response = self.session.post(url, json=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Add Item to Picklist', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('add_item_to_picklist', 'POST', 'Add Item to Picklist',
+                              path_args=(picklist_id,), json=params)
 
     def list_picklist_items(self, picklist_id, with_trashed=False, only_trashed=False):
         """Retrieve a list of all picklist items in a specified list
@@ -772,28 +1199,14 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address,
-                              self.end_points['get_picklist_item_list'])
         params = {
             'picklist_id': picklist_id,
             'with_trashed': with_trashed,
             'only_trashed': only_trashed,
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get List of Picklist Items', url, headers=headers,
-                                         params=params)
-
-        response = self.session.get(url, params=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Get List of Picklist Items', response.status_code,
-                                          response.json())
 
-        return response.json()
+        return self._dispatch('get_picklist_item_list', 'GET', 'Get List of Picklist Items',
+                              params=params)
 
     def create_picklist_item(self, picklist_id, value, label, description=None):
         """Create a new item in a specified picklist
@@ -809,30 +1222,16 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['create_picklist_item'])
         params = {
             'picklist_id': picklist_id,
             'value': value,
             'label': label,
         }
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
 
         if description is not None:
             params['description'] = description
 
-        if self.debug:
-            self.dump_request_debug_info('Add Picklist Item', url, headers=headers, params=params)
-
-        response = self.session.post(url, json=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Add PIcklist Item', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('create_picklist_item', 'POST', 'Add Picklist Item', json=params)
 
     def get_picklist_item(self, picklist_item_id):
         """Retrieve the picklist item corresponding to the specified ID
@@ -843,22 +1242,8 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['get_picklist_item'])
-        url = url % picklist_item_id
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Get Picklist Item', url, headers=headers)
-
-        response = self.session.get(url, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Get Picklist Item', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('get_picklist_item', 'GET', 'Get Picklist Item',
+                              path_args=(picklist_item_id,))
 
     def restore_picklist_item(self, picklist_item_id):
         """Restore a previously deleted picklist item
@@ -869,22 +1254,8 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['restore_picklist_item'])
-        url = url % picklist_item_id
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Restore Picklist Item', url, headers=headers)
-
-        response = self.session.put(url, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Restore Picklist Item', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('restore_picklist_item', 'PUT', 'Restore Picklist Item',
+                              path_args=(picklist_item_id,))
 
     def delete_picklist_item(self, picklist_item_id):
         """Mark a picklist item as deleted
@@ -895,22 +1266,8 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['delete_picklist_item'])
-        url = url % picklist_item_id
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-        if self.debug:
-            self.dump_request_debug_info('Delete Picklist Item', url, headers=headers)
-
-        response = self.session.delete(url, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Delete Picklist Item', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('delete_picklist_item', 'DELETE', 'Delete Picklist Item',
+                              path_args=(picklist_item_id,))
 
     def create_object_type(self, type_name, type_label, parent_type_name=None, parent_type_id=None):
         """Create an object type of the provided parent type or id with the provided name and label
@@ -933,12 +1290,6 @@ class IRFlowClient(object):
         if parent_type_name is None and parent_type_id is None:
             raise TypeError("Either parent_type_name or parent_type_id is required")
 
-        url = '%s://%s/%s' % (self.protocol, self.address, self.end_points['object_type'])
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
-
         params = {
             'type_name': type_name,
             'type_label': type_label,
@@ -946,16 +1297,7 @@ class IRFlowClient(object):
             'parent_type_id': parent_type_id
         }
 
-        if self.debug:
-            self.dump_request_debug_info('Store Object Type', url, headers=headers, params=params)
-
-        response = self.session.post(url, json=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Store Object Type', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('object_type', 'POST', 'Store Object Type', json=params)
 
     def attach_field_to_object_type(self, object_type_name, field_name,
                                     object_type_id=None, field_id=None):
@@ -974,12 +1316,6 @@ class IRFlowClient(object):
         Returns:
             dict: The full json response object from the IR-Flow API
         """
-        url = '%s://%s/%s/%s' % (self.protocol, self.address,
-                                 self.end_points['object_type'], 'attach_field')
-        headers = {
-            'Content-type': 'application/json',
-            'Accept': 'application/json'
-        }
         params = {
             'object_type_name': object_type_name,
             'field_name': field_name,
@@ -987,23 +1323,17 @@ class IRFlowClient(object):
             'field_id': field_id
         }
 
-        if self.debug:
-            self.dump_request_debug_info('Attach Field to Object Type', url, headers=headers,
-                                         params=params)
-
-        response = self.session.put(url, json=params, verify=False, headers=headers)
-
-        if self.debug:
-            self.dump_response_debug_info('Attach Field to Object Type', response.status_code,
-                                          response.json())
-
-        return response.json()
+        return self._dispatch('object_type', 'PUT', 'Attach Field to Object Type',
+                              suffix='attach_field', json=params)
 
     # The following helper functions are also defined in the irflow_client
     @staticmethod
     def get_field_by_name(field_name, field_list):
         """Helper function to return a field via a string name match given a field and field list
 
+        This scans `field_list` on every call, use :func:`get_fact_group_view` to look up
+        many fields of the same fact group.
+
         Args:
             field_name (str): The string name of the desired field
             field_list (list): A list of field objects
@@ -1040,6 +1370,63 @@ class IRFlowClient(object):
             protocol (str): https unless otherwise specified, default = HTTPS
             debug (bool): enable debug output, default = None
             verbose (int): turn up the verbosity default = 0 (optional)
+            pool_connections (int): number of per host connection pools to cache, default = 10
+            pool_maxsize (int): connections kept open per host, default = 10
+            pool_block (bool): wait for a free connection instead of opening an extra one
+                when the pool is exhausted, default = False
+            tcp_keepalive (bool): enable TCP keep-alive on pooled connections, default = True
+            max_retries (int): retries of a failed call, 0 disables retrying, default = 3
+            backoff_factor (float): seconds of the first retry backoff, default = 0.5
+            backoff_max (float): upper bound of a retry backoff in seconds, default = 30
+            retry_non_idempotent (bool): also retry POST calls, default = False
+            connect_timeout (float): seconds to wait for a connection, default = 5
+            read_timeout (float): seconds to wait for response data, default = 30
+            attachment_read_timeout (float): read timeout of attachment uploads and
+                downloads, default = 300
+            eager_version (bool): request the server version when the client is created
+                instead of on first use of `version`, default = False
+            version_cache_file (str): path of a file caching the server version between
+                processes, default = None (no cache)
+            version_cache_ttl (float): seconds a cached server version is valid, default = 3600
+            download_chunk_size (int): largest read of an attachment download in bytes,
+                default = 1 MiB
+            download_spill_threshold (int): largest attachment downloaded to memory in bytes,
+                larger ones go to a temporary file, default = 64 MiB
+            cache_responses (bool): cache responses of read-mostly endpoints, default = False
+            response_cache_max_bytes (int): upper bound of the response cache in bytes,
+                default = 8 MiB
+            dedup_uploads (bool): skip uploads of content already uploaded to the same
+                object, default = False
+            upload_index_file (str): path of a file keeping the uploaded content hashes
+                between runs, enables dedup_uploads, default = None
+            dedup_alerts (bool): suppress repeats of an alert in create_alert, default = False
+            alert_dedup_window (float): seconds repeats of a created alert are suppressed,
+                default = 60
+            alert_dedup_fields (str): comma separated field names identifying an alert,
+                default = all fields
+            alert_dedup_max_entries (int): upper bound of alerts remembered, default = 10000
+            coalesce_requests (bool): share the response of identical GET requests in flight,
+                default = False
+            collect_metrics (bool): record calls per endpoint in `metrics`, default = False
+            record_file (str): append every call to this file with secrets redacted,
+                default = None
+            record_redact_fields (str): comma separated json field names redacted on top of
+                the built in secret names, default = None
+            rate_limit (float): requests per second of all endpoints together, default = None
+            rate_limit_burst (float): requests sent at once after an idle period,
+                default = one second's worth
+            rate_limit_endpoints (str): comma separated endpoint=rate pairs, e.g.
+                `create_alert=2, get_alert=10`, default = None
+            rate_limit_file (str): state file sharing the rate limit between processes,
+                default = None
+            circuit_breaking (bool): fail calls fast after repeated failures, default = False
+            circuit_failure_threshold (int): consecutive failed requests opening the circuit,
+                default = 5
+            circuit_reset_timeout (float): seconds before an open circuit lets a trial call
+                through, default = 30
+            circuit_half_open_probes (int): trial calls let through at once, default = 1
+            outbox_file (str): SQLite file keeping calls made while IR-Flow is unavailable,
+                default = None
         """
 
         # Checking for missing config values
@@ -1077,9 +1464,13 @@ class IRFlowClient(object):
         try:
             if config_args['verbose']:
                 self.verbose = int(config_args['verbose'])
+            else:
+                self.verbose = 0
         except KeyError:
             self.verbose = 1
 
+        self._set_optional_config(config_args.get)
+
         # Dump Configuration if --debug
         if self.debug:
             self.dump_settings()
@@ -1149,6 +1540,25 @@ class IRFlowClient(object):
         else:
             self.verbose = 1
 
+        self._set_optional_config(lambda name: config.get('IRFlowAPI', name)
+                                  if config.has_option('IRFlowAPI', name) else None)
+
         # Dump Configuration if --debug
         if self.debug:
             self.dump_settings()
+
+    def _set_optional_config(self, get_option):
+        """Helper function to set the optional tuning options listed in `config_options`
+
+        Args:
+            get_option (callable): Returns the raw value for an option name, `None` if unset
+        """
+        for name, (kind, default) in self.config_options.items():
+            value = get_option(name)
+            if value is None or value == '':
+                value = default
+            elif kind is bool and not isinstance(value, bool):
+                value = str(value).strip().lower() in ('1', 'true', 'yes', 'on')
+            else:
+                value = kind(value)
+            setattr(self, name, value)
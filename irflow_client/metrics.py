@@ -0,0 +1,278 @@
+"""Per endpoint request metrics
+
+With ``collect_metrics`` configured, every call of a client is recorded in a
+:class:`ClientMetrics` under its logical endpoint, the key of
+:attr:`irflow_client.irflow_client.IRFlowClient.end_points`: number of calls, a latency
+histogram, request and response bytes, status codes and retries. Read the figures with
+:func:`ClientMetrics.snapshot`, or in the Prometheus text format with
+:func:`format_prometheus`. Components such as the adaptive concurrency limiter of bulk
+operations publish their current state as gauges, see :func:`ClientMetrics.set_gauge`::
+
+    irfc = IRFlowClient(dict(config, collect_metrics=True))
+    ...
+    print(irfc.metrics.snapshot()['get_alert']['latency']['p95'])
+    open('/var/lib/node_exporter/irflow.prom', 'w').write(format_prometheus(irfc.metrics))
+"""
+import bisect
+import threading
+
+# Upper bounds of the latency histogram buckets in seconds
+DEFAULT_BUCKETS = (0.005, 0.01, 0.025, 0.05, 0.1, 0.25, 0.5, 1.0, 2.5, 5.0, 10.0, 30.0, 60.0)
+
+
+def body_size(body):
+    """Return the size of a request body as sent by ``requests``
+
+    Args:
+        body (bytes or str or file-like): A prepared request body
+
+    Returns:
+        int: The size in bytes, 0 if there is none or it is unknown
+    """
+    if body is None:
+        return 0
+    if isinstance(body, (bytes, bytearray)):
+        return len(body)
+    if isinstance(body, str):
+        return len(body.encode('utf-8'))
+    return getattr(body, 'len', None) or 0
+
+
+class EndpointMetrics(object):
+    """Figures of one endpoint, updated under the lock of its :class:`ClientMetrics`
+
+    Attributes:
+        requests (int): Calls made, retries not counted separately
+        retries (int): Attempts repeated by the retry policy
+        request_bytes (int): Request body bytes sent, counted once per call
+        response_bytes (int): Response body bytes received
+        statuses (dict): Calls per final HTTP status, or per exception class name for calls
+            without a response
+        latency_sum (float): Seconds spent in calls, retries and backoff included
+        bucket_counts (list): Calls per latency bucket, not cumulative
+    """
+    __slots__ = ('requests', 'retries', 'request_bytes', 'response_bytes', 'statuses',
+                 'latency_sum', 'bucket_counts')
+
+    def __init__(self, bucket_count):
+        self.requests = 0
+        self.retries = 0
+        self.request_bytes = 0
+        self.response_bytes = 0
+        self.statuses = {}
+        self.latency_sum = 0.0
+        self.bucket_counts = [0] * (bucket_count + 1)
+
+
+class ClientMetrics(object):
+    """Thread safe per endpoint request metrics
+
+    Args:
+        buckets (tuple): Ascending upper bounds of the latency histogram buckets in seconds,
+            default = 5 ms to 60 s
+    """
+
+    def __init__(self, buckets=DEFAULT_BUCKETS):
+        self.buckets = tuple(buckets)
+        self._lock = threading.Lock()
+        self._endpoints = {}
+        # (name, sorted label pairs) -> value, and name -> help text
+        self._gauges = {}
+        self._gauge_help = {}
+
+    def set_gauge(self, name, value, labels=None, help_text=None):
+        """Set the current value of a gauge
+
+        Args:
+            name (str): The gauge name, prefixed like every metric when exported
+            value (float): The current value
+            labels (dict): Labels telling apart gauges of the same name
+            help_text (str): The description of the gauge in the Prometheus export
+        """
+        key = (name, tuple(sorted((labels or {}).items())))
+        with self._lock:
+            self._gauges[key] = value
+            if help_text:
+                self._gauge_help[name] = help_text
+
+    def gauges(self):
+        """Return the current gauge values
+
+        Returns:
+            dict: Keyed by gauge name, each a list of (labels dict, value)
+        """
+        with self._lock:
+            items = sorted(self._gauges.items(), key=lambda item: (item[0][0], str(item[0][1])))
+        gauges = {}
+        for (name, labels), value in items:
+            gauges.setdefault(name, []).append((dict(labels), value))
+        return gauges
+
+    def record(self, endpoint, latency, status, request_bytes=0, response_bytes=0, retries=0):
+        """Record a call
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            latency (float): Seconds the call took
+            status (int or str): The final HTTP status, or the name of the exception raised
+            request_bytes (int): Request body bytes sent
+            response_bytes (int): Response body bytes received
+            retries (int): Attempts repeated by the retry policy
+        """
+        bucket = bisect.bisect_left(self.buckets, latency)
+        with self._lock:
+            metrics = self._endpoints.get(endpoint)
+            if metrics is None:
+                metrics = self._endpoints[endpoint] = EndpointMetrics(len(self.buckets))
+            metrics.requests += 1
+            metrics.retries += retries
+            metrics.request_bytes += request_bytes
+            metrics.response_bytes += response_bytes
+            metrics.statuses[status] = metrics.statuses.get(status, 0) + 1
+            metrics.latency_sum += latency
+            metrics.bucket_counts[bucket] += 1
+
+    def _quantile(self, counts, total, fraction):
+        """Helper function to estimate a latency quantile as the upper bound of its bucket"""
+        rank = fraction * total
+        seen = 0
+        for bound, count in zip(self.buckets, counts):
+            seen += count
+            if seen >= rank:
+                return bound
+        return float('inf')
+
+    def snapshot(self):
+        """Return a consistent copy of the figures of every endpoint called so far
+
+        Returns:
+            dict: Keyed by endpoint, each a dict with `requests`, `retries`, `request_bytes`,
+                `response_bytes`, `statuses` and `latency`. `latency` holds `sum`, `mean`,
+                `p50`, `p95` and `p99` in seconds, the quantiles estimated as the upper bound
+                of their bucket, and `buckets`, a list of (upper bound, cumulative count).
+        """
+        with self._lock:
+            endpoints = dict(
+                (name, (metrics.requests, metrics.retries, metrics.request_bytes,
+                        metrics.response_bytes, dict(metrics.statuses), metrics.latency_sum,
+                        list(metrics.bucket_counts)))
+                for name, metrics in self._endpoints.items())
+
+        snapshot = {}
+        for name, (requests, retries, sent, received, statuses, latency_sum,
+                   counts) in endpoints.items():
+            cumulative = []
+            total = 0
+            for bound, count in zip(self.buckets + (float('inf'),), counts):
+                total += count
+                cumulative.append((bound, total))
+            snapshot[name] = {
+                'requests': requests,
+                'retries': retries,
+                'request_bytes': sent,
+                'response_bytes': received,
+                'statuses': statuses,
+                'latency': {
+                    'sum': latency_sum,
+                    'mean': latency_sum / requests if requests else None,
+                    'p50': self._quantile(counts, requests, 0.50),
+                    'p95': self._quantile(counts, requests, 0.95),
+                    'p99': self._quantile(counts, requests, 0.99),
+                    'buckets': cumulative,
+                },
+            }
+        return snapshot
+
+    def reset(self):
+        """Forget the figures of every endpoint, gauges keep their current values"""
+        with self._lock:
+            self._endpoints = {}
+
+    def __len__(self):
+        with self._lock:
+            return len(self._endpoints)
+
+    def __repr__(self):
+        with self._lock:
+            calls = sum(metrics.requests for metrics in self._endpoints.values())
+        return 'ClientMetrics(endpoints={}, requests={})'.format(len(self), calls)
+
+
+def _label(value):
+    """Helper function to escape a Prometheus label value"""
+    return str(value).replace('\\', '\\\\').replace('"', '\\"').replace('\n', '\\n')
+
+
+def _number(value):
+    if value == float('inf'):
+        return '+Inf'
+    return repr(float(value)) if isinstance(value, float) else str(value)
+
+
+def format_prometheus(metrics, prefix='irflow_client', labels=None):
+    """Render client metrics in the Prometheus text exposition format
+
+    Args:
+        metrics (ClientMetrics or dict): The metrics, or a snapshot of them without gauges
+        prefix (str): Prefix of every metric name, default = `irflow_client`
+        labels (dict): Constant labels added to every sample, e.g. ``{'instance': 'soar1'}``
+
+    Returns:
+        str: The exposition text, ending in a newline
+    """
+    snapshot = metrics.snapshot() if isinstance(metrics, ClientMetrics) else metrics
+    constant = ''.join(',{}="{}"'.format(key, _label(value))
+                       for key, value in sorted((labels or {}).items()))
+    lines = []
+
+    def family(name, kind, help_text, samples):
+        lines.append('# HELP {}_{} {}'.format(prefix, name, help_text))
+        lines.append('# TYPE {}_{} {}'.format(prefix, name, kind))
+        lines.extend(samples)
+
+    endpoints = sorted(snapshot.items())
+    for name, key, help_text in (
+            ('requests_total', 'requests', 'IR-Flow API calls made.'),
+            ('retries_total', 'retries', 'IR-Flow API attempts repeated by the retry policy.'),
+            ('request_bytes_total', 'request_bytes', 'Request body bytes sent.'),
+            ('response_bytes_total', 'response_bytes', 'Response body bytes received.')):
+        family(name, 'counter', help_text, [
+            '{}_{}{{endpoint="{}"{}}} {}'.format(prefix, name, _label(endpoint), constant,
+                                                 figures[key])
+            for endpoint, figures in endpoints])
+
+    family('responses_total', 'counter',
+           'IR-Flow API calls by final HTTP status, or exception raised.', [
+               '{}_responses_total{{endpoint="{}",status="{}"{}}} {}'.format(
+                   prefix, _label(endpoint), _label(status), constant, count)
+               for endpoint, figures in endpoints
+               for status, count in sorted(figures['statuses'].items(), key=str)])
+
+    samples = []
+    for endpoint, figures in endpoints:
+        latency = figures['latency']
+        for bound, count in latency['buckets']:
+            samples.append('{}_request_duration_seconds_bucket{{endpoint="{}",le="{}"{}}} {}'
+                           .format(prefix, _label(endpoint), _number(bound), constant, count))
+        samples.append('{}_request_duration_seconds_sum{{endpoint="{}"{}}} {}'.format(
+            prefix, _label(endpoint), constant, _number(latency['sum'])))
+        samples.append('{}_request_duration_seconds_count{{endpoint="{}"{}}} {}'.format(
+            prefix, _label(endpoint), constant, figures['requests']))
+    family('request_duration_seconds', 'histogram',
+           'Duration of IR-Flow API calls, retries and backoff included.', samples)
+
+    if isinstance(metrics, ClientMetrics):
+        for name, values in sorted(metrics.gauges().items()):
+            samples = []
+            for gauge_labels, value in values:
+                pairs = ['{}="{}"'.format(key, _label(label))
+                         for key, label in sorted(gauge_labels.items())]
+                pairs.extend('{}="{}"'.format(key, _label(label))
+                             for key, label in sorted((labels or {}).items()))
+                samples.append('{}_{}{} {}'.format(prefix, name,
+                                                   '{' + ','.join(pairs) + '}' if pairs else '',
+                                                   _number(value)))
+            family(name, 'gauge', metrics._gauge_help.get(name, name.replace('_', ' ')),
+                   samples)
+
+    return '\n'.join(lines) + '\n'
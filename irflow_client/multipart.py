@@ -0,0 +1,173 @@
+"""Streaming multipart/form-data bodies for attachment uploads
+
+A :class:`MultipartUpload` produces the multipart body of a single file upload on demand, one
+chunk at a time, so uploading a multi-GB capture needs no more memory than one chunk. The file
+can be given as a path, an open binary file object or bytes. A file the upload opened itself is
+closed when the upload is closed; file objects passed in are left open for the caller.
+"""
+import binascii
+import io
+import os
+
+CHUNK_SIZE = 64 * 1024
+
+
+def _quote(value):
+    """Escape a value for a quoted multipart header parameter, as browsers do"""
+    return value.replace('"', '%22').replace('\r', '%0D').replace('\n', '%0A')
+
+
+class MultipartUpload(object):
+    """Readable, iterable multipart/form-data body holding one file
+
+    ``requests`` streams it as the request body, with a Content-Length header when the size of
+    the file is known and chunked transfer encoding otherwise::
+
+        with MultipartUpload('/tmp/capture.pcap') as body:
+            session.post(url, data=body, headers={'Content-Type': body.content_type})
+
+    Args:
+        source (str or file or bytes): Path of the file, a binary file object positioned at the
+            start of the content, or the content itself
+        name (str): File name sent to IR-Flow, defaults to the base name of the file, or
+            `attachment` if there is none
+        field_name (str): Name of the form field, default = `file`
+        progress (callable): Called as ``progress(bytes_sent, total_bytes)`` after every chunk
+            of file content read for sending. `total_bytes` is `None` if the size is unknown.
+        chunk_size (int): Largest chunk of file content read at once, default = 64 KiB
+
+    Attributes:
+        name (str): The file name sent to IR-Flow
+        content_type (str): The Content-Type header of the request, boundary included
+        size (int): Size of the file content, `None` if unknown
+        len (int): Size of the whole body, `None` if unknown. ``requests`` reads it to set the
+            Content-Length header.
+        bytes_sent (int): File content read for sending so far
+        rewindable (bool): Whether the body can be produced again for a retry
+    """
+
+    def __init__(self, source, name=None, field_name='file', progress=None,
+                 chunk_size=CHUNK_SIZE):
+        self.progress = progress
+        self.chunk_size = chunk_size
+        self._data = None
+        self._handle = None
+        self._owns_handle = False
+        self._start = 0
+
+        if isinstance(source, (bytes, bytearray, memoryview)):
+            self._data = memoryview(source).cast('B')
+            self.size = len(self._data)
+            self.rewindable = True
+        elif hasattr(source, 'read'):
+            self._handle = source
+            self.size, self.rewindable = self._measure(source)
+            name = name or os.path.basename(str(getattr(source, 'name', '')))
+        else:
+            path = os.fspath(source)
+            self._handle = open(path, 'rb')
+            self._owns_handle = True
+            self.size = os.fstat(self._handle.fileno()).st_size
+            self.rewindable = True
+            name = name or os.path.basename(path)
+
+        self.name = name or 'attachment'
+        boundary = binascii.hexlify(os.urandom(16)).decode('ascii')
+        self.content_type = 'multipart/form-data; boundary=%s' % boundary
+        self._preamble = ('--%s\r\nContent-Disposition: form-data; name="%s"; '
+                          'filename="%s"\r\n\r\n' % (boundary, _quote(field_name),
+                                                     _quote(self.name))
+                          ).encode('utf-8')
+        self._epilogue = ('\r\n--%s--\r\n' % boundary).encode('ascii')
+        self.len = None
+        if self.size is not None:
+            self.len = len(self._preamble) + self.size + len(self._epilogue)
+        self._part = 0
+        self._offset = 0
+        self.bytes_sent = 0
+
+    def _measure(self, handle):
+        """Helper function to find the remaining size of a file object and if it can seek
+
+        Returns:
+            tuple: (size or `None`, seekable)
+        """
+        try:
+            if not handle.seekable():
+                return None, False
+            self._start = handle.tell()
+            end = handle.seek(0, io.SEEK_END)
+            handle.seek(self._start)
+            return end - self._start, True
+        except (AttributeError, OSError, ValueError):
+            return None, False
+
+    def seek(self, offset, whence=io.SEEK_SET):
+        """Rewind the body to its start, the only supported position
+
+        Raises:
+            io.UnsupportedOperation: The body cannot be rewound, or `offset` is not 0
+        """
+        if offset != 0 or whence != io.SEEK_SET:
+            raise io.UnsupportedOperation('MultipartUpload can only seek to the start')
+        if self._part == 0 and self._offset == 0:
+            return 0
+        if not self.rewindable:
+            raise io.UnsupportedOperation('The file object of this upload cannot seek')
+        if self._handle is not None:
+            self._handle.seek(self._start)
+        self._part = 0
+        self._offset = 0
+        self.bytes_sent = 0
+        return 0
+
+    def read(self, size=-1):
+        """Read the next piece of the body, at most `chunk_size` bytes of file content at once
+
+        Returns:
+            bytes: The next piece, empty once the whole body was read
+        """
+        if size is None or size < 0:
+            size = self.chunk_size
+        while self._part < 3:
+            if self._part == 1:
+                chunk = self._read_content(min(size, self.chunk_size))
+            else:
+                segment = self._preamble if self._part == 0 else self._epilogue
+                chunk = segment[self._offset:self._offset + size]
+                self._offset += len(chunk)
+            if chunk:
+                return chunk
+            self._part += 1
+            self._offset = 0
+        return b''
+
+    def _read_content(self, size):
+        if self._data is not None:
+            chunk = self._data[self._offset:self._offset + size]
+            self._offset += len(chunk)
+        else:
+            chunk = self._handle.read(size)
+        if chunk:
+            self.bytes_sent += len(chunk)
+            if self.progress is not None:
+                self.progress(self.bytes_sent, self.size)
+        return chunk
+
+    def __iter__(self):
+        while True:
+            chunk = self.read(self.chunk_size)
+            if not chunk:
+                return
+            yield chunk
+
+    def close(self):
+        """Close the file if this upload opened it"""
+        if self._owns_handle and not self._handle.closed:
+            self._handle.close()
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
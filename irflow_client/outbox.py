@@ -0,0 +1,630 @@
+"""Durable outbox for calls made while IR-Flow is unavailable
+
+With ``outbox_file`` configured, :func:`irflow_client.irflow_client.IRFlowClient.create_alert`
+and :func:`irflow_client.irflow_client.IRFlowClient.put_fact_group` calls that fail because
+IR-Flow cannot be reached, is in maintenance or the circuit breaker is open are written to an
+SQLite :class:`Outbox` instead of being lost. The call then returns an unsuccessful response
+with `queued` set and the `outbox_id` of the entry in its `data`.
+
+An :class:`OutboxDrainer` sends the entries again, oldest first, at a controlled rate. While
+IR-Flow is still unavailable it pauses with exponential backoff, so it can run all the time::
+
+    irfc = IRFlowClient(dict(config, outbox_file='/var/lib/irflow/outbox.db'))
+    drainer = OutboxDrainer(irfc, rate=5).start()
+    ...
+    drainer.stop()
+
+or as a command::
+
+    irflow-outbox --config api.conf /var/lib/irflow/outbox.db --drain --rate 5
+    irflow-outbox --config api.conf /var/lib/irflow/outbox.db --requeue-in-doubt
+
+Every entry is committed to disk before the call returns and is marked sent exactly once:
+drainers claim entries in a transaction, so two drainers never send the same entry, and only
+the drainer holding an entry can settle it. A drainer that dies while sending leaves its
+entry claimed. The next drainer recovers it once the process is gone, or after `lease`
+seconds: a PUT is queued again, since sending it twice does no harm, but a POST is marked
+`in_doubt`, as IR-Flow may have created the alert already. The same goes for a call that
+timed out or lost its connection after it was sent. Entries in doubt are kept for review,
+:func:`Outbox.requeue` sends them again.
+
+Entries are sent in order by a single drainer, but calls made directly once IR-Flow is back
+may overtake older queued ones, e.g. two updates of the same fact group.
+"""
+import argparse
+import errno
+import json
+import logging
+import os
+import socket
+import sqlite3
+import sys
+import threading
+import time
+import uuid
+
+from .ratelimit import RateLimiter
+
+PENDING = 'pending'
+SENDING = 'sending'
+DONE = 'done'
+FAILED = 'failed'
+IN_DOUBT = 'in_doubt'
+
+# Responses telling to try again later, any other error status rejects the entry for good
+TRANSIENT_STATUSES = frozenset([408, 429, 502, 503, 504])
+
+# Transient responses of a server that refused the call without acting on it
+REFUSED_STATUSES = frozenset([429, 503])
+
+# Methods that may be sent twice without a second effect
+IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE'])
+
+_SCHEMA = '''
+CREATE TABLE IF NOT EXISTS entries (
+    id INTEGER PRIMARY KEY AUTOINCREMENT,
+    endpoint TEXT NOT NULL,
+    method TEXT NOT NULL,
+    path TEXT NOT NULL,
+    headers TEXT,
+    body TEXT,
+    state TEXT NOT NULL,
+    attempts INTEGER NOT NULL DEFAULT 0,
+    created REAL NOT NULL,
+    claimed_by TEXT,
+    claimed_at REAL,
+    finished REAL,
+    error TEXT,
+    result TEXT
+);
+CREATE INDEX IF NOT EXISTS entries_state ON entries (state, id);
+'''
+
+_COLUMNS = ('id, endpoint, method, path, headers, body, state, attempts, created, claimed_by, '
+            'error, result')
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def _loads(text):
+    return json.loads(text) if text is not None else None
+
+
+def failed_state(method, maybe_received):
+    """Return the state of a call IR-Flow did not answer
+
+    Args:
+        method (str): The HTTP verb of the call
+        maybe_received (bool): The call may have reached IR-Flow, e.g. it timed out waiting
+            for the response
+
+    Returns:
+        str: `pending` to send it again, `in_doubt` if sending it again may repeat its effect
+    """
+    if maybe_received and method not in IDEMPOTENT_METHODS:
+        return IN_DOUBT
+    return PENDING
+
+
+class OutboxEntry(object):
+    """A call kept in the outbox
+
+    Attributes:
+        id (int): The entry number, increasing in the order calls were queued
+        endpoint (str): The key of the endpoint in `end_points`
+        method (str): The HTTP verb of the call
+        path (str): The path and query string of the call
+        headers (dict): The headers of the call, without authentication
+        json (object): The json body of the call
+        state (str): `pending`, `sending`, `done`, `failed` or `in_doubt`
+        attempts (int): Times the entry was sent without a final answer
+        created (float): Unix time the call was queued
+        error (str): Why the call was queued, or the last failure sending it
+        result (object): The json response of IR-Flow once the entry is done
+    """
+    __slots__ = ('id', 'endpoint', 'method', 'path', 'headers', 'json', 'state', 'attempts',
+                 'created', 'claimed_by', 'error', 'result')
+
+    def __init__(self, row):
+        (self.id, self.endpoint, self.method, self.path, headers, body, self.state,
+         self.attempts, self.created, self.claimed_by, self.error, result) = row
+        self.headers = _loads(headers) or {}
+        self.json = _loads(body)
+        self.result = _loads(result)
+
+    def __repr__(self):
+        return 'OutboxEntry(id={}, endpoint={}, state={}, attempts={})'.format(
+            self.id, self.endpoint, self.state, self.attempts)
+
+
+class Outbox(object):
+    """Calls waiting to be sent to IR-Flow, kept in an SQLite file, thread and process safe
+
+    Every change is committed with ``synchronous=FULL``, it survives a crash of the process
+    or the host once the method returned.
+
+    Args:
+        path (str): The SQLite file, created if missing
+        timeout (float): Seconds to wait for another process holding the file, default = 30
+    """
+
+    def __init__(self, path, timeout=30.0):
+        self.path = os.path.expanduser(path)
+        self.timeout = timeout
+        self._lock = threading.RLock()
+        self._connection = None
+        self._pid = None
+
+    def _connect(self):
+        # A forked worker opens its own connection, SQLite connections must not be shared
+        if self._connection is None or self._pid != os.getpid():
+            connection = sqlite3.connect(self.path, timeout=self.timeout,
+                                         isolation_level=None, check_same_thread=False)
+            connection.execute('PRAGMA journal_mode=WAL')
+            connection.execute('PRAGMA synchronous=FULL')
+            connection.executescript(_SCHEMA)
+            self._connection = connection
+            self._pid = os.getpid()
+        return self._connection
+
+    def _transaction(self, func):
+        """Helper function to run ``func(connection)`` in one write transaction"""
+        with self._lock:
+            connection = self._connect()
+            connection.execute('BEGIN IMMEDIATE')
+            try:
+                result = func(connection)
+            except BaseException:
+                connection.execute('ROLLBACK')
+                raise
+            connection.execute('COMMIT')
+            return result
+
+    def _query(self, sql, args=()):
+        with self._lock:
+            return self._connect().execute(sql, args).fetchall()
+
+    def add(self, endpoint, method, path, json=None, headers=None, error=None, state=PENDING):
+        """Queue a call
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            method (str): The HTTP verb of the call
+            path (str): The path and query string of the call
+            json (object): The json body of the call
+            headers (dict): The headers of the call, without authentication
+            error (str): Why the call was queued
+            state (str): `pending` to send it, or `in_doubt` if IR-Flow may have received it
+
+        Returns:
+            int: The ID of the entry
+        """
+        body = None if json is None else _dumps(json)
+        return self._transaction(lambda connection: connection.execute(
+            'INSERT INTO entries (endpoint, method, path, headers, body, state, created, error) '
+            'VALUES (?, ?, ?, ?, ?, ?, ?, ?)',
+            (endpoint, method, path, _dumps(headers or {}), body, state, time.time(),
+             error)).lastrowid)
+
+    def claim(self, owner):
+        """Take the oldest pending entry for sending, no other owner can take it meanwhile
+
+        Args:
+            owner (str): Identifies the drainer, see :attr:`OutboxDrainer.owner`
+
+        Returns:
+            OutboxEntry: The entry, `None` if nothing is pending
+        """
+        def take(connection):
+            row = connection.execute(
+                'SELECT {} FROM entries WHERE state = ? ORDER BY id LIMIT 1'.format(_COLUMNS),
+                (PENDING,)).fetchone()
+            if row is None:
+                return None
+            connection.execute(
+                'UPDATE entries SET state = ?, claimed_by = ?, claimed_at = ? WHERE id = ?',
+                (SENDING, owner, time.time(), row[0]))
+            entry = OutboxEntry(row)
+            entry.state = SENDING
+            entry.claimed_by = owner
+            return entry
+
+        return self._transaction(take)
+
+    def _settle(self, entry_id, owner, sql, args):
+        """Helper function to update an entry still claimed by `owner`, returns if it was"""
+        return self._transaction(lambda connection: connection.execute(
+            'UPDATE entries SET {} WHERE id = ? AND state = ? AND claimed_by = ?'.format(sql),
+            tuple(args) + (entry_id, SENDING, owner)).rowcount == 1)
+
+    def complete(self, entry_id, owner, result=None):
+        """Mark a claimed entry sent, IR-Flow answered it
+
+        Args:
+            entry_id (int): The ID of the entry
+            owner (str): The drainer that claimed it
+            result (object): The json response of IR-Flow
+
+        Returns:
+            bool: `False` if the entry was not claimed by `owner`, e.g. recovered by another
+                drainer after the lease expired
+        """
+        return self._settle(entry_id, owner, 'state = ?, finished = ?, result = ?',
+                            (DONE, time.time(), None if result is None else _dumps(result)))
+
+    def release(self, entry_id, owner, error):
+        """Return a claimed entry to the queue after a failure that may pass
+
+        Args:
+            entry_id (int): The ID of the entry
+            owner (str): The drainer that claimed it
+            error (str): The failure
+
+        Returns:
+            bool: `False` if the entry was not claimed by `owner`
+        """
+        return self._settle(entry_id, owner,
+                            'state = ?, attempts = attempts + 1, claimed_by = NULL, error = ?',
+                            (PENDING, error))
+
+    def reject(self, entry_id, owner, error, state=FAILED):
+        """Stop sending a claimed entry
+
+        Args:
+            entry_id (int): The ID of the entry
+            owner (str): The drainer that claimed it
+            error (str): Why, e.g. the message of IR-Flow rejecting the call
+            state (str): `failed`, or `in_doubt` if IR-Flow may have received it
+
+        Returns:
+            bool: `False` if the entry was not claimed by `owner`
+        """
+        return self._settle(entry_id, owner,
+                            'state = ?, attempts = attempts + 1, finished = ?, error = ?',
+                            (state, time.time(), error))
+
+    def recover(self, lease=300.0, alive=None):
+        """Settle entries claimed by drainers that died while sending them
+
+        An entry is recovered once its drainer's process is gone, or `lease` seconds after
+        it was claimed. Idempotent calls are queued again, others are marked `in_doubt`.
+
+        Args:
+            lease (float): Seconds after which a claim is considered abandoned
+            alive (callable): Tells from an owner whether its drainer still runs, default =
+                the process of the owner exists on this host
+
+        Returns:
+            tuple: (entries queued again, entries marked in doubt)
+        """
+        alive = alive or _owner_alive
+        now = time.time()
+
+        def settle(connection):
+            requeued = in_doubt = 0
+            rows = connection.execute(
+                'SELECT id, method, claimed_by, claimed_at FROM entries WHERE state = ?',
+                (SENDING,)).fetchall()
+            for entry_id, method, owner, claimed_at in rows:
+                if claimed_at > now - lease and alive(owner):
+                    continue
+                if method in IDEMPOTENT_METHODS:
+                    state = PENDING
+                    requeued += 1
+                else:
+                    state = IN_DOUBT
+                    in_doubt += 1
+                connection.execute(
+                    'UPDATE entries SET state = ?, claimed_by = NULL, error = ? WHERE id = ?',
+                    (state, 'Drainer {} stopped while sending'.format(owner), entry_id))
+            return requeued, in_doubt
+
+        requeued, in_doubt = self._transaction(settle)
+        if requeued or in_doubt:
+            logger.warning('Recovered outbox entries of stopped drainers: {} queued again, {} '
+                           'in doubt'.format(requeued, in_doubt))
+        return requeued, in_doubt
+
+    def requeue(self, entry_ids=None, state=IN_DOUBT):
+        """Queue entries in doubt or failed again
+
+        Args:
+            entry_ids (list): The IDs of the entries, default = every entry in `state`
+            state (str): The state of the entries to queue again, default = `in_doubt`
+
+        Returns:
+            int: Entries queued again
+        """
+        def update(connection):
+            if entry_ids is None:
+                return connection.execute('UPDATE entries SET state = ? WHERE state = ?',
+                                          (PENDING, state)).rowcount
+            return sum(connection.execute(
+                'UPDATE entries SET state = ? WHERE id = ? AND state = ?',
+                (PENDING, entry_id, state)).rowcount for entry_id in entry_ids)
+
+        return self._transaction(update)
+
+    def entries(self, state=None):
+        """Return the entries, oldest first
+
+        Args:
+            state (str): Only entries in this state, default = all
+
+        Returns:
+            list: :class:`OutboxEntry` instances
+        """
+        if state is None:
+            rows = self._query('SELECT {} FROM entries ORDER BY id'.format(_COLUMNS))
+        else:
+            rows = self._query('SELECT {} FROM entries WHERE state = ? ORDER BY id'.format(
+                _COLUMNS), (state,))
+        return [OutboxEntry(row) for row in rows]
+
+    def counts(self):
+        """dict: Number of entries by state"""
+        counts = dict.fromkeys((PENDING, SENDING, DONE, FAILED, IN_DOUBT), 0)
+        counts.update(self._query('SELECT state, COUNT(*) FROM entries GROUP BY state'))
+        return counts
+
+    def purge(self, older_than=0.0):
+        """Delete entries that were sent
+
+        Args:
+            older_than (float): Only entries sent more than this many seconds ago
+
+        Returns:
+            int: Entries deleted
+        """
+        return self._transaction(lambda connection: connection.execute(
+            'DELETE FROM entries WHERE state = ? AND finished <= ?',
+            (DONE, time.time() - older_than)).rowcount)
+
+    def close(self):
+        with self._lock:
+            if self._connection is not None and self._pid == os.getpid():
+                self._connection.close()
+            self._connection = None
+
+    def __len__(self):
+        """Entries waiting to be sent"""
+        return self._query('SELECT COUNT(*) FROM entries WHERE state = ?', (PENDING,))[0][0]
+
+    def __repr__(self):
+        return 'Outbox(path={!r})'.format(self.path)
+
+
+def _dumps(value):
+    return json.dumps(value, separators=(',', ':'), sort_keys=True)
+
+
+def _owner_alive(owner):
+    """Helper function to tell whether the drainer `owner` still runs, `True` if unknown"""
+    host, _, rest = (owner or '').partition(':')
+    pid = rest.partition(':')[0]
+    if host != socket.gethostname() or not pid.isdigit():
+        return True
+    if int(pid) == os.getpid():
+        return True
+    try:
+        os.kill(int(pid), 0)
+    except OSError as exc:
+        # The process exists but belongs to another user
+        return exc.errno == errno.EPERM
+    return True
+
+
+class OutboxDrainer(object):
+    """Sends the entries of an outbox through a client, at a controlled rate
+
+    Entries IR-Flow answers are marked `done` with its response. Entries it rejects, e.g.
+    with HTTP 422, are marked `failed`. After a connection error, a timeout, one of the
+    `TRANSIENT_STATUSES` or while the circuit breaker of the client is open, the entry goes
+    back to the queue and the drainer pauses, `backoff` seconds at first and twice as long
+    after each further failure, up to `backoff_max`. A POST that may have reached IR-Flow
+    before failing is marked `in_doubt` instead of being sent again.
+
+    Args:
+        irfc (irflow_client.irflow_client.IRFlowClient): The client sending the entries
+        outbox (Outbox): The outbox to drain, default = the `outbox` of the client
+        rate (float): Entries sent per second at most, `None` for no limit, default = 5
+        backoff (float): Seconds of the first pause after a failure, default = 1
+        backoff_max (float): Longest pause in seconds, default = 60
+        max_attempts (int): Failures after which an entry is marked `failed`, default = no
+            limit
+        lease (float): Seconds after which an entry claimed by another drainer that did not
+            settle it is recovered, default = 300
+
+    Attributes:
+        owner (str): `host:pid:token`, identifies the claims of this drainer
+        sent (int): Entries IR-Flow answered
+        rejected (int): Entries marked `failed` or `in_doubt`
+        retried (int): Failed attempts returned to the queue
+    """
+
+    def __init__(self, irfc, outbox=None, rate=5.0, backoff=1.0, backoff_max=60.0,
+                 max_attempts=None, lease=300.0):
+        self.irfc = irfc
+        self.outbox = outbox if outbox is not None else irfc.outbox
+        if self.outbox is None:
+            raise ValueError('The client has no outbox, configure outbox_file')
+        self.limiter = RateLimiter(rate=rate, burst=1) if rate else None
+        self.backoff = backoff
+        self.backoff_max = backoff_max
+        self.max_attempts = max_attempts
+        self.lease = lease
+        self.owner = '{}:{}:{}'.format(socket.gethostname(), os.getpid(), uuid.uuid4().hex[:8])
+        self.sent = 0
+        self.rejected = 0
+        self.retried = 0
+        self._failures = 0
+        self._stop = threading.Event()
+        self._thread = None
+
+    def _pause(self):
+        """Helper function to return the pause after the consecutive failures so far"""
+        return min(self.backoff_max, self.backoff * 2 ** max(0, self._failures - 1))
+
+    def send(self, entry):
+        """Send one claimed entry and settle it
+
+        Args:
+            entry (OutboxEntry): An entry claimed by this drainer
+
+        Returns:
+            bool: `True` if IR-Flow answered, even with a rejection, `False` if the entry went
+                back to the queue
+        """
+        url = '{}://{}{}'.format(self.irfc.protocol, self.irfc.address, entry.path)
+        try:
+            response = self.irfc._send(entry.endpoint, entry.method, url,
+                                       headers=entry.headers, json=entry.json)
+        except Exception as exc:
+            return self._failed(entry, '{}: {}'.format(exc.__class__.__name__, exc),
+                                not self.irfc._never_delivered(exc))
+
+        try:
+            body = response.json()
+        except ValueError:
+            body = None
+        status = response.status_code
+        if status < 400:
+            if self.outbox.complete(entry.id, self.owner, body):
+                self.sent += 1
+            self._failures = 0
+            return True
+        if status in TRANSIENT_STATUSES:
+            return self._failed(entry, 'HTTP {}'.format(status),
+                                status not in REFUSED_STATUSES)
+        message = body.get('message') if isinstance(body, dict) else None
+        error = 'HTTP {}: {}'.format(status, message or response.reason)
+        self.outbox.reject(entry.id, self.owner, error)
+        self.rejected += 1
+        self._failures = 0
+        return True
+
+    def _failed(self, entry, error, maybe_received):
+        """Helper function to settle an entry IR-Flow did not answer, returns `False`"""
+        self._failures += 1
+        if failed_state(entry.method, maybe_received) == IN_DOUBT:
+            self.outbox.reject(entry.id, self.owner, error, IN_DOUBT)
+            self.rejected += 1
+        elif self.max_attempts is not None and entry.attempts + 1 >= self.max_attempts:
+            self.outbox.reject(entry.id, self.owner, error)
+            self.rejected += 1
+        else:
+            self.outbox.release(entry.id, self.owner, error)
+            self.retried += 1
+        logger.info('Outbox entry {} not sent ({}), pausing {:.1f}s'.format(entry.id, error,
+                                                                           self._pause()))
+        return False
+
+    def _wait(self, seconds, until):
+        """Helper function to wait, returns `False` if stopped or past `until` first"""
+        if until is not None:
+            seconds = min(seconds, until - time.time())
+            if seconds <= 0:
+                return False
+        return not self._stop.wait(seconds)
+
+    def drain(self, timeout=None):
+        """Send entries until the outbox has none pending
+
+        Entries of drainers that stopped while sending are recovered first.
+
+        Args:
+            timeout (float): Seconds after which to stop even if entries are pending,
+                default = no limit
+
+        Returns:
+            dict: `sent`, `rejected` and `retried` by this call, and the `pending` entries
+        """
+        until = time.time() + timeout if timeout is not None else None
+        before = (self.sent, self.rejected, self.retried)
+        self.outbox.recover(self.lease)
+        while not self._stop.is_set():
+            breaker = getattr(self.irfc, 'circuit_breaker', None)
+            if breaker is not None and breaker.retry_after > 0:
+                if not self._wait(breaker.retry_after, until):
+                    break
+                continue
+            if until is not None and time.time() >= until:
+                break
+            entry = self.outbox.claim(self.owner)
+            if entry is None:
+                break
+            if self.limiter is not None:
+                delay = self.limiter.reserve('outbox')
+                if delay > 0 and not self._wait(delay, None):
+                    self.outbox.release(entry.id, self.owner, 'Drainer stopped')
+                    break
+            if not self.send(entry) and not self._wait(self._pause(), until):
+                break
+        return {'sent': self.sent - before[0], 'rejected': self.rejected - before[1],
+                'retried': self.retried - before[2], 'pending': len(self.outbox)}
+
+    def run(self, interval=1.0):
+        """Drain the outbox until stopped, checking for new entries every `interval` seconds"""
+        while not self._stop.is_set():
+            try:
+                self.drain()
+            except Exception:
+                logger.exception('Draining the outbox failed')
+            self._stop.wait(interval)
+
+    def start(self, interval=1.0):
+        """Drain the outbox on a background thread until :func:`stop` is called"""
+        self._stop.clear()
+        self._thread = threading.Thread(target=self.run, args=(interval,),
+                                        name='irflow-outbox-drainer')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self, timeout=None):
+        """Stop draining, waiting for the entry being sent"""
+        self._stop.set()
+        if self._thread is not None:
+            self._thread.join(timeout)
+            self._thread = None
+
+    def as_dict(self):
+        return {'sent': self.sent, 'rejected': self.rejected, 'retried': self.retried}
+
+    def __repr__(self):
+        return 'OutboxDrainer(owner={}, sent={}, rejected={}, retried={})'.format(
+            self.owner, self.sent, self.rejected, self.retried)
+
+
+def main(argv=None):
+    """Command line entry point of the outbox drainer"""
+    parser = argparse.ArgumentParser(description='Show or send the IR-Flow calls kept in an '
+                                                 'outbox file.')
+    parser.add_argument('outbox', help='outbox file configured as outbox_file')
+    parser.add_argument('--config', default='api.conf', help='IR-Flow api.conf file')
+    parser.add_argument('--drain', action='store_true', help='send the pending entries')
+    parser.add_argument('--rate', type=float, default=5.0, help='entries sent per second')
+    parser.add_argument('--timeout', type=float, help='stop draining after this many seconds')
+    parser.add_argument('--requeue-in-doubt', action='store_true',
+                        help='send the entries IR-Flow may have received again')
+    args = parser.parse_args(argv)
+
+    logging.basicConfig(level=logging.INFO)
+    outbox = Outbox(args.outbox)
+    if args.requeue_in_doubt:
+        print('Queued {} entries in doubt again'.format(outbox.requeue()))
+    if args.drain:
+        # Imported here so `--help` works without a configured client
+        from .irflow_client import IRFlowClient
+        irfc = IRFlowClient(config_file=args.config)
+        outcome = OutboxDrainer(irfc, outbox, rate=args.rate).drain(args.timeout)
+        print('Sent {sent}, rejected {rejected}, retried {retried}, {pending} pending'.format(
+            **outcome))
+    counts = outbox.counts()
+    print(', '.join('{} {}'.format(counts[state], state) for state in sorted(counts)))
+    return 1 if counts[PENDING] or counts[IN_DOUBT] else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
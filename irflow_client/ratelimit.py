@@ -0,0 +1,288 @@
+"""Client side rate limiting of IR-Flow API calls
+
+With ``rate_limit`` or ``rate_limit_endpoints`` configured, every request of a client first
+takes a token from a global token bucket and from the bucket of its endpoint, waiting until
+the buckets have refilled when they are empty. Retries take tokens too.
+
+By default the buckets belong to the client. With ``rate_limit_file`` set, their state lives
+in that file, guarded by a file lock, so all worker processes on a host configured with the
+same file share one budget.
+
+IR-Flow answering HTTP 429 or 503 tightens the limit for every client sharing the buckets:
+the rate drops by `throttle_factor` on each such response, down to `min_factor` of the
+configured rate, and recovers linearly over `recovery_time` seconds. A ``Retry-After`` header
+pauses all of them until it has passed.
+"""
+import json
+import os
+import threading
+import time
+
+try:
+    import fcntl
+except ImportError:
+    # Windows, only the in-process store is available
+    fcntl = None
+
+# Bucket state shared between processes is stamped with wall clock time
+clock = time.time
+
+# Responses telling a client to slow down
+THROTTLE_STATUSES = frozenset([429, 503])
+
+_THROTTLE_KEY = 'throttle'
+_GLOBAL_BUCKET = 'bucket:*'
+
+
+def parse_rates(value):
+    """Parse per endpoint rates
+
+    Args:
+        value (str or dict): ``endpoint=rate`` pairs separated by commas, e.g.
+            `create_alert=2, get_alert=10`, or a dict
+
+    Returns:
+        dict: Requests per second keyed by endpoint, `None` if empty
+    """
+    if not value:
+        return None
+    if isinstance(value, dict):
+        return dict((endpoint, float(rate)) for endpoint, rate in value.items())
+    rates = {}
+    for pair in value.split(','):
+        if not pair.strip():
+            continue
+        endpoint, _, rate = pair.partition('=')
+        if not rate.strip():
+            raise ValueError('Expected endpoint=rate, got "{}"'.format(pair.strip()))
+        rates[endpoint.strip()] = float(rate)
+    return rates or None
+
+
+class MemoryBucketStore(object):
+    """Keeps the bucket state of a limiter in memory, shared by the threads of a process"""
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self._state = {}
+
+    def update(self, func):
+        """Return ``func(state)``, run while no other caller can read or change `state`
+
+        Args:
+            func (callable): Reads and changes the state dict in place
+        """
+        with self._lock:
+            return func(self._state)
+
+
+class FileBucketStore(object):
+    """Keeps the bucket state of a limiter in a file, shared by every process using it
+
+    Each update holds an exclusive ``flock`` on the file while reading and rewriting the small
+    json document, so the processes see each other's token use. Requires a POSIX system.
+
+    Args:
+        path (str): The state file, created if missing
+    """
+
+    def __init__(self, path):
+        if fcntl is None:
+            raise RuntimeError('rate_limit_file requires fcntl, which is not available on '
+                               'this platform')
+        self.path = os.path.expanduser(path)
+        self._lock = threading.Lock()
+        self._handle = None
+        self._pid = None
+
+    def _file(self):
+        # A forked worker opens its own handle, flock is shared between copies of one handle
+        if self._handle is None or self._pid != os.getpid():
+            self._handle = open(self.path, 'a+')
+            self._pid = os.getpid()
+        return self._handle
+
+    def update(self, func):
+        """Return ``func(state)``, run while no other thread or process can read or change it
+
+        Args:
+            func (callable): Reads and changes the state dict in place
+        """
+        with self._lock:
+            handle = self._file()
+            fcntl.flock(handle.fileno(), fcntl.LOCK_EX)
+            try:
+                handle.seek(0)
+                try:
+                    state = json.loads(handle.read() or '{}')
+                except ValueError:
+                    state = {}
+                result = func(state)
+                handle.seek(0)
+                handle.truncate()
+                handle.write(json.dumps(state, separators=(',', ':')))
+                handle.flush()
+                return result
+            finally:
+                fcntl.flock(handle.fileno(), fcntl.LOCK_UN)
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+
+class RateLimiter(object):
+    """Global and per endpoint token buckets, tightened when IR-Flow throttles
+
+    Args:
+        rate (float): Requests per second of all endpoints together, `None` for no global limit
+        burst (float): Requests that may be sent at once after an idle period,
+            default = one second's worth of requests, at least 1
+        endpoint_rates (dict): Requests per second keyed by endpoint, the key of the endpoint
+            in `end_points`
+        store (object): Where the bucket state lives, a :class:`FileBucketStore` to share it
+            between processes, default = a :class:`MemoryBucketStore`
+        throttle_factor (float): Rate multiplier applied on every 429 or 503, default = 0.5
+        min_factor (float): Lowest fraction of the configured rates, default = 0.05
+        recovery_time (float): Seconds to recover from the lowest rate to the configured one,
+            default = 30
+
+    Attributes:
+        delayed (int): Requests that waited for a token
+        waited (float): Seconds spent waiting for tokens
+        throttled (int): Throttling responses seen by this limiter
+    """
+
+    def __init__(self, rate=None, burst=None, endpoint_rates=None, store=None,
+                 throttle_factor=0.5, min_factor=0.05, recovery_time=30.0):
+        self.rate = rate
+        self.burst = burst
+        self.endpoint_rates = dict(endpoint_rates or {})
+        self.store = store if store is not None else MemoryBucketStore()
+        self.throttle_factor = throttle_factor
+        self.min_factor = min_factor
+        self.recovery_time = recovery_time
+        self.delayed = 0
+        self.waited = 0.0
+        self.throttled = 0
+        self._lock = threading.Lock()
+
+    def _burst(self, rate):
+        return self.burst if self.burst is not None else max(1.0, rate)
+
+    def _factor(self, state, now):
+        """Helper function to return (current rate factor, pause end) from the shared state"""
+        factor, since, pause_until = state.get(_THROTTLE_KEY) or (1.0, now, 0.0)
+        if self.recovery_time > 0:
+            factor += (1.0 - self.min_factor) * max(0.0, now - since) / self.recovery_time
+        else:
+            factor = 1.0
+        return min(1.0, factor), pause_until
+
+    def reserve(self, endpoint, max_delay=None):
+        """Take a token for a request to `endpoint`, without waiting for it
+
+        Tokens may be borrowed from the future, the caller has to wait the returned number of
+        seconds before sending, which keeps waiting callers in order.
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+            max_delay (float): Take no token if the wait would not be shorter, e.g. the time
+                left before a deadline, default = no limit
+
+        Returns:
+            float: Seconds to wait before sending the request, no token was taken if it is
+                `max_delay` or more
+        """
+        buckets = []
+        if self.rate:
+            buckets.append((_GLOBAL_BUCKET, self.rate))
+        endpoint_rate = self.endpoint_rates.get(endpoint)
+        if endpoint_rate:
+            buckets.append(('bucket:' + endpoint, endpoint_rate))
+
+        def fits(delay):
+            return max_delay is None or delay <= 0 or delay < max_delay
+
+        def take(state):
+            now = clock()
+            factor, pause_until = self._factor(state, now)
+            delay = max(0.0, pause_until - now)
+            taken = {}
+            for key, rate in buckets:
+                burst = self._burst(rate)
+                rate *= factor
+                tokens, stamp = state.get(key) or (burst, now)
+                tokens = min(burst, tokens + max(0.0, now - stamp) * rate) - 1
+                taken[key] = [tokens, now]
+                if tokens < 0:
+                    delay = max(delay, -tokens / rate)
+            if fits(delay):
+                state.update(taken)
+            return delay
+
+        delay = self.store.update(take) if buckets else 0.0
+        if delay > 0 and fits(delay):
+            with self._lock:
+                self.delayed += 1
+                self.waited += delay
+        return delay
+
+    def acquire(self, endpoint):
+        """Wait until a request to `endpoint` may be sent
+
+        Args:
+            endpoint (str): The key of the endpoint in `end_points`
+
+        Returns:
+            float: Seconds waited
+        """
+        delay = self.reserve(endpoint)
+        if delay > 0:
+            time.sleep(delay)
+        return delay
+
+    def throttle(self, retry_after=None):
+        """Tighten the limit after IR-Flow asked to slow down
+
+        Args:
+            retry_after (float): Seconds every client sharing the buckets pauses, if any
+        """
+        def tighten(state):
+            now = clock()
+            factor, pause_until = self._factor(state, now)
+            factor = max(self.min_factor, factor * self.throttle_factor)
+            if retry_after:
+                pause_until = max(pause_until, now + retry_after)
+            state[_THROTTLE_KEY] = [factor, now, pause_until]
+
+        self.store.update(tighten)
+        with self._lock:
+            self.throttled += 1
+
+    def observe(self, status, retry_after=None):
+        """Tighten the limit if a response status asks to slow down
+
+        Args:
+            status (int): The HTTP status of a response
+            retry_after (float): The ``Retry-After`` of the response in seconds, if any
+        """
+        if status in THROTTLE_STATUSES:
+            self.throttle(retry_after)
+
+    @property
+    def factor(self):
+        """float: The fraction of the configured rates currently allowed"""
+        return self.store.update(lambda state: self._factor(state, clock())[0])
+
+    def as_dict(self):
+        factor = self.factor
+        with self._lock:
+            return {'delayed': self.delayed, 'waited': self.waited,
+                    'throttled': self.throttled, 'factor': factor}
+
+    def __repr__(self):
+        return 'RateLimiter(rate={}, endpoint_rates={}, delayed={}, throttled={})'.format(
+            self.rate, self.endpoint_rates, self.delayed, self.throttled)
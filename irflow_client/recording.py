@@ -0,0 +1,213 @@
+"""Recording of the requests and responses of a client
+
+With ``record_file`` configured, every call of a client is appended to that file as one
+compact json line: the endpoint, method, path, request headers and json body, the status,
+response headers and body, and the time it took. Secrets are redacted before they are
+written: authentication headers, and json fields named like a password, key or token, plus
+any field listed in ``record_redact_fields``. Attachment bodies are not stored, only their
+size. A path ending in ``.gz`` is written gzip compressed, flushed after every exchange so
+that it can be read before the client is closed.
+
+The recording captures the real mix of calls a playbook makes, and
+:mod:`irflow_client.replay` serves it back from a local stand-in for load tests and
+benchmarks::
+
+    irfc = IRFlowClient(dict(config, record_file='/var/tmp/irflow-calls.jsonl.gz'))
+    ...
+    for exchange in read_recording('/var/tmp/irflow-calls.jsonl.gz'):
+        print(exchange['endpoint'], exchange['status'], exchange['elapsed'])
+"""
+import base64
+import gzip
+import json
+import logging
+import threading
+from time import monotonic
+import zlib
+
+REDACTED = '[REDACTED]'
+
+# Header names and json field names redacted in every recording, compared lower case
+REDACTED_HEADERS = frozenset(['authorization', 'x-authorization', 'proxy-authorization',
+                              'cookie', 'set-cookie'])
+REDACTED_FIELDS = frozenset(['password', 'passwd', 'secret', 'token', 'api_key', 'apikey',
+                             'access_token', 'refresh_token', 'authorization'])
+
+# Response headers kept in a recording, the ones that change how a client treats a response.
+# The body is recorded decoded, so its Content-Encoding is not kept
+RECORDED_RESPONSE_HEADERS = frozenset(['content-type', 'etag', 'last-modified', 'retry-after',
+                                       'accept-ranges', 'content-range'])
+
+logger = logging.getLogger(__name__)
+logger.addHandler(logging.NullHandler())
+
+
+def redact(value, fields=REDACTED_FIELDS):
+    """Return a copy of a json value with the values of secret fields replaced
+
+    Args:
+        value (object): A decoded json value
+        fields (frozenset): Lower case names of the fields to redact, at any depth
+
+    Returns:
+        object: The redacted copy
+    """
+    if isinstance(value, dict):
+        return dict((key, REDACTED if str(key).lower() in fields else redact(item, fields))
+                    for key, item in value.items())
+    if isinstance(value, list):
+        return [redact(item, fields) for item in value]
+    return value
+
+
+def _is_json(headers):
+    return 'json' in (headers.get('Content-Type') or headers.get('content-type') or '')
+
+
+class Recorder(object):
+    """Appends request and response pairs to a recording file, thread safe
+
+    Args:
+        path (str): The recording file, created if missing and appended to otherwise
+        redact_fields (iterable): Json field names redacted on top of `REDACTED_FIELDS`
+
+    Attributes:
+        recorded (int): Exchanges written by this recorder
+    """
+
+    def __init__(self, path, redact_fields=None):
+        self.path = path
+        self.redact_fields = REDACTED_FIELDS | frozenset(
+            field.lower() for field in (redact_fields or ()))
+        self.recorded = 0
+        self._lock = threading.Lock()
+        self._started = monotonic()
+        self._handle = None
+
+    def _open(self):
+        if self.path.endswith('.gz'):
+            return gzip.open(self.path, 'ab')
+        return open(self.path, 'ab')
+
+    def record(self, endpoint, method, path, request_headers, request_json, request_size,
+               status, response_headers, content=None, elapsed=0.0, content_size=None):
+        """Append one exchange
+
+        Args:
+            endpoint (str): The key of the called endpoint in `end_points`
+            method (str): The HTTP verb of the request
+            path (str): The path and query string of the request
+            request_headers (dict): The headers sent
+            request_json (object): The json body sent, if any
+            request_size (int): Request body bytes sent
+            status (int): The HTTP status of the response
+            response_headers (dict): The headers received
+            content (bytes): The response body, `None` if it was not read, e.g. a download
+            elapsed (float): Seconds IR-Flow took to answer
+            content_size (int): The size of a body that was not read
+        """
+        exchange = {
+            't': round(monotonic() - self._started, 6),
+            'endpoint': endpoint,
+            'method': method,
+            'path': path,
+            'headers': dict((key, REDACTED if key.lower() in REDACTED_HEADERS else value)
+                            for key, value in request_headers.items()),
+            'status': status,
+            'response_headers': dict((key, value) for key, value in response_headers.items()
+                                     if key.lower() in RECORDED_RESPONSE_HEADERS),
+            'elapsed': round(elapsed, 6),
+        }
+        if request_json is not None:
+            exchange['json'] = redact(request_json, self.redact_fields)
+        elif request_size:
+            exchange['body_size'] = request_size
+        if content is None:
+            exchange['response_size'] = content_size or 0
+        elif _is_json(response_headers) or not content:
+            try:
+                exchange['response'] = redact(json.loads(content.decode('utf-8')),
+                                              self.redact_fields) if content else None
+            except ValueError:
+                exchange['response_b64'] = base64.b64encode(content).decode('ascii')
+        else:
+            exchange['response_b64'] = base64.b64encode(content).decode('ascii')
+
+        line = (json.dumps(exchange, separators=(',', ':'), sort_keys=True) + '\n').encode('utf-8')
+        with self._lock:
+            if self._handle is None:
+                self._handle = self._open()
+            self._handle.write(line)
+            if isinstance(self._handle, gzip.GzipFile):
+                # Ends the compressed block, every line written so far can be decompressed
+                self._handle.flush(zlib.Z_SYNC_FLUSH)
+            else:
+                self._handle.flush()
+            self.recorded += 1
+
+    def close(self):
+        with self._lock:
+            if self._handle is not None:
+                self._handle.close()
+                self._handle = None
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return 'Recorder(path={!r}, recorded={})'.format(self.path, self.recorded)
+
+
+def read_recording(path):
+    """Yield the exchanges of a recording in the order they were recorded
+
+    A truncated last line, left by a process that died while writing, is skipped, as is the
+    unfinished end of a gzip recording that is still being written or was never closed.
+
+    Args:
+        path (str): The recording file, gzip compressed if it ends in ``.gz``
+
+    Yields:
+        dict: One exchange, see :func:`Recorder.record`
+    """
+    opener = gzip.open if path.endswith('.gz') else open
+    with opener(path, 'rt', encoding='utf-8') as handle:
+        lines = enumerate(handle, 1)
+        while True:
+            try:
+                number, line = next(lines)
+            except StopIteration:
+                return
+            except (EOFError, zlib.error):
+                logger.warning('Skipping the unfinished end of {}'.format(path))
+                return
+            if not line.strip():
+                continue
+            try:
+                yield json.loads(line)
+            except ValueError:
+                logger.warning('Skipping unreadable line {} of {}'.format(number, path))
+
+
+def response_body(exchange):
+    """Return the recorded response body of an exchange as bytes
+
+    Bodies recorded by size only, such as attachment downloads, are replaced by as many zero
+    bytes.
+
+    Args:
+        exchange (dict): An exchange read with :func:`read_recording`
+
+    Returns:
+        bytes: The body
+    """
+    if 'response_b64' in exchange:
+        return base64.b64decode(exchange['response_b64'])
+    if 'response_size' in exchange:
+        return b'\0' * exchange['response_size']
+    if exchange.get('response') is None:
+        return b''
+    return json.dumps(exchange['response']).encode('utf-8')
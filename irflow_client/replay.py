@@ -0,0 +1,298 @@
+"""Replay of recorded IR-Flow traffic
+
+:class:`ReplayServer` is a local stand-in for IR-Flow serving the responses of a recording
+made with ``record_file``, see :mod:`irflow_client.recording`. Requests are matched on method
+and path, repeated requests get the recorded responses in order. Every response is delayed by
+the time it took IR-Flow, divided by `speed`.
+
+:func:`replay_traffic` sends the recorded requests again through a client, at the pace they
+were recorded at or `speed` times faster, so the stand-in and the client together reproduce
+the load of production without an IR-Flow server::
+
+    with ReplayServer('calls.jsonl.gz', speed=10) as server:
+        irfc = IRFlowClient(server.config_args)
+        summary = replay_traffic(irfc, 'calls.jsonl.gz', speed=10)
+        print(summary.throughput, summary.latency_p99)
+
+Run it as a command::
+
+    irflow-replay calls.jsonl.gz --speed 10 --port 8080     # serve the recording
+    irflow-replay calls.jsonl.gz --speed 10 --drive         # serve it and replay the requests
+"""
+from concurrent.futures import ThreadPoolExecutor
+import argparse
+import collections
+import json
+import socket
+import sys
+import threading
+import time
+from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+from urllib.parse import urlsplit
+
+from .bulk import BulkSummary
+from .recording import read_recording, response_body
+
+# Request headers not sent again when replaying, the client sets its own
+_HOP_HEADERS = frozenset(['host', 'connection', 'content-length', 'transfer-encoding',
+                          'accept-encoding', 'user-agent', 'x-authorization', 'authorization',
+                          'cookie', 'traceparent'])
+
+# Response headers of the body as it was sent, the recorded body is decoded and its length is
+# set again
+_BODY_HEADERS = frozenset(['content-encoding', 'content-length', 'transfer-encoding'])
+
+
+def _load(recording):
+    """Helper function to accept a recording file or already read exchanges"""
+    if isinstance(recording, str):
+        return list(read_recording(recording))
+    return list(recording)
+
+
+class ReplayServer(object):
+    """Threaded HTTP server answering requests with recorded responses
+
+    Use as a context manager, or call :func:`start` and :func:`stop`.
+
+    Args:
+        recording (str or list): The recording file, or exchanges read from it
+        speed (float): Factor the recorded response times are divided by, 0 answers at once,
+            default = 1, the recorded pace
+        host (str): The interface to listen on, default = 127.0.0.1
+        port (int): The port to listen on, default = any free port
+
+    Attributes:
+        served (int): Requests answered with a recorded response
+        unmatched (int): Requests without a recorded response, answered with HTTP 404
+    """
+
+    def __init__(self, recording, speed=1.0, host='127.0.0.1', port=0):
+        self.speed = speed
+        self.served = 0
+        self.unmatched = 0
+        # (method, path with query) and (method, path) -> the recorded exchanges, in order
+        self._routes = collections.defaultdict(list)
+        for exchange in _load(recording):
+            self._routes[(exchange['method'], exchange['path'])].append(exchange)
+            path = exchange['path'].split('?', 1)[0]
+            if path != exchange['path']:
+                self._routes[(exchange['method'], path)].append(exchange)
+        self._next = collections.Counter()
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer((host, port), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = None
+
+    @property
+    def address(self):
+        host, port = self._server.server_address[:2]
+        return '%s:%s' % (host, port)
+
+    @property
+    def config_args(self):
+        """dict: The configuration of a client calling this server"""
+        return {
+            'address': self.address,
+            'api_user': 'replay',
+            'api_key': 'replay',
+            'protocol': 'http',
+            'debug': False,
+            'verbose': 0
+        }
+
+    def match(self, method, path):
+        """Return the recorded exchange answering a request, `None` if there is none
+
+        Repeated requests get the recorded responses in order, starting over after the last.
+        """
+        key = (method, path)
+        if key not in self._routes:
+            key = (method, path.split('?', 1)[0])
+        exchanges = self._routes.get(key)
+        with self._lock:
+            if not exchanges:
+                self.unmatched += 1
+                return None
+            index = self._next[key]
+            self._next[key] = index + 1
+            self.served += 1
+        return exchanges[index % len(exchanges)]
+
+    def start(self):
+        self._thread = threading.Thread(target=self._server.serve_forever,
+                                        name='irflow-replay-server')
+        self._thread.daemon = True
+        self._thread.start()
+        return self
+
+    def stop(self):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def __enter__(self):
+        return self.start()
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.stop()
+
+    def __repr__(self):
+        return 'ReplayServer(address={}, served={}, unmatched={})'.format(
+            self.address, self.served, self.unmatched)
+
+    def _handler_class(self):
+        replay = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                # Headers and body are written separately, avoid Nagle delays on keep-alive
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                self._discard_body()
+                parts = urlsplit(self.path)
+                path = parts.path + ('?' + parts.query if parts.query else '')
+                exchange = replay.match(self.command, path)
+                if exchange is None:
+                    status = 404
+                    headers = {'Content-Type': 'application/json'}
+                    body = json.dumps({'success': False,
+                                       'message': 'No recorded response'}).encode('utf-8')
+                else:
+                    if replay.speed:
+                        time.sleep(exchange.get('elapsed', 0) / replay.speed)
+                    status = exchange['status']
+                    headers = exchange.get('response_headers', {})
+                    body = response_body(exchange)
+                self.send_response(status)
+                for key, value in headers.items():
+                    if key.lower() not in _BODY_HEADERS:
+                        self.send_header(key, value)
+                self.send_header('Content-Length', str(len(body)))
+                self.end_headers()
+                if self.command != 'HEAD':
+                    self.wfile.write(body)
+
+            def _discard_body(self):
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    while True:
+                        size = int(self.rfile.readline().strip(), 16)
+                        self.rfile.read(size)
+                        self.rfile.readline()
+                        if size == 0:
+                            return
+                length = int(self.headers.get('Content-Length') or 0)
+                while length > 0:
+                    chunk = self.rfile.read(min(length, 1024 * 1024))
+                    if not chunk:
+                        return
+                    length -= len(chunk)
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+        return Handler
+
+
+def replay_traffic(irfc, recording, speed=1.0, max_workers=8):
+    """Send the requests of a recording again through a client
+
+    Requests are started at their recorded offsets divided by `speed`, up to `max_workers` at
+    once. Json bodies are sent as recorded, other bodies as zero bytes of the recorded size.
+
+    .. note:: Replayed writes are real writes, point the client at a :class:`ReplayServer` or
+        a test instance of IR-Flow.
+
+    Args:
+        irfc (irflow_client.irflow_client.IRFlowClient): The client sending the requests
+        recording (str or list): The recording file, or exchanges read from it
+        speed (float): Factor the recorded pace is sped up by, 0 sends as fast as possible,
+            default = 1
+        max_workers (int): Requests kept in flight, default = 8
+
+    Returns:
+        irflow_client.bulk.BulkSummary: Latencies, failures (HTTP errors and exceptions) and
+            throughput of the replay
+    """
+    exchanges = _load(recording)
+    base_url = '%s://%s' % (irfc.protocol, irfc.address)
+    latencies = []
+    failures = [0]
+    lock = threading.Lock()
+
+    def send(exchange):
+        kwargs = {'headers': dict((key, value) for key, value in exchange['headers'].items()
+                                  if key.lower() not in _HOP_HEADERS)}
+        if 'json' in exchange:
+            kwargs['json'] = exchange['json']
+        elif exchange.get('body_size'):
+            kwargs['data'] = b'\0' * exchange['body_size']
+        started = time.perf_counter()
+        try:
+            response = irfc._send(exchange['endpoint'], exchange['method'],
+                                  base_url + exchange['path'], **kwargs)
+            failed = response.status_code >= 400
+        except Exception:
+            failed = True
+        latency = time.perf_counter() - started
+        with lock:
+            latencies.append(latency)
+            failures[0] += failed
+
+    started = time.perf_counter()
+    first = exchanges[0]['t'] if exchanges else 0
+    with ThreadPoolExecutor(max_workers=max_workers) as executor:
+        for exchange in exchanges:
+            if speed:
+                delay = (exchange['t'] - first) / speed - (time.perf_counter() - started)
+                if delay > 0:
+                    time.sleep(delay)
+            executor.submit(send, exchange)
+    return BulkSummary(latencies, failures[0], time.perf_counter() - started)
+
+
+def main(argv=None):
+    """Command line entry point of the replay server"""
+    parser = argparse.ArgumentParser(description='Serve recorded IR-Flow responses from a '
+                                                 'local stand-in, optionally replaying the '
+                                                 'recorded requests against it.')
+    parser.add_argument('recording', help='recording file written with record_file')
+    parser.add_argument('--speed', type=float, default=1.0,
+                        help='speed up factor of the recorded pace, 0 for no delays')
+    parser.add_argument('--host', default='127.0.0.1', help='interface to listen on')
+    parser.add_argument('--port', type=int, default=0, help='port to listen on')
+    parser.add_argument('--drive', action='store_true',
+                        help='replay the recorded requests against the stand-in and exit')
+    parser.add_argument('--workers', type=int, default=8, help='requests kept in flight')
+    args = parser.parse_args(argv)
+
+    exchanges = list(read_recording(args.recording))
+    with ReplayServer(exchanges, args.speed, args.host, args.port) as server:
+        print('Serving {} recorded exchanges on http://{}'.format(len(exchanges),
+                                                                  server.address))
+        if not args.drive:
+            try:
+                while True:
+                    time.sleep(3600)
+            except KeyboardInterrupt:
+                return 0
+
+        # Imported here so `--help` works without requests configured
+        from .irflow_client import IRFlowClient
+        irfc = IRFlowClient(dict(server.config_args, max_retries=0))
+        summary = replay_traffic(irfc, exchanges, args.speed, args.workers)
+        print('Replayed {} requests in {:.1f}s: {} failed, {} unmatched'.format(
+            summary.total, summary.elapsed, summary.failed, server.unmatched))
+        if summary.total:
+            print('{:.1f} requests/s, latency p50 {:.1f} ms, p99 {:.1f} ms'.format(
+                summary.throughput, summary.latency_p50 * 1000, summary.latency_p99 * 1000))
+    return 1 if summary.failed else 0
+
+
+if __name__ == '__main__':
+    sys.exit(main())
@@ -0,0 +1,211 @@
+"""Retry policy for the IR-Flow REST API client
+
+Every request sent by :class:`irflow_client.irflow_client.IRFlowClient` and
+:class:`irflow_client.async_client.AsyncIRFlowClient` goes through a :class:`RetryPolicy`.
+Connection errors, HTTP 429 and 5xx responses are retried with exponential backoff and full
+jitter, a ``Retry-After`` header sent by IR-Flow takes precedence over the computed backoff.
+Only idempotent verbs are replayed unless `retry_non_idempotent` is set, with the exception of
+connect timeouts, where the request never reached the server.
+"""
+import asyncio
+from email.utils import parsedate_tz, mktime_tz
+import random
+import threading
+import time
+
+import requests
+
+try:
+    import aiohttp
+except ImportError:
+    aiohttp = None
+
+# Errors raised before a request reached IR-Flow, requests of any verb can be sent again
+CONNECT_ERRORS = (requests.exceptions.ConnectTimeout,)
+
+# Connection errors and timeouts of a request IR-Flow may have received
+TRANSPORT_ERRORS = (requests.exceptions.ConnectionError, requests.exceptions.Timeout)
+
+if aiohttp is not None:
+    TRANSPORT_ERRORS += (aiohttp.ClientConnectionError, asyncio.TimeoutError)
+    if hasattr(aiohttp, 'ConnectionTimeoutError'):
+        # Only aiohttp 3.10 and later tell connect timeouts apart from read timeouts
+        CONNECT_ERRORS += (aiohttp.ConnectionTimeoutError,)
+
+
+class RetryPolicy(object):
+    """When and how long to wait before replaying a request
+
+    Args:
+        max_retries (int): Retries after the first attempt, 0 disables retrying, default = 3
+        backoff_factor (float): Seconds of the first backoff, doubled on every retry,
+            default = 0.5
+        backoff_max (float): Upper bound of a single backoff in seconds, default = 30
+        jitter (bool): Pick a random delay between 0 and the computed backoff, default = `True`
+        retry_statuses (iterable of int): HTTP status codes to retry,
+            default = 429, 500, 502, 503, 504
+        retry_non_idempotent (bool): Also replay POST requests, default = `False`
+        respect_retry_after (bool): Honour the ``Retry-After`` response header, default = `True`
+        max_retry_after (float): Give up instead of waiting when ``Retry-After`` asks for longer
+            than this many seconds, default = 60
+    """
+    IDEMPOTENT_METHODS = frozenset(['GET', 'HEAD', 'PUT', 'DELETE', 'OPTIONS', 'TRACE'])
+    RETRY_STATUSES = frozenset([429, 500, 502, 503, 504])
+
+    def __init__(self, max_retries=3, backoff_factor=0.5, backoff_max=30.0, jitter=True,
+                 retry_statuses=None, retry_non_idempotent=False, respect_retry_after=True,
+                 max_retry_after=60.0):
+        self.max_retries = max_retries
+        self.backoff_factor = backoff_factor
+        self.backoff_max = backoff_max
+        self.jitter = jitter
+        self.retry_statuses = frozenset(retry_statuses if retry_statuses is not None
+                                        else self.RETRY_STATUSES)
+        self.retry_non_idempotent = retry_non_idempotent
+        self.respect_retry_after = respect_retry_after
+        self.max_retry_after = max_retry_after
+
+    def copy(self, **overrides):
+        """Return a copy of this policy with some arguments replaced
+
+        Returns:
+            RetryPolicy: The new policy
+        """
+        settings = dict(self.__dict__, **overrides)
+        return RetryPolicy(**settings)
+
+    def is_replayable(self, method):
+        """Whether a request with the given verb may be sent again"""
+        return self.retry_non_idempotent or method.upper() in self.IDEMPOTENT_METHODS
+
+    def should_retry_exception(self, method, exc, attempt):
+        """Whether to retry after the request raised `exc`
+
+        Args:
+            method (str): The HTTP verb of the request
+            exc (Exception): The exception raised by ``requests`` or ``aiohttp``
+            attempt (int): Number of retries already made
+
+        Returns:
+            bool: `True` if the request should be sent again
+        """
+        if attempt >= self.max_retries:
+            return False
+        if isinstance(exc, CONNECT_ERRORS):
+            return True
+        if isinstance(exc, TRANSPORT_ERRORS):
+            return self.is_replayable(method)
+        return False
+
+    def should_retry_response(self, method, response, attempt):
+        """Whether to retry after receiving `response`
+
+        Args:
+            method (str): The HTTP verb of the request
+            response (requests.Response): The response received
+            attempt (int): Number of retries already made
+
+        Returns:
+            bool: `True` if the request should be sent again
+        """
+        if attempt >= self.max_retries or response.status_code not in self.retry_statuses:
+            return False
+        if not self.is_replayable(method):
+            return False
+        retry_after = self.get_retry_after(response)
+        return retry_after is None or retry_after <= self.max_retry_after
+
+    def get_backoff(self, attempt):
+        """Exponential backoff for the given retry number, with full jitter if enabled
+
+        Args:
+            attempt (int): Number of retries already made
+
+        Returns:
+            float: Seconds to wait
+        """
+        backoff = min(self.backoff_max, self.backoff_factor * (2 ** attempt))
+        if self.jitter:
+            return random.uniform(0, backoff)
+        return backoff
+
+    def get_retry_after(self, response):
+        """Parse the ``Retry-After`` header of a response
+
+        Args:
+            response (requests.Response): The response received
+
+        Returns:
+            float: Seconds to wait, `None` if the header is missing, invalid or ignored
+        """
+        if not self.respect_retry_after or response is None:
+            return None
+        value = response.headers.get('Retry-After')
+        if not value:
+            return None
+        try:
+            return max(0.0, float(value))
+        except ValueError:
+            pass
+        parsed = parsedate_tz(value)
+        if parsed is None:
+            return None
+        return max(0.0, mktime_tz(parsed) - time.time())
+
+    def get_delay(self, attempt, response=None):
+        """Seconds to wait before the next retry
+
+        Args:
+            attempt (int): Number of retries already made
+            response (requests.Response): The response that triggered the retry, if any
+
+        Returns:
+            float: Seconds to wait
+        """
+        retry_after = self.get_retry_after(response)
+        if retry_after is not None:
+            return retry_after
+        return self.get_backoff(attempt)
+
+    def __repr__(self):
+        return 'RetryPolicy(max_retries={}, backoff_factor={}, retry_non_idempotent={})'.format(
+            self.max_retries, self.backoff_factor, self.retry_non_idempotent)
+
+
+class RetryStats(object):
+    """Thread safe counters of retries made by a client
+
+    Attributes:
+        retries (int): Total number of retries
+        exhausted (int): Number of requests that failed after using up all retries
+        by_endpoint (dict): Number of retries keyed by endpoint name
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.retries = 0
+        self.exhausted = 0
+        self.by_endpoint = {}
+
+    def record_retry(self, endpoint):
+        with self._lock:
+            self.retries += 1
+            self.by_endpoint[endpoint] = self.by_endpoint.get(endpoint, 0) + 1
+
+    def record_exhausted(self):
+        with self._lock:
+            self.exhausted += 1
+
+    def reset(self):
+        with self._lock:
+            self.retries = 0
+            self.exhausted = 0
+            self.by_endpoint = {}
+
+    def as_dict(self):
+        with self._lock:
+            return {
+                'retries': self.retries,
+                'exhausted': self.exhausted,
+                'by_endpoint': dict(self.by_endpoint)
+            }
@@ -0,0 +1,275 @@
+"""Tracing spans around IR-Flow API calls
+
+A client given a :class:`Tracer` wraps every call to IR-Flow in a :class:`Span` named after
+the endpoint, the key of :attr:`irflow_client.irflow_client.IRFlowClient.end_points`, with
+the object it concerns (e.g. `irflow.alert_num`), the HTTP status, the body sizes and the
+retries as attributes. The span is sent to IR-Flow in a W3C ``traceparent`` header, and
+handed to the span exporter of the tracer once the call is done.
+
+Spans of the client are children of the span active in the calling thread or asyncio task,
+so the time spent in IR-Flow shows up inside the spans of the playbook making the calls::
+
+    tracer = Tracer(InMemorySpanExporter())
+    irfc = IRFlowClient(config_args, tracer=tracer)
+    with tracer.span('enrich alert', alert_num=alert_num):
+        irfc.put_fact_group(fact_group_id, facts)
+
+Exporters are plain objects with an ``export(span)`` method, e.g. an adapter forwarding the
+spans to an OpenTelemetry or Zipkin pipeline. :class:`InMemorySpanExporter` collects them for
+tests, :class:`LoggingSpanExporter` writes them to a logger.
+"""
+from contextlib import contextmanager
+import binascii
+import contextvars
+import logging
+import os
+import re
+import threading
+import time
+
+_current_span = contextvars.ContextVar('irflow_current_span', default=None)
+
+_TRACEPARENT = re.compile(r'^([0-9a-f]{2})-([0-9a-f]{32})-([0-9a-f]{16})-([0-9a-f]{2})$')
+
+
+def _random_id(size):
+    return binascii.hexlify(os.urandom(size)).decode('ascii')
+
+
+class SpanContext(object):
+    """The identity of a span, as carried in a ``traceparent`` header
+
+    Args:
+        trace_id (str): 32 hex digits identifying the trace
+        span_id (str): 16 hex digits identifying the span
+        sampled (bool): Whether the trace is recorded, default = `True`
+    """
+    __slots__ = ('trace_id', 'span_id', 'sampled')
+
+    def __init__(self, trace_id, span_id, sampled=True):
+        self.trace_id = trace_id
+        self.span_id = span_id
+        self.sampled = sampled
+
+    @classmethod
+    def from_traceparent(cls, header):
+        """Parse a W3C ``traceparent`` header
+
+        Args:
+            header (str): The header value, e.g. received by the playbook from its caller
+
+        Returns:
+            SpanContext: The context, `None` if the header is missing or invalid
+        """
+        match = _TRACEPARENT.match((header or '').strip().lower())
+        if match is None or match.group(1) == 'ff' or set(match.group(2)) == {'0'} or \
+                set(match.group(3)) == {'0'}:
+            return None
+        return cls(match.group(2), match.group(3), bool(int(match.group(4), 16) & 1))
+
+    @property
+    def traceparent(self):
+        """str: The W3C ``traceparent`` header value of this context"""
+        return '00-{}-{}-{}'.format(self.trace_id, self.span_id, '01' if self.sampled else '00')
+
+    def __repr__(self):
+        return 'SpanContext({})'.format(self.traceparent)
+
+
+class Span(object):
+    """A timed operation within a trace
+
+    Attributes:
+        name (str): The operation, for client calls the endpoint name
+        context (SpanContext): The identity of this span
+        parent_id (str): The span ID of the parent span, `None` for a root span
+        attributes (dict): Key, Value pairs describing the operation
+        start_time (float): Epoch seconds the span started
+        end_time (float): Epoch seconds the span ended, `None` while running
+        status (str): `ok` or `error`
+        error (Exception): The exception that ended the span, if any
+    """
+
+    def __init__(self, tracer, name, context, parent_id=None, attributes=None):
+        self.tracer = tracer
+        self.name = name
+        self.context = context
+        self.parent_id = parent_id
+        self.attributes = dict(attributes or {})
+        self.start_time = time.time()
+        self._started = time.perf_counter()
+        self.end_time = None
+        self.duration = None
+        self.status = 'ok'
+        self.error = None
+
+    @property
+    def trace_id(self):
+        return self.context.trace_id
+
+    @property
+    def span_id(self):
+        return self.context.span_id
+
+    @property
+    def traceparent(self):
+        """str: The ``traceparent`` header making the receiver's spans children of this one"""
+        return self.context.traceparent
+
+    def set_attribute(self, key, value):
+        if value is not None:
+            self.attributes[key] = value
+
+    def record_error(self, error):
+        """Mark the span as failed
+
+        Args:
+            error (Exception or str): The exception, or a description of the failure
+        """
+        self.status = 'error'
+        if isinstance(error, BaseException):
+            self.error = error
+            self.attributes['error.type'] = error.__class__.__name__
+        self.attributes['error.message'] = str(error)
+
+    def end(self):
+        """End the span and hand it to the exporter, only the first call has an effect"""
+        if self.end_time is not None:
+            return
+        self.duration = time.perf_counter() - self._started
+        self.end_time = self.start_time + self.duration
+        self.tracer._export(self)
+
+    def as_dict(self):
+        return {'name': self.name, 'trace_id': self.trace_id, 'span_id': self.span_id,
+                'parent_id': self.parent_id, 'start_time': self.start_time,
+                'end_time': self.end_time, 'duration': self.duration, 'status': self.status,
+                'attributes': dict(self.attributes)}
+
+    def __repr__(self):
+        return 'Span(name={!r}, trace_id={}, span_id={}, status={})'.format(
+            self.name, self.trace_id, self.span_id, self.status)
+
+
+class Tracer(object):
+    """Creates spans and hands finished ones to an exporter
+
+    Args:
+        exporter (object): Receives every finished span with ``exporter.export(span)``,
+            `None` to only propagate trace context
+    """
+
+    def __init__(self, exporter=None):
+        self.exporter = exporter
+        self.logger = logging.getLogger(__name__)
+        self.logger.addHandler(logging.NullHandler())
+
+    @staticmethod
+    def current_span():
+        """Span: The span active in the current thread or asyncio task, if any"""
+        return _current_span.get()
+
+    def start_span(self, name, parent=None, attributes=None):
+        """Start a span, end it with :func:`Span.end`
+
+        Args:
+            name (str): The operation
+            parent (Span or SpanContext or str): The parent span, its context or a
+                ``traceparent`` header, default = the current span
+            attributes (dict): Key, Value pairs describing the operation
+
+        Returns:
+            Span: The running span
+        """
+        if parent is None:
+            parent = _current_span.get()
+        if isinstance(parent, str):
+            parent = SpanContext.from_traceparent(parent)
+        if isinstance(parent, Span):
+            parent = parent.context
+        if parent is None:
+            context = SpanContext(_random_id(16), _random_id(8))
+            parent_id = None
+        else:
+            context = SpanContext(parent.trace_id, _random_id(8), parent.sampled)
+            parent_id = parent.span_id
+        return Span(self, name, context, parent_id, attributes)
+
+    @contextmanager
+    def span(self, name, parent=None, **attributes):
+        """Context manager running a span, the current span while the block runs
+
+        An exception leaving the block marks the span as failed.
+
+        Args:
+            name (str): The operation
+            parent (Span or SpanContext or str): The parent span, its context or a
+                ``traceparent`` header, default = the current span
+            **attributes: Key, Value pairs describing the operation
+        """
+        span = self.start_span(name, parent, attributes)
+        token = _current_span.set(span)
+        try:
+            yield span
+        except BaseException as exc:
+            span.record_error(exc)
+            raise
+        finally:
+            _current_span.reset(token)
+            span.end()
+
+    def _export(self, span):
+        if self.exporter is None or not span.context.sampled:
+            return
+        try:
+            self.exporter.export(span)
+        except Exception:
+            # A broken exporter must not break the traced call
+            self.logger.exception('Failed to export span {!r}'.format(span))
+
+
+class InMemorySpanExporter(object):
+    """Collects finished spans in memory, for tests
+
+    Attributes:
+        spans (list): The finished spans, in the order they ended
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.spans = []
+
+    def export(self, span):
+        with self._lock:
+            self.spans.append(span)
+
+    def find(self, name):
+        """list: The finished spans called `name`"""
+        with self._lock:
+            return [span for span in self.spans if span.name == name]
+
+    def clear(self):
+        with self._lock:
+            self.spans = []
+
+    def __len__(self):
+        with self._lock:
+            return len(self.spans)
+
+
+class LoggingSpanExporter(object):
+    """Writes every finished span to a logger, one line each
+
+    Args:
+        logger (logging.Logger): The logger, default = the logger of this module
+        level (int): The level of the messages, default = `logging.INFO`
+    """
+
+    def __init__(self, logger=None, level=logging.INFO):
+        self.logger = logger or logging.getLogger(__name__)
+        self.level = level
+
+    def export(self, span):
+        self.logger.log(self.level, 'span {} {:.1f}ms trace={} span={} parent={} {} {}'.format(
+            span.name, span.duration * 1000, span.trace_id, span.span_id, span.parent_id,
+            span.status, span.attributes))
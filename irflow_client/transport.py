@@ -0,0 +1,118 @@
+"""HTTP transport tuning for the IR-Flow REST API client
+
+:class:`IRFlowHTTPAdapter` is mounted on the ``requests.Session`` of every
+:class:`irflow_client.irflow_client.IRFlowClient`. It sizes the urllib3 connection pools from
+the client configuration, enables TCP keep-alive and counts how many requests reused a pooled
+connection versus opened a new one, see :class:`ConnectionStats`.
+"""
+import socket
+import threading
+
+from requests.adapters import HTTPAdapter
+from urllib3.connection import HTTPConnection
+from urllib3.connectionpool import HTTPConnectionPool, HTTPSConnectionPool
+
+
+class ConnectionStats(object):
+    """Thread safe counters of connection pool usage
+
+    Attributes:
+        requests (int): Number of connections checked out of the pools, one per request
+        new_connections (int): Number of connections that had to be opened
+    """
+
+    def __init__(self):
+        self._lock = threading.Lock()
+        self.requests = 0
+        self.new_connections = 0
+
+    @property
+    def reused_connections(self):
+        """int: Number of requests served by an already open, pooled connection"""
+        return self.requests - self.new_connections
+
+    def record_request(self):
+        with self._lock:
+            self.requests += 1
+
+    def record_new_connection(self):
+        with self._lock:
+            self.new_connections += 1
+
+    def reset(self):
+        with self._lock:
+            self.requests = 0
+            self.new_connections = 0
+
+    def as_dict(self):
+        return {
+            'requests': self.requests,
+            'new_connections': self.new_connections,
+            'reused_connections': self.reused_connections
+        }
+
+    def __repr__(self):
+        return 'ConnectionStats(requests={}, new_connections={}, reused_connections={})'.format(
+            self.requests, self.new_connections, self.reused_connections)
+
+
+def _counting_pool_class(base, stats):
+    """Helper function to build a connection pool class reporting to `stats`
+
+    Args:
+        base (type): The urllib3 connection pool class to extend
+        stats (ConnectionStats): The counters to update
+
+    Returns:
+        type: A subclass of `base`
+    """
+
+    def _get_conn(self, timeout=None):
+        stats.record_request()
+        return base._get_conn(self, timeout=timeout)
+
+    def _new_conn(self):
+        stats.record_new_connection()
+        return base._new_conn(self)
+
+    return type('Counting' + base.__name__, (base,), {'_get_conn': _get_conn,
+                                                      '_new_conn': _new_conn})
+
+
+class IRFlowHTTPAdapter(HTTPAdapter):
+    """Transport adapter with configurable pooling, TCP keep-alive and connection counters
+
+    Args:
+        pool_connections (int): Number of per host connection pools to cache, default = 10
+        pool_maxsize (int): Maximum number of connections kept open to a single host,
+            default = 10
+        pool_block (bool): Block when all `pool_maxsize` connections are in use instead of
+            opening (and later discarding) an extra connection, default = `False`
+        tcp_keepalive (bool): Enable TCP keep-alive probes on pooled sockets, default = `True`
+        stats (ConnectionStats): Counters to update, a new instance if not provided
+    """
+    __attrs__ = HTTPAdapter.__attrs__ + ['tcp_keepalive']
+
+    def __init__(self, pool_connections=10, pool_maxsize=10, pool_block=False,
+                 tcp_keepalive=True, stats=None, **kwargs):
+        self.tcp_keepalive = tcp_keepalive
+        self.stats = stats if stats is not None else ConnectionStats()
+        super(IRFlowHTTPAdapter, self).__init__(pool_connections=pool_connections,
+                                                pool_maxsize=pool_maxsize,
+                                                pool_block=pool_block, **kwargs)
+
+    def init_poolmanager(self, connections, maxsize, block=False, **pool_kwargs):
+        if self.tcp_keepalive:
+            pool_kwargs.setdefault('socket_options', HTTPConnection.default_socket_options +
+                                   [(socket.SOL_SOCKET, socket.SO_KEEPALIVE, 1)])
+        super(IRFlowHTTPAdapter, self).init_poolmanager(connections, maxsize, block=block,
+                                                        **pool_kwargs)
+        self.poolmanager.pool_classes_by_scheme = {
+            'http': _counting_pool_class(HTTPConnectionPool, self.stats),
+            'https': _counting_pool_class(HTTPSConnectionPool, self.stats)
+        }
+
+    def __setstate__(self, state):
+        # HTTPAdapter.__setstate__ rebuilds the pool manager, which needs the counters first
+        self.stats = ConnectionStats()
+        super(IRFlowHTTPAdapter, self).__setstate__(state)
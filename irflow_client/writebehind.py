@@ -0,0 +1,339 @@
+"""Write-behind buffering of fact group updates
+
+Enrichment pipelines often update one fact group many times within a second, once per
+enrichment source. A :class:`FactGroupWriter` merges the pending updates of every fact group
+and sends them as a single ``put_fact_group`` call once enough updates are pending, once the
+oldest one has waited long enough, or when flushed or closed::
+
+    with irfc.fact_group_writer(max_updates=20, max_delay=0.5) as writer:
+        for source in enrichment_sources:
+            writer.put(fact_group_id, source.enrich(alert))
+
+Every update returns a future resolving to the response of the call it was merged into, so
+errors reach every caller whose update was part of it. :class:`AsyncFactGroupWriter` is the
+asyncio counterpart used by :class:`irflow_client.async_client.AsyncIRFlowClient`.
+"""
+import asyncio
+from concurrent.futures import Future, ThreadPoolExecutor
+import threading
+from time import monotonic
+
+
+class _Pending(object):
+    """The merged updates of one fact group waiting to be written"""
+    __slots__ = ('fields', 'futures', 'since')
+
+    def __init__(self, since):
+        self.fields = {}
+        self.futures = []
+        self.since = since
+
+
+class WriterStats(object):
+    """Counters of a fact group writer
+
+    Attributes:
+        updates (int): Updates received
+        puts (int): put_fact_group calls made
+        failed (int): put_fact_group calls that raised
+    """
+
+    def __init__(self):
+        self.updates = 0
+        self.puts = 0
+        self.failed = 0
+
+    @property
+    def merged(self):
+        """int: Updates sent as part of another update's call"""
+        return max(self.updates - self.puts, 0)
+
+    def as_dict(self):
+        return {'updates': self.updates, 'puts': self.puts, 'failed': self.failed,
+                'merged': self.merged}
+
+    def __repr__(self):
+        return 'WriterStats(updates={}, puts={}, failed={})'.format(self.updates, self.puts,
+                                                                   self.failed)
+
+
+def _merge(pending, fact_data):
+    """Helper function to merge an update, fields of later updates replace earlier values"""
+    pending.fields.update(fact_data)
+
+
+class FactGroupWriter(object):
+    """Thread safe write-behind buffer for ``put_fact_group``
+
+    Updates of the same fact group are merged field by field, later values winning, and sent
+    as one call. Calls for different fact groups run on up to `max_workers` threads; calls for
+    the same fact group never overlap, so updates are applied in the order they were made.
+
+    Args:
+        put_fact_group (callable): Called as ``put_fact_group(fact_group_id, fact_data)``,
+            e.g. :func:`irflow_client.irflow_client.IRFlowClient.put_fact_group`
+        max_updates (int): Pending updates of a fact group that trigger a write, default = 20
+        max_delay (float): Seconds the oldest pending update of a fact group may wait,
+            default = 0.5
+        max_workers (int): Calls kept in flight for different fact groups, default = 4
+
+    Attributes:
+        stats (WriterStats): Updates received and calls made
+    """
+
+    def __init__(self, put_fact_group, max_updates=20, max_delay=0.5, max_workers=4):
+        self.put_fact_group = put_fact_group
+        self.max_updates = max_updates
+        self.max_delay = max_delay
+        self.stats = WriterStats()
+        self._pending = {}
+        self._in_flight = set()
+        self._closed = False
+        self._condition = threading.Condition()
+        self._executor = ThreadPoolExecutor(max_workers=max_workers)
+        self._thread = threading.Thread(target=self._run, name='irflow-fact-group-writer')
+        self._thread.daemon = True
+        self._thread.start()
+
+    def put(self, fact_group_id, fact_data):
+        """Queue an update of a fact group
+
+        Args:
+            fact_group_id (int): The IR-Flow assigned ID of the fact group to be updated
+            fact_data (dict): Key, Value pairs of fact fields and their values
+
+        Returns:
+            concurrent.futures.Future: Resolves to the json response of the call the update
+                was sent with, or raises its exception
+
+        Raises:
+            RuntimeError: The writer is closed
+        """
+        future = Future()
+        with self._condition:
+            if self._closed:
+                raise RuntimeError('FactGroupWriter is closed')
+            pending = self._pending.get(fact_group_id)
+            if pending is None:
+                pending = self._pending[fact_group_id] = _Pending(monotonic())
+            _merge(pending, fact_data)
+            pending.futures.append(future)
+            self.stats.updates += 1
+            if len(pending.futures) >= self.max_updates:
+                pending.since = None
+            self._condition.notify_all()
+        return future
+
+    def _due(self, now):
+        """Helper function to pop the fact groups to write now, returns (due, next wake up)"""
+        due = []
+        wake_up = None
+        for fact_group_id, pending in list(self._pending.items()):
+            if fact_group_id in self._in_flight:
+                continue
+            if pending.since is None or now - pending.since >= self.max_delay:
+                due.append((fact_group_id, self._pending.pop(fact_group_id)))
+                self._in_flight.add(fact_group_id)
+            else:
+                deadline = pending.since + self.max_delay - now
+                wake_up = deadline if wake_up is None else min(wake_up, deadline)
+        return due, wake_up
+
+    def _run(self):
+        """Flusher thread, hands due fact groups to the executor until closed and drained"""
+        with self._condition:
+            while True:
+                due, wake_up = self._due(monotonic())
+                for fact_group_id, pending in due:
+                    self._executor.submit(self._write, fact_group_id, pending)
+                if self._closed and not self._pending and not self._in_flight:
+                    return
+                if not due:
+                    self._condition.wait(wake_up)
+
+    def _write(self, fact_group_id, pending):
+        """Helper function to send the merged updates of a fact group, run on the executor"""
+        try:
+            response = self.put_fact_group(fact_group_id, pending.fields)
+        except Exception as exc:
+            error = exc
+        else:
+            error = None
+        with self._condition:
+            self.stats.puts += 1
+            if error is not None:
+                self.stats.failed += 1
+            self._in_flight.discard(fact_group_id)
+            self._condition.notify_all()
+        for future in pending.futures:
+            if error is not None:
+                future.set_exception(error)
+            else:
+                future.set_result(response)
+
+    def flush(self, timeout=None):
+        """Write every pending update now and wait until written
+
+        Args:
+            timeout (float): Seconds to wait at most, default = no limit
+
+        Returns:
+            bool: `True` if everything pending was written, `False` on timeout
+        """
+        with self._condition:
+            futures = [future for pending in self._pending.values()
+                       for future in pending.futures]
+            for pending in self._pending.values():
+                pending.since = None
+            self._condition.notify_all()
+        end = None if timeout is None else monotonic() + timeout
+        for future in futures:
+            remaining = None if end is None else max(end - monotonic(), 0)
+            try:
+                future.exception(remaining)
+            except Exception:
+                return False
+        return True
+
+    def close(self):
+        """Write every pending update, then stop the writer"""
+        with self._condition:
+            if self._closed:
+                return
+            self._closed = True
+            for pending in self._pending.values():
+                pending.since = None
+            self._condition.notify_all()
+        self._thread.join()
+        self._executor.shutdown(wait=True)
+
+    def __len__(self):
+        with self._condition:
+            return sum(len(pending.futures) for pending in self._pending.values())
+
+    def __enter__(self):
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self.close()
+
+    def __repr__(self):
+        return 'FactGroupWriter(pending={}, {!r})'.format(len(self), self.stats)
+
+
+class AsyncFactGroupWriter(object):
+    """Asyncio write-behind buffer for ``put_fact_group``, see :class:`FactGroupWriter`
+
+    Use it from a single event loop, as an async context manager or closed with :func:`close`.
+
+    Args:
+        put_fact_group (callable): Returns a coroutine for
+            ``put_fact_group(fact_group_id, fact_data)``, e.g.
+            :func:`irflow_client.async_client.AsyncIRFlowClient.put_fact_group`
+        max_updates (int): Pending updates of a fact group that trigger a write, default = 20
+        max_delay (float): Seconds the oldest pending update of a fact group may wait,
+            default = 0.5
+
+    Attributes:
+        stats (WriterStats): Updates received and calls made
+    """
+
+    def __init__(self, put_fact_group, max_updates=20, max_delay=0.5):
+        self.put_fact_group = put_fact_group
+        self.max_updates = max_updates
+        self.max_delay = max_delay
+        self.stats = WriterStats()
+        self._pending = {}
+        self._timers = {}
+        # fact_group_id -> task writing it, later writes of the same group wait for it
+        self._writes = {}
+        self._closed = False
+
+    def put(self, fact_group_id, fact_data):
+        """Queue an update of a fact group
+
+        Args:
+            fact_group_id (int): The IR-Flow assigned ID of the fact group to be updated
+            fact_data (dict): Key, Value pairs of fact fields and their values
+
+        Returns:
+            asyncio.Future: Resolves to the json response of the call the update was sent
+                with, or raises its exception
+
+        Raises:
+            RuntimeError: The writer is closed
+        """
+        if self._closed:
+            raise RuntimeError('AsyncFactGroupWriter is closed')
+        loop = asyncio.get_event_loop()
+        future = loop.create_future()
+        pending = self._pending.get(fact_group_id)
+        if pending is None:
+            pending = self._pending[fact_group_id] = _Pending(monotonic())
+            self._timers[fact_group_id] = loop.call_later(self.max_delay, self._start,
+                                                          fact_group_id)
+        _merge(pending, fact_data)
+        pending.futures.append(future)
+        self.stats.updates += 1
+        if len(pending.futures) >= self.max_updates:
+            self._start(fact_group_id)
+        return future
+
+    def _start(self, fact_group_id):
+        """Helper function to start writing the pending updates of a fact group"""
+        pending = self._pending.pop(fact_group_id, None)
+        timer = self._timers.pop(fact_group_id, None)
+        if timer is not None:
+            timer.cancel()
+        if pending is None:
+            return None
+        previous = self._writes.get(fact_group_id)
+        task = asyncio.ensure_future(self._write(fact_group_id, pending, previous))
+        self._writes[fact_group_id] = task
+        return task
+
+    async def _write(self, fact_group_id, pending, previous):
+        """Helper function to send the merged updates of a fact group after earlier writes"""
+        if previous is not None:
+            await asyncio.wait([previous])
+        try:
+            response = await self.put_fact_group(fact_group_id, pending.fields)
+        except Exception as exc:
+            self.stats.failed += 1
+            for future in pending.futures:
+                if not future.done():
+                    future.set_exception(exc)
+                    # Mark it retrieved, the caller may not await it
+                    future.exception()
+        else:
+            for future in pending.futures:
+                if not future.done():
+                    future.set_result(response)
+        finally:
+            self.stats.puts += 1
+            if self._writes.get(fact_group_id) is asyncio.current_task():
+                del self._writes[fact_group_id]
+
+    async def flush(self):
+        """Write every pending update now and wait until written"""
+        for fact_group_id in list(self._pending):
+            self._start(fact_group_id)
+        if self._writes:
+            await asyncio.wait(list(self._writes.values()))
+
+    async def close(self):
+        """Write every pending update, then refuse further updates"""
+        self._closed = True
+        await self.flush()
+
+    def __len__(self):
+        return sum(len(pending.futures) for pending in self._pending.values())
+
+    async def __aenter__(self):
+        return self
+
+    async def __aexit__(self, exc_type, exc_value, traceback):
+        await self.close()
+
+    def __repr__(self):
+        return 'AsyncFactGroupWriter(pending={}, {!r})'.format(len(self), self.stats)
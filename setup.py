@@ -33,10 +33,20 @@ setup(
     packages=['irflow_client'],
     platforms=['Windows', 'MacOS', 'Enterprise Linux'],
     install_requires=base_requirements,
-    # python_requires='>=2.7.*, >=3.6',
+    entry_points={
+        'console_scripts': [
+            'irflow-csv-ingest=irflow_client.ingest:main',
+            'irflow-replay=irflow_client.replay:main',
+            'irflow-outbox=irflow_client.outbox:main'
+        ]
+    },
+    python_requires='>=3.7',
     extras_require={
         'dev': [
             dev_requirements
+        ],
+        'async': [
+            'aiohttp>=3.7'
         ]
     },
     classifiers=[
@@ -45,10 +55,9 @@ setup(
         'Operating System :: MacOS :: MacOS X',
         'Operating System :: Microsoft :: Windows',
         'Operating System :: POSIX',
-        'Programming Language :: Python :: 2',
-        'Programming Language :: Python :: 2.7',
         'Programming Language :: Python :: 3',
-        'Programming Language :: Python :: 3.6',
+        'Programming Language :: Python :: 3 :: Only',
+        'Programming Language :: Python :: 3.7',
         'Topic :: Security'
     ]
 )
@@ -0,0 +1,14 @@
+"""
+    conftest.py. Shared pytest fixtures for irflow_client
+"""
+import pytest
+
+from .stub_server import StubServer
+
+
+@pytest.fixture
+def server():
+    """Local stand-in for an IR-Flow server, answering the version endpoint"""
+    with StubServer() as stub:
+        stub.add('GET', '/api/v1/version', json_body={'data': {'version': '5.1'}})
+        yield stub
@@ -0,0 +1,195 @@
+"""
+    stub_server.py. A small threaded HTTP server that stands in for IR-Flow during tests
+
+    Routes are registered per (method, path) and answered with either a static
+    (status, json, headers) tuple or a callable that receives the parsed request.
+    Files registered with `add_file` are served with HTTP Range support.
+"""
+import json
+import re
+import socket
+import threading
+
+try:
+    from http.server import BaseHTTPRequestHandler, ThreadingHTTPServer
+    from urllib.parse import urlsplit, parse_qs
+except ImportError:
+    pass
+
+
+class StubRequest(object):
+    """A request received by the stub server"""
+
+    def __init__(self, method, path, query, headers, body):
+        self.method = method
+        self.path = path
+        self.query = query
+        self.headers = headers
+        self.body = body
+
+    def json(self):
+        return json.loads(self.body.decode('utf-8'))
+
+
+class StubResponse(object):
+    """A response to be served by the stub server
+
+    `drop_after` closes the connection after that many body bytes, while the Content-Length
+    header still announces the whole body.
+    """
+
+    def __init__(self, status=200, json_body=None, body=None, headers=None, delay=0,
+                 drop_after=None):
+        self.status = status
+        self.headers = dict(headers or {})
+        self.delay = delay
+        self.drop_after = drop_after
+        if body is None:
+            body = json.dumps(json_body if json_body is not None else {}).encode('utf-8')
+            self.headers.setdefault('Content-Type', 'application/json')
+        self.body = body
+
+
+class StubServer(object):
+    """Threaded HTTP server answering registered routes
+
+    Use as a context manager::
+
+        with StubServer() as server:
+            server.add('GET', '/api/v1/version', json_body={'data': {'version': '5.1'}})
+            client = IRFlowClient(server.config_args)
+    """
+
+    def __init__(self):
+        self.routes = {}
+        self.requests = []
+        self._lock = threading.Lock()
+        self._server = ThreadingHTTPServer(('127.0.0.1', 0), self._handler_class())
+        self._server.daemon_threads = True
+        self._thread = threading.Thread(target=self._server.serve_forever)
+        self._thread.daemon = True
+
+    @property
+    def address(self):
+        return '127.0.0.1:%s' % self._server.server_address[1]
+
+    @property
+    def config_args(self):
+        return {
+            'address': self.address,
+            'api_user': 'stub_user',
+            'api_key': 'stub_key',
+            'protocol': 'http',
+            'debug': False,
+            'verbose': 0
+        }
+
+    def add(self, method, path, status=200, json_body=None, body=None, headers=None, delay=0):
+        """Register a static response, or a callable taking a StubRequest via `json_body`"""
+        if callable(json_body):
+            self.routes[(method, path)] = json_body
+        else:
+            self.routes[(method, path)] = StubResponse(status, json_body, body, headers, delay)
+
+    def add_file(self, path, content, drop_after=None, ranges=True):
+        """Serve `content` on GET, honouring single `bytes=start-` / `bytes=start-end` ranges
+
+        Args:
+            path (str): The url path
+            content (bytes): The file content
+            drop_after (int): Drop the connection after this many body bytes, for the first
+                response only
+            ranges (bool): Support Range requests, else always answer the whole file
+        """
+        drops = [drop_after] if drop_after is not None else []
+
+        def serve(request):
+            drop = drops.pop() if drops else None
+            match = re.match(r'bytes=(\d+)-(\d*)$', request.headers.get('Range', ''))
+            if not ranges or match is None:
+                return StubResponse(body=content, drop_after=drop,
+                                    headers={'Accept-Ranges': 'bytes' if ranges else 'none'})
+            start = int(match.group(1))
+            end = int(match.group(2)) if match.group(2) else len(content) - 1
+            if start >= len(content):
+                return StubResponse(416, body=b'',
+                                    headers={'Content-Range': 'bytes */%s' % len(content)})
+            end = min(end, len(content) - 1)
+            return StubResponse(206, body=content[start:end + 1], drop_after=drop, headers={
+                'Content-Range': 'bytes %s-%s/%s' % (start, end, len(content))})
+
+        self.routes[('GET', path)] = serve
+
+    def requests_for(self, method, path):
+        return [req for req in self.requests if req.method == method and req.path == path]
+
+    def __enter__(self):
+        self._thread.start()
+        return self
+
+    def __exit__(self, exc_type, exc_value, traceback):
+        self._server.shutdown()
+        self._server.server_close()
+
+    def _handler_class(self):
+        stub = self
+
+        class Handler(BaseHTTPRequestHandler):
+            protocol_version = 'HTTP/1.1'
+
+            def setup(self):
+                BaseHTTPRequestHandler.setup(self)
+                # Headers and body are written separately, avoid Nagle delays on keep-alive
+                self.connection.setsockopt(socket.IPPROTO_TCP, socket.TCP_NODELAY, 1)
+
+            def log_message(self, *args):
+                pass
+
+            def _handle(self):
+                parts = urlsplit(self.path)
+                length = int(self.headers.get('Content-Length') or 0)
+                if self.headers.get('Transfer-Encoding') == 'chunked':
+                    body = self._read_chunked()
+                else:
+                    body = self.rfile.read(length) if length else b''
+                request = StubRequest(self.command, parts.path, parse_qs(parts.query),
+                                      dict(self.headers), body)
+                with stub._lock:
+                    stub.requests.append(request)
+                route = stub.routes.get((self.command, parts.path))
+                if route is None:
+                    response = StubResponse(404, {'success': False, 'message': 'Not Found'})
+                elif callable(route):
+                    response = route(request)
+                else:
+                    response = route
+                if response.delay:
+                    threading.Event().wait(response.delay)
+                self.send_response(response.status)
+                for key, value in response.headers.items():
+                    self.send_header(key, value)
+                self.send_header('Content-Length', str(len(response.body)))
+                self.end_headers()
+                if self.command == 'HEAD':
+                    return
+                if response.drop_after is None:
+                    self.wfile.write(response.body)
+                else:
+                    self.wfile.write(response.body[:response.drop_after])
+                    self.wfile.flush()
+                    self.close_connection = True
+                    self.connection.shutdown(socket.SHUT_RDWR)
+
+            def _read_chunked(self):
+                chunks = []
+                while True:
+                    size = int(self.rfile.readline().strip(), 16)
+                    if size == 0:
+                        self.rfile.readline()
+                        return b''.join(chunks)
+                    chunks.append(self.rfile.read(size))
+                    self.rfile.readline()
+
+            do_GET = do_POST = do_PUT = do_DELETE = do_HEAD = _handle
+
+        return Handler
@@ -0,0 +1,217 @@
+"""
+    test_async_client.py. Pytests for AsyncIRFlowClient against a local stub server
+"""
+import asyncio
+import inspect
+
+import pytest
+
+pytest.importorskip('aiohttp')
+
+from irflow_client import AsyncIRFlowClient, IRFlowClient
+from irflow_client.irflow_client import (IRFlowClientConfigError, IRFlowDeadlineExceededError,
+                                         IRFlowMaintenanceError)
+
+from .stub_server import StubResponse
+
+
+def run(coroutine):
+    return asyncio.run(coroutine)
+
+
+def test_mirrors_every_endpoint():
+    """Every public IRFlowClient API method has a coroutine counterpart"""
+    helpers = ('get_field_by_name', 'create_alerts', 'download_attachments', 'fact_group_writer',
+               'request_options')
+    for name, member in inspect.getmembers(IRFlowClient, inspect.isfunction):
+        if name.startswith(('_', 'dump_')) or name in helpers:
+            continue
+        assert inspect.iscoroutinefunction(getattr(AsyncIRFlowClient, name)), name
+
+
+def test_get_version(server):
+    server.add('GET', '/api/v1/version', json_body={'data': {'version': '5.1'}})
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            return await irfc.get_version()
+
+    assert run(scenario()) == '5.1'
+    assert server.requests[0].headers['X-Authorization'] == 'stub_user stub_key'
+
+
+def test_get_version_maintenance(server):
+    server.add('GET', '/api/v1/version', status=503, body=b'down')
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            await irfc.get_version()
+
+    with pytest.raises(IRFlowMaintenanceError):
+        run(scenario())
+
+
+def test_get_version_is_measured_and_cached(server, tmpdir):
+    server.add('GET', '/api/v1/version', json_body={'data': {'version': '5.1'}})
+    config_args = dict(server.config_args, collect_metrics=True,
+                       version_cache_file=str(tmpdir.join('version.json')))
+
+    async def scenario():
+        async with AsyncIRFlowClient(config_args) as irfc:
+            await irfc.get_version()
+            return irfc.metrics.snapshot()
+
+    assert run(scenario())['version']['statuses'] == {200: 1}
+    assert IRFlowClient(config_args).version == '5.1'
+    assert len(server.requests_for('GET', '/api/v1/version')) == 1
+    assert server.requests[0].headers['Content-type'] == 'application/json'
+
+
+def test_create_alert_and_picklists(server):
+    server.add('POST', '/api/v1/alerts',
+               json_body=lambda req: StubResponse(200, {'success': True, 'data': req.json()}))
+    server.add('GET', '/api/v1/picklist_items', json_body={'success': True})
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            alert = await irfc.create_alert({'src_ip': '10.0.0.1'}, description='desc',
+                                            incoming_field_group_name='group')
+            items = await irfc.list_picklist_items(3)
+            return alert, items
+
+    alert, items = run(scenario())
+    assert alert['data']['fields'] == {'src_ip': '10.0.0.1'}
+    assert alert['data']['data_field_group_name'] == 'group'
+    assert items == {'success': True}
+    query = server.requests_for('GET', '/api/v1/picklist_items')[0].query
+    assert query == {'picklist_id': ['3'], 'with_trashed': ['False'], 'only_trashed': ['False']}
+
+
+def test_upload_and_download(server, tmpdir):
+    upload = tmpdir.join('evidence.txt')
+    upload.write('evidence')
+    server.add('POST', '/api/v1/alerts/7/attachments', json_body={'success': True})
+    server.add('GET', '/api/v1/attachments/9/download', body=b'attachment body')
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            uploaded = await irfc.upload_attachment_to_alert(7, str(upload))
+            await irfc.download_attachment(9, str(tmpdir.join('out.bin')))
+            body = await irfc.download_attachment_string(9)
+            return uploaded, body
+
+    uploaded, body = run(scenario())
+    assert uploaded == {'success': True}
+    assert body == b'attachment body'
+    assert tmpdir.join('out.bin').read_binary() == b'attachment body'
+    assert b'evidence' in server.requests_for('POST', '/api/v1/alerts/7/attachments')[0].body
+
+
+def test_duplicate_upload_is_skipped(server):
+    server.add('POST', '/api/v1/alerts/7/attachments', json_body={'success': True})
+
+    async def scenario():
+        async with AsyncIRFlowClient(dict(server.config_args, dedup_uploads=True)) as irfc:
+            first = await irfc.upload_attachment_to_alert(7, b'evidence')
+            return first, await irfc.upload_attachment_to_alert(7, b'evidence')
+
+    first, second = run(scenario())
+    assert first == {'success': True}
+    assert second['skipped']
+    assert len(server.requests_for('POST', '/api/v1/alerts/7/attachments')) == 1
+
+
+def test_many_calls_in_flight_share_bounded_pool(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.2)
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args, max_connections=20) as irfc:
+            loop = asyncio.get_running_loop()
+            start = loop.time()
+            results = await asyncio.gather(*[irfc.get_alert(1) for _ in range(40)])
+            return results, loop.time() - start, irfc.session.connector.limit
+
+    results, elapsed, limit = run(scenario())
+    assert len(results) == 40
+    assert limit == 20
+    # 40 calls at 0.2s each through 20 connections take two rounds, not forty
+    assert elapsed < 2
+
+
+def test_create_alerts_bulk(server):
+    server.add('POST', '/api/v1/alerts', json_body=lambda req: StubResponse(
+        200, {'success': True, 'data': {'alert': {'alert_num': req.json()['fields']['n']}}}))
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            bulk = irfc.create_alerts(({'n': n} for n in range(25)), max_workers=5)
+            results = [result async for result in bulk]
+            return results, bulk.summary
+
+    results, summary = run(scenario())
+    assert [result.alert_num for result in results] == list(range(25))
+    assert summary.succeeded == 25
+
+
+def test_calls_share_the_retry_policy(server):
+    responses = iter([StubResponse(503, body=b'<html>maintenance</html>'),
+                      StubResponse(200, {'success': True})])
+    server.add('GET', '/api/v1/alerts/1', json_body=lambda req: next(responses))
+    server.add('GET', '/api/v1/alerts/2', status=503, body=b'<html>maintenance</html>')
+    server.add('POST', '/api/v1/alerts', status=502, json_body={})
+    config = dict(server.config_args, backoff_factor=0.01, coalesce_requests=False)
+
+    async def scenario():
+        async with AsyncIRFlowClient(config) as irfc:
+            assert await irfc.get_alert(1) == {'success': True}
+            with irfc.request_options(retry=irfc.retry_policy.copy(max_retries=1)):
+                with pytest.raises(IRFlowMaintenanceError):
+                    await irfc.get_alert(2)
+            # A POST is not replayed
+            assert await irfc.create_alert({'src_ip': '10.0.0.1'}) == {}
+            return irfc.retry_stats.as_dict()
+
+    stats = run(scenario())
+    assert stats == {'retries': 2, 'exhausted': 1, 'by_endpoint': {'get_alert': 2}}
+    assert len(server.requests_for('GET', '/api/v1/alerts/2')) == 2
+    assert len(server.requests_for('POST', '/api/v1/alerts')) == 1
+
+
+def test_timeouts_and_deadlines(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.4)
+    server.add('GET', '/api/v1/attachments/5/download', body=b'pcap', delay=0.4)
+    config = dict(server.config_args, read_timeout=0.2, max_retries=0)
+
+    async def scenario():
+        async with AsyncIRFlowClient(config) as irfc:
+            with pytest.raises(asyncio.TimeoutError):
+                await irfc.get_alert(1)
+            # Attachments have a read timeout of their own
+            assert await irfc.download_attachment_string(5) == b'pcap'
+            with irfc.request_options(timeout=(1, 1)):
+                assert await irfc.get_alert(1) == {'success': True}
+            with irfc.request_options(timeout=(1, 1), deadline=0.5):
+                await irfc.get_alert(1)
+                with pytest.raises(asyncio.TimeoutError):
+                    await irfc.get_alert(1)
+                with pytest.raises(IRFlowDeadlineExceededError):
+                    await irfc.get_alert(1)
+
+    run(scenario())
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 4
+
+
+def test_plain_with_is_refused(server):
+    irfc = AsyncIRFlowClient(server.config_args)
+
+    with pytest.raises(TypeError, match='async with'):
+        with irfc:
+            pass
+    assert irfc.session is None
+
+
+def test_response_cache_is_refused():
+    with pytest.raises(IRFlowClientConfigError):
+        AsyncIRFlowClient({'address': '127.0.0.1:1', 'api_user': 'user', 'api_key': 'key',
+                           'protocol': 'http', 'debug': False, 'verbose': 0,
+                           'cache_responses': True})
@@ -0,0 +1,222 @@
+"""
+    test_breaker.py. Pytests for the circuit breaker of the request path
+"""
+import asyncio
+import time
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client import breaker
+from irflow_client.breaker import CircuitBreaker
+from irflow_client.irflow_client import (IRFlowCircuitOpenError, IRFlowDeadlineExceededError,
+                                         IRFlowMaintenanceError)
+from irflow_client.metrics import format_prometheus
+from irflow_client.ratelimit import RateLimiter
+
+from .stub_server import StubResponse
+
+
+@pytest.fixture
+def clock(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(breaker, 'monotonic', lambda: now[0])
+    return now
+
+
+def maintenance_client(server, **config):
+    server.add('GET', '/api/v1/alerts/1', status=503, json_body={'success': False})
+    server.add('GET', '/api/v1/incidents/2', json_body={'success': True})
+    return IRFlowClient(dict(server.config_args, circuit_breaking=True, max_retries=0,
+                             circuit_failure_threshold=3, **config))
+
+
+def test_breaker_is_off_by_default(server):
+    assert IRFlowClient(server.config_args).circuit_breaker is None
+
+
+def test_repeated_503s_open_the_circuit_for_every_method(server, clock):
+    irfc = maintenance_client(server)
+
+    for _ in range(3):
+        with pytest.raises(IRFlowMaintenanceError):
+            irfc.get_alert(1)
+    with pytest.raises(IRFlowCircuitOpenError) as info:
+        irfc.get_incident(2)
+
+    assert irfc.circuit_breaker.state == breaker.OPEN
+    assert info.value.retry_after == 30.0 and 'get_incident' in str(info.value)
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 3
+    assert server.requests_for('GET', '/api/v1/incidents/2') == []
+
+
+def test_half_open_probe_closes_or_reopens_the_circuit(server, clock):
+    irfc = maintenance_client(server)
+    for _ in range(3):
+        with pytest.raises(IRFlowMaintenanceError):
+            irfc.get_alert(1)
+
+    clock[0] += 30
+    assert irfc.circuit_breaker.state == breaker.HALF_OPEN
+    with pytest.raises(IRFlowMaintenanceError) as info:
+        irfc.get_alert(1)
+    # A failed probe opens the circuit again at once
+    assert not isinstance(info.value, IRFlowCircuitOpenError)
+    assert irfc.circuit_breaker.state == breaker.OPEN and irfc.circuit_breaker.opened == 2
+
+    clock[0] += 30
+    assert irfc.get_incident(2) == {'success': True}
+    assert irfc.circuit_breaker.state == breaker.CLOSED
+    with pytest.raises(IRFlowMaintenanceError):
+        irfc.get_alert(1)
+    assert irfc.circuit_breaker.state == breaker.CLOSED
+
+
+def test_probes_without_an_answer_give_back_their_slot(server, clock):
+    server.add('GET', '/api/v1/alerts/3', status=302, json_body={},
+               headers={'Location': '/api/v1/alerts/3'})
+    irfc = maintenance_client(server, rate_limit=5, rate_limit_burst=1)
+    for _ in range(3):
+        with pytest.raises(IRFlowMaintenanceError):
+            irfc.get_alert(1)
+    clock[0] += 30
+
+    # Stopped by the deadline while waiting for the rate limiter
+    with irfc.request_options(deadline=0.1):
+        with pytest.raises(IRFlowDeadlineExceededError):
+            irfc.get_incident(2)
+    # An error that is no sign of an outage
+    with pytest.raises(requests.exceptions.TooManyRedirects):
+        irfc.get_alert(3)
+    assert irfc.circuit_breaker.state == breaker.HALF_OPEN
+
+    assert irfc.get_incident(2) == {'success': True}
+    assert irfc.circuit_breaker.state == breaker.CLOSED
+
+
+def test_open_circuit_fails_before_the_rate_limiter(server, clock):
+    irfc = maintenance_client(server, rate_limit=20, rate_limit_burst=1)
+    for _ in range(3):
+        with pytest.raises(IRFlowMaintenanceError):
+            irfc.get_alert(1)
+    delayed = irfc.rate_limiter.delayed
+
+    started = time.perf_counter()
+    for _ in range(5):
+        with pytest.raises(IRFlowCircuitOpenError):
+            irfc.get_incident(2)
+
+    assert time.perf_counter() - started < 0.05
+    assert irfc.rate_limiter.delayed == delayed
+
+
+def test_cancelled_async_probe_gives_back_its_slot(server, clock):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('GET', '/api/v1/alerts/1', status=503, json_body={})
+    server.add('GET', '/api/v1/incidents/2', json_body={'success': True}, delay=5)
+    server.add('GET', '/api/v1/incidents/3', json_body={'success': True})
+    config = dict(server.config_args, circuit_breaking=True, circuit_failure_threshold=1,
+                  max_retries=0)
+
+    async def scenario():
+        async with AsyncIRFlowClient(config) as irfc:
+            with pytest.raises(IRFlowMaintenanceError):
+                await irfc.get_alert(1)
+            clock[0] += 30
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(irfc.get_incident(2), 0.2)
+            assert irfc.circuit_breaker.state == breaker.HALF_OPEN
+            # Cancelled while waiting for the rate limiter
+            irfc.rate_limiter = RateLimiter(rate=1, burst=1)
+            irfc.rate_limiter.reserve('get_incident')
+            with pytest.raises(asyncio.TimeoutError):
+                await asyncio.wait_for(irfc.get_incident(3), 0.2)
+            irfc.rate_limiter = None
+            return await irfc.get_incident(3)
+
+    assert asyncio.run(scenario()) == {'success': True}
+
+
+def test_retries_stop_once_the_circuit_opens(server, clock):
+    server.add('GET', '/api/v1/alerts/1', status=502, json_body={})
+    irfc = IRFlowClient(dict(server.config_args, circuit_breaking=True, max_retries=5,
+                             backoff_factor=0, circuit_failure_threshold=2))
+
+    with pytest.raises(IRFlowCircuitOpenError):
+        irfc.get_alert(1)
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 2
+
+
+def test_connection_failures_open_the_circuit_and_fail_fast():
+    irfc = IRFlowClient({'address': '127.0.0.1:1', 'api_user': 'user', 'api_key': 'key',
+                         'protocol': 'http', 'debug': False, 'verbose': 0,
+                         'circuit_breaking': True, 'circuit_failure_threshold': 2,
+                         'max_retries': 0, 'collect_metrics': True})
+
+    for _ in range(2):
+        with pytest.raises(requests.exceptions.ConnectionError):
+            irfc.get_alert(1)
+    started = time.perf_counter()
+    with pytest.raises(IRFlowCircuitOpenError):
+        irfc.get_alert(1)
+
+    assert time.perf_counter() - started < 0.05
+    assert irfc.metrics.snapshot()['get_alert']['statuses'] == {'ConnectionError': 2,
+                                                                'IRFlowCircuitOpenError': 1}
+    assert 'irflow_client_circuit_state 2\n' in format_prometheus(irfc.metrics)
+
+
+def test_retry_after_keeps_the_circuit_open_longer(clock):
+    circuit = CircuitBreaker(failure_threshold=1, reset_timeout=5)
+
+    circuit.record(503, retry_after=120)
+    clock[0] += 60
+    assert circuit.state == breaker.OPEN and circuit.retry_after == 60
+    clock[0] += 60
+    assert circuit.state == breaker.HALF_OPEN
+
+
+def test_half_open_lets_a_limited_number_of_probes_through(clock):
+    circuit = CircuitBreaker(failure_threshold=2, reset_timeout=10, half_open_probes=2)
+
+    circuit.record(504)
+    circuit.record(404)
+    circuit.record(504)
+    assert circuit.allow()
+    circuit.record_failure()
+    assert not circuit.allow()
+
+    clock[0] += 10
+    assert [circuit.allow() for _ in range(3)] == [True, True, False]
+    assert circuit.rejected == 2
+    circuit.release()
+    assert circuit.allow() and not circuit.allow()
+
+
+def test_async_calls_share_the_circuit(server, clock):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    responses = iter([StubResponse(503, {})] * 2 + [StubResponse(200, {'success': True})])
+    server.add('GET', '/api/v1/alerts/1', json_body=lambda request: next(responses))
+    server.add('GET', '/api/v1/incidents/2', json_body={'success': True})
+    config = dict(server.config_args, circuit_breaking=True, circuit_failure_threshold=2,
+                  coalesce_requests=False, max_retries=0)
+
+    async def scenario():
+        async with AsyncIRFlowClient(config) as irfc:
+            for _ in range(2):
+                with pytest.raises(IRFlowMaintenanceError):
+                    await irfc.get_alert(1)
+            with pytest.raises(IRFlowCircuitOpenError):
+                await irfc.get_incident(2)
+            clock[0] += 30
+            assert await irfc.get_alert(1) == {'success': True}
+            return irfc.circuit_breaker
+
+    circuit = asyncio.run(scenario())
+    assert circuit.state == breaker.CLOSED and circuit.opened == 1
+    assert server.requests_for('GET', '/api/v1/incidents/2') == []
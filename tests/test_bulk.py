@@ -0,0 +1,67 @@
+"""
+    test_bulk.py. Pytests for IRFlowClient.create_alerts against a local stub server
+"""
+import threading
+
+from irflow_client import IRFlowClient
+
+from .stub_server import StubResponse
+
+
+def alert_route(in_flight, peak, lock):
+    def respond(request):
+        with lock:
+            in_flight[0] += 1
+            peak[0] = max(peak[0], in_flight[0])
+        threading.Event().wait(0.05)
+        with lock:
+            in_flight[0] -= 1
+        num = request.json()['fields']['n']
+        if num == 3:
+            return StubResponse(422, {'success': False, 'message': 'Invalid field'})
+        # Later alerts answer faster, so completion order differs from input order
+        return StubResponse(200, {'success': True, 'data': {'alert': {'alert_num': num}}},
+                            delay=0.01 * (10 - num))
+    return respond
+
+
+def test_create_alerts_ordered(server):
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    server.add('POST', '/api/v1/alerts', json_body=alert_route(in_flight, peak, lock))
+    irfc = IRFlowClient(server.config_args)
+
+    bulk = irfc.create_alerts(({'n': n} for n in range(10)), description='bulk',
+                              max_workers=4)
+    results = list(bulk)
+
+    assert [result.index for result in results] == list(range(10))
+    assert [result.alert_num for result in results if result.success] == \
+        [0, 1, 2, 4, 5, 6, 7, 8, 9]
+    assert results[3].error == 'Invalid field'
+    assert peak[0] <= 4
+    assert bulk.summary.total == 10
+    assert bulk.summary.failed == 1
+    assert bulk.summary.throughput > 0
+    assert bulk.summary.latency_p50 <= bulk.summary.latency_p99 <= bulk.summary.latency_max
+
+
+def test_create_alerts_as_completed(server):
+    in_flight, peak, lock = [0], [0], threading.Lock()
+    server.add('POST', '/api/v1/alerts', json_body=alert_route(in_flight, peak, lock))
+    irfc = IRFlowClient(server.config_args)
+
+    results = list(irfc.create_alerts(({'n': n} for n in range(10)), max_workers=10,
+                                      ordered=False))
+
+    assert sorted(result.index for result in results) == list(range(10))
+    assert [result.index for result in results] != list(range(10))
+
+
+def test_create_alerts_reports_exceptions(server):
+    irfc = IRFlowClient(server.config_args)
+    irfc.address = '127.0.0.1:1'
+
+    results = list(irfc.create_alerts([{'n': 1}]))
+
+    assert not results[0].success
+    assert isinstance(results[0].error, Exception)
@@ -0,0 +1,141 @@
+"""
+    test_coalesce.py. Pytests for coalescing of concurrent identical GET requests
+"""
+import asyncio
+from concurrent.futures import ThreadPoolExecutor
+import threading
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.coalesce import SingleFlight
+from irflow_client.irflow_client import IRFlowDeadlineExceededError
+from irflow_client.retry import RetryPolicy
+
+
+def coalescing_client(server, **config):
+    return IRFlowClient(dict(server.config_args, coalesce_requests=True, **config))
+
+
+def fan_out(func, args):
+    with ThreadPoolExecutor(max_workers=len(args)) as executor:
+        return list(executor.map(func, args))
+
+
+def test_concurrent_identical_gets_share_one_request(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True, 'data': {'n': 1}},
+               delay=0.3)
+    irfc = coalescing_client(server)
+
+    results = fan_out(irfc.get_alert, [1] * 10)
+
+    assert all(result == {'success': True, 'data': {'n': 1}} for result in results)
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 1
+    assert irfc.request_coalescer.as_dict() == {'calls': 1, 'coalesced': 9}
+    # Every caller decoded its own copy
+    results[0]['data']['n'] = 2
+    assert results[1]['data']['n'] == 1
+
+
+def test_different_requests_and_writes_are_not_coalesced(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.2)
+    server.add('GET', '/api/v1/alerts/2', json_body={'success': True}, delay=0.2)
+    server.add('PUT', '/api/v1/alerts/close', json_body={'success': True}, delay=0.2)
+    irfc = coalescing_client(server)
+
+    fan_out(irfc.get_alert, [1, 2, 1, 2])
+    fan_out(lambda _: irfc.close_alert(1, 'dupe'), range(3))
+
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 1
+    assert len(server.requests_for('GET', '/api/v1/alerts/2')) == 1
+    assert len(server.requests_for('PUT', '/api/v1/alerts/close')) == 3
+
+
+def test_coalescing_is_off_by_default(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.2)
+    irfc = IRFlowClient(server.config_args)
+
+    fan_out(irfc.get_alert, [1] * 3)
+
+    assert irfc.request_coalescer is None
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 3
+
+
+def test_calls_with_other_request_options_are_not_coalesced(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.2)
+    irfc = coalescing_client(server)
+    no_retries = RetryPolicy(max_retries=0)
+
+    def get_alert(options):
+        with irfc.request_options(**options):
+            return irfc.get_alert(1)
+
+    fan_out(get_alert, [{}, {'retry': no_retries}, {'timeout': 5}, {'retry': no_retries}])
+
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 3
+    assert irfc.request_coalescer.as_dict() == {'calls': 3, 'coalesced': 1}
+
+
+def test_errors_reach_every_waiting_caller():
+    flight = SingleFlight()
+    started = threading.Event()
+    release = threading.Event()
+
+    def fail():
+        started.set()
+        release.wait()
+        raise ValueError('boom')
+
+    errors = []
+
+    def call():
+        try:
+            flight.do('key', fail)
+        except ValueError as exc:
+            errors.append(exc)
+
+    threads = [threading.Thread(target=call)]
+    threads[0].start()
+    started.wait()
+    threads += [threading.Thread(target=call) for _ in range(3)]
+    for thread in threads[1:]:
+        thread.start()
+    while flight.coalesced < 3:
+        pass
+    release.set()
+    for thread in threads:
+        thread.join()
+
+    assert len(errors) == 4 and len(set(map(id, errors))) == 1
+    assert len(flight) == 0
+
+
+def test_waiting_caller_keeps_its_own_deadline(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.5)
+    irfc = coalescing_client(server, max_retries=0)
+    leader = threading.Thread(target=irfc.get_alert, args=(1,))
+    leader.start()
+    while not len(irfc.request_coalescer):
+        pass
+
+    with pytest.raises(IRFlowDeadlineExceededError):
+        with irfc.request_options(deadline=0.05):
+            irfc.get_alert(1)
+    leader.join()
+
+
+def test_async_identical_gets_share_one_request(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.2)
+
+    async def scenario():
+        async with AsyncIRFlowClient(dict(server.config_args, coalesce_requests=True)) as irfc:
+            results = await asyncio.gather(*[irfc.get_alert(1) for _ in range(10)])
+            return results, irfc.request_coalescer.as_dict()
+
+    results, counters = asyncio.run(scenario())
+    assert results == [{'success': True}] * 10
+    assert counters == {'calls': 1, 'coalesced': 9}
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 1
@@ -0,0 +1,151 @@
+"""
+    test_concurrency.py. Pytests for the adaptive concurrency of bulk operations
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.concurrency import AdaptiveConcurrencyLimiter
+from irflow_client.metrics import ClientMetrics, format_prometheus
+
+from .stub_server import StubResponse
+
+
+class SimulatedServer(object):
+    """An IR-Flow stand-in handling `capacity` requests at once, queueing the others"""
+
+    def __init__(self, capacity, service_time=0.02):
+        self.service_time = service_time
+        self.slots = threading.Semaphore(capacity)
+        self.in_flight = 0
+        self.peak = 0
+        self._lock = threading.Lock()
+
+    def set_capacity(self, capacity):
+        # Requests holding a slot of the old semaphore release it there
+        self.slots = threading.Semaphore(capacity)
+
+    def __call__(self, request):
+        with self._lock:
+            self.in_flight += 1
+            self.peak = max(self.peak, self.in_flight)
+        slots = self.slots
+        with slots:
+            time.sleep(self.service_time)
+        with self._lock:
+            self.in_flight -= 1
+        return StubResponse(200, {'success': True, 'data': {'alert': {'alert_num': 1}}})
+
+
+def drive(limiter, latencies, failed=False):
+    """Finish one call per latency, each started in the window of the current limit"""
+    for latency in latencies:
+        windows = [limiter.start() for _ in range(limiter.limit)]
+        for window in windows:
+            limiter.finish(latency, failed, window)
+
+
+def test_limit_doubles_then_backs_off_and_grows_by_one():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=2, max_limit=64)
+
+    drive(limiter, [0.02, 0.02, 0.02])
+    assert limiter.limit == 16
+
+    drive(limiter, [0.05])
+    assert limiter.limit == 12 and limiter.decreases == 1
+
+    drive(limiter, [0.02, 0.02])
+    assert limiter.limit == 14
+
+
+def test_errors_cut_the_limit_and_idle_limits_do_not_grow():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=8)
+
+    drive(limiter, [0.02], failed=True)
+    assert limiter.limit == 6
+
+    # Only one call at a time, the limit of 6 is never reached
+    for _ in range(12):
+        limiter.finish(0.02, window=limiter.start())
+    assert limiter.limit == 6
+
+
+def test_calls_from_an_earlier_window_are_not_judged():
+    limiter = AdaptiveConcurrencyLimiter(initial_limit=4)
+    stale = [limiter.start() for _ in range(4)]
+    drive(limiter, [0.02])
+    assert limiter.limit == 8
+
+    # The slow calls started before the limit grew
+    for window in stale:
+        limiter.finish(1.0, window=window)
+    assert limiter.limit == 8 and limiter.in_flight == 0
+
+
+def test_concurrency_settles_near_the_server_capacity(server):
+    simulated = SimulatedServer(capacity=4)
+    server.add('POST', '/api/v1/alerts', json_body=simulated)
+    irfc = IRFlowClient(dict(server.config_args, collect_metrics=True))
+
+    bulk = irfc.create_alerts(({'n': n} for n in range(200)), max_workers=32, ordered=False,
+                              adaptive=True)
+    limits = [bulk.limiter.limit for result in bulk if result.success]
+
+    assert len(limits) == 200
+    assert bulk.limiter.increases and bulk.limiter.decreases
+    assert max(limits) < 32 and simulated.peak < 32
+    # A sawtooth around the capacity once the first backoff ended the doubling
+    assert 2 <= sum(limits[100:]) / 100.0 <= 12
+    assert 'irflow_client_concurrency_limit{{operation="create_alerts"}} {}'.format(
+        bulk.limiter.limit) in format_prometheus(irfc.metrics)
+
+
+def test_concurrency_follows_a_server_slowing_down(server):
+    simulated = SimulatedServer(capacity=12)
+    server.add('POST', '/api/v1/alerts', json_body=simulated)
+    irfc = IRFlowClient(server.config_args)
+
+    bulk = irfc.create_alerts(({'n': n} for n in range(300)), max_workers=32, ordered=False,
+                              adaptive=True)
+    limits = []
+    for result in bulk:
+        limits.append(bulk.limiter.limit)
+        if len(limits) == 150:
+            simulated.set_capacity(2)
+
+    assert max(limits[:150]) >= 8
+    assert limits[-1] <= max(limits[:150]) / 2
+
+
+def test_gauges_are_exported():
+    metrics = ClientMetrics()
+    AdaptiveConcurrencyLimiter(initial_limit=3, metrics=metrics, name='download_attachments')
+
+    assert metrics.gauges() == {'concurrency_limit': [({'operation': 'download_attachments'},
+                                                       3)]}
+    assert '# TYPE irflow_client_concurrency_limit gauge\n' \
+        'irflow_client_concurrency_limit{operation="download_attachments",instance="soar1"} 3\n' \
+        in format_prometheus(metrics, labels={'instance': 'soar1'})
+
+
+def test_async_bulk_operations_adapt(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    simulated = SimulatedServer(capacity=4)
+    server.add('POST', '/api/v1/alerts', json_body=simulated)
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            bulk = irfc.create_alerts(({'n': n} for n in range(100)), max_workers=32,
+                                      ordered=False, adaptive=True)
+            results = [result async for result in bulk]
+            return bulk.limiter, results
+
+    limiter, results = asyncio.run(scenario())
+    assert all(result.success for result in results) and len(results) == 100
+    assert limiter.increases and limiter.limit < 32
+    assert simulated.peak < 32
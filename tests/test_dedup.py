@@ -0,0 +1,170 @@
+"""
+    test_dedup.py. Pytests for upload and alert deduplication
+"""
+import hashlib
+import io
+
+from irflow_client import IRFlowClient
+from irflow_client import dedup
+from irflow_client.dedup import AlertDeduplicator, UploadIndex, content_digest
+
+from .stub_server import StubResponse
+
+ALERT_UPLOAD = '/api/v1/alerts/7/attachments'
+INCIDENT_UPLOAD = '/api/v1/incidents/3/attachments'
+
+
+def test_repeated_upload_is_skipped(server, tmpdir):
+    server.add('POST', ALERT_UPLOAD, json_body={'success': True})
+    server.add('POST', INCIDENT_UPLOAD, json_body={'success': True})
+    screenshot = tmpdir.join('screenshot.png')
+    screenshot.write_binary(b'\x89PNG' * 1000)
+    irfc = IRFlowClient(dict(server.config_args, dedup_uploads=True))
+
+    assert irfc.upload_attachment_to_alert(7, str(screenshot)) == {'success': True}
+    skipped = irfc.upload_attachment_to_alert(7, b'\x89PNG' * 1000, attachment_name='copy.png')
+    # The same content on another object is still uploaded
+    assert irfc.upload_attachment_to_incident(3, str(screenshot)) == {'success': True}
+
+    assert skipped['success'] and skipped['skipped']
+    assert skipped['data']['attachment_name'] == 'screenshot.png'
+    assert skipped['data']['sha256'] == hashlib.sha256(b'\x89PNG' * 1000).hexdigest()
+    assert len(server.requests_for('POST', ALERT_UPLOAD)) == 1
+    assert len(server.requests_for('POST', INCIDENT_UPLOAD)) == 1
+    assert irfc.upload_index.as_dict() == {'uploaded': 2, 'skipped': 1, 'bytes_skipped': 4000}
+
+
+def test_failed_uploads_are_not_recorded(server):
+    server.add('POST', ALERT_UPLOAD, json_body={'success': False, 'message': 'Denied'})
+    irfc = IRFlowClient(dict(server.config_args, dedup_uploads=True))
+
+    irfc.upload_attachment_to_alert(7, b'log bundle')
+    irfc.upload_attachment_to_alert(7, b'log bundle')
+
+    assert len(server.requests_for('POST', ALERT_UPLOAD)) == 2
+    assert len(irfc.upload_index) == 0
+
+
+def test_index_file_is_shared_between_runs(server, tmpdir):
+    server.add('POST', ALERT_UPLOAD, json_body={'success': True})
+    config = dict(server.config_args, upload_index_file=str(tmpdir.join('uploads.json')))
+
+    IRFlowClient(config).upload_attachment_to_alert(7, b'evidence', attachment_name='e.bin')
+    second_run = IRFlowClient(config)
+    assert second_run.upload_attachment_to_alert(7, b'evidence')['skipped']
+
+    second_run.upload_index.forget('alerts', 7)
+    assert 'skipped' not in IRFlowClient(config).upload_attachment_to_alert(7, b'evidence')
+    assert len(server.requests_for('POST', ALERT_UPLOAD)) == 2
+
+
+def test_digest_leaves_file_objects_in_place(tmpdir):
+    source = io.BytesIO(b'header' + b'content')
+    source.read(6)
+
+    assert content_digest(source, chunk_size=3) == (hashlib.sha256(b'content').hexdigest(), 7)
+    assert source.read() == b'content'
+
+    path = tmpdir.join('big.bin')
+    path.write_binary(b'x' * 10000)
+    assert content_digest(str(path), chunk_size=4096)[1] == 10000
+
+
+def test_unseekable_sources_are_uploaded_unhashed(server):
+    server.add('POST', ALERT_UPLOAD, json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, dedup_uploads=True))
+
+    class Pipe(io.RawIOBase):
+        def readable(self):
+            return True
+
+        def readinto(self, buffer):
+            return 0
+
+    assert content_digest(Pipe()) is None
+    irfc.upload_attachment_to_alert(7, Pipe(), attachment_name='pipe.txt')
+    irfc.upload_attachment_to_alert(7, Pipe(), attachment_name='pipe.txt')
+    assert len(server.requests_for('POST', ALERT_UPLOAD)) == 2
+
+
+def test_index_merges_writes_of_other_processes(tmpdir):
+    path = str(tmpdir.join('uploads.json'))
+    first, second = UploadIndex(path), UploadIndex(path)
+
+    first.add('alerts', 1, 'aa', 1)
+    second.add('incidents', 2, 'bb', 2)
+
+    merged = UploadIndex(path)
+    assert merged.get('alerts', 1, 'aa')['size'] == 1
+    assert merged.get('incidents', 2, 'bb')['size'] == 2
+
+
+def create_alert_route(server):
+    counter = iter(range(100, 200))
+    server.add('POST', '/api/v1/alerts', json_body=lambda request: StubResponse(
+        200, {'success': True, 'data': {'alert': {'alert_num': next(counter)}}}))
+
+
+def test_repeated_alerts_are_suppressed_within_the_window(server):
+    create_alert_route(server)
+    irfc = IRFlowClient(dict(server.config_args, dedup_alerts=True,
+                             alert_dedup_fields='rule, src_ip'))
+
+    first = irfc.create_alert({'rule': 'beacon', 'src_ip': '10.0.0.1', 'seen': 1}, 'first')
+    repeat = irfc.create_alert({'rule': 'beacon', 'src_ip': '10.0.0.1', 'seen': 2}, 'again')
+    other_host = irfc.create_alert({'rule': 'beacon', 'src_ip': '10.0.0.2'})
+    other_group = irfc.create_alert({'rule': 'beacon', 'src_ip': '10.0.0.1'},
+                                    incoming_field_group_name='edr')
+
+    assert first['data']['alert']['alert_num'] == 100
+    assert repeat['suppressed'] and repeat['data']['alert']['alert_num'] == 100
+    assert 'suppressed' not in other_host and 'suppressed' not in other_group
+    assert len(server.requests_for('POST', '/api/v1/alerts')) == 3
+    assert irfc.alert_dedup.as_dict() == {'forwarded': 3, 'suppressed': 1, 'evicted': 0}
+
+
+def test_alert_is_forwarded_again_after_the_window(server, monkeypatch):
+    create_alert_route(server)
+    irfc = IRFlowClient(dict(server.config_args, dedup_alerts=True, alert_dedup_window=30))
+    now = [1000.0]
+    monkeypatch.setattr(dedup, 'monotonic', lambda: now[0])
+
+    irfc.create_alert({'rule': 'beacon'})
+    now[0] += 29
+    assert irfc.create_alert({'rule': 'beacon'})['suppressed']
+    now[0] += 2
+    assert irfc.create_alert({'rule': 'beacon'})['data']['alert']['alert_num'] == 101
+    assert len(server.requests_for('POST', '/api/v1/alerts')) == 2
+
+
+def test_failed_alerts_are_not_remembered(server):
+    server.add('POST', '/api/v1/alerts', json_body={'success': False, 'message': 'Bad field'})
+    irfc = IRFlowClient(dict(server.config_args, dedup_alerts=True))
+
+    irfc.create_alert({'rule': 'beacon'})
+    irfc.create_alert({'rule': 'beacon'})
+
+    assert len(server.requests_for('POST', '/api/v1/alerts')) == 2
+    assert len(irfc.alert_dedup) == 0
+
+
+def test_bulk_repeats_are_suppressed_while_in_flight(server):
+    create_alert_route(server)
+    irfc = IRFlowClient(dict(server.config_args, dedup_alerts=True))
+
+    results = list(irfc.create_alerts([{'rule': 'beacon'}] * 20, max_workers=8))
+
+    assert all(result.success for result in results)
+    assert len(server.requests_for('POST', '/api/v1/alerts')) == 1
+    assert irfc.alert_dedup.suppressed == 19
+
+
+def test_fingerprint_store_is_bounded():
+    deduplicator = AlertDeduplicator(max_entries=2)
+    for rule in ('a', 'b', 'c'):
+        assert deduplicator.check(deduplicator.fingerprint({'rule': rule})) is None
+
+    assert len(deduplicator) == 2 and deduplicator.evicted == 1
+    # The oldest fingerprint was dropped, the alert is forwarded again
+    assert deduplicator.check(deduplicator.fingerprint({'rule': 'a'})) is None
+    assert deduplicator.check(deduplicator.fingerprint({'rule': 'c'}))['repeats'] == 1
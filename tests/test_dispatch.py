@@ -0,0 +1,33 @@
+"""
+    test_dispatch.py. Pytests for the request dispatch core of IRFlowClient
+"""
+from irflow_client import IRFlowClient
+
+
+def test_urls_match_end_points(server):
+    irfc = IRFlowClient(server.config_args)
+    base = 'http://%s/' % server.address
+
+    assert irfc._url('get_alert', suffix=7) == base + 'api/v1/alerts/7'
+    assert irfc._url('put_attachment', ('alerts', 7)) == base + 'api/v1/alerts/7/attachments'
+    # The leading slash of this endpoint path has always been kept
+    assert irfc._url('assign_user_to_alert', (7,)) == base + '/api/v1/alerts/7/assign'
+
+
+def test_urls_follow_address_changes(server):
+    irfc = IRFlowClient(dict(server.config_args, address='irflow.invalid'))
+    irfc.address = server.address
+    server.add('GET', '/api/v1/alerts/3', json_body={'success': True, 'data': {'alert': 3}})
+
+    assert irfc.get_alert(3)['data'] == {'alert': 3}
+
+
+def test_debug_dispatch(server, caplog):
+    server.add('PUT', '/api/v1/alerts/close', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, debug=True))
+
+    with caplog.at_level('DEBUG'):
+        assert irfc.close_alert(3, 'False Positive') == {'success': True}
+    assert 'Close Alert' in caplog.text
+    assert server.requests_for('PUT', '/api/v1/alerts/close')[0].json() == {
+        'alert_num': '3', 'close_reason_name': 'False Positive'}
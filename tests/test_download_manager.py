@@ -0,0 +1,138 @@
+"""
+    test_download_manager.py. Pytests for parallel, resumable attachment downloads
+"""
+import asyncio
+import os
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.irflow_client import IRFlowDownloadError
+
+from .stub_server import StubResponse
+
+FILES = dict((attachment_id, os.urandom(100000 + attachment_id)) for attachment_id in range(1, 6))
+
+
+def download_path(attachment_id):
+    return '/api/v1/attachments/%s/download' % attachment_id
+
+
+def test_downloads_many_attachments(server, tmpdir):
+    for attachment_id, content in FILES.items():
+        server.add_file(download_path(attachment_id), content)
+    irfc = IRFlowClient(server.config_args)
+
+    downloads = irfc.download_attachments(FILES, str(tmpdir.join('case')), max_workers=3,
+                                          ordered=True)
+    results = list(downloads)
+
+    assert [result.item for result in results] == list(FILES)
+    for result in results:
+        assert result.success
+        assert result.response['size'] == len(FILES[result.item])
+        assert tmpdir.join('case', str(result.item)).read_binary() == FILES[result.item]
+    assert not tmpdir.join('case').listdir('*.part')
+    assert downloads.summary.bytes_transferred == sum(len(data) for data in FILES.values())
+    assert downloads.summary.bytes_per_second > 0
+
+
+def test_dropped_connection_resumes_with_range(server, tmpdir):
+    server.add_file(download_path(1), FILES[1], drop_after=30000)
+    irfc = IRFlowClient(server.config_args)
+
+    result, = irfc.download_attachments([1], str(tmpdir))
+
+    assert result.success and result.response['resumes'] == 1
+    assert tmpdir.join('1').read_binary() == FILES[1]
+    first, second = server.requests_for('GET', download_path(1))
+    assert 'Range' not in first.headers
+    assert second.headers['Range'] == 'bytes=30000-'
+    assert result.response['transferred'] == len(FILES[1])
+
+
+def test_leftover_part_file_is_continued(server, tmpdir):
+    server.add_file(download_path(2), FILES[2])
+    tmpdir.join('2.part').write_binary(FILES[2][:4096])
+    irfc = IRFlowClient(server.config_args)
+
+    result, = irfc.download_attachments([2], str(tmpdir))
+
+    assert result.response['resumed_from'] == 4096
+    assert result.response['transferred'] == len(FILES[2]) - 4096
+    assert tmpdir.join('2').read_binary() == FILES[2]
+
+
+def test_complete_file_is_verified_without_transfer(server, tmpdir):
+    server.add_file(download_path(3), FILES[3])
+    tmpdir.join('3').write_binary(FILES[3])
+    irfc = IRFlowClient(server.config_args)
+
+    downloads = irfc.download_attachments([3], str(tmpdir))
+    result, = downloads
+
+    assert result.response['transferred'] == 0
+    assert downloads.summary.bytes_transferred == 0
+    assert tmpdir.join('3').read_binary() == FILES[3]
+
+
+def test_server_without_ranges_restarts_the_file(server, tmpdir):
+    server.add_file(download_path(4), FILES[4], drop_after=5000, ranges=False)
+    irfc = IRFlowClient(server.config_args)
+
+    result, = irfc.download_attachments([4], str(tmpdir))
+
+    assert result.response['resumes'] == 1
+    assert result.response['transferred'] == 5000 + len(FILES[4])
+    assert tmpdir.join('4').read_binary() == FILES[4]
+
+
+def test_failures_are_reported_per_attachment(server, tmpdir):
+    server.add_file(download_path(1), FILES[1])
+    server.add('GET', download_path(9), status=404, json_body={'success': False})
+    server.add('GET', download_path(8), status=206, body=b'late',
+               headers={'Content-Range': 'bytes 10-13/14'})
+    irfc = IRFlowClient(dict(server.config_args, max_retries=0))
+    tmpdir.join('8.part').write_binary(b'0123')
+
+    downloads = irfc.download_attachments([1, 9, 8], str(tmpdir), ordered=True)
+    ok, missing, mismatched = downloads
+
+    assert ok.success
+    assert missing.error.response.status_code == 404
+    assert isinstance(mismatched.error, IRFlowDownloadError)
+    assert not tmpdir.join('9').exists() and not tmpdir.join('8').exists()
+    assert downloads.summary.failed == 2
+
+
+def test_gives_up_after_max_resumes(server, tmpdir):
+    server.add('GET', download_path(5), json_body=lambda request: StubResponse(
+        body=FILES[5], drop_after=100))
+    irfc = IRFlowClient(server.config_args)
+
+    result, = irfc.download_attachments([5], str(tmpdir), max_resumes=2)
+
+    assert not result.success
+    assert len(server.requests_for('GET', download_path(5))) == 3
+    # Without range support every attempt starts the file over
+    assert tmpdir.join('5.part').size() == 100
+
+
+def test_async_downloads_resume(server, tmpdir):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add_file(download_path(1), FILES[1], drop_after=20000)
+    server.add_file(download_path(2), FILES[2])
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            downloads = irfc.download_attachments([1, 2], str(tmpdir), ordered=True)
+            return [result async for result in downloads], downloads.summary
+
+    results, summary = asyncio.run(scenario())
+
+    assert [result.response['resumes'] for result in results] == [1, 0]
+    assert tmpdir.join('1').read_binary() == FILES[1]
+    assert tmpdir.join('2').read_binary() == FILES[2]
+    assert summary.bytes_transferred == len(FILES[1]) + len(FILES[2])
@@ -0,0 +1,73 @@
+"""
+    test_downloads.py. Pytests for size-aware in-memory attachment downloads
+"""
+import gzip
+import os
+
+from irflow_client import IRFlowClient
+from irflow_client.downloads import AttachmentBuffer
+
+CONTENT = os.urandom(300000)
+
+
+def download_path(attachment_id):
+    return '/api/v1/attachments/%s/download' % attachment_id
+
+
+def test_download_to_preallocated_buffer(server):
+    server.add('GET', download_path(5), body=CONTENT)
+    irfc = IRFlowClient(dict(server.config_args, download_chunk_size=65536))
+
+    with irfc.download_attachment_buffer(5) as attachment:
+        assert not attachment.spilled
+        assert attachment.size == len(CONTENT)
+        assert attachment.memoryview() == CONTENT
+    assert irfc.download_attachment_string(5) == CONTENT
+
+
+def test_large_downloads_spill_to_disk(server):
+    server.add('GET', download_path(6), body=CONTENT)
+    irfc = IRFlowClient(dict(server.config_args, download_spill_threshold=100000))
+
+    attachment = irfc.download_attachment_buffer(6)
+    assert attachment.spilled
+    assert attachment.memoryview() == CONTENT
+    assert attachment.getvalue() == CONTENT
+    attachment.close()
+    assert attachment.file.closed
+
+
+def test_text_is_only_decoded_when_asked(server):
+    server.add('GET', download_path(7), body=u'café'.encode('utf-8'))
+    irfc = IRFlowClient(server.config_args)
+
+    assert irfc.download_attachment_string(7) == b'caf\xc3\xa9'
+    assert irfc.download_attachment_string(7, encoding='utf-8') == u'café'
+
+
+def test_content_encoded_downloads_are_decoded(server):
+    server.add('GET', download_path(8), body=gzip.compress(CONTENT),
+               headers={'Content-Encoding': 'gzip'})
+    irfc = IRFlowClient(server.config_args)
+
+    assert irfc.download_attachment_string(8) == CONTENT
+
+
+def test_buffer_grows_and_spills_without_announced_size():
+    attachment = AttachmentBuffer(spill_threshold=10)
+    attachment.write(b'abcd')
+    attachment.write(memoryview(b'efgh'))
+    assert not attachment.spilled and attachment.getvalue() == b'abcdefgh'
+
+    attachment.write(b'ijkl')
+    assert attachment.spilled
+    assert attachment.text() == 'abcdefghijkl'
+    attachment.close()
+
+
+def test_buffer_accepts_more_than_announced():
+    attachment = AttachmentBuffer(length=2)
+    attachment.write(b'ab')
+    attachment.write(b'cd')
+    assert attachment.getvalue() == b'abcd'
+    assert len(attachment) == 4
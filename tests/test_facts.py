@@ -0,0 +1,54 @@
+"""
+    test_facts.py. Pytests for the indexed FactGroup view
+"""
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.facts import FactGroup
+
+FACTS = [
+    {'field': {'id': 11, 'field_name': 'src_dns'}, 'value': 'example.com'},
+    {'field': {'id': 12, 'field_name': 'file_hash'}, 'value': None},
+    {'field': {'id': 13, 'field_name': 'src_dns'}, 'value': 'shadowed.com'},
+]
+RESPONSE = {'success': True, 'data': {'fact_group': {'id': 4, 'facts': FACTS}}}
+
+
+def test_lookups_match_get_field_by_name():
+    fact_group = FactGroup.from_response(RESPONSE)
+
+    assert fact_group.id == 4
+    assert len(fact_group) == 3
+    for name in ('src_dns', 'file_hash', 'missing'):
+        assert fact_group.get(name) is IRFlowClient.get_field_by_name(name, FACTS)
+    assert fact_group.get_by_id(13) is FACTS[2]
+    assert fact_group.value('src_dns') == 'example.com'
+    assert fact_group.value('missing', 'n/a') == 'n/a'
+    assert 'file_hash' in fact_group
+    assert fact_group.field_names() == ['src_dns', 'file_hash']
+
+
+def test_update_payload():
+    fact_group = FactGroup.from_response(RESPONSE)
+    fact_group.set('file_hash', 'abc')
+
+    assert fact_group.value('file_hash') == 'abc'
+    assert fact_group.changes() == {'file_hash': 'abc'}
+    assert fact_group.as_fact_data() == {'src_dns': 'example.com', 'file_hash': 'abc'}
+    assert FACTS[1]['value'] is None
+    with pytest.raises(KeyError):
+        fact_group.set('missing', 1)
+
+
+def test_get_fact_group_view(server):
+    server.add('GET', '/api/v1/fact_groups/4', json_body=RESPONSE)
+    server.add('PUT', '/api/v1/fact_groups/4', json_body={'success': True})
+    irfc = IRFlowClient(server.config_args)
+
+    fact_group = irfc.get_fact_group_view(4)
+    assert fact_group.response == RESPONSE
+    fact_group.set('src_dns', 'phishing.com')
+    irfc.put_fact_group(fact_group.id, fact_group.changes())
+
+    assert server.requests_for('PUT', '/api/v1/fact_groups/4')[0].json() == {
+        'fields': {'src_dns': 'phishing.com'}}
@@ -0,0 +1,120 @@
+"""
+    test_ingest.py. Pytests for the resumable CSV ingestion
+"""
+import csv
+import json
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.ingest import ingest_csv, main
+
+from .stub_server import StubResponse
+
+
+def write_csv(path, rows):
+    with open(str(path), 'w', newline='') as handle:
+        writer = csv.DictWriter(handle, ['n', 'src_ip'])
+        writer.writeheader()
+        for n in range(rows):
+            writer.writerow({'n': n, 'src_ip': '10.0.0.%s' % n})
+
+
+def alert_route(request):
+    num = int(request.json()['fields']['n'])
+    if num == 7:
+        return StubResponse(422, {'success': False, 'message': 'Invalid field'})
+    return StubResponse(200, {'success': True, 'data': {'alert': {'alert_num': num}}})
+
+
+@pytest.fixture
+def irfc(server):
+    server.add('POST', '/api/v1/alerts', json_body=alert_route)
+    return IRFlowClient(server.config_args)
+
+
+def posted_rows(server):
+    return sorted(int(req.json()['fields']['n'])
+                  for req in server.requests_for('POST', '/api/v1/alerts'))
+
+
+def test_ingest_and_resume(server, irfc, tmpdir):
+    csv_file = tmpdir.join('alerts.csv')
+    write_csv(csv_file, 50)
+    failed = tmpdir.join('failed.csv')
+
+    first = ingest_csv(irfc, str(csv_file), incoming_field_group_name='ds_test',
+                       checkpoint_every=5, max_rows=20, failed_rows_file=str(failed))
+    assert first.last_row == 20
+    assert first.summary.failed == 1
+    assert json.loads(tmpdir.join('alerts.csv.checkpoint').read())['last_row'] == 20
+    assert '7,10.0.0.7' in failed.read()
+
+    second = ingest_csv(irfc, str(csv_file), incoming_field_group_name='ds_test',
+                        checkpoint_every=5)
+    assert second.resumed_from == 20
+    assert second.last_row == 50
+    assert second.summary.total == 30
+    assert posted_rows(server) == list(range(50))
+
+
+def test_crash_keeps_checkpoint_of_acknowledged_rows(server, irfc, tmpdir):
+    csv_file = tmpdir.join('alerts.csv')
+    write_csv(csv_file, 30)
+    create_alerts = irfc.create_alerts
+
+    def crashing_create_alerts(*args, **kwargs):
+        for result in create_alerts(*args, **kwargs):
+            if result.index == 12:
+                raise KeyboardInterrupt()
+            yield result
+
+    irfc.create_alerts = crashing_create_alerts
+    with pytest.raises(KeyboardInterrupt):
+        ingest_csv(irfc, str(csv_file), checkpoint_every=100)
+    assert json.loads(tmpdir.join('alerts.csv.checkpoint').read())['last_row'] == 12
+
+    irfc.create_alerts = create_alerts
+    report = ingest_csv(irfc, str(csv_file))
+    assert report.resumed_from == 12
+    assert report.last_row == 30
+
+
+def test_checkpoint_of_other_file_is_rejected(irfc, tmpdir):
+    csv_file = tmpdir.join('alerts.csv')
+    write_csv(csv_file, 3)
+    tmpdir.join('shared.checkpoint').write(json.dumps({'csv_file': '/elsewhere.csv',
+                                                       'last_row': 2}))
+
+    with pytest.raises(ValueError):
+        ingest_csv(irfc, str(csv_file), checkpoint_file=str(tmpdir.join('shared.checkpoint')))
+
+
+def test_rows_queued_in_the_outbox_are_not_failed(server, tmpdir):
+    server.add('POST', '/api/v1/alerts', status=503, json_body={'success': False})
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=str(tmpdir.join('outbox.db')),
+                             max_retries=0))
+    csv_file = tmpdir.join('alerts.csv')
+    write_csv(csv_file, 5)
+    failed = tmpdir.join('failed.csv')
+
+    report = ingest_csv(irfc, str(csv_file), failed_rows_file=str(failed))
+
+    assert report.last_row == 5
+    assert (report.summary.succeeded, report.summary.queued, report.summary.failed) == (0, 5, 0)
+    assert not failed.exists()
+    assert len(irfc.outbox) == 5
+
+
+def test_command_line(server, tmpdir, capsys):
+    server.add('POST', '/api/v1/alerts', json_body=alert_route)
+    csv_file = tmpdir.join('alerts.csv')
+    write_csv(csv_file, 5)
+    config_file = tmpdir.join('api.conf')
+    config_file.write('[IRFlowAPI]\naddress = {}\napi_user = u\napi_key = k\nprotocol = http\n'
+                      .format(server.address))
+
+    assert main([str(csv_file), '--config', str(config_file), '--workers', '2']) == 0
+    output = capsys.readouterr().out
+    assert 'Ingested rows 1-5: 5 succeeded, 0 failed' in output
+    assert 'rows/s, latency p50' in output
@@ -0,0 +1,120 @@
+"""
+    test_metrics.py. Pytests for per endpoint request metrics and the Prometheus exporter
+"""
+import asyncio
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client.irflow_client import IRFlowMaintenanceError
+from irflow_client.metrics import ClientMetrics, format_prometheus
+
+from .stub_server import StubResponse
+
+
+def test_metrics_are_off_by_default(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc = IRFlowClient(server.config_args)
+
+    irfc.get_alert(1)
+    assert irfc.metrics is None
+
+
+def test_calls_are_recorded_per_endpoint(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True, 'data': 'x' * 100})
+    server.add('PUT', '/api/v1/fact_groups/4', status=404, json_body={'success': False})
+    irfc = IRFlowClient(dict(server.config_args, collect_metrics=True))
+
+    irfc.get_alert(1)
+    irfc.get_alert(1)
+    irfc.put_fact_group(4, {'field': 'value'})
+
+    snapshot = irfc.metrics.snapshot()
+    get_alert = snapshot['get_alert']
+    assert get_alert['requests'] == 2 and get_alert['statuses'] == {200: 2}
+    assert get_alert['request_bytes'] == 0
+    assert get_alert['response_bytes'] == 2 * len(b'{"success": true, "data": "' + b'x' * 100 +
+                                                  b'"}')
+    assert get_alert['latency']['buckets'][-1] == (float('inf'), 2)
+    assert 0 < get_alert['latency']['p50'] <= get_alert['latency']['p99']
+
+    put = snapshot['put_fact_group']
+    assert put['statuses'] == {404: 1}
+    assert put['request_bytes'] == len(b'{"fields": {"field": "value"}}')
+
+
+def test_retries_and_failures_are_recorded(server):
+    responses = iter([StubResponse(502, {}), StubResponse(502, {}), StubResponse(200, {})])
+    server.add('GET', '/api/v1/incidents/2', json_body=lambda request: next(responses))
+    server.add('GET', '/api/v1/version', status=503, json_body={})
+    irfc = IRFlowClient(dict(server.config_args, collect_metrics=True, backoff_factor=0))
+
+    irfc.get_incident(2)
+    with pytest.raises(IRFlowMaintenanceError):
+        irfc.get_version()
+    unreachable = IRFlowClient(dict(server.config_args, address='127.0.0.1:1', max_retries=0,
+                                    collect_metrics=True))
+    with pytest.raises(requests.exceptions.ConnectionError):
+        unreachable.get_alert(1)
+
+    snapshot = irfc.metrics.snapshot()
+    assert snapshot['get_incident']['retries'] == 2
+    assert snapshot['get_incident']['statuses'] == {200: 1}
+    assert snapshot['version']['statuses'] == {503: 1}
+    assert unreachable.metrics.snapshot()['get_alert']['statuses'] == {'ConnectionError': 1}
+
+
+def test_histogram_buckets_and_quantiles():
+    metrics = ClientMetrics(buckets=(0.1, 1.0))
+    for latency in (0.05, 0.1, 0.5, 2.0):
+        metrics.record('get_alert', latency, 200)
+
+    latency = metrics.snapshot()['get_alert']['latency']
+    assert latency['buckets'] == [(0.1, 2), (1.0, 3), (float('inf'), 4)]
+    assert latency['p50'] == 0.1
+    assert latency['p99'] == float('inf')
+    metrics.reset()
+    assert len(metrics) == 0
+
+
+def test_prometheus_text_format():
+    metrics = ClientMetrics(buckets=(0.1, 1.0))
+    metrics.record('get_alert', 0.05, 200, 0, 120)
+    metrics.record('get_alert', 0.5, 'Timeout', retries=1)
+
+    text = format_prometheus(metrics, labels={'instance': 'soar"1'})
+
+    assert text.endswith('\n')
+    assert '# TYPE irflow_client_requests_total counter' in text
+    assert 'irflow_client_requests_total{endpoint="get_alert",instance="soar\\"1"} 2' in text
+    assert 'irflow_client_retries_total{endpoint="get_alert",instance="soar\\"1"} 1' in text
+    assert 'irflow_client_response_bytes_total{endpoint="get_alert",instance="soar\\"1"} 120' \
+        in text
+    assert 'irflow_client_responses_total{endpoint="get_alert",status="Timeout",' \
+        'instance="soar\\"1"} 1' in text
+    assert '# TYPE irflow_client_request_duration_seconds histogram' in text
+    assert 'irflow_client_request_duration_seconds_bucket{endpoint="get_alert",le="0.1",' \
+        'instance="soar\\"1"} 1' in text
+    assert 'irflow_client_request_duration_seconds_bucket{endpoint="get_alert",le="+Inf",' \
+        'instance="soar\\"1"} 2' in text
+    assert 'irflow_client_request_duration_seconds_count{endpoint="get_alert",' \
+        'instance="soar\\"1"} 2' in text
+
+
+def test_async_calls_are_recorded(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    server.add('POST', '/api/v1/alerts', json_body={'success': True})
+
+    async def scenario():
+        async with AsyncIRFlowClient(dict(server.config_args, collect_metrics=True)) as irfc:
+            await irfc.get_alert(1)
+            await irfc.create_alert({'src_ip': '10.0.0.1'})
+            return irfc.metrics.snapshot()
+
+    snapshot = asyncio.run(scenario())
+    assert snapshot['get_alert']['statuses'] == {200: 1}
+    assert snapshot['create_alert']['request_bytes'] > 0
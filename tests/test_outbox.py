@@ -0,0 +1,266 @@
+"""
+    test_outbox.py. Pytests for the durable outbox and its drainer, crash recovery included
+"""
+import asyncio
+import json
+import os
+import subprocess
+import sys
+import textwrap
+import threading
+import time
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.outbox import Outbox, OutboxDrainer, main
+
+from .stub_server import StubResponse
+
+ROOT = os.path.dirname(os.path.dirname(os.path.abspath(__file__)))
+
+UNREACHABLE = {'address': '127.0.0.1:1', 'api_user': 'user', 'api_key': 'key',
+               'protocol': 'http', 'debug': False, 'verbose': 0, 'max_retries': 0}
+
+
+def accept_alerts(server, received):
+    def respond(request):
+        received.append(request.json())
+        return StubResponse(200, {'success': True,
+                                  'data': {'alert': {'alert_num': len(received)}}})
+    server.add('POST', '/api/v1/alerts', json_body=respond)
+
+
+def test_calls_during_an_outage_are_queued_and_drained_once(server, tmpdir):
+    path = str(tmpdir.join('outbox.db'))
+    server.add('POST', '/api/v1/alerts', status=503, json_body={'success': False})
+    server.add('PUT', '/api/v1/fact_groups/7', status=503, json_body={'success': False})
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=path, max_retries=0))
+
+    queued = irfc.create_alert({'src_ip': '10.0.0.1'}, description='beacon')
+    irfc.put_fact_group(7, {'user': 'bob'})
+
+    assert queued['success'] is False and queued['queued'] is True
+    assert queued['data'] == {'outbox_id': 1, 'state': 'pending',
+                              'reason': 'IRFlowMaintenanceError: IR-Flow Server is down for '
+                                        'maintenance'}
+    assert len(irfc.outbox) == 2
+
+    received = []
+    accept_alerts(server, received)
+    server.add('PUT', '/api/v1/fact_groups/7', json_body={'success': True})
+    outcome = OutboxDrainer(irfc, rate=None).drain()
+
+    assert outcome == {'sent': 2, 'rejected': 0, 'retried': 0, 'pending': 0}
+    assert received == [{'fields': {'src_ip': '10.0.0.1'}, 'description': 'beacon',
+                         'suppress_missing_field_warning': False}]
+    alert, facts = irfc.outbox.entries()
+    assert alert.state == 'done' and alert.result['data']['alert']['alert_num'] == 1
+    assert facts.state == 'done' and facts.path == '/api/v1/fact_groups/7'
+    # A second drain has nothing to send
+    assert OutboxDrainer(irfc, rate=None).drain()['sent'] == 0
+    assert len(received) == 1
+
+
+def test_repeats_of_a_queued_alert_are_suppressed(server, tmpdir):
+    server.add('POST', '/api/v1/alerts', status=503, json_body={'success': False})
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=str(tmpdir.join('outbox.db')),
+                             max_retries=0, dedup_alerts=True))
+
+    queued = irfc.create_alert({'src_ip': '10.0.0.1'})
+    repeat = irfc.create_alert({'src_ip': '10.0.0.1'})
+
+    assert queued['queued'] and repeat['suppressed']
+    assert len(irfc.outbox) == 1
+    received = []
+    accept_alerts(server, received)
+    assert OutboxDrainer(irfc, rate=None).drain()['sent'] == 1
+    assert len(received) == 1
+
+
+def test_queued_calls_survive_a_crash_of_the_process(server, tmpdir):
+    path = str(tmpdir.join('outbox.db'))
+    script = textwrap.dedent('''
+        import os
+        from irflow_client import IRFlowClient
+        irfc = IRFlowClient(dict({config}, outbox_file={path!r}))
+        for n in range(5):
+            assert irfc.create_alert({{'n': n}})['queued']
+        os._exit(1)
+    ''').format(config=UNREACHABLE, path=path)
+    assert subprocess.call([sys.executable, '-c', script], cwd=ROOT) == 1
+
+    received = []
+    accept_alerts(server, received)
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=path))
+    assert OutboxDrainer(irfc, rate=None).drain()['sent'] == 5
+    assert [alert['fields']['n'] for alert in received] == [0, 1, 2, 3, 4]
+
+
+def test_drainer_killed_while_sending_leaves_no_duplicates(server, tmpdir):
+    path = str(tmpdir.join('outbox.db'))
+    outbox = Outbox(path)
+    outbox.add('create_alert', 'POST', '/api/v1/alerts', {'fields': {'n': 0}})
+    outbox.add('put_fact_group', 'PUT', '/api/v1/fact_groups/7', {'fields': {'user': 'bob'}})
+    arrived = threading.Event()
+    received = []
+
+    def hang(request):
+        received.append(request.json())
+        arrived.set()
+        return StubResponse(200, {'success': True}, delay=30)
+
+    server.add('POST', '/api/v1/alerts', json_body=hang)
+    script = textwrap.dedent('''
+        from irflow_client import IRFlowClient
+        from irflow_client.outbox import OutboxDrainer
+        irfc = IRFlowClient(dict({config}, outbox_file={path!r}))
+        OutboxDrainer(irfc, rate=None).drain()
+    ''').format(config=server.config_args, path=path)
+    drainer = subprocess.Popen([sys.executable, '-c', script], cwd=ROOT)
+    try:
+        assert arrived.wait(20)
+    finally:
+        drainer.kill()
+        drainer.wait()
+
+    server.add('PUT', '/api/v1/fact_groups/7', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=path))
+    outcome = OutboxDrainer(irfc, rate=None).drain()
+
+    # IR-Flow may have created the alert, it is not sent a second time
+    assert outcome == {'sent': 1, 'rejected': 0, 'retried': 0, 'pending': 0}
+    assert len(received) == 1
+    alert, facts = irfc.outbox.entries()
+    assert alert.state == 'in_doubt' and facts.state == 'done'
+    assert 'stopped while sending' in alert.error
+
+    # Once reviewed, the alert can be sent again
+    accept_alerts(server, received)
+    assert irfc.outbox.requeue() == 1
+    assert OutboxDrainer(irfc, rate=None).drain()['sent'] == 1
+    assert irfc.outbox.counts()['done'] == 2
+
+
+def test_abandoned_claims_are_recovered_after_the_lease(tmpdir):
+    outbox = Outbox(str(tmpdir.join('outbox.db')))
+    outbox.add('put_fact_group', 'PUT', '/api/v1/fact_groups/7', {'fields': {}})
+    outbox.add('create_alert', 'POST', '/api/v1/alerts', {'fields': {}})
+    first, second = outbox.claim('other-host:1:a'), outbox.claim('other-host:1:a')
+
+    assert outbox.claim('other-host:1:a') is None
+    assert outbox.recover(lease=300) == (0, 0)
+    assert outbox.recover(lease=0) == (1, 1)
+    # The owner lost its claim and cannot settle the entry any more
+    assert not outbox.complete(first.id, 'other-host:1:a')
+    assert [entry.state for entry in outbox.entries()] == ['pending', 'in_doubt']
+    assert second.endpoint == 'create_alert'
+
+
+def test_concurrent_drainers_send_every_entry_once(server, tmpdir):
+    path = str(tmpdir.join('outbox.db'))
+    outbox = Outbox(path)
+    for n in range(40):
+        outbox.add('create_alert', 'POST', '/api/v1/alerts', {'fields': {'n': n}})
+    received = []
+    accept_alerts(server, received)
+
+    def drain():
+        irfc = IRFlowClient(dict(server.config_args, outbox_file=path))
+        OutboxDrainer(irfc, rate=None).drain()
+
+    workers = [threading.Thread(target=drain) for _ in range(4)]
+    for worker in workers:
+        worker.start()
+    for worker in workers:
+        worker.join()
+
+    assert sorted(alert['fields']['n'] for alert in received) == list(range(40))
+    assert Outbox(path).counts()['done'] == 40
+
+
+def test_drainer_pauses_while_ir_flow_is_unavailable(server, tmpdir):
+    path = str(tmpdir.join('outbox.db'))
+    outbox = Outbox(path)
+    for n in range(4):
+        outbox.add('create_alert', 'POST', '/api/v1/alerts', {'fields': {'n': n}})
+    responses = iter([StubResponse(503, {})] * 2 + [StubResponse(200, {'success': True})] * 4)
+    server.add('POST', '/api/v1/alerts', json_body=lambda request: next(responses))
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=path, max_retries=0))
+    drainer = OutboxDrainer(irfc, rate=20, backoff=0.1)
+
+    started = time.perf_counter()
+    outcome = drainer.drain()
+
+    # Two pauses of 0.1 and 0.2s, then four entries at 20 per second
+    assert time.perf_counter() - started >= 0.45
+    assert outcome == {'sent': 4, 'rejected': 0, 'retried': 2, 'pending': 0}
+    assert outbox.entries()[0].attempts == 2
+
+
+def test_rejected_and_uncertain_entries_are_not_retried(server, tmpdir):
+    path = str(tmpdir.join('outbox.db'))
+    outbox = Outbox(path)
+    outbox.add('create_alert', 'POST', '/api/v1/alerts', {'fields': {'n': 0}})
+    outbox.add('put_fact_group', 'PUT', '/api/v1/fact_groups/7', {'fields': {}})
+    server.add('POST', '/api/v1/alerts', status=502, json_body={})
+    server.add('PUT', '/api/v1/fact_groups/7', status=422,
+               json_body={'success': False, 'message': 'Invalid field'})
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=path, max_retries=0))
+
+    assert OutboxDrainer(irfc, rate=None, backoff=0).drain()['rejected'] == 2
+    alert, facts = outbox.entries()
+    assert (alert.state, alert.error) == ('in_doubt', 'HTTP 502')
+    assert (facts.state, facts.error) == ('failed', 'HTTP 422: Invalid field')
+
+
+def test_calls_that_may_have_arrived_are_kept_in_doubt(server, tmpdir):
+    server.add('POST', '/api/v1/alerts', json_body={'success': True}, delay=1)
+    irfc = IRFlowClient(dict(server.config_args, outbox_file=str(tmpdir.join('outbox.db')),
+                             read_timeout=0.2, max_retries=0))
+
+    queued = irfc.create_alert({'src_ip': '10.0.0.1'})
+
+    assert queued['data']['state'] == 'in_doubt'
+    assert queued['data']['reason'].startswith('ReadTimeout')
+    assert len(irfc.outbox) == 0 and irfc.outbox.counts()['in_doubt'] == 1
+
+
+def test_outbox_is_off_by_default(server):
+    server.add('POST', '/api/v1/alerts', status=503, json_body={})
+    irfc = IRFlowClient(dict(server.config_args, max_retries=0))
+
+    assert irfc.outbox is None
+    with pytest.raises(Exception):
+        irfc.create_alert({'src_ip': '10.0.0.1'})
+
+
+def test_outbox_command(server, tmpdir, capsys):
+    path = str(tmpdir.join('outbox.db'))
+    Outbox(path).add('create_alert', 'POST', '/api/v1/alerts', {'fields': {'n': 0}})
+    received = []
+    accept_alerts(server, received)
+    config = tmpdir.join('api.conf')
+    config.write('[IRFlowAPI]\naddress = {address}\napi_user = u\napi_key = k\n'
+                 'protocol = http\ndebug = false\nverbose = 0\n'.format(**server.config_args))
+
+    assert main([path, '--config', str(config), '--drain']) == 0
+    assert 'Sent 1, rejected 0, retried 0, 0 pending' in capsys.readouterr().out
+    assert len(received) == 1
+
+
+def test_async_calls_are_queued(tmpdir):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    path = str(tmpdir.join('outbox.db'))
+
+    async def scenario():
+        async with AsyncIRFlowClient(dict(UNREACHABLE, outbox_file=path)) as irfc:
+            return await irfc.create_alert({'src_ip': '10.0.0.1'})
+
+    queued = asyncio.run(scenario())
+    assert queued['queued'] and queued['data']['state'] == 'pending'
+    entry, = Outbox(path).entries()
+    assert entry.json['fields'] == {'src_ip': '10.0.0.1'}
+    assert json.dumps(entry.headers) and 'X-Authorization' not in entry.headers
@@ -0,0 +1,138 @@
+"""
+    test_ratelimit.py. Pytests for the client side rate limiter
+"""
+import asyncio
+import time
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client import ratelimit
+from irflow_client.irflow_client import IRFlowDeadlineExceededError
+from irflow_client.ratelimit import FileBucketStore, RateLimiter, parse_rates
+
+from .stub_server import StubResponse
+
+
+def timed(func, *args):
+    started = time.perf_counter()
+    func(*args)
+    return time.perf_counter() - started
+
+
+def test_requests_are_paced_by_the_global_rate(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, rate_limit=20, rate_limit_burst=1))
+
+    elapsed = timed(lambda: [irfc.get_alert(1) for _ in range(6)])
+
+    # The first request spends the burst, the other five wait 50 ms each
+    assert elapsed >= 0.24
+    assert irfc.rate_limiter.delayed == 5
+
+
+def test_endpoint_rates_only_limit_their_endpoint(server):
+    server.add('POST', '/api/v1/alerts', json_body={'success': True})
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, rate_limit_endpoints='create_alert=10',
+                             rate_limit_burst=1))
+
+    assert timed(lambda: [irfc.create_alert({'rule': 'a'}) for _ in range(3)]) >= 0.19
+    assert timed(lambda: [irfc.get_alert(1) for _ in range(10)]) < 0.2
+
+
+def test_throttling_pauses_every_client_sharing_the_file(server, tmpdir):
+    server.add('GET', '/api/v1/incidents/1', status=429, json_body={'success': False},
+               headers={'Retry-After': '0.3'})
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    config = dict(server.config_args, rate_limit=100, max_retries=0,
+                  rate_limit_file=str(tmpdir.join('rate.json')))
+    worker_a, worker_b = IRFlowClient(config), IRFlowClient(config)
+
+    worker_a.get_incident(1)
+
+    assert worker_a.rate_limiter.throttled == 1
+    assert timed(worker_b.get_alert, 1) >= 0.25
+    assert worker_b.rate_limiter.factor < 1
+
+
+def test_file_store_shares_the_budget(tmpdir):
+    path = str(tmpdir.join('rate.json'))
+    first = RateLimiter(rate=10, burst=1, store=FileBucketStore(path))
+    second = RateLimiter(rate=10, burst=1, store=FileBucketStore(path))
+
+    delays = [first.reserve('get_alert'), second.reserve('get_alert'),
+              first.reserve('get_alert')]
+
+    assert delays[0] == 0
+    assert delays[1] == pytest.approx(0.1, abs=0.02)
+    assert delays[2] == pytest.approx(0.2, abs=0.02)
+
+
+def test_rate_recovers_after_throttling(monkeypatch):
+    now = [1000.0]
+    monkeypatch.setattr(ratelimit, 'clock', lambda: now[0])
+    limiter = RateLimiter(rate=10, min_factor=0.1, recovery_time=10)
+
+    limiter.observe(429)
+    limiter.observe(503)
+    limiter.observe(500)
+    assert limiter.factor == 0.25 and limiter.throttled == 2
+    now[0] += 5
+    assert limiter.factor == pytest.approx(0.7)
+    now[0] += 5
+    assert limiter.factor == 1.0
+
+
+def test_wait_beyond_the_deadline_raises(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, rate_limit=1, rate_limit_burst=1))
+
+    with irfc.request_options(deadline=0.5):
+        irfc.get_alert(1)
+        with pytest.raises(IRFlowDeadlineExceededError):
+            irfc.get_alert(1)
+
+
+def test_calls_failed_on_their_deadline_take_no_token(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, rate_limit=1, rate_limit_burst=1))
+
+    irfc.get_alert(1)
+    for _ in range(3):
+        with irfc.request_options(deadline=0.5):
+            with pytest.raises(IRFlowDeadlineExceededError):
+                irfc.get_alert(1)
+
+    # The next caller waits for the one token taken so far, not for four
+    assert irfc.rate_limiter.reserve('get_alert') == pytest.approx(1.0, abs=0.1)
+    assert irfc.rate_limiter.delayed == 1
+
+
+def test_parse_rates():
+    assert parse_rates('create_alert=2, get_alert = 10') == {'create_alert': 2.0,
+                                                             'get_alert': 10.0}
+    assert parse_rates('') is None
+    with pytest.raises(ValueError):
+        parse_rates('create_alert')
+
+
+def test_async_requests_are_rate_limited(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    responses = iter([StubResponse(429, {}, headers={'Retry-After': '0'})] +
+                     [StubResponse(200, {'success': True})] * 5)
+    server.add('GET', '/api/v1/alerts/1', json_body=lambda request: next(responses))
+    config = dict(server.config_args, rate_limit=20, rate_limit_burst=1,
+                  coalesce_requests=False)
+
+    async def scenario():
+        async with AsyncIRFlowClient(config) as irfc:
+            started = time.perf_counter()
+            await asyncio.gather(*[irfc.get_alert(1) for _ in range(5)])
+            return irfc.rate_limiter, time.perf_counter() - started
+
+    limiter, elapsed = asyncio.run(scenario())
+    assert elapsed >= 0.19
+    assert limiter.throttled == 1
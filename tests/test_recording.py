@@ -0,0 +1,161 @@
+"""
+    test_recording.py. Pytests for recording client traffic and replaying it
+"""
+import asyncio
+import gzip
+import json
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.recording import REDACTED, Recorder, read_recording
+from irflow_client.replay import ReplayServer, main, replay_traffic
+
+
+def record_session(server, path, **config):
+    server.add('POST', '/api/v1/alerts', json_body={
+        'success': True, 'data': {'alert': {'alert_num': 41}}})
+    server.add('GET', '/api/v1/picklists', json_body={'success': True, 'data': ['low', 'high']})
+    server.add('PUT', '/api/v1/fact_groups/3', json_body={'success': True})
+    server.add_file('/api/v1/attachments/5/download', b'pcap' * 256)
+    irfc = IRFlowClient(dict(server.config_args, record_file=path, **config))
+
+    irfc.create_alert({'src_ip': '10.0.0.1', 'password': 'hunter2'}, description='beacon')
+    irfc.list_picklists(with_trashed=True)
+    irfc.put_fact_group(3, {'session_id': 'abc', 'user': 'bob'})
+    irfc.download_attachment_buffer(5).close()
+    irfc.close()
+    return irfc
+
+
+def test_calls_are_recorded_with_secrets_redacted(server, tmpdir):
+    path = str(tmpdir.join('calls.jsonl'))
+    record_session(server, path, record_redact_fields='session_id')
+
+    create, picklists, put, download = read_recording(path)
+
+    assert create['endpoint'] == 'create_alert' and create['method'] == 'POST'
+    assert create['headers']['X-Authorization'] == REDACTED
+    assert create['json']['fields'] == {'src_ip': '10.0.0.1', 'password': REDACTED}
+    assert create['response']['data']['alert']['alert_num'] == 41
+    assert picklists['path'] == '/api/v1/picklists?with_trashed=True&only_trashed=False'
+    assert put['json']['fields'] == {'session_id': REDACTED, 'user': 'bob'}
+    # Attachment bodies are recorded by size only
+    assert download['response_size'] == 1024 and 'response' not in download
+    assert download['t'] >= create['t'] and create['elapsed'] >= 0
+    assert 'stub_key' not in open(path).read()
+
+
+def test_recording_appends_and_compresses(server, tmpdir):
+    path = str(tmpdir.join('calls.jsonl.gz'))
+    record_session(server, path)
+    record_session(server, path)
+
+    assert [exchange['endpoint'] for exchange in read_recording(path)] == \
+        ['create_alert', 'get_picklist_list', 'put_fact_group', 'get_attachment'] * 2
+
+
+def test_compressed_recording_is_readable_before_close(server, tmpdir):
+    path = str(tmpdir.join('calls.jsonl.gz'))
+    server.add('GET', '/api/v1/incidents/2', json_body={'success': True})
+    irfc = IRFlowClient(dict(server.config_args, record_file=path))
+
+    irfc.get_incident(2)
+    irfc.get_incident(2)
+    assert [exchange['status'] for exchange in read_recording(path)] == [200, 200]
+
+    with irfc:
+        irfc.get_incident(2)
+    assert len(list(read_recording(path))) == 3
+
+
+def test_truncated_last_line_is_skipped(tmpdir):
+    path = str(tmpdir.join('calls.jsonl'))
+    with Recorder(path) as recorder:
+        recorder.record('get_alert', 'GET', '/api/v1/alerts/1', {}, None, 0, 200,
+                        {'Content-Type': 'application/json'}, b'{"success": true}', 0.01)
+    with open(path, 'a') as handle:
+        handle.write('{"t": 1.0, "endpoint": "get_al')
+
+    exchanges = list(read_recording(path))
+    assert len(exchanges) == 1 and exchanges[0]['response'] == {'success': True}
+
+
+def test_replay_server_serves_recorded_responses(server, tmpdir):
+    path = str(tmpdir.join('calls.jsonl'))
+    record_session(server, path)
+
+    with ReplayServer(path, speed=0) as replay:
+        irfc = IRFlowClient(replay.config_args)
+        assert irfc.create_alert({'src_ip': '10.0.0.9'})['data']['alert']['alert_num'] == 41
+        assert irfc.list_picklists(with_trashed=True)['data'] == ['low', 'high']
+        assert len(irfc.download_attachment_buffer(5).getvalue()) == 1024
+        assert irfc.get_alert(99)['message'] == 'No recorded response'
+        assert (replay.served, replay.unmatched) == (3, 1)
+
+
+def test_compressed_responses_are_replayed_decoded(server, tmpdir):
+    path = str(tmpdir.join('calls.jsonl'))
+    body = json.dumps({'success': True, 'data': {'version': '5.1'}}).encode('utf-8')
+    server.add('GET', '/api/v1/version', body=gzip.compress(body),
+               headers={'Content-Type': 'application/json', 'Content-Encoding': 'gzip'})
+    with IRFlowClient(dict(server.config_args, record_file=path)) as irfc:
+        assert irfc.get_version() == '5.1'
+
+    exchange, = read_recording(path)
+    assert 'Content-Encoding' not in exchange['response_headers']
+    # Recordings made before the header was dropped replay as well
+    exchange['response_headers']['Content-Encoding'] = 'gzip'
+    with ReplayServer([exchange], speed=0) as replay:
+        assert IRFlowClient(replay.config_args).get_version() == '5.1'
+
+
+def test_traffic_is_replayed_at_the_recorded_pace(tmpdir):
+    exchanges = [
+        {'t': 0.0, 'endpoint': 'get_alert', 'method': 'GET', 'path': '/api/v1/alerts/1',
+         'headers': {'Accept': 'application/json'}, 'status': 200, 'elapsed': 0.01,
+         'response_headers': {'Content-Type': 'application/json'}, 'response': {'ok': 1}},
+        {'t': 0.4, 'endpoint': 'put_fact_group', 'method': 'PUT',
+         'path': '/api/v1/fact_groups/2', 'headers': {}, 'json': {'fields': {}},
+         'status': 200, 'elapsed': 0.01, 'response_headers': {}, 'response': None},
+        {'t': 0.8, 'endpoint': 'get_alert', 'method': 'GET', 'path': '/api/v1/alerts/1',
+         'headers': {}, 'status': 404, 'elapsed': 0.01, 'response_headers': {},
+         'response': None},
+    ]
+
+    with ReplayServer(exchanges) as replay:
+        irfc = IRFlowClient(dict(replay.config_args, max_retries=0))
+        summary = replay_traffic(irfc, exchanges, speed=4)
+
+    assert summary.total == 3 and summary.failed == 1
+    # 0.8s of recorded traffic at four times the pace
+    assert 0.2 <= summary.elapsed < 0.8
+
+
+def test_replay_command_drives_the_recording(server, tmpdir, capsys):
+    path = str(tmpdir.join('calls.jsonl'))
+    record_session(server, path)
+
+    assert main([path, '--speed', '0', '--drive']) == 0
+    assert 'Replayed 4 requests' in capsys.readouterr().out
+
+
+def test_async_calls_are_recorded(server, tmpdir):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('GET', '/api/v1/incidents/2', json_body={'success': True, 'data': {'id': 2}})
+    path = str(tmpdir.join('calls.jsonl'))
+
+    async def scenario():
+        config = dict(server.config_args, record_file=path, coalesce_requests=False)
+        async with AsyncIRFlowClient(config) as irfc:
+            await irfc.get_incident(2)
+            irfc.recorder.close()
+
+    asyncio.run(scenario())
+    exchange, = read_recording(path)
+    assert exchange['endpoint'] == 'get_incident'
+    assert exchange['path'] == '/api/v1/incidents/2'
+    assert exchange['headers']['X-Authorization'] == REDACTED
+    assert exchange['response'] == {'success': True, 'data': {'id': 2}}
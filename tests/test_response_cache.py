@@ -0,0 +1,114 @@
+"""
+    test_response_cache.py. Pytests for the response cache of IRFlowClient
+"""
+from irflow_client import IRFlowClient
+from irflow_client.cache import ResponseCache
+
+from .stub_server import StubResponse
+
+
+def cached_client(server, **options):
+    return IRFlowClient(dict(server.config_args, cache_responses=True, **options))
+
+
+def test_cache_is_opt_in(server):
+    server.add('GET', '/api/v1/picklists/1', json_body={'success': True})
+    irfc = IRFlowClient(server.config_args)
+
+    irfc.get_picklist(1)
+    irfc.get_picklist(1)
+    assert irfc.response_cache is None
+    assert len(server.requests_for('GET', '/api/v1/picklists/1')) == 2
+
+
+def test_fresh_responses_are_served_from_cache(server):
+    server.add('GET', '/api/v1/picklists/1', json_body={'success': True, 'data': {'id': 1}})
+    irfc = cached_client(server)
+
+    first = irfc.get_picklist(1)
+    first['data']['id'] = 'changed by caller'
+    assert irfc.get_picklist(1) == {'success': True, 'data': {'id': 1}}
+    assert len(server.requests_for('GET', '/api/v1/picklists/1')) == 1
+
+    stats = irfc.response_cache.as_dict()
+    assert (stats['hits'], stats['misses'], stats['entries']) == (1, 1, 1)
+
+
+def test_query_parameters_are_part_of_the_key(server):
+    server.add('GET', '/api/v1/picklists', json_body={'success': True})
+    irfc = cached_client(server)
+
+    irfc.list_picklists()
+    irfc.list_picklists(with_trashed=True)
+    irfc.list_picklists()
+    assert len(server.requests_for('GET', '/api/v1/picklists')) == 2
+
+
+def test_stale_entries_are_revalidated(server):
+    def fact_group(request):
+        if request.headers.get('If-None-Match') == '"v1"':
+            return StubResponse(304, body=b'')
+        return StubResponse(json_body={'success': True, 'data': {'id': 4}},
+                            headers={'ETag': '"v1"'})
+
+    server.add('GET', '/api/v1/fact_groups/4', json_body=fact_group)
+    irfc = cached_client(server)
+    irfc.response_cache.ttls['get_fact_group'] = 0
+
+    assert irfc.get_fact_group(4)['data'] == {'id': 4}
+    assert irfc.get_fact_group(4)['data'] == {'id': 4}
+
+    requests = server.requests_for('GET', '/api/v1/fact_groups/4')
+    assert len(requests) == 2
+    assert 'If-None-Match' not in requests[0].headers
+    assert irfc.response_cache.revalidations == 1
+
+
+def test_writes_invalidate_matching_entries(server):
+    for fact_group_id in (1, 2):
+        server.add('GET', '/api/v1/fact_groups/%s' % fact_group_id, json_body={'success': True})
+    server.add('PUT', '/api/v1/fact_groups/1', json_body={'success': True})
+    server.add('GET', '/api/v1/picklist_items', json_body={'success': True})
+    server.add('POST', '/api/v1/picklists/3/picklist_items', json_body={'success': True})
+    irfc = cached_client(server)
+
+    irfc.get_fact_group(1)
+    irfc.get_fact_group(2)
+    irfc.list_picklist_items(3)
+    irfc.put_fact_group(1, {'hostname': 'web01'})
+    irfc.add_item_to_picklist(3, 'value', 'label')
+    irfc.get_fact_group(1)
+    irfc.get_fact_group(2)
+    irfc.list_picklist_items(3)
+
+    assert len(server.requests_for('GET', '/api/v1/fact_groups/1')) == 2
+    assert len(server.requests_for('GET', '/api/v1/fact_groups/2')) == 1
+    assert len(server.requests_for('GET', '/api/v1/picklist_items')) == 2
+    assert irfc.response_cache.invalidations == 2
+
+
+def test_errors_are_not_cached(server):
+    server.add('GET', '/api/v1/picklists/9', status=404, json_body={'success': False})
+    irfc = cached_client(server)
+
+    irfc.get_picklist(9)
+    irfc.get_picklist(9)
+    assert len(server.requests_for('GET', '/api/v1/picklists/9')) == 2
+
+
+def test_lru_eviction_respects_memory_bound():
+    cache = ResponseCache(ttls={'get_picklist': 60}, max_bytes=100)
+    keys = [cache.key('get_picklist', 'u%s' % index) for index in range(3)]
+
+    cache.store(keys[0], b'a' * 40, {})
+    cache.store(keys[1], b'b' * 40, {})
+    cache.get(keys[0])
+    cache.store(keys[2], b'c' * 40, {})
+
+    assert cache.get(keys[1]) is None
+    assert cache.get(keys[0]) is not None
+    assert cache.evictions == 1
+    assert cache.as_dict()['bytes'] <= 100
+
+    cache.store(cache.key('get_picklist', 'big'), b'x' * 200, {})
+    assert len(cache) == 2
@@ -0,0 +1,117 @@
+"""
+    test_retry.py. Pytests for the retry policy of IRFlowClient
+"""
+import time
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client.irflow_client import IRFlowMaintenanceError
+from irflow_client.retry import RetryPolicy
+
+from .stub_server import StubResponse
+
+
+def sequence(*responses):
+    """Route answering with the given responses in turn, repeating the last one"""
+    responses = list(responses)
+
+    def respond(request):
+        return responses.pop(0) if len(responses) > 1 else responses[0]
+    return respond
+
+
+def fast_client(server, **options):
+    config_args = dict(server.config_args, backoff_factor=0.001, **options)
+    return IRFlowClient(config_args)
+
+
+def test_get_is_retried_on_5xx(server):
+    server.add('GET', '/api/v1/alerts/1', json_body=sequence(
+        StubResponse(502, body=b'<html>bad gateway</html>'),
+        StubResponse(429),
+        StubResponse(200, {'success': True})))
+    irfc = fast_client(server)
+
+    assert irfc.get_alert(1) == {'success': True}
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 3
+    assert irfc.retry_stats.as_dict() == {'retries': 2, 'exhausted': 0,
+                                          'by_endpoint': {'get_alert': 2}}
+
+
+def test_post_is_not_retried_unless_opted_in(server):
+    server.add('POST', '/api/v1/alerts', json_body=sequence(
+        StubResponse(500, {'success': False, 'message': 'Server Error'}),
+        StubResponse(200, {'success': True})))
+    irfc = fast_client(server)
+
+    assert irfc.create_alert({'a': 1}) == {'success': False, 'message': 'Server Error'}
+    assert irfc.retry_stats.retries == 0
+
+    with irfc.request_options(retry=irfc.retry_policy.copy(retry_non_idempotent=True)):
+        server.add('POST', '/api/v1/alerts', json_body=sequence(
+            StubResponse(500, {'success': False}),
+            StubResponse(200, {'success': True})))
+        assert irfc.create_alert({'a': 1}) == {'success': True}
+    assert irfc.retry_stats.by_endpoint == {'create_alert': 1}
+
+
+def test_request_options_are_per_client(server):
+    server.add('GET', '/api/v1/alerts/1', json_body=sequence(
+        StubResponse(500), StubResponse(200, {'success': True})))
+    irfc = fast_client(server)
+    other = fast_client(server)
+
+    with other.request_options(retry=RetryPolicy(max_retries=0)):
+        assert irfc.get_alert(1) == {'success': True}
+    assert irfc.retry_stats.retries == 1
+
+
+def test_retry_after_is_honoured(server):
+    server.add('GET', '/api/v1/picklists/2', json_body=sequence(
+        StubResponse(503, headers={'Retry-After': '0.3'}),
+        StubResponse(200, {'success': True})))
+    irfc = fast_client(server)
+
+    start = time.time()
+    assert irfc.get_picklist(2) == {'success': True}
+    assert time.time() - start >= 0.3
+
+
+def test_long_retry_after_gives_up(server):
+    server.add('GET', '/api/v1/picklists/2',
+               json_body=sequence(StubResponse(429, {'success': False},
+                                               headers={'Retry-After': '3600'})))
+    irfc = fast_client(server)
+
+    assert irfc.get_picklist(2) == {'success': False}
+    assert irfc.retry_stats.retries == 0
+
+
+def test_maintenance_raises_after_retries(server):
+    server.add('GET', '/api/v1/incidents/4', status=503, body=b'maintenance')
+    irfc = fast_client(server, max_retries=2)
+
+    with pytest.raises(IRFlowMaintenanceError):
+        irfc.get_incident(4)
+    assert len(server.requests_for('GET', '/api/v1/incidents/4')) == 3
+    assert irfc.retry_stats.exhausted == 1
+
+
+def test_connection_errors_are_retried(server):
+    irfc = fast_client(server, max_retries=2)
+    irfc.address = '127.0.0.1:1'
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        irfc.get_alert(1)
+    assert irfc.retry_stats.retries == 2
+    assert irfc.retry_stats.exhausted == 1
+
+
+def test_backoff_is_exponential_with_jitter():
+    policy = RetryPolicy(backoff_factor=1, backoff_max=5, jitter=False)
+    assert [policy.get_backoff(attempt) for attempt in range(4)] == [1, 2, 4, 5]
+
+    policy = RetryPolicy(backoff_factor=1, backoff_max=5)
+    assert all(0 <= policy.get_backoff(3) <= 5 for _ in range(100))
@@ -0,0 +1,111 @@
+"""
+    test_timeouts.py. Pytests for request timeouts and deadlines of IRFlowClient
+"""
+import asyncio
+import time
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client.irflow_client import IRFlowDeadlineExceededError, IRFlowMaintenanceError
+
+from .stub_server import StubResponse
+
+
+def test_read_timeout_is_enforced(server):
+    server.add('GET', '/api/v1/picklist_items/1', json_body={'success': True}, delay=1)
+    irfc = IRFlowClient(dict(server.config_args, read_timeout=0.2, max_retries=0))
+
+    start = time.time()
+    with pytest.raises(requests.exceptions.ReadTimeout):
+        irfc.get_picklist_item(1)
+    assert time.time() - start < 0.9
+
+
+def test_attachments_use_longer_read_timeout(server):
+    server.add('GET', '/api/v1/attachments/5/download', body=b'pcap', delay=0.4)
+    irfc = IRFlowClient(dict(server.config_args, read_timeout=0.2, max_retries=0))
+
+    assert irfc.end_point_timeouts['get_attachment'] == (5.0, 300.0)
+    assert irfc.download_attachment_string(5) == b'pcap'
+
+
+def test_request_options_timeout(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.4)
+    irfc = IRFlowClient(dict(server.config_args, max_retries=0))
+
+    with irfc.request_options(timeout=(1, 0.1)):
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            irfc.get_alert(1)
+    assert irfc.get_alert(1) == {'success': True}
+
+
+def test_deadline_covers_retries(server):
+    server.add('GET', '/api/v1/alerts/1', status=503, body=b'maintenance',
+               headers={'Retry-After': '0.3'})
+    irfc = IRFlowClient(dict(server.config_args, max_retries=10))
+
+    start = time.time()
+    with irfc.request_options(deadline=0.5):
+        with pytest.raises(IRFlowMaintenanceError):
+            irfc.get_alert(1)
+    assert time.time() - start < 0.8
+    assert len(server.requests_for('GET', '/api/v1/alerts/1')) == 2
+
+
+def test_deadline_spans_several_calls(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.2)
+    irfc = IRFlowClient(server.config_args)
+
+    with irfc.request_options(deadline=0.3):
+        irfc.get_alert(1)
+        with pytest.raises(requests.exceptions.ReadTimeout):
+            irfc.get_alert(1)
+        with pytest.raises(IRFlowDeadlineExceededError):
+            irfc.get_alert(1)
+
+
+def test_nested_deadline_cannot_extend_outer(server):
+    irfc = IRFlowClient(server.config_args)
+
+    with irfc.request_options(deadline=0.01):
+        with irfc.request_options(deadline=60):
+            time.sleep(0.02)
+            with pytest.raises(IRFlowDeadlineExceededError):
+                irfc.get_alert(1)
+
+
+def test_bulk_deadline_fails_fast(server):
+    server.add('POST', '/api/v1/alerts',
+               json_body=lambda req: StubResponse(200, {'success': True}, delay=0.2))
+    irfc = IRFlowClient(server.config_args)
+
+    start = time.time()
+    bulk = irfc.create_alerts(({'n': n} for n in range(100)), max_workers=2, deadline=0.5)
+    results = list(bulk)
+
+    assert time.time() - start < 1
+    assert len(results) < 100
+    assert bulk.summary.deadline_exceeded
+
+
+def test_async_bulk_deadline_fails_fast(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('POST', '/api/v1/alerts',
+               json_body=lambda req: StubResponse(200, {'success': True}, delay=0.2))
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            bulk = irfc.create_alerts(({'n': n} for n in range(100)), max_workers=2,
+                                      deadline=0.5)
+            return [result async for result in bulk], bulk.summary
+
+    start = time.time()
+    results, summary = asyncio.run(scenario())
+
+    assert time.time() - start < 1
+    assert len(results) < 100
+    assert summary.deadline_exceeded
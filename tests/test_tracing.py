@@ -0,0 +1,138 @@
+"""
+    test_tracing.py. Pytests for the tracing spans around IR-Flow calls
+"""
+import asyncio
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client.tracing import InMemorySpanExporter, SpanContext, Tracer
+
+from .stub_server import StubResponse
+
+
+def traced_client(server, **config):
+    exporter = InMemorySpanExporter()
+    irfc = IRFlowClient(dict(server.config_args, **config), tracer=Tracer(exporter))
+    return irfc, exporter
+
+
+def test_span_per_call_named_after_the_endpoint(server):
+    server.add('GET', '/api/v1/alerts/12', json_body={'success': True, 'data': 'x' * 50})
+    server.add('PUT', '/api/v1/incidents/3/alerts/12', json_body={'success': True})
+    server.add('PUT', '/api/v1/alerts/close', json_body={'success': True})
+    irfc, exporter = traced_client(server)
+
+    irfc.get_alert(12)
+    irfc.attach_alert_to_incident(12, 3)
+    irfc.close_alert(12, 'False Positive')
+
+    assert [span.name for span in exporter.spans] == ['get_alert', 'put_alert_on_incident',
+                                                      'put_alert_close']
+    get_alert, attach, close = exporter.spans
+    assert get_alert.attributes['irflow.alert_num'] == '12'
+    assert get_alert.attributes['http.status_code'] == 200
+    assert get_alert.attributes['http.response_content_length'] == \
+        len(b'{"success": true, "data": "' + b'x' * 50 + b'"}')
+    assert attach.attributes['irflow.incident_num'] == '3'
+    assert attach.attributes['irflow.alert_num'] == '12'
+    assert attach.attributes['http.method'] == 'PUT'
+    assert close.attributes['irflow.alert_num'] == '12'
+    assert close.attributes['http.request_content_length'] > 0
+    assert all(span.status == 'ok' and span.duration >= 0 for span in exporter.spans)
+
+
+def test_trace_context_is_sent_to_irflow(server):
+    server.add('GET', '/api/v1/incidents/5', json_body={'success': True})
+    irfc, exporter = traced_client(server)
+
+    with irfc.tracer.span('triage', parent='00-' + 'a' * 32 + '-' + 'b' * 16 + '-01') as parent:
+        irfc.get_incident(5)
+
+    span, root = exporter.spans
+    assert root is parent and span.name == 'get_incident'
+    assert span.trace_id == 'a' * 32 and span.parent_id == parent.span_id
+    assert span.attributes['irflow.incident_num'] == '5'
+    sent = server.requests_for('GET', '/api/v1/incidents/5')[0].headers
+    assert sent['traceparent'] == span.traceparent
+    assert SpanContext.from_traceparent(sent['traceparent']).span_id == span.span_id
+
+
+def test_failed_calls_mark_the_span(server):
+    responses = iter([StubResponse(502, {}), StubResponse(404, {'success': False})])
+    server.add('GET', '/api/v1/fact_groups/8', json_body=lambda request: next(responses))
+    irfc, exporter = traced_client(server, backoff_factor=0)
+    unreachable = IRFlowClient(dict(server.config_args, address='127.0.0.1:1', max_retries=0),
+                               tracer=irfc.tracer)
+
+    irfc.get_fact_group(8)
+    with pytest.raises(requests.exceptions.ConnectionError):
+        unreachable.get_alert(1)
+
+    missing, refused = exporter.spans
+    assert missing.status == 'error' and missing.attributes['irflow.retries'] == 1
+    assert missing.attributes['irflow.fact_group_id'] == '8'
+    assert refused.status == 'error'
+    assert refused.attributes['error.type'] == 'ConnectionError'
+
+
+def test_attachment_spans_name_the_owner(server):
+    server.add('POST', '/api/v1/incidents/4/attachments', json_body={'success': True})
+    server.add_file('/api/v1/attachments/9/download', b'evidence')
+    irfc, exporter = traced_client(server)
+
+    irfc.upload_attachment_to_incident(4, b'report', attachment_name='report.txt')
+    assert irfc.download_attachment_string(9) == b'evidence'
+
+    upload, download = exporter.spans
+    assert upload.name == 'put_attachment'
+    assert upload.attributes['irflow.incident_num'] == '4'
+    assert download.attributes['irflow.attachment_id'] == '9'
+
+
+def test_broken_exporter_does_not_break_calls(server):
+    class Broken(object):
+        def export(self, span):
+            raise ValueError('collector down')
+
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc = IRFlowClient(server.config_args, tracer=Tracer(Broken()))
+
+    assert irfc.get_alert(1) == {'success': True}
+
+
+def test_unsampled_traces_are_propagated_but_not_exported(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True})
+    irfc, exporter = traced_client(server)
+
+    with irfc.tracer.span('sampled out', parent='00-' + 'c' * 32 + '-' + 'd' * 16 + '-00'):
+        irfc.get_alert(1)
+
+    assert len(exporter) == 0
+    sent = server.requests_for('GET', '/api/v1/alerts/1')[0].headers['traceparent']
+    assert sent.startswith('00-' + 'c' * 32) and sent.endswith('-00')
+
+
+def test_async_calls_are_traced(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('GET', '/api/v1/alerts/7', json_body={'success': True})
+    server.add('GET', '/api/v1/incidents/2', json_body={'success': True})
+    exporter = InMemorySpanExporter()
+    tracer = Tracer(exporter)
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args, tracer=tracer) as irfc:
+            with tracer.span('enrich') as parent:
+                await asyncio.gather(irfc.get_alert(7), irfc.get_incident(2))
+            return parent
+
+    parent = asyncio.run(scenario())
+    spans = dict((span.name, span) for span in exporter.spans)
+    assert spans['get_alert'].attributes['irflow.alert_num'] == '7'
+    assert spans['get_incident'].attributes['irflow.incident_num'] == '2'
+    assert spans['get_alert'].parent_id == parent.span_id
+    sent = server.requests_for('GET', '/api/v1/alerts/7')[0].headers
+    assert sent['traceparent'] == spans['get_alert'].traceparent
@@ -0,0 +1,64 @@
+"""
+    test_transport.py. Pytests for the connection pool configuration of IRFlowClient
+"""
+from concurrent.futures import ThreadPoolExecutor
+
+from irflow_client import IRFlowClient
+from irflow_client.transport import IRFlowHTTPAdapter
+
+
+def test_pool_defaults(server):
+    irfc = IRFlowClient(server.config_args)
+    adapter = irfc.session.get_adapter('https://irflow.example.com')
+
+    assert isinstance(adapter, IRFlowHTTPAdapter)
+    assert adapter._pool_maxsize == 10
+    assert adapter._pool_block is False
+    assert adapter is irfc.session.get_adapter('http://irflow.example.com')
+
+
+def test_pool_options_from_config_args(server):
+    config_args = dict(server.config_args, pool_connections=2, pool_maxsize='32',
+                       pool_block='true')
+    irfc = IRFlowClient(config_args)
+    adapter = irfc.session.get_adapter('https://irflow.example.com')
+
+    assert irfc.pool_maxsize == 32
+    assert adapter._pool_connections == 2
+    assert adapter._pool_maxsize == 32
+    assert adapter._pool_block is True
+
+
+def test_pool_options_from_config_file(server, tmpdir):
+    config_file = tmpdir.join('api.conf')
+    config_file.write('[IRFlowAPI]\n'
+                      'address = {}\n'
+                      'api_user = stub_user\n'
+                      'api_key = stub_key\n'
+                      'protocol = http\n'
+                      'pool_maxsize = 4\n'
+                      'pool_block = yes\n'.format(server.address))
+    irfc = IRFlowClient(config_file=str(config_file))
+    adapter = irfc.session.get_adapter('http://irflow.example.com')
+
+    assert adapter._pool_maxsize == 4
+    assert adapter._pool_block is True
+    assert irfc.tcp_keepalive is True
+
+
+def test_connections_are_reused_under_threads(server):
+    server.add('GET', '/api/v1/alerts/1', json_body={'success': True}, delay=0.01)
+    # Identical concurrent GETs would share one request, send every one of them
+    irfc = IRFlowClient(dict(server.config_args, pool_maxsize=4, pool_block=True,
+                             coalesce_requests=False))
+    irfc.connection_stats.reset()
+
+    with ThreadPoolExecutor(max_workers=8) as executor:
+        results = list(executor.map(lambda _: irfc.get_alert(1), range(100)))
+
+    assert all(result == {'success': True} for result in results)
+    stats = irfc.connection_stats.as_dict()
+    assert stats['requests'] == 100
+    # A blocking pool of 4 never opens more than 4 sockets to the host
+    assert stats['new_connections'] <= 4
+    assert stats['reused_connections'] >= 96
@@ -0,0 +1,135 @@
+"""
+    test_uploads.py. Pytests for streaming attachment uploads
+"""
+from email.parser import BytesParser
+import io
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client import multipart
+from irflow_client.multipart import MultipartUpload
+
+from .stub_server import StubResponse
+
+UPLOAD_PATH = '/api/v1/alerts/7/attachments'
+
+
+def parse_upload(request):
+    """Return (file name, content) of the single file of a multipart request"""
+    message = BytesParser().parsebytes(
+        b'Content-Type: ' + request.headers['Content-Type'].encode('ascii') + b'\r\n\r\n' +
+        request.body)
+    part, = message.get_payload()
+    return part.get_filename(), part.get_payload(decode=True)
+
+
+class Unseekable(io.RawIOBase):
+    """A file object like a pipe, readable once"""
+
+    def __init__(self, data):
+        self._source = io.BytesIO(data)
+
+    def readable(self):
+        return True
+
+    def readinto(self, buffer):
+        data = self._source.read(len(buffer))
+        buffer[:len(data)] = data
+        return len(data)
+
+
+@pytest.fixture
+def opened_files(monkeypatch):
+    """Record the files opened by MultipartUpload"""
+    handles = []
+
+    def recording_open(*args, **kwargs):
+        handles.append(open(*args, **kwargs))
+        return handles[-1]
+
+    monkeypatch.setattr(multipart, 'open', recording_open, raising=False)
+    return handles
+
+
+def test_upload_path_streams_and_closes(server, tmpdir, opened_files):
+    server.add('POST', UPLOAD_PATH, json_body={'success': True})
+    capture = tmpdir.join('capture.pcap')
+    capture.write_binary(b'\xd4\xc3\xb2\xa1' * 50000)
+    irfc = IRFlowClient(server.config_args)
+
+    assert irfc.upload_attachment_to_alert(7, str(capture)) == {'success': True}
+
+    request, = server.requests_for('POST', UPLOAD_PATH)
+    assert int(request.headers['Content-Length']) == len(request.body)
+    assert parse_upload(request) == ('capture.pcap', capture.read_binary())
+    assert [handle.closed for handle in opened_files] == [True]
+
+
+def test_handle_is_closed_when_the_upload_fails(server, tmpdir, opened_files):
+    capture = tmpdir.join('capture.pcap')
+    capture.write_binary(b'pcap')
+    irfc = IRFlowClient(dict(server.config_args, address='127.0.0.1:1', max_retries=0))
+
+    with pytest.raises(requests.exceptions.ConnectionError):
+        irfc.upload_attachment_to_incident(3, str(capture))
+    assert [handle.closed for handle in opened_files] == [True]
+
+
+def test_upload_bytes_with_progress(server):
+    server.add('POST', '/api/v1/tasks/2/attachments', json_body={'success': True})
+    irfc = IRFlowClient(server.config_args)
+    data = b'x' * (3 * multipart.CHUNK_SIZE + 10)
+    calls = []
+
+    irfc.upload_attachment_to_task(2, data, attachment_name='notes.txt',
+                                   progress=lambda sent, total: calls.append((sent, total)))
+
+    request, = server.requests_for('POST', '/api/v1/tasks/2/attachments')
+    assert parse_upload(request) == ('notes.txt', data)
+    assert calls[-1] == (len(data), len(data))
+    assert [sent for sent, _ in calls] == sorted(set(sent for sent, _ in calls))
+
+
+def test_unseekable_file_is_sent_chunked_without_retry(server):
+    server.add('POST', UPLOAD_PATH, status=502, json_body={'success': False})
+    irfc = IRFlowClient(dict(server.config_args, backoff_factor=0, retry_non_idempotent=True))
+    source = Unseekable(b'streamed from a pipe')
+
+    assert irfc.upload_attachment_to_alert(7, source, attachment_name='pipe.txt') == {
+        'success': False}
+
+    request, = server.requests_for('POST', UPLOAD_PATH)
+    assert request.headers['Transfer-Encoding'] == 'chunked'
+    assert parse_upload(request) == ('pipe.txt', b'streamed from a pipe')
+    assert not source.closed
+
+
+def test_retry_resends_the_whole_body(server):
+    responses = iter([StubResponse(503, {'success': False}), StubResponse(200, {'success': True})])
+    server.add('POST', UPLOAD_PATH, json_body=lambda request: next(responses))
+    irfc = IRFlowClient(dict(server.config_args, backoff_factor=0, retry_non_idempotent=True))
+    source = io.BytesIO(b'header' + b'evidence')
+    source.read(6)
+
+    assert irfc.upload_attachment_to_alert(7, source, attachment_name='e.bin') == {
+        'success': True}
+
+    first, second = server.requests_for('POST', UPLOAD_PATH)
+    assert first.body == second.body
+    assert parse_upload(second) == ('e.bin', b'evidence')
+
+
+def test_multipart_upload_rewinds_only_when_possible():
+    body = MultipartUpload(b'abc', 'a.txt')
+    first = b''.join(bytes(chunk) for chunk in body)
+    body.seek(0)
+    assert b''.join(bytes(chunk) for chunk in body) == first
+    assert body.len == len(first)
+
+    body = MultipartUpload(Unseekable(b'abc'))
+    assert body.len is None and not body.rewindable
+    body.read()
+    with pytest.raises(io.UnsupportedOperation):
+        body.seek(0)
@@ -0,0 +1,82 @@
+"""
+    test_version.py. Pytests for lazy and cached server version negotiation
+"""
+import json
+
+import pytest
+
+from irflow_client import IRFlowClient
+from irflow_client.cache import VersionCache
+from irflow_client.irflow_client import IRFlowMaintenanceError
+
+
+def version_requests(server):
+    return len(server.requests_for('GET', '/api/v1/version'))
+
+
+def test_version_is_lazy(server):
+    irfc = IRFlowClient(server.config_args)
+    assert version_requests(server) == 0
+
+    assert irfc.version == '5.1'
+    assert irfc.version == '5.1'
+    assert version_requests(server) == 1
+
+
+def test_construction_survives_maintenance(server):
+    server.add('GET', '/api/v1/version', status=503, body=b'maintenance')
+    irfc = IRFlowClient(dict(server.config_args, max_retries=0))
+
+    with pytest.raises(IRFlowMaintenanceError):
+        irfc.version
+
+
+def test_eager_version(server, monkeypatch):
+    monkeypatch.delenv('CI', raising=False)
+    irfc = IRFlowClient(dict(server.config_args, eager_version=True))
+    assert version_requests(server) == 1
+    assert irfc.version == '5.1'
+    assert version_requests(server) == 1
+
+    monkeypatch.setenv('CI', 'true')
+    IRFlowClient(dict(server.config_args, eager_version=True))
+    assert version_requests(server) == 1
+
+
+def test_version_cache_is_shared_between_clients(server, tmpdir):
+    cache_file = str(tmpdir.join('version.json'))
+    config_args = dict(server.config_args, version_cache_file=cache_file)
+
+    assert IRFlowClient(config_args).version == '5.1'
+    assert IRFlowClient(config_args).version == '5.1'
+    assert version_requests(server) == 1
+    entries = json.loads(tmpdir.join('version.json').read())
+    assert entries['http://' + server.address]['version'] == '5.1'
+
+
+def test_version_cache_expires(server, tmpdir):
+    cache_file = str(tmpdir.join('version.json'))
+    config_args = dict(server.config_args, version_cache_file=cache_file, version_cache_ttl=0)
+
+    IRFlowClient(config_args).version
+    IRFlowClient(config_args).version
+    assert version_requests(server) == 2
+
+
+def test_version_cache_is_keyed_by_server(tmpdir):
+    cache = VersionCache(str(tmpdir.join('version.json')))
+    cache.set('https://one', '5.1')
+    cache.set('https://two', '5.2')
+
+    assert cache.get('https://one') == '5.1'
+    assert cache.get('https://two') == '5.2'
+    assert cache.get('https://three') is None
+
+
+def test_corrupt_version_cache_is_ignored(tmpdir):
+    tmpdir.join('version.json').write('{not json')
+    cache = VersionCache(str(tmpdir.join('version.json')))
+
+    assert cache.get('https://one') is None
+    cache.set('https://one', '5.1')
+    assert cache.get('https://one') == '5.1'
@@ -0,0 +1,104 @@
+"""
+    test_writebehind.py. Pytests for write-behind coalescing of fact group updates
+"""
+import asyncio
+import threading
+import time
+
+import pytest
+import requests
+
+from irflow_client import IRFlowClient
+from irflow_client.writebehind import FactGroupWriter
+
+FACT_GROUP = '/api/v1/fact_groups/12'
+
+
+def test_updates_are_merged_into_one_put_on_close(server):
+    server.add('PUT', FACT_GROUP, json_body={'success': True})
+    irfc = IRFlowClient(server.config_args)
+
+    with irfc.fact_group_writer(max_delay=60) as writer:
+        futures = [writer.put(12, {'whois': 'a'}), writer.put(12, {'geoip': 'US'}),
+                   writer.put(12, {'whois': 'b'})]
+
+    request, = server.requests_for('PUT', FACT_GROUP)
+    assert request.json() == {'fields': {'whois': 'b', 'geoip': 'US'}}
+    assert [future.result() for future in futures] == [{'success': True}] * 3
+    assert writer.stats.as_dict() == {'updates': 3, 'puts': 1, 'failed': 0, 'merged': 2}
+
+
+def test_count_and_age_trigger_writes(server):
+    server.add('PUT', FACT_GROUP, json_body={'success': True})
+    server.add('PUT', '/api/v1/fact_groups/13', json_body={'success': True})
+    irfc = IRFlowClient(server.config_args)
+    writer = irfc.fact_group_writer(max_updates=3, max_delay=0.2)
+
+    futures = [writer.put(12, {'field_%s' % n: n}) for n in range(3)]
+    assert futures[-1].result(timeout=5) == {'success': True}
+
+    started = time.monotonic()
+    assert writer.put(13, {'field': 1}).result(timeout=5) == {'success': True}
+    assert time.monotonic() - started >= 0.15
+    writer.close()
+    assert len(server.requests_for('PUT', FACT_GROUP)) == 1
+
+
+def test_errors_reach_every_merged_caller(server):
+    irfc = IRFlowClient(dict(server.config_args, address='127.0.0.1:1', max_retries=0))
+    writer = irfc.fact_group_writer(max_delay=60)
+
+    futures = [writer.put(12, {'a': 1}), writer.put(12, {'b': 2})]
+    assert writer.flush(timeout=5)
+
+    assert all(isinstance(future.exception(), requests.exceptions.ConnectionError)
+               for future in futures)
+    assert writer.stats.failed == 1
+    writer.close()
+    with pytest.raises(RuntimeError):
+        writer.put(12, {'c': 3})
+
+
+def test_writes_of_one_fact_group_never_overlap():
+    active = []
+    overlaps = []
+    written = []
+    lock = threading.Lock()
+
+    def put_fact_group(fact_group_id, fact_data):
+        with lock:
+            active.append(fact_group_id)
+            overlaps.append(active.count(fact_group_id) > 1)
+        time.sleep(0.05)
+        written.append(dict(fact_data))
+        with lock:
+            active.remove(fact_group_id)
+        return {'success': True}
+
+    with FactGroupWriter(put_fact_group, max_updates=1, max_delay=60) as writer:
+        for n in range(5):
+            writer.put(1, {'n': n})
+
+    assert not any(overlaps)
+    # Updates queued during a write are merged into the next one, in order
+    assert written[-1] == {'n': 4}
+    assert len(written) < 5
+
+
+def test_async_writer_merges_updates(server):
+    pytest.importorskip('aiohttp')
+    from irflow_client import AsyncIRFlowClient
+
+    server.add('PUT', FACT_GROUP, json_body={'success': True})
+
+    async def scenario():
+        async with AsyncIRFlowClient(server.config_args) as irfc:
+            async with irfc.fact_group_writer(max_delay=60) as writer:
+                futures = [writer.put(12, {'source_%s' % n: n}) for n in range(10)]
+            return await asyncio.gather(*futures), writer.stats
+
+    responses, stats = asyncio.run(scenario())
+    assert responses == [{'success': True}] * 10
+    assert stats.puts == 1
+    request, = server.requests_for('PUT', FACT_GROUP)
+    assert len(request.json()['fields']) == 10